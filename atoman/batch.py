@@ -0,0 +1,563 @@
+"""
+Run filter pipelines without the GUI.
+
+`atoman-batch` applies a list of filters to a range of frames and writes the results for
+each frame to a file. It does not import Qt or VTK, so it can run on machines without a
+display (eg. cluster nodes) and from scripts. The frames are processed in parallel worker
+processes.
+
+The pipeline is defined in a JSON file, for example::
+    
+    {
+        "input": "lattice%04d.dat",
+        "inputFormat": "LBOMD Lattice",
+        "ref": "animation-reference.xyz",
+        "refFormat": "LBOMD REF",
+        "first": 0,
+        "last": 100,
+        "interval": 1,
+        "driftCompensation": false,
+        "reorder": "hilbert",
+        "filters": [
+            {"name": "Point defects", "settings": {"vacancyRadius": 1.3, "findClusters": true}},
+            {"name": "Crop box", "settings": {"xEnabled": true, "xmin": 10.0, "xmax": 20.0}}
+        ],
+        "output": "results"
+    }
+
+"input" contains the frame number as a format specifier (it is a single file for
+trajectories, when the frames are indexes into it). "ref" defaults to the first frame,
+"refFormat" to "inputFormat", "last" to the last frame that exists and "fileFormats" to
+the user's file formats file. The settings of each filter are those of its settings
+object (eg. PointDefectsFilterSettings); unspecified settings keep their defaults and
+`atoman-batch --print-settings NAME` lists them. Options for Voronoi calculations can be
+given as a "voronoi" object. "reorder" ("morton" or "hilbert") orders the atoms of each
+frame along a space-filling curve when it is read, which makes the filters faster for
+files in which the atoms are not ordered in space.
+
+For each frame a NumPy archive (.npz) is written to the output directory, containing the
+visible atoms, the scalars of the visible atoms ("scalars_<name>"), the defect arrays
+and the cluster lists. Cluster lists are stored as the indexes of all clusters
+concatenated plus an offsets array (cluster i is indexes[offsets[i]:offsets[i + 1]]);
+antisites are stored as (antisite, onAntisite) pairs and split interstitials as
+triplets. Atom indexes always refer to the order of the atoms in the files, even if they
+were reordered. A summary of the counts for all frames is written to "summary.csv".
+
+`atoman-batch --convert FILE.atraj PIPELINE` instead converts the input frames of the
+pipeline to a single trajectory file (the filters are not run), which is faster to read
+and seek than a sequence of text files.
+
+@author: Chris Scott
+
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import multiprocessing
+
+import numpy as np
+import six
+from six.moves import range
+
+from .system import latticeReaderGeneric
+from .system import compression
+from .system import trajectory
+from .filtering import filterer
+from .filtering import filters
+from .filtering import clusters
+
+
+class VoronoiOptions(object):
+    """
+    Options for Voronoi calculations (the same defaults as the GUI).
+    
+    """
+    def __init__(self, **kwargs):
+        self.dispersion = 10.0
+        self.displayVoronoi = False
+        self.useRadii = False
+        self.opacity = 0.8
+        self.outputToFile = False
+        self.outputFilename = "voronoi.csv"
+        self.faceAreaThreshold = 0.1
+        
+        for name, value in six.iteritems(kwargs):
+            if not hasattr(self, name):
+                raise ValueError("Unrecognised Voronoi option: '%s'" % name)
+            setattr(self, name, value)
+
+
+def makeFilterSettings(filterName, values=None):
+    """
+    Return the settings object for the named filter, updated with the given values.
+    
+    """
+    # the filterer finds filter modules the same way
+    if filterName.startswith("Scalar: "):
+        moduleName = "genericScalarFilter"
+        settingsName = "GenericScalarFilterSettings"
+    
+    elif filterName in filterer.Filterer.defaultFilters:
+        words = str(filterName).title().split()
+        settingsName = "%sFilterSettings" % "".join(words)
+        moduleName = settingsName[:1].lower() + settingsName[1:-8]
+    
+    else:
+        raise ValueError("Unrecognised filter: '%s'" % filterName)
+    
+    settings = getattr(getattr(filters, moduleName), settingsName)()
+    
+    if filterName.startswith("Scalar: "):
+        settings.updateSetting("scalarsName", filterName[8:])
+    
+    if values is not None:
+        for name, value in six.iteritems(values):
+            settings.updateSetting(name, value)
+    
+    return settings
+
+
+class Pipeline(object):
+    """
+    A pipeline definition (see the module docstring for the keys).
+    
+    """
+    def __init__(self, definition, baseDir="."):
+        definition = dict(definition)
+        
+        def path(key):
+            value = definition.pop(key, None)
+            if value is not None:
+                value = os.path.join(baseDir, value)
+            return value
+        
+        self.input = path("input")
+        if self.input is None:
+            raise ValueError("The pipeline must have an 'input'")
+        self.inputFormat = definition.pop("inputFormat", None)
+        self.ref = path("ref")
+        self.refFormat = definition.pop("refFormat", None)
+        self.fileFormats = path("fileFormats")
+        self.first = int(definition.pop("first", 0))
+        self.last = int(definition.pop("last", -1))
+        self.interval = int(definition.pop("interval", 1))
+        self.driftCompensation = bool(definition.pop("driftCompensation", False))
+        self.reorder = definition.pop("reorder", None)
+        self.voronoi = dict(definition.pop("voronoi", {}))
+        self.output = path("output") or os.path.join(baseDir, "atoman-batch")
+        self.filters = []
+        for item in definition.pop("filters", []):
+            self.filters.append((item["name"], dict(item.get("settings", {}))))
+        
+        if len(definition):
+            raise ValueError("Unrecognised pipeline keys: %s" % ", ".join(sorted(definition)))
+        
+        if self.interval < 1:
+            raise ValueError("The interval must be at least 1")
+        
+        if self.reorder not in (None, "morton", "hilbert"):
+            raise ValueError("Unrecognised reorder curve: '%s'" % self.reorder)
+        
+        # check the filters and settings
+        self.makeFilters()
+        VoronoiOptions(**self.voronoi)
+    
+    @classmethod
+    def fromFile(cls, filename):
+        """
+        Read the pipeline from a JSON file (relative paths are relative to the file).
+        
+        """
+        with open(filename) as fh:
+            definition = json.load(fh)
+        
+        return cls(definition, baseDir=os.path.dirname(os.path.abspath(filename)))
+    
+    def makeFilters(self):
+        """
+        Return the lists of filter names and settings objects.
+        
+        """
+        names = [name for name, _ in self.filters]
+        settings = [makeFilterSettings(name, values) for name, values in self.filters]
+        
+        return names, settings
+    
+    @property
+    def isTrajectory(self):
+        """
+        True if the input is a trajectory file.
+        
+        """
+        return os.path.exists(self.input) and trajectory.isTrajectory(self.input)
+    
+    def inputFile(self, index):
+        """
+        The input file for the given frame.
+        
+        """
+        return self.input if self.isTrajectory else self.input % index
+    
+    def frames(self, reader):
+        """
+        Return the list of frames to process.
+        
+        """
+        last = self.last
+        if self.isTrajectory:
+            numFrames = reader.getTrajectory(self.input).numFrames
+            if last < self.first or last >= numFrames:
+                last = numFrames - 1
+        
+        elif last < self.first:
+            # find the last file that exists
+            last = self.first
+            while compression.locateFile(self.input % (last + 1)) is not None:
+                last += 1
+        
+        return list(range(self.first, last + 1, self.interval))
+
+
+def _fileIndexes(indexes, lattices):
+    """
+    Return the indexes (rows of one index into each of the lattices, flattened) as indexes
+    into the files the lattices were read from (the atoms may have been reordered).
+    
+    """
+    indexes = np.asarray(indexes, dtype=np.int32).reshape((-1, len(lattices)))
+    result = indexes.copy()
+    for column, lattice in enumerate(lattices):
+        if lattice.permutation is not None:
+            result[:, column] = lattice.permutation[indexes[:, column]]
+    
+    return result.ravel()
+
+
+def _packLists(lists):
+    """
+    Concatenate (flattened) lists of indexes, returning (indexes, offsets).
+    
+    """
+    arrays = [np.asarray(item, dtype=np.int32).ravel() for item in lists]
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(array) for array in arrays])
+    indexes = np.concatenate(arrays) if len(arrays) else np.empty(0, dtype=np.int32)
+    
+    return indexes, offsets
+
+
+class BatchRunner(object):
+    """
+    Applies the pipeline to frames (one runner per worker process).
+    
+    """
+    def __init__(self, pipeline, tmpLocation):
+        self.logger = logging.getLogger(__name__ + ".BatchRunner")
+        self.pipeline = pipeline
+        
+        # file formats
+        fileFormats = latticeReaderGeneric.FileFormats()
+        fileFormats.read(pipeline.fileFormats)
+        self.inputFormat = None
+        if pipeline.inputFormat is not None:
+            self.inputFormat = fileFormats.getFormat(pipeline.inputFormat)
+        refFormatName = pipeline.refFormat or pipeline.inputFormat
+        self.refFormat = None if refFormatName is None else fileFormats.getFormat(refFormatName)
+        
+        self.reader = latticeReaderGeneric.LatticeReaderGeneric(tmpLocation=tmpLocation, reorder=pipeline.reorder)
+        
+        # filters
+        self.filterNames, self.filterSettings = pipeline.makeFilters()
+        self.filterer = filterer.Filterer(VoronoiOptions(**pipeline.voronoi))
+        self.filterer.toggleDriftCompensation(pipeline.driftCompensation)
+        
+        # every frame is a new lattice, so there are no stages to reuse
+        self.filterer.stageCache.setMaxSize(0)
+        
+        # neighbour lists are reused across the frames
+        self.filterer.toggleVerletLists(True)
+        
+        # formats that are linked to another one (eg. positions only) need the reference
+        linked = self.inputFormat is not None and self.inputFormat.linkedName is not None
+        if linked and pipeline.ref is None:
+            raise ValueError("'%s' files need a reference ('%s')" % (self.inputFormat.name,
+                                                                      self.inputFormat.linkedName))
+        
+        # reference (the first frame by default)
+        if pipeline.ref is not None:
+            self.refState = self.readFile(pipeline.ref, self.refFormat)
+        else:
+            self.refState = self.readFile(pipeline.inputFile(pipeline.first), self.inputFormat, index=pipeline.first)
+        self.linkedLattice = self.refState if linked else None
+    
+    def readFile(self, filename, fileFormat, index=None, linkedLattice=None):
+        """
+        Read a file (or trajectory frame), raising IOError on failure.
+        
+        """
+        rouletteIndex = None if index is None else index - 1
+        status, state = self.reader.readFile(filename, fileFormat, rouletteIndex=rouletteIndex,
+                                             linkedLattice=linkedLattice, frameIndex=index)
+        if status:
+            raise IOError("Could not read file: '%s' (error %d)" % (filename, status))
+        
+        return state
+    
+    def outputFile(self, index):
+        """
+        The output file for the given frame.
+        
+        """
+        return os.path.join(self.pipeline.output, "frame%06d.npz" % index)
+    
+    def processFrame(self, index):
+        """
+        Apply the filters to the given frame and write the results, returning a summary dict.
+        
+        """
+        filename = self.pipeline.inputFile(index)
+        self.logger.info("Processing frame %d ('%s')", index, filename)
+        
+        inputState = self.readFile(filename, self.inputFormat, index=index, linkedLattice=self.linkedLattice)
+        
+        flt = self.filterer
+        flt.runFilters(self.filterNames, self.filterSettings, inputState, self.refState)
+        
+        # results (indexes into the files)
+        refState = self.refState
+        results = {
+            "visibleAtoms": _fileIndexes(flt.visibleAtoms, [inputState]),
+            "vacancies": _fileIndexes(flt.vacancies, [refState]),
+            "interstitials": _fileIndexes(flt.interstitials, [inputState]),
+            "antisites": _fileIndexes(flt.antisites, [refState]),
+            "onAntisites": _fileIndexes(flt.onAntisites, [inputState]),
+            "splitInterstitials": _fileIndexes(flt.splitInterstitials, [refState, inputState, inputState]),
+            "driftVector": flt.driftVector,
+        }
+        for scalarsDict in (flt.latticeScalarsDict, flt.scalarsDict):
+            for name, scalars in six.iteritems(scalarsDict):
+                results["scalars_%s" % name] = np.asarray(scalars)
+        
+        if len(flt.clusterList) and isinstance(flt.clusterList[0], clusters.DefectCluster):
+            defectLists = (
+                ("Vacancies", lambda cluster: list(cluster.vacancies()), [refState]),
+                ("Interstitials", lambda cluster: list(cluster.interstitials()), [inputState]),
+                ("Antisites", lambda cluster: list(cluster.antisites()), [refState, inputState]),
+                ("SplitInterstitials", lambda cluster: list(cluster.splitInterstitials()),
+                 [refState, inputState, inputState]),
+            )
+            for name, getter, lattices in defectLists:
+                indexes, offsets = _packLists([getter(cluster) for cluster in flt.clusterList])
+                results["cluster%s" % name] = _fileIndexes(indexes, lattices)
+                results["cluster%sOffsets" % name] = offsets
+        
+        else:
+            indexes, offsets = _packLists([list(cluster) for cluster in flt.clusterList])
+            results["clusterAtoms"] = _fileIndexes(indexes, [inputState])
+            results["clusterAtomsOffsets"] = offsets
+        
+        np.savez(self.outputFile(index), **results)
+        
+        summary = {
+            "frame": index,
+            "file": filename,
+            "NAtoms": inputState.NAtoms,
+            "visible": len(flt.visibleAtoms),
+            "vacancies": len(flt.vacancies),
+            "interstitials": len(flt.interstitials),
+            "antisites": len(flt.antisites),
+            "splitInterstitials": len(flt.splitInterstitials) // 3,
+            "clusters": len(flt.clusterList),
+        }
+        
+        return summary
+
+
+# columns of the summary file
+SUMMARY_COLUMNS = ("frame", "file", "NAtoms", "visible", "vacancies", "interstitials", "antisites",
+                   "splitInterstitials", "clusters")
+
+# the runner in a worker process
+_runner = None
+
+
+def _initWorker(pipeline, tmpLocation, numThreads):
+    """
+    Create the runner in a worker process.
+    
+    """
+    global _runner
+    from .gui import _preferences
+    _preferences.setNumThreads(numThreads)
+    _runner = BatchRunner(pipeline, tmpLocation)
+
+
+def _processFrame(index):
+    """
+    Process a frame in a worker process.
+    
+    """
+    return _runner.processFrame(index)
+
+
+def runPipeline(pipeline, numWorkers=1, numThreads=1, summaryFile=None):
+    """
+    Run the pipeline over all its frames, returning the list of summaries (in frame order).
+    
+    """
+    logger = logging.getLogger(__name__)
+    
+    if not os.path.isdir(pipeline.output):
+        os.makedirs(pipeline.output)
+    if summaryFile is None:
+        summaryFile = os.path.join(pipeline.output, "summary.csv")
+    
+    tmpLocation = tempfile.mkdtemp(prefix="atomanBatch-")
+    try:
+        # the runner in this process (also finds the frames)
+        _initWorker(pipeline, tmpLocation, numThreads)
+        frames = pipeline.frames(_runner.reader)
+        logger.info("Processing %d frames in %d processes", len(frames), numWorkers)
+        if not len(frames):
+            return []
+        
+        startTime = time.time()
+        pool = None
+        if numWorkers > 1 and len(frames) > 1:
+            pool = multiprocessing.Pool(processes=min(numWorkers, len(frames)), initializer=_initWorker,
+                                        initargs=(pipeline, tmpLocation, numThreads))
+            results = pool.imap(_processFrame, frames)
+        else:
+            results = six.moves.map(_processFrame, frames)
+        
+        summaries = []
+        try:
+            with open(summaryFile, "w") as fh:
+                fh.write("%s\n" % ",".join(SUMMARY_COLUMNS))
+                for summary in results:
+                    fh.write("%s\n" % ",".join(str(summary[column]) for column in SUMMARY_COLUMNS))
+                    fh.flush()
+                    summaries.append(summary)
+                    logger.info("Finished frame %d (%d/%d)", summary["frame"], len(summaries), len(frames))
+            
+            if pool is not None:
+                pool.close()
+        
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        
+        logger.info("Processed %d frames in %.1f s", len(summaries), time.time() - startTime)
+    
+    finally:
+        shutil.rmtree(tmpLocation, ignore_errors=True)
+    
+    return summaries
+
+
+def convertPipeline(pipeline, outputFilename):
+    """
+    Convert the input frames of the pipeline to a trajectory file, returning the number of
+    frames written.
+    
+    """
+    if pipeline.isTrajectory:
+        raise ValueError("The input is already a trajectory: '%s'" % pipeline.input)
+    
+    tmpLocation = tempfile.mkdtemp(prefix="atomanBatch-")
+    try:
+        runner = BatchRunner(pipeline, tmpLocation)
+        filenames = [pipeline.inputFile(index) for index in pipeline.frames(runner.reader)]
+        numFrames = trajectory.convertSequence(runner.reader, filenames, runner.inputFormat, outputFilename,
+                                               linkedLattice=runner.linkedLattice)
+    
+    finally:
+        shutil.rmtree(tmpLocation, ignore_errors=True)
+    
+    return numFrames
+
+
+def main(args=None):
+    """
+    Entry point for atoman-batch.
+    
+    """
+    parser = argparse.ArgumentParser(prog="atoman-batch", description="Run an Atoman filter pipeline over a "
+                                     "range of frames without the GUI")
+    parser.add_argument("pipeline", nargs="?", help="the pipeline definition (JSON)")
+    parser.add_argument("-n", "--workers", type=int, default=multiprocessing.cpu_count(),
+                        help="number of worker processes (default: %(default)s)")
+    parser.add_argument("-t", "--threads", type=int, default=1,
+                        help="number of OpenMP threads per worker (default: %(default)s)")
+    parser.add_argument("-o", "--output", help="output directory (overrides the pipeline)")
+    parser.add_argument("--first", type=int, help="first frame (overrides the pipeline)")
+    parser.add_argument("--last", type=int, help="last frame (overrides the pipeline)")
+    parser.add_argument("--interval", type=int, help="frame interval (overrides the pipeline)")
+    parser.add_argument("--convert", metavar="TRAJECTORY", help="convert the input frames to a trajectory "
+                        "file (%s) instead of running the filters" % trajectory.TRAJECTORY_EXTENSION)
+    parser.add_argument("--print-settings", metavar="FILTER", help="print the settings of a filter and exit")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="more output (repeat for debug)")
+    args = parser.parse_args(args)
+    
+    level = logging.WARNING if args.verbose == 0 else logging.INFO if args.verbose == 1 else logging.DEBUG
+    logging.basicConfig(format="%(levelname)s: %(name)s: %(message)s", level=level)
+    
+    if args.print_settings is not None:
+        try:
+            makeFilterSettings(args.print_settings).printSettings()
+        except ValueError as error:
+            parser.error(str(error))
+        return 0
+    
+    if args.pipeline is None:
+        parser.error("a pipeline definition is required")
+    
+    try:
+        pipeline = Pipeline.fromFile(args.pipeline)
+    except (IOError, ValueError, KeyError) as error:
+        parser.error("invalid pipeline: %s" % error)
+    
+    if args.output is not None:
+        pipeline.output = args.output
+    if args.first is not None:
+        pipeline.first = args.first
+    if args.last is not None:
+        pipeline.last = args.last
+    if args.interval is not None:
+        pipeline.interval = max(1, args.interval)
+    
+    if args.convert is not None:
+        try:
+            numFrames = convertPipeline(pipeline, args.convert)
+        
+        except Exception:
+            logging.getLogger(__name__).exception("Conversion failed")
+            return 1
+        
+        print("Converted %d frames to '%s'" % (numFrames, args.convert))
+        
+        return 0
+    
+    try:
+        summaries = runPipeline(pipeline, numWorkers=max(1, args.workers), numThreads=max(1, args.threads))
+    
+    except Exception:
+        logging.getLogger(__name__).exception("Batch run failed")
+        return 1
+    
+    print("Processed %d frames; results in '%s'" % (len(summaries), pipeline.output))
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -75,9 +75,10 @@ calculateBonds(PyObject *self, PyObject *args)
     PyArrayObject *bondMaxArrayIn=NULL;
     PyArrayObject *cellDimsIn=NULL;
     PyArrayObject *bondVectorArrayIn=NULL;
+    PyObject *spatialIndex=NULL;
     
     int i, j, k, index, index2, visIndex;
-    int speca, specb, count, boxstat;
+    int speca, specb, count;
     int boxIndex, boxNebList[27];
     double *visiblePos, sep2, sep;
     double sepVec[3];
@@ -85,10 +86,10 @@ calculateBonds(PyObject *self, PyObject *args)
     
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!O!iO!O!diO!O!O!O!O!O!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, &PyArray_Type, &specieIn,
+    if (!PyArg_ParseTuple(args, "O!O!O!iO!O!diO!O!O!O!O!O!|O", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, &PyArray_Type, &specieIn,
             &NSpecies, &PyArray_Type, &bondMinArrayIn, &PyArray_Type, &bondMaxArrayIn, &approxBoxWidth, &maxBondsPerAtom, &PyArray_Type, &cellDimsIn,
             &PyArray_Type, &PBCIn, &PyArray_Type, &bondArrayIn, &PyArray_Type, &NBondsArrayIn, &PyArray_Type, &bondVectorArrayIn, &PyArray_Type,
-            &bondSpecieCounterIn))
+            &bondSpecieCounterIn, &spatialIndex))
         return NULL;
     
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -155,15 +156,9 @@ calculateBonds(PyObject *self, PyObject *args)
     }
     
     /* box visible atoms */
-    boxes = setupBoxes(approxBoxWidth, PBC, cellDims);
-    if (boxes == NULL)
-    {
-        free(visiblePos);
-        return NULL;
-    }
-    boxstat = putAtomsInBoxes(NVisible, visiblePos, boxes);
+    boxes = boxVisibleAtoms(spatialIndex, approxBoxWidth, PBC, cellDims, pos, NVisible, visibleAtoms, visiblePos);
     free(visiblePos);
-    if (boxstat) return NULL;
+    if (boxes == NULL) return NULL;
     
     /* loop over visible atoms */
     count = 0;
@@ -191,9 +186,9 @@ calculateBonds(PyObject *self, PyObject *args)
         {
             boxIndex = boxNebList[j];
             
-            for (k = 0; k < boxes->boxNAtoms[boxIndex]; k++)
+            for (k = boxes->boxOffsets[boxIndex]; k < boxes->boxOffsets[boxIndex + 1]; k++)
             {
-                visIndex = boxes->boxAtoms[boxIndex][k];
+                visIndex = boxes->boxAtoms[k];
                 index2 = visibleAtoms[visIndex];
                 
                 if (index >= index2) continue;
@@ -75,9 +75,10 @@ findClusters(PyObject *self, PyObject *args)
     PyArrayObject *resultsIn=NULL;
     PyArrayObject *fullScalarsIn=NULL;
     PyArrayObject *fullVectors=NULL;
+    PyObject *spatialIndex=NULL;
     
     int i, j, index, NClusters, numInCluster;
-    int maxNumInCluster, boxstat;
+    int maxNumInCluster;
     double nebRad2, approxBoxWidth;
     double *visiblePos;
     struct Boxes *boxes;
@@ -87,9 +88,9 @@ findClusters(PyObject *self, PyObject *args)
     
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!O!dO!O!iiO!iO!iO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, &PyArray_Type, &clusterArrayIn,
+    if (!PyArg_ParseTuple(args, "O!O!O!dO!O!iiO!iO!iO!|O", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, &PyArray_Type, &clusterArrayIn,
             &neighbourRad, &PyArray_Type, &cellDimsIn, &PyArray_Type, &PBCIn, &minClusterSize, &maxClusterSize, &PyArray_Type, &resultsIn,
-			&NScalars, &PyArray_Type, &fullScalarsIn, &NVectors, &PyArray_Type, &fullVectors))
+			&NScalars, &PyArray_Type, &fullScalarsIn, &NVectors, &PyArray_Type, &fullVectors, &spatialIndex))
         return NULL;
     
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -136,18 +137,12 @@ findClusters(PyObject *self, PyObject *args)
     
     /* box visible atoms */
     approxBoxWidth = neighbourRad;
-    boxes = setupBoxes(approxBoxWidth, PBC, cellDims);
+    boxes = boxVisibleAtoms(spatialIndex, approxBoxWidth, PBC, cellDims, pos, NVisibleIn, visibleAtoms, visiblePos);
     if (boxes == NULL)
     {
         free(visiblePos);
         return NULL;
     }
-    boxstat = putAtomsInBoxes(NVisibleIn, visiblePos, boxes);
-    if (boxstat)
-    {
-        free(visiblePos);
-        return NULL;
-    }
     
     nebRad2 = neighbourRad * neighbourRad;
     
@@ -270,9 +265,9 @@ static int findNeighbours(int index, int clusterID, int numInCluster, int* atomC
     {
         boxIndex = boxNebList[i];
         
-        for (j=0; j<boxes->boxNAtoms[boxIndex]; j++)
+        for (j = boxes->boxOffsets[boxIndex]; j < boxes->boxOffsets[boxIndex + 1]; j++)
         {
-            index2 = boxes->boxAtoms[boxIndex][j];
+            index2 = boxes->boxAtoms[j];
             
             /* skip itself or if already searched */
             if ((index == index2) || (atomCluster[index2] != -1))
@@ -7,12 +7,11 @@ The filterer object.
 """
 from __future__ import absolute_import
 from __future__ import unicode_literals
-import copy
 import time
 import logging
+import weakref
 
 import numpy as np
-import six
 from six.moves import zip
 
 from .filters import _filtering as filtering_c
@@ -21,7 +20,12 @@ from . import voronoi
 from .filters import base
 from . import filters
 from . import atomStructure
+from . import pickIndex
+from . import stageCache
+from . import visibleColumns
+from . import visibleSet
 from ..rendering import _rendering
+from ..visclibs import spatialIndex
 
 
 class Filterer(object):
@@ -61,16 +65,48 @@ class Filterer(object):
         "Slice",
     ]
     
+    # state stored after each stage of the pipeline (see stageCache)
+    stageArrays = ["visibleAtoms", "interstitials", "vacancies", "antisites", "onAntisites", "splitInterstitials",
+                   "spaghettiAtoms"]
+    stageDicts = ["structureCounterDicts"]
+    stageColumns = ["scalarsDict", "latticeScalarsDict", "vectorsDict"]
+    stageLists = ["clusterList", "bubbleList"]
+    
     def __init__(self, voronoiOptions):
         self.logger = logging.getLogger(__name__)
         self.voronoiOptions = voronoiOptions
         self._driftCompensation = False
+        
+        # neighbour lists reused across the frames of a sequence (see toggleVerletLists)
+        self.verletCache = None
+        
+        # reference sites of the input atoms for the incremental point defects classification
+        self.defectSitesCache = filters.pointDefectsFilter.DefectSitesCache()
+        
+        # results of each stage, so the filters can be rerun from the first one that changed
+        self.stageCache = stageCache.StageCache()
+        self._stageLattices = None
+        
         self.reset()
     
     def toggleDriftCompensation(self, driftCompensation):
         """Toggle the drift setting."""
         self._driftCompensation = driftCompensation
     
+    def toggleVerletLists(self, enabled):
+        """
+        Toggle reusing neighbour lists (Verlet lists) across the frames this filterer is run on.
+        
+        This only pays off when running over a sequence of frames with most atoms visible,
+        so it is enabled by the sequencer and the batch runner. The lists are freed when
+        it is disabled.
+        
+        """
+        if not enabled:
+            self.verletCache = None
+        elif self.verletCache is None:
+            self.verletCache = spatialIndex.VerletCache()
+    
     def reset(self):
         """
         Reset to initial state.
@@ -97,12 +133,14 @@ class Filterer(object):
         self.structureCounterDicts = {}
         self.voronoiAtoms = voronoi.VoronoiAtomsCalculator(self.voronoiOptions)
         self.voronoiDefects = voronoi.VoronoiDefectsCalculator(self.voronoiOptions)
-        self.scalarsDict = {}
-        self.latticeScalarsDict = {}
-        self.vectorsDict = {}
+        self.scalarsDict = visibleColumns.VisibleColumns()
+        self.latticeScalarsDict = visibleColumns.VisibleColumns()
+        self.vectorsDict = visibleColumns.VisibleColumns()
         self.defectFilterSelected = False
         self.bubblesFilterSelected = False
         self.spaghettiAtoms = np.asarray([], dtype=np.int32)
+        self._pickIndex = None
+        self._visibleSet = None
     
     def runFilters(self, currentFilters, currentSettings, inputState, refState, sequencer=False):
         """
@@ -129,6 +167,11 @@ class Filterer(object):
             elif filterName == "Bubbles":
                 bubblesFilterSelected = True
         self.logger.debug("Defect filter selected: %s", defectFilterSelected)
+        
+        # read scalars used by the filters that were skipped when the input was read
+        for filterName in currentFilters:
+            if filterName.startswith("Scalar: "):
+                inputState.loadDeferredColumn(filterName[8:])
         self.defectFilterSelected = defectFilterSelected
         self.bubblesFilterSelected = bubblesFilterSelected
         
@@ -138,23 +181,29 @@ class Filterer(object):
         self.currentFilters = currentFilters
         self.currentSettings = currentSettings
         
+        # resume after the last stage that is in the cache (the keys depend on all the previous stages)
+        stageKeys = self.stageKeys(currentFilters, currentSettings, inputState, refState)
+        firstStage = len(stageKeys) if self.stageCache.enabled else 0
+        while firstStage:
+            state = self.stageCache.get(stageKeys[firstStage - 1])
+            if state is not None:
+                break
+            firstStage -= 1
+        
+        if firstStage:
+            self.logger.debug("Resuming from cached stage %d of %d", firstStage, len(stageKeys))
+            self.restoreStageState(state)
+        
         # set up visible atoms or defect arrays
-        if not defectFilterSelected:
+        elif not defectFilterSelected:
             self.logger.debug("Setting all atoms visible initially")
             self.visibleAtoms = np.arange(inputState.NAtoms, dtype=np.int32)
             self.logger.info("%d visible atoms", len(self.visibleAtoms))
             
-            # set Lattice scalars
-            self.logger.debug("Adding initial scalars from inputState")
-            for scalarsName, scalars in six.iteritems(inputState.scalarsDict):
-                self.logger.debug("  Adding '%s' scalars", scalarsName)
-                self.latticeScalarsDict[scalarsName] = copy.deepcopy(scalars)
-            
-            # set initial vectors
-            self.logger.debug("Adding initial vectors from inputState")
-            for vectorsName, vectors in six.iteritems(inputState.vectorsDict):
-                self.logger.debug("  Adding '%s' vectors", vectorsName)
-                self.vectorsDict[vectorsName] = vectors
+            # set Lattice scalars and vectors (gathered for the visible atoms when they are used)
+            self.logger.debug("Adding initial scalars and vectors from inputState")
+            self.latticeScalarsDict.addColumns(inputState.scalarsDict)
+            self.vectorsDict.addColumns(inputState.vectorsDict)
         
         else:
             # initialise defect arrays
@@ -166,58 +215,68 @@ class Filterer(object):
         
         # drift compensation
         if self._driftCompensation:
-            filtering_c.calculate_drift_vector(inputState.NAtoms, inputState.pos, refState.pos,
-                                               refState.cellDims, inputState.PBC, self.driftVector)
+            refPos = inputState.matchingPositions(refState)
+            filtering_c.calculate_drift_vector(inputState.NAtoms, inputState.pos, refPos, refState.cellDims,
+                                               inputState.PBC, self.driftVector)
             self.logger.info("Calculated drift vector: (%f, %f, %f)" % tuple(self.driftVector))
         
+        # spatial index of the input atoms, shared by the filters (built when first required)
+        inputSpatialIndex = spatialIndex.forLattice(inputState)
+        inputSpatialIndex.verletCache = self.verletCache
+        
         # run filters
         applyFiltersTime = time.time()
-        for filterName, filterSettings in zip(currentFilters, currentSettings):
-            # determine the name of filter module to be loaded
-            if filterName.startswith("Scalar: "):
-                moduleName = "genericScalarFilter"
-                filterObjectName = "GenericScalarFilter"
-            else:
-                words = str(filterName).title().split()
-                filterObjectName = "%sFilter" % "".join(words)
-                moduleName = filterObjectName[:1].lower() + filterObjectName[1:]
-            self.logger.debug("Loading filter module: '%s'", moduleName)
-            self.logger.debug("Creating filter object: '%s'", filterObjectName)
+        filterObjects = [self.createFilter(filterName) for filterName in currentFilters]
+        stage = firstStage
+        while stage < len(currentFilters):
+            # construct filter input object
+            filterInput = base.FilterInput()
+            filterInput.visibleAtoms = self.visibleAtoms
+            filterInput.inputState = inputState
+            filterInput.refState = refState
+            filterInput.voronoiOptions = self.voronoiOptions
+            filterInput.bondDict = elements.bondDict
+            filterInput.NScalars, filterInput.fullScalars = self.makeSelectionArray()
+            filterInput.voronoiAtoms = self.voronoiAtoms
+            filterInput.voronoiDefects = self.voronoiDefects
+            filterInput.driftCompensation = self._driftCompensation
+            filterInput.driftVector = self.driftVector
+            filterInput.vacancies = self.vacancies
+            filterInput.interstitials = self.interstitials
+            filterInput.splitInterstitials = self.splitInterstitials
+            filterInput.antisites = self.antisites
+            filterInput.onAntisites = self.onAntisites
+            filterInput.defectFilterSelected = defectFilterSelected
+            filterInput.spatialIndex = inputSpatialIndex
+            filterInput.defectSitesCache = self.defectSitesCache
             
-            # get module
-            filterModule = getattr(filters, moduleName)
+            # consecutive filters that only test each atom are applied together in a single pass
+            predicates = []
+            lastStage = stage
+            while lastStage < len(currentFilters) and filterObjects[lastStage] is not None:
+                predicate = filterObjects[lastStage].predicate(filterInput, currentSettings[lastStage])
+                if predicate is None:
+                    break
+                predicates.append(predicate)
+                lastStage += 1
             
-            # load dialog
-            filterObject = getattr(filterModule, filterObjectName, None)
-            if filterObject is None:
-                self.logger.error("Could not locate filter object for: '%s'", filterName)
+            if predicates:
+                filterNames = currentFilters[stage:lastStage]
+                self.logger.info("Running filter%s: '%s'", "s" if len(filterNames) > 1 else "",
+                                 "', '".join(filterNames))
+                filterObject = filters.predicateFilter.PredicateFilter("Predicate")
+                filterSettings = predicates
             
             else:
-                self.logger.info("Running filter: '%s'", filterName)
-                
-                # filter
-                filterObject = filterObject(filterName)
-                
-                # construct filter input object
-                filterInput = base.FilterInput()
-                filterInput.visibleAtoms = self.visibleAtoms
-                filterInput.inputState = inputState
-                filterInput.refState = refState
-                filterInput.voronoiOptions = self.voronoiOptions
-                filterInput.bondDict = elements.bondDict
-                filterInput.NScalars, filterInput.fullScalars = self.makeFullScalarsArray()
-                filterInput.NVectors, filterInput.fullVectors = self.makeFullVectorsArray()
-                filterInput.voronoiAtoms = self.voronoiAtoms
-                filterInput.voronoiDefects = self.voronoiDefects
-                filterInput.driftCompensation = self._driftCompensation
-                filterInput.driftVector = self.driftVector
-                filterInput.vacancies = self.vacancies
-                filterInput.interstitials = self.interstitials
-                filterInput.splitInterstitials = self.splitInterstitials
-                filterInput.antisites = self.antisites
-                filterInput.onAntisites = self.onAntisites
-                filterInput.defectFilterSelected = defectFilterSelected
-                
+                lastStage = stage + 1
+                filterObject = filterObjects[stage]
+                filterSettings = currentSettings[stage]
+                if filterObject is None:
+                    self.logger.error("Could not locate filter object for: '%s'", currentFilters[stage])
+                else:
+                    self.logger.info("Running filter: '%s'", currentFilters[stage])
+            
+            if filterObject is not None:
                 # run the filter
                 result = filterObject.apply(filterInput, filterSettings)
                 
@@ -237,12 +296,11 @@ class Filterer(object):
                 if result.hasSpaghettiAtoms():
                     self.spaghettiAtoms = result.getSpaghettiAtoms()
                 
-                # full vectors/scalars
-                self.storeFullScalarsArray(len(self.visibleAtoms), filterInput.NScalars, filterInput.fullScalars)
-                self.storeFullVectorsArray(len(self.visibleAtoms), filterInput.NVectors, filterInput.fullVectors)
+                # compact the visible scalars/vectors
+                self.storeSelectionArray(filterInput.NScalars, filterInput.fullScalars)
                 
                 # new scalars
-                self.scalarsDict.update(result.getScalars())
+                self.scalarsDict.addColumns(result.getScalars())
             
             if defectFilterSelected:
                 nint = len(self.interstitials)
@@ -253,6 +311,11 @@ class Filterer(object):
                 self.logger.info("%d visible defects", num)
             else:
                 self.logger.info("%d visible atoms", len(self.visibleAtoms))
+            
+            # store the result of this stage (only the last of filters applied together)
+            stage = lastStage
+            if self.stageCache.enabled:
+                self.stageCache.put(stageKeys[stage - 1], self.stageState())
         
         # species counts here
         if len(self.visibleAtoms):
@@ -275,6 +338,12 @@ class Filterer(object):
         # time to apply filters
         applyFiltersTime = time.time() - applyFiltersTime
         self.logger.debug("Apply filter(s) time: %f s", applyFiltersTime)
+        self.logger.debug("Spatial index: %d built, %d reused", inputSpatialIndex.builds, inputSpatialIndex.hits)
+        if self.verletCache is not None:
+            self.logger.debug("Verlet lists: %d built, %d reused (skin %f)", self.verletCache.misses,
+                              self.verletCache.hits, self.verletCache.skin)
+        self.logger.debug("Stage cache: %d of %d stages reused (%d stages, %d bytes cached)", firstStage,
+                          len(currentFilters), len(self.stageCache), self.stageCache.size)
         
         # refresh available scalars in extra options dialog
         # self.parent.colouringOptions.refreshScalarColourOption()
@@ -283,6 +352,131 @@ class Filterer(object):
         runFiltersTime = time.time() - runFiltersTime
         self.logger.debug("Apply list total time: %f s", runFiltersTime)
     
+    def createFilter(self, filterName):
+        """
+        Return the filter object for the given filter name (None if it could not be found).
+        
+        """
+        # determine the name of filter module to be loaded
+        if filterName.startswith("Scalar: "):
+            moduleName = "genericScalarFilter"
+            filterObjectName = "GenericScalarFilter"
+        else:
+            words = str(filterName).title().split()
+            filterObjectName = "%sFilter" % "".join(words)
+            moduleName = filterObjectName[:1].lower() + filterObjectName[1:]
+        self.logger.debug("Loading filter module: '%s'", moduleName)
+        self.logger.debug("Creating filter object: '%s'", filterObjectName)
+        
+        # get module
+        filterModule = getattr(filters, moduleName)
+        
+        # load dialog
+        filterObject = getattr(filterModule, filterObjectName, None)
+        if filterObject is None:
+            return None
+        
+        return filterObject(filterName)
+    
+    def stageKeys(self, currentFilters, currentSettings, inputState, refState):
+        """
+        Return the cache keys of the stages of the pipeline.
+        
+        The key of a stage depends on the inputs of the pipeline and on the name and settings
+        of the filter and all the filters before it. The stage cache is cleared if the lattices
+        are not the ones it was filled for.
+        
+        """
+        lattices = (inputState, refState)
+        if (self._stageLattices is None or
+                any(lattice is not ref() for lattice, ref in zip(lattices, self._stageLattices))):
+            self.stageCache.clear()
+            self._stageLattices = tuple((lambda: None) if lattice is None else weakref.ref(lattice)
+                                        for lattice in lattices)
+        
+        key = (
+            tuple((lattice.NAtoms, lattice.positionsVersion, lattice.dataVersion, tuple(lattice.PBC),
+                   tuple(lattice.cellDims)) for lattice in lattices if lattice is not None),
+            tuple(sorted(inputState.scalarsDict.keys())),
+            tuple(sorted(inputState.vectorsDict.keys())),
+            self._driftCompensation,
+            "Point defects" in currentFilters,
+            self.voronoiOptions.useRadii,
+            self.voronoiOptions.faceAreaThreshold,
+            stageCache.freeze(elements.bondDict),
+        )
+        
+        stageKeys = []
+        for filterName, filterSettings in zip(currentFilters, currentSettings):
+            key = (key, filterName, filterSettings.settingsKey())
+            stageKeys.append(key)
+        
+        return stageKeys
+    
+    def stageState(self):
+        """
+        Return the current state of the filterer (copies of everything the filters modify).
+        
+        """
+        state = {}
+        for name in self.stageArrays:
+            state[name] = np.array(getattr(self, name))
+        for name in self.stageDicts:
+            state[name] = dict(getattr(self, name))
+        for name in self.stageColumns:
+            state[name] = getattr(self, name).copy()
+        for name in self.stageLists:
+            state[name] = list(getattr(self, name))
+        
+        # Voronoi calculations are only stored once they are done (they are not changed after that)
+        for name in ("voronoiAtoms", "voronoiDefects"):
+            calculator = getattr(self, name)
+            state[name] = calculator if calculator.isCalculated() else None
+        
+        return state
+    
+    def restoreStageState(self, state):
+        """
+        Restore the state of the filterer from the given stage state.
+        
+        """
+        for name in self.stageArrays:
+            setattr(self, name, np.array(state[name]))
+        for name in self.stageDicts:
+            setattr(self, name, dict(state[name]))
+        for name in self.stageColumns:
+            setattr(self, name, state[name].copy())
+        for name in self.stageLists:
+            setattr(self, name, list(state[name]))
+        for name in ("voronoiAtoms", "voronoiDefects"):
+            if state[name] is not None:
+                setattr(self, name, state[name])
+    
+    def getPickIndex(self):
+        """
+        Return the nearest neighbour index of the visible atoms and defects.
+        
+        It is built the first time it is required after the filters are run.
+        
+        """
+        if self._pickIndex is None or not self._pickIndex.isValid(self.inputState):
+            self._pickIndex = pickIndex.PickIndex(self)
+        
+        return self._pickIndex
+    
+    def getVisibleSet(self):
+        """
+        Return the bitmap of the visible atoms.
+        
+        It is built the first time it is required after the filters are run.
+        
+        """
+        if self._visibleSet is None:
+            NAtoms = 0 if self.inputState is None else self.inputState.NAtoms
+            self._visibleSet = visibleSet.VisibleSet(NAtoms, self.visibleAtoms)
+        
+        return self._visibleSet
+    
     def getBubblesIndices(self):
         """Return arrays for bubble vacancy and atom indices."""
         bubbleVacs = []
@@ -307,140 +501,38 @@ class Filterer(object):
         
         self.logger.debug("Povray atoms written in %f s (%s)", povtime, uniqueID)
     
-    def makeFullScalarsArray(self):
+    def makeSelectionArray(self):
         """
-        Combine scalars array into one big array for passing to C
+        Return the array passed to the filters as their scalars, to find which visible atoms they keep
         
-        """
-        self.logger.debug("Making full scalars array (N=%d)", len(self.scalarsDict) + len(self.latticeScalarsDict))
-        
-        scalarsList = []
-        for name, scalars in six.iteritems(self.scalarsDict):
-            self.logger.debug("  Adding '%s' scalars", name)
-            scalarsList.append(scalars)
-            if len(scalars) != len(self.visibleAtoms):
-                raise RuntimeError("Wrong length for scalars: '{0}'".format(name))
-        
-        for name, scalars in six.iteritems(self.latticeScalarsDict):
-            self.logger.debug("  Adding '%s' scalars (Lattice)", name)
-            scalarsList.append(scalars)
-            if len(scalars) != len(self.visibleAtoms):
-                raise RuntimeError("Wrong length for scalars: '{0}' (Lattice)".format(name))
-        
-        if len(scalarsList):
-            scalarsFull = np.concatenate(scalarsList)
-        else:
-            scalarsFull = np.array([], dtype=np.float64)
+        The filters compact it along with the visible atoms; the visible columns are then compacted
+        from it (see `storeSelectionArray`) rather than passing all the scalars and vectors to them.
         
-        return len(scalarsList), scalarsFull
-    
-    def makeFullVectorsArray(self):
         """
-        Combine vectors array into one big array for passing to C
+        if len(self.scalarsDict) + len(self.latticeScalarsDict) + len(self.vectorsDict):
+            return 1, np.arange(len(self.visibleAtoms), dtype=np.float64)
         
-        """
-        self.logger.debug("Making full vectors array (N=%d)", len(self.vectorsDict))
-        
-        vectorsList = []
-        for name, vectors in six.iteritems(self.vectorsDict):
-            self.logger.debug("Adding '%s' vectors", name)
-            vectorsList.append(vectors)
-            if vectors.shape != (len(self.visibleAtoms), 3):
-                raise RuntimeError("Shape wrong for vectors array '%s': %r != %r" % (name, vectors.shape,
-                                                                                     (len(self.visibleAtoms), 3)))
-        
-        if len(vectorsList):
-            vectorsFull = np.concatenate(vectorsList)
-        else:
-            vectorsFull = np.array([], dtype=np.float64)
-        
-        return len(vectorsList), vectorsFull
+        return 0, np.array([], dtype=np.float64)
     
-    def storeFullScalarsArray(self, NVisible, NScalars, scalarsFull):
+    def storeSelectionArray(self, NSelection, selection):
         """
-        Split and resize full scalars array; store in dict
-        
-        Assumes scalarsDict was not modified since we called
-        makeFullScalarsArray.
+        Compact the visible columns to the atoms that are still visible after a filter
         
         """
-        if NScalars > 0:
-            self.logger.debug("Storing full scalars array")
-            scalarsList = np.split(scalarsFull, NScalars)
-            
-            # Filterer.scalarsDict
-            keys = list(self.scalarsDict.keys())
-            lenError = False
-            for i, key in enumerate(keys):
-                self.logger.debug("Storing '%s' scalars", key)
-                scalars = scalarsList[i]
-                
-                if len(scalars) < NVisible:
-                    msg = "'%s' scalars smaller than expected (%d < %d) (this is expected in some situations); "
-                    msg += "clearing scalars list"
-                    self.logger.warning(msg, key, len(scalars), NVisible)
-                    lenError = True
-                    break
-                
-                else:
-                    scalars_cp = copy.copy(scalars)
-                    scalars_cp.resize(NVisible, refcheck=False)
-                    self.scalarsDict[key] = scalars_cp
-            
-            if lenError:
-                self.scalarsDict.clear()
-            
-            # Lattice.scalarsDict
-            offset = len(keys)
-            keys = list(self.latticeScalarsDict.keys())
-            lenError = False
-            for j, key in enumerate(keys):
-                self.logger.debug("  Storing '%s' scalars (Lattice)", key)
-                i = j + offset
-                scalars = scalarsList[i]
-                
-                if len(scalars) < NVisible:
-                    msg = "'%s' scalars smaller than expected (%d < %d) (this is expected in some situations); "
-                    msg += "clearing scalars list"
-                    self.logger.warning(msg, key, len(scalars), NVisible)
-                    lenError = True
-                    break
-                
-                else:
-                    scalars_cp = copy.copy(scalars)
-                    scalars_cp.resize(NVisible, refcheck=False)
-                    self.latticeScalarsDict[key] = scalars_cp
-            
-            if lenError:
-                self.latticeScalarsDict.clear()
-    
-    def storeFullVectorsArray(self, NVisible, NVectors, vectorsFull):
-        """
-        Split and resize full vectors array; store in dict
+        NVisible = len(self.visibleAtoms)
+        if not NSelection or NVisible == len(selection):
+            return
         
-        Assumes vectorsDict was not modified since we called
-        makeFullVectorsArray.
+        columnDicts = (self.scalarsDict, self.latticeScalarsDict, self.vectorsDict)
+        if NVisible > len(selection):
+            msg = "Visible columns smaller than expected (%d < %d) (this is expected in some situations); "
+            msg += "clearing scalars and vectors"
+            self.logger.warning(msg, len(selection), NVisible)
+            for columns in columnDicts:
+                columns.clear()
         
-        """
-        if NVectors > 0:
-            self.logger.debug("Storing full vectors array in dict")
-            vectorsList = np.split(vectorsFull, NVectors)
-            keys = list(self.vectorsDict.keys())
-            lenError = False
-            for key, vectors in zip(keys, vectorsList):
-                self.logger.debug("  Storing '%s' vectors", key)
-                
-                if len(vectors) < NVisible:
-                    msg = "'%s' vectors smaller than expected (%d < %d) (this is expected in some situations); "
-                    msg += "clearing vectors list"
-                    self.logger.warning(msg, key, len(vectors), NVisible)
-                    lenError = True
-                    break
-                
-                else:
-                    vectors_cp = copy.copy(vectors)
-                    vectors_cp.resize((NVisible, 3), refcheck=False)
-                    self.vectorsDict[key] = vectors_cp
-            
-            if lenError:
-                self.vectorsDict.clear()
+        else:
+            self.logger.debug("Compacting visible columns")
+            kept = selection[:NVisible].astype(np.int32)
+            for columns in columnDicts:
+                columns.select(kept)
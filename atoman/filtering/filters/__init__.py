@@ -11,7 +11,9 @@ from . import coordinationNumberFilter
 from . import cropBoxFilter
 from . import cropSphereFilter
 from . import displacementFilter
+from . import genericScalarFilter
 from . import pointDefectsFilter
+from . import predicateFilter
 from . import sliceFilter
 from . import slipFilter
 from . import speciesFilter
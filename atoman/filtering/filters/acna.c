@@ -41,8 +41,8 @@
 /* function prototypes */
 static PyObject* adaptiveCommonNeighbourAnalysis(PyObject*, PyObject*);
 static int compare_two_nebs(const void *, const void *);
-static int analyseAtom(int, struct NeighbourList2 *);
-static int checkForNeighbourBond(int, int, struct NeighbourList2 *, double);
+static int analyseAtom(int, struct NeighbourListCSR *);
+static int checkForNeighbourBond(int, int, struct NeighbourListCSR *, double);
 static void setNeighbourBond(unsigned int *, int, int, int);
 static int findCommonNeighbours(unsigned int *, int, unsigned int *);
 static int findNeighbourBonds(unsigned int *, unsigned int, int, unsigned int *);
@@ -85,6 +85,9 @@ static int compare_two_nebs(const void * a, const void * b)
     
     if (n1->separation < n2->separation) return -1;
     else if (n1->separation > n2->separation) return 1;
+    /* order equal separations by index, so the order does not depend on how the list was built */
+    else if (n1->index < n2->index) return -1;
+    else if (n1->index > n2->index) return 1;
     else return 0;
 }
 
@@ -106,17 +109,18 @@ adaptiveCommonNeighbourAnalysis(PyObject *self, PyObject *args)
     PyArrayObject *cellDimsIn=NULL;
     PyArrayObject *fullScalarsIn=NULL;
     PyArrayObject *fullVectors=NULL;
+    PyObject *spatialIndex=NULL;
     
-    int i, NVisible, status;
-    double *visiblePos, approxBoxWidth, maxSep2;
-    struct Boxes *boxes;
-    struct NeighbourList2 *nebList;
+    int i, NVisible;
+    double *visiblePos;
+    struct NeighbourListCSR *nebList;
     
 /* parse and check arguments from Python */
     
-    if (!PyArg_ParseTuple(args, "O!O!O!O!O!iO!dO!iO!iO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, &PyArray_Type, &scalarsIn,
+    if (!PyArg_ParseTuple(args, "O!O!O!O!O!iO!dO!iO!iO!|O", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, &PyArray_Type, &scalarsIn,
             &PyArray_Type, &cellDimsIn, &PyArray_Type, &PBCIn, &NScalars, &PyArray_Type, &fullScalarsIn, &maxBondDistance, &PyArray_Type,
-            &countersIn, &filteringEnabled, &PyArray_Type, &structureVisibilityIn, &NVectors, &PyArray_Type, &fullVectors))
+            &countersIn, &filteringEnabled, &PyArray_Type, &structureVisibilityIn, &NVectors, &PyArray_Type, &fullVectors,
+            &spatialIndex))
         return NULL;
     
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -166,27 +170,11 @@ adaptiveCommonNeighbourAnalysis(PyObject *self, PyObject *args)
         visiblePos[i3 + 2] = pos[ind3 + 2];
     }
     
-    /* box visible atoms */
-    approxBoxWidth = maxBondDistance;
-    maxSep2 = maxBondDistance * maxBondDistance;
-    boxes = setupBoxes(approxBoxWidth, PBC, cellDims);
-    if (boxes == NULL)
-    {
-        free(visiblePos);
-        return NULL;
-    }
-    status = putAtomsInBoxes(NVisibleIn, visiblePos, boxes);
-    if (status)
-    {
-        free(visiblePos);
-        return NULL;
-    }
-    
-    /* create neighbour list */
-    nebList = constructNeighbourList2(NVisibleIn, visiblePos, boxes, cellDims, PBC, maxSep2);
+    /* create neighbour list (from the Verlet list of the spatial index if there is one) */
+    nebList = visibleNeighbourList(spatialIndex, NVisibleIn, visibleAtoms, pos, visiblePos, cellDims, PBC,
+            maxBondDistance, prefs_numThreads);
     
     /* only required for building neb list */
-    freeBoxes(boxes);
     free(visiblePos);
     
     if (nebList == NULL) return NULL;
@@ -199,7 +187,8 @@ adaptiveCommonNeighbourAnalysis(PyObject *self, PyObject *args)
     /* sort neighbours by distance */
     #pragma omp parallel for num_threads(prefs_numThreads)
     for (i = 0; i < NVisibleIn; i++)
-        qsort(nebList[i].neighbour, nebList[i].neighbourCount, sizeof(struct Neighbour), compare_two_nebs);
+        qsort(nebList->neighbours + nebList->offsets[i], nebList->offsets[i + 1] - nebList->offsets[i],
+                sizeof(struct Neighbour), compare_two_nebs);
     
 /* classify atoms */
     
@@ -250,7 +239,7 @@ adaptiveCommonNeighbourAnalysis(PyObject *self, PyObject *args)
     
 /* tidy up */
     
-    freeNeighbourList2(nebList, NVisibleIn);
+    freeNeighbourListCSR(nebList);
     
     return Py_BuildValue("i", NVisible);
 }
@@ -258,15 +247,20 @@ adaptiveCommonNeighbourAnalysis(PyObject *self, PyObject *args)
 /*******************************************************************************
  ** classify atom
  *******************************************************************************/
-static int analyseAtom(int mainIndex, struct NeighbourList2 *nebList)
+static int analyseAtom(int mainIndex, struct NeighbourListCSR *nebList)
 {
-    int i, j, nn, ok, visInd1, visInd2;
+    int i, j, nn, ok, visInd1, visInd2, numNebs;
     double localScaling, localCutoff;
     double localScalingSum;
+    struct Neighbour *nebs;
+    
     
+    /* neighbours of this atom (sorted by separation) */
+    nebs = nebList->neighbours + nebList->offsets[mainIndex];
+    numNebs = nebList->offsets[mainIndex + 1] - nebList->offsets[mainIndex];
     
     /* check we have the minimum number of neighbours */
-    if (nebList[mainIndex].neighbourCount < MIN_REQUIRED_NEBS)
+    if (numNebs < MIN_REQUIRED_NEBS)
         return ATOM_STRUCTURE_DISORDERED;
     
 /* first we test for FCC, HCP, Icosohedral (12 1NN) */
@@ -275,14 +269,14 @@ static int analyseAtom(int mainIndex, struct NeighbourList2 *nebList)
     nn = 12;
     
     /* check enough nebs */
-    if (nebList[mainIndex].neighbourCount < nn)
+    if (numNebs < nn)
         return ATOM_STRUCTURE_DISORDERED;
     
     /* compute local cutoff */
     localScaling = 0.0;
     for (i = 0; i < nn; i++)
     {
-        localScaling += nebList[mainIndex].neighbour[i].separation;
+        localScaling += nebs[i].separation;
     }
     localScaling /= nn;
     localCutoff = localScaling * (1.0 + CONST_SQRT2) / 2.0;
@@ -291,7 +285,7 @@ static int analyseAtom(int mainIndex, struct NeighbourList2 *nebList)
     ok = 1;
     for (i = 0; i < nn; i++)
     {
-        if (nebList[mainIndex].neighbour[i].separation > localCutoff)
+        if (nebs[i].separation > localCutoff)
         {
             ok = 0;
             break;
@@ -308,11 +302,11 @@ static int analyseAtom(int mainIndex, struct NeighbourList2 *nebList)
         /* determine bonding between neighbours, based on local cutoff */
         for (i = 0; i < nn; i++)
         {
-            visInd1 = nebList[mainIndex].neighbour[i].index;
+            visInd1 = nebs[i].index;
             setNeighbourBond(neighbourArray, i, i, 0);
             for (j = i + 1; j < nn; j++)
             {
-                visInd2 = nebList[mainIndex].neighbour[j].index;
+                visInd2 = nebs[j].index;
                 setNeighbourBond(neighbourArray, i, j, checkForNeighbourBond(visInd1, visInd2, nebList, localCutoff));
             }
         }
@@ -360,21 +354,21 @@ static int analyseAtom(int mainIndex, struct NeighbourList2 *nebList)
     nn = 14;
     
     /* check enough nebs */
-    if (nebList[mainIndex].neighbourCount < nn)
+    if (numNebs < nn)
         return ATOM_STRUCTURE_DISORDERED;
     
     /* compute local cutoff */
     localScaling = 0.0;
     for (i = 0; i < 8; i++)
     {
-        localScaling += nebList[mainIndex].neighbour[i].separation;
+        localScaling += nebs[i].separation;
     }
     localScaling /= 8.0;
     
     localScalingSum = 0.0;
     for (i = 8; i < 14; i++)
     {
-        localScalingSum += nebList[mainIndex].neighbour[i].separation;
+        localScalingSum += nebs[i].separation;
     }
     localScalingSum /= 6.0;
     
@@ -384,7 +378,7 @@ static int analyseAtom(int mainIndex, struct NeighbourList2 *nebList)
     ok = 1;
     for (i = 0; i < nn; i++)
     {
-        if (nebList[mainIndex].neighbour[i].separation > localCutoff)
+        if (nebs[i].separation > localCutoff)
         {
             ok = 0;
             break;
@@ -400,11 +394,11 @@ static int analyseAtom(int mainIndex, struct NeighbourList2 *nebList)
         /* determine bonding between neighbours, based on local cutoff */
         for (i = 0; i < nn; i++)
         {
-            visInd1 = nebList[mainIndex].neighbour[i].index;
+            visInd1 = nebs[i].index;
             setNeighbourBond(neighbourArray, i, i, 0);
             for (j = i + 1; j < nn; j++)
             {
-                visInd2 = nebList[mainIndex].neighbour[j].index;
+                visInd2 = nebs[j].index;
                 setNeighbourBond(neighbourArray, i, j, checkForNeighbourBond(visInd1, visInd2, nebList, localCutoff));
             }
         }
@@ -594,15 +588,15 @@ static int findCommonNeighbours(unsigned int *neighbourArray, int neighbourIndex
 /*******************************************************************************
  ** check if two neighbours are bonded
  *******************************************************************************/
-static int checkForNeighbourBond(int visInd1, int visInd2, struct NeighbourList2 *nebList, double cutoff)
+static int checkForNeighbourBond(int visInd1, int visInd2, struct NeighbourListCSR *nebList, double cutoff)
 {
     int i, bonded;
     
     
     bonded = 0;
-    for (i = 0; i < nebList[visInd1].neighbourCount; i++)
+    for (i = nebList->offsets[visInd1]; i < nebList->offsets[visInd1 + 1]; i++)
     {
-        if (nebList[visInd1].neighbour[i].index == visInd2 && nebList[visInd1].neighbour[i].separation <= cutoff)
+        if (nebList->neighbours[i].index == visInd2 && nebList->neighbours[i].separation <= cutoff)
         {
             bonded = 1;
             break;
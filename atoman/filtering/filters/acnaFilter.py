@@ -82,7 +82,8 @@ class AcnaFilter(base.BaseFilter):
         # call C library
         NVisible = _acna.adaptiveCommonNeighbourAnalysis(visibleAtoms, inputState.pos, scalars, inputState.cellDims,
                                                          pbc, NScalars, fullScalars, maxBondDistance, counters,
-                                                         filteringEnabled, structureVisibility, NVectors, fullVectors)
+                                                         filteringEnabled, structureVisibility, NVectors, fullVectors,
+                                                         filterInput.spatialIndex)
         
         # result
         result = base.FilterResult()
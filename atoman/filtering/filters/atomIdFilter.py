@@ -18,6 +18,7 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 from . import base
 from . import _filtering
+from . import predicateFilter
 
 import numpy as np
 
@@ -38,6 +39,44 @@ class AtomIdFilter(base.BaseFilter):
     The Atom ID filter.
     
     """
+    def parseRanges(self, text):
+        """Return the (min, max) ranges of atom IDs in the text."""
+        array = [val for val in text.split(",") if val]
+        num = len(array)
+        rangeArray = np.empty((num, 2), np.int32)
+        for i, item in enumerate(array):
+            if "-" in item:
+                values = [val for val in item.split("-") if val]
+                minval = int(values[0])
+                if len(values) == 1:
+                    maxval = minval
+                else:
+                    maxval = int(values[1])
+            else:
+                minval = maxval = int(item)
+            
+            self.logger.debug("  %d: %d -> %d", i, minval, maxval)
+            rangeArray[i][0] = minval
+            rangeArray[i][1] = maxval
+        
+        return rangeArray
+    
+    def predicate(self, filterInput, settings):
+        """Return the per atom test of the filter."""
+        if filterInput.defectFilterSelected:
+            return None
+        
+        text = settings.getSetting("filterString")
+        if not text:
+            # no visible atoms if input string was empty
+            self.logger.warning("No visible atoms specified in AtomID filter")
+            rangeArray = np.empty((0, 2), np.int32)
+        else:
+            rangeArray = self.parseRanges(text)
+        
+        return predicateFilter.makePredicate(predicateFilter.ATOM_ID, filterInput.inputState.atomID,
+                                             iparams=rangeArray.ravel())
+    
     def apply(self, filterInput, settings):
         """Apply the atom ID filter."""
         # unpack inputs
@@ -59,23 +98,7 @@ class AtomIdFilter(base.BaseFilter):
         
         else:
             # parse text
-            array = [val for val in text.split(",") if val]
-            num = len(array)
-            rangeArray = np.empty((num, 2), np.int32)
-            for i, item in enumerate(array):
-                if "-" in item:
-                    values = [val for val in item.split("-") if val]
-                    minval = int(values[0])
-                    if len(values) == 1:
-                        maxval = minval
-                    else:
-                        maxval = int(values[1])
-                else:
-                    minval = maxval = int(item)
-            
-                self.logger.debug("  %d: %d -> %d", i, minval, maxval)
-                rangeArray[i][0] = minval
-                rangeArray[i][1] = maxval
+            rangeArray = self.parseRanges(text)
         
             # run displacement filter
             NVisible = _filtering.atomIndexFilter(visibleAtoms, inputState.atomID, rangeArray, 
@@ -11,6 +11,8 @@ import logging
 import numpy as np
 from six import string_types
 
+from .. import stageCache
+
 
 class FilterResult(object):
     """
@@ -120,6 +122,8 @@ class FilterInput(object):
         self.antisites = np.empty(0, np.float64)
         self.onAntisites = np.empty(0, np.float64)
         self.defectFilterSelected = False
+        self.spatialIndex = None
+        self.defectSitesCache = None
 
 
 class BaseSettings(object):
@@ -175,6 +179,10 @@ class BaseSettings(object):
         value = self._settings[name]
         
         return value
+    
+    def settingsKey(self):
+        """Return a hashable key of the current values of the settings."""
+        return stageCache.freeze(self._settings)
 
 
 class BaseFilter(object):
@@ -195,3 +203,14 @@ class BaseFilter(object):
     
     def apply(self, *args, **kwargs):
         raise NotImplementedError("apply method not implemented")
+    
+    def predicate(self, filterInput, settings):
+        """
+        Return the per atom test of the filter, or None if the filter cannot be applied as one.
+        
+        Filters that only test each visible atom independently (cropping, species, ...) return
+        a tuple (see `predicateFilter`), so that consecutive filters of this kind can be applied
+        in a single pass over the visible atoms.
+        
+        """
+        return None
@@ -111,7 +111,8 @@ class BondOrderFilter(base.BaseFilter):
         # call C lib
         NVisible = _bond_order.bondOrderFilter(visibleAtoms, inputState.pos, maxBondDistance, scalarsQ4, scalarsQ6,
                                                inputState.cellDims, inputState.PBC, NScalars, fullScalars, filterQ4Enabled,
-                                               minQ4, maxQ4, filterQ6Enabled, minQ6, maxQ6, NVectors, fullVectors)
+                                               minQ4, maxQ4, filterQ6Enabled, minQ6, maxQ6, NVectors, fullVectors,
+                                               filterInput.spatialIndex)
         
         # resize visible atoms and scalars
         visibleAtoms.resize(NVisible, refcheck=False)
@@ -46,7 +46,7 @@ struct AtomStructureResults
 static PyObject* bondOrderFilter(PyObject*, PyObject*);
 static void Ylm(int, int, double, double, double*, double*);
 static void convertToSphericalCoordinates(double, double, double, double, double*, double*);
-static void complex_qlm(int, int*, struct NeighbourList*, double*, double*, int*, struct AtomStructureResults*);
+static void complex_qlm(int, int*, struct NeighbourListCSR*, double*, double*, int*, struct AtomStructureResults*);
 static void calculate_Q(int, struct AtomStructureResults*);
 
 const double factorials[] = {1.0, 1.0, 2.0, 6.0, 24.0, 120.0, 720.0, 5040.0, 40320.0, 362880.0, 3628800.0, 39916800.0, 479001600.0};
@@ -158,7 +158,7 @@ static void convertToSphericalCoordinates(double xdiff, double ydiff, double zdi
 /*******************************************************************************
  ** Compute complex q_lm (sum over eq. 3 from Stukowski paper), for each atom
  *******************************************************************************/
-static void complex_qlm(int NVisibleIn, int *visibleAtoms, struct NeighbourList *nebList, double *pos, double *cellDims,
+static void complex_qlm(int NVisibleIn, int *visibleAtoms, struct NeighbourListCSR *nebList, double *pos, double *cellDims,
         int *PBC, struct AtomStructureResults *results)
 {
     int visIndex;
@@ -168,8 +168,9 @@ static void complex_qlm(int NVisibleIn, int *visibleAtoms, struct NeighbourList
     #pragma omp parallel for num_threads(prefs_numThreads)
     for (visIndex = 0; visIndex < NVisibleIn; visIndex++)
     {
-        int index, m;
+        int index, m, numNebs;
         double xpos1, ypos1, zpos1;
+        struct Neighbour *nebs;
 
         /* atom 1 position */
         index = visibleAtoms[visIndex];
@@ -177,6 +178,10 @@ static void complex_qlm(int NVisibleIn, int *visibleAtoms, struct NeighbourList
         ypos1 = pos[3*index+1];
         zpos1 = pos[3*index+2];
 
+        /* neighbours of atom 1 */
+        nebs = nebList->neighbours + nebList->offsets[visIndex];
+        numNebs = nebList->offsets[visIndex + 1] - nebList->offsets[visIndex];
+
         /* loop over m, l = 6 */
         for (m = -6; m < 7; m++)
         {
@@ -186,14 +191,14 @@ static void complex_qlm(int NVisibleIn, int *visibleAtoms, struct NeighbourList
             /* loop over neighbours */
             real_part = 0.0;
             img_part = 0.0;
-            for (i = 0; i < nebList[visIndex].neighbourCount; i++)
+            for (i = 0; i < numNebs; i++)
             {
                 int visIndex2, index2;
                 double xpos2, ypos2, zpos2, sepVec[3];
                 double theta, phi, realYlm, complexYlm;
 
                 /* atom 2 position */
-                visIndex2 = nebList[visIndex].neighbour[i];
+                visIndex2 = nebs[i].index;
                 index2 = visibleAtoms[visIndex2];
                 xpos2 = pos[3*index2];
                 ypos2 = pos[3*index2+1];
@@ -203,7 +208,7 @@ static void complex_qlm(int NVisibleIn, int *visibleAtoms, struct NeighbourList
                 atomSeparationVector(sepVec, xpos1, ypos1, zpos1, xpos2, ypos2, zpos2, cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
 
                 /* convert to spherical coordinates */
-                convertToSphericalCoordinates(sepVec[0], sepVec[1], sepVec[2], nebList[visIndex].neighbourSep[i], &phi, &theta);
+                convertToSphericalCoordinates(sepVec[0], sepVec[1], sepVec[2], nebs[i].separation, &phi, &theta);
 
                 /* calculate Ylm */
                 if (m < 0)
@@ -223,8 +228,8 @@ static void complex_qlm(int NVisibleIn, int *visibleAtoms, struct NeighbourList
             }
 
             /* divide by number of neighbours */
-            results[visIndex].realQ6[m+6] = real_part / ((double) nebList[visIndex].neighbourCount);
-            results[visIndex].imgQ6[m+6] = img_part / ((double) nebList[visIndex].neighbourCount);
+            results[visIndex].realQ6[m+6] = real_part / ((double) numNebs);
+            results[visIndex].imgQ6[m+6] = img_part / ((double) numNebs);
         }
 
         /* loop over m, l = 4 */
@@ -236,14 +241,14 @@ static void complex_qlm(int NVisibleIn, int *visibleAtoms, struct NeighbourList
             /* loop over neighbours */
             real_part = 0.0;
             img_part = 0.0;
-            for (i = 0; i < nebList[visIndex].neighbourCount; i++)
+            for (i = 0; i < numNebs; i++)
             {
                 int visIndex2, index2;
                 double xpos2, ypos2, zpos2, sepVec[3];
                 double theta, phi, realYlm, complexYlm;
 
                 /* atom 2  position */
-                visIndex2 = nebList[visIndex].neighbour[i];
+                visIndex2 = nebs[i].index;
                 index2 = visibleAtoms[visIndex2];
                 xpos2 = pos[3*index2];
                 ypos2 = pos[3*index2+1];
@@ -253,7 +258,7 @@ static void complex_qlm(int NVisibleIn, int *visibleAtoms, struct NeighbourList
                 atomSeparationVector(sepVec, xpos1, ypos1, zpos1, xpos2, ypos2, zpos2, cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
 
                 /* convert to spherical coordinates */
-                convertToSphericalCoordinates(sepVec[0], sepVec[1], sepVec[2], nebList[visIndex].neighbourSep[i], &phi, &theta);
+                convertToSphericalCoordinates(sepVec[0], sepVec[1], sepVec[2], nebs[i].separation, &phi, &theta);
 
                 /* calculate Ylm */
                 if (m < 0)
@@ -273,8 +278,8 @@ static void complex_qlm(int NVisibleIn, int *visibleAtoms, struct NeighbourList
             }
 
             /* divide by number of neighbours */
-            results[visIndex].realQ4[m+4] = real_part / ((double) nebList[visIndex].neighbourCount);
-            results[visIndex].imgQ4[m+4] = img_part / ((double) nebList[visIndex].neighbourCount);
+            results[visIndex].realQ4[m+4] = real_part / ((double) numNebs);
+            results[visIndex].imgQ4[m+4] = img_part / ((double) numNebs);
         }
     }
 }
@@ -346,18 +351,18 @@ bondOrderFilter(PyObject *self, PyObject *args)
     PyArrayObject *cellDimsIn=NULL;
     PyArrayObject *fullScalarsIn=NULL;
     PyArrayObject *fullVectors=NULL;
+    PyObject *spatialIndex=NULL;
 
-    int i, NVisible, boxstat;
-    double *visiblePos, maxSep2;
-    struct Boxes *boxes;
-    struct NeighbourList *nebList;
+    int i, NVisible;
+    double *visiblePos;
+    struct NeighbourListCSR *nebList;
     struct AtomStructureResults *results;
 
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!dO!O!O!O!iO!iddiddiO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, &maxBondDistance,
+    if (!PyArg_ParseTuple(args, "O!O!dO!O!O!O!iO!iddiddiO!|O", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, &maxBondDistance,
             &PyArray_Type, &scalarsQ4In, &PyArray_Type, &scalarsQ6In, &PyArray_Type, &cellDimsIn, &PyArray_Type, &PBCIn, &NScalars,
             &PyArray_Type, &fullScalarsIn, &filterQ4Enabled, &minQ4, &maxQ4, &filterQ6Enabled, &minQ6, &maxQ6, &NVectors,
-            &PyArray_Type, &fullVectors))
+            &PyArray_Type, &fullVectors, &spatialIndex))
         return NULL;
 
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -401,27 +406,12 @@ bondOrderFilter(PyObject *self, PyObject *args)
         visiblePos[i3 + 2] = pos[ind3 + 2];
     }
 
-    /* box visible atoms */
-    boxes = setupBoxes(maxBondDistance, PBC, cellDims);
-    if (boxes == NULL)
-    {
-        free(visiblePos);
-        return NULL;
-    }
-    boxstat = putAtomsInBoxes(NVisibleIn, visiblePos, boxes);
-    if (boxstat)
-    {
-        free(visiblePos);
-        return NULL;
-    }
-
-    /* build neighbour list */
-    maxSep2 = maxBondDistance * maxBondDistance;
-    nebList = constructNeighbourList(NVisibleIn, visiblePos, boxes, cellDims, PBC, maxSep2);
+    /* build neighbour list (from the Verlet list of the spatial index if there is one) */
+    nebList = visibleNeighbourList(spatialIndex, NVisibleIn, visibleAtoms, pos, visiblePos, cellDims, PBC,
+            maxBondDistance, prefs_numThreads);
 
     /* only required for building neb list */
     free(visiblePos);
-    freeBoxes(boxes);
 
     /* return if failed to build the neighbour list */
     if (nebList == NULL) return NULL;
@@ -431,7 +421,7 @@ bondOrderFilter(PyObject *self, PyObject *args)
     if (results == NULL)
     {
         PyErr_SetString(PyExc_MemoryError, "Could not allocate results");
-        freeNeighbourList(nebList, NVisibleIn);
+        freeNeighbourListCSR(nebList);
         return NULL;
     }
 
@@ -439,7 +429,7 @@ bondOrderFilter(PyObject *self, PyObject *args)
     complex_qlm(NVisibleIn, visibleAtoms, nebList, pos, cellDims, PBC, results);
 
     /* free neighbour list */
-    freeNeighbourList(nebList, NVisibleIn);
+    freeNeighbourListCSR(nebList);
 
     /* calculate Q4 and Q6 */
     calculate_Q(NVisibleIn, results);
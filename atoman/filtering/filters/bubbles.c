@@ -938,9 +938,9 @@ static int findDefectNeighbours(int index, int clusterID, int numInCluster, int*
     {
         boxIndex = boxNebList[i];
         
-        for (j=0; j<boxes->boxNAtoms[boxIndex]; j++)
+        for (j = boxes->boxOffsets[boxIndex]; j < boxes->boxOffsets[boxIndex + 1]; j++)
         {
-            index2 = boxes->boxAtoms[boxIndex][j];
+            index2 = boxes->boxAtoms[j];
             
             /* skip itself or if already searched */
             if ((index == index2) || (atomCluster[index2] != -1)) continue;
@@ -1436,13 +1436,13 @@ classifyVacsAndInts(double vacancyRadius, int NAtoms, double *pos, int refNAtoms
             checkBox = boxNebList[j];
 
             /* loop over all input atoms in the box */
-            for (k = 0; k < boxes->boxNAtoms[checkBox]; k++)
+            for (k = boxes->boxOffsets[checkBox]; k < boxes->boxOffsets[checkBox + 1]; k++)
             {
                 int index, index3;
                 double xpos, ypos, zpos, sep2;
 
                 /* index of this input atom */
-                index = boxes->boxAtoms[checkBox][k];
+                index = boxes->boxAtoms[k];
 
                 /* skip if a bubble atom */
                 if (bubbleAtomMask[index]) continue;
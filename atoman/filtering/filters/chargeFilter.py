@@ -20,6 +20,7 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 from . import base
 from . import _filtering
+from . import predicateFilter
 
 
 class ChargeFilterSettings(base.BaseSettings):
@@ -39,6 +40,15 @@ class ChargeFilter(base.BaseFilter):
     The charge filter.
     
     """
+    def predicate(self, filterInput, settings):
+        """Return the per atom test of the filter."""
+        if filterInput.defectFilterSelected:
+            return None
+        
+        params = [settings.getSetting("minCharge"), settings.getSetting("maxCharge")]
+        
+        return predicateFilter.makePredicate(predicateFilter.CHARGE, filterInput.inputState.charge, params)
+    
     def apply(self, filterInput, settings):
         """Apply the charge filter."""
         # unpack inputs
@@ -131,7 +131,8 @@ class ClusterFilter(base.BaseFilter):
         
         # call C lib
         _clusters.findClusters(visibleAtoms, lattice.pos, atomCluster, nebRad, lattice.cellDims, PBC,
-                               minSize, maxSize, result, NScalars, fullScalars, NVectors, fullVectors)
+                               minSize, maxSize, result, NScalars, fullScalars, NVectors, fullVectors,
+                               filterInput.spatialIndex)
         
         NVisible = result[0]
         NClusters = result[1]
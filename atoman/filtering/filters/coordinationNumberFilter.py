@@ -97,7 +97,8 @@ class CoordinationNumberFilter(base.BaseFilter):
         # run filter
         NVisible = _filtering.coordNumFilter(visibleAtoms, inputState.pos, inputState.specie, NSpecies, bondMinArray, bondMaxArray,
                                              maxBond, inputState.cellDims, inputState.PBC, scalars, minCoordNum, maxCoordNum,
-                                             NScalars, fullScalars, filteringEnabled, NVectors, fullVectors)
+                                             NScalars, fullScalars, filteringEnabled, NVectors, fullVectors,
+                                             filterInput.spatialIndex)
         
         # resize visible atoms and scalars
         visibleAtoms.resize(NVisible, refcheck=False)
@@ -10,6 +10,7 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 from . import base
 from . import _filtering
+from . import predicateFilter
 
 
 class CropBoxFilterSettings(base.BaseSettings):
@@ -37,6 +38,17 @@ class CropBoxFilter(base.BaseFilter):
     Crop box filter.
     
     """
+    def predicate(self, filterInput, settings):
+        """Return the per atom test of the filter (defects are cropped separately)."""
+        if filterInput.defectFilterSelected:
+            return None
+        
+        params = [settings.getSetting(name) for name in ("xmin", "xmax", "ymin", "ymax", "zmin", "zmax")]
+        iparams = [int(settings.getSetting(name)) for name in ("xEnabled", "yEnabled", "zEnabled",
+                                                               "invertSelection")]
+        
+        return predicateFilter.makePredicate(predicateFilter.CROP_BOX, filterInput.inputState.pos, params, iparams)
+    
     def apply(self, filterInput, settings):
         """Apply the filter."""
         # unpack inputs
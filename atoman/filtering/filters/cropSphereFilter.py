@@ -30,6 +30,7 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 from . import base
 from . import _filtering
+from . import predicateFilter
 
 
 class CropSphereFilterSettings(base.BaseSettings):
@@ -52,6 +53,18 @@ class CropSphereFilter(base.BaseFilter):
     Crop sphere filter.
     
     """
+    def predicate(self, filterInput, settings):
+        """Return the per atom test of the filter."""
+        if filterInput.defectFilterSelected:
+            return None
+        
+        lattice = filterInput.inputState
+        params = [settings.getSetting(name) for name in ("xCentre", "yCentre", "zCentre", "radius")]
+        params.extend(lattice.cellDims)
+        iparams = list(lattice.PBC) + [int(settings.getSetting("invertSelection"))]
+        
+        return predicateFilter.makePredicate(predicateFilter.CROP_SPHERE, lattice.pos, params, iparams)
+    
     def apply(self, filterInput, settings):
         """Apply the filter."""
         # unpack inputs
@@ -14,6 +14,40 @@
 #include "visclibs/utilities.h"
 #include "visclibs/array_utils.h"
 #include "filtering/atom_structure.h"
+#include "gui/preferences.h"
+
+/* name of the capsule of reference sites for the incremental defect classification */
+#define DEFECT_SITES_CAPSULE_NAME "atoman.filtering.DefectSites"
+
+/*******************************************************************************
+ ** Sites of the reference lattice, kept across the frames of a sequence for the
+ ** incremental mode of the defect classification: the nearest input atom to
+ ** each site is only found again for the sites near atoms that have moved
+ ** more than a threshold since they were last checked
+ *******************************************************************************/
+struct DefectSites
+{
+    /* the lattices the sites were found for */
+    int NAtoms;
+    int refNAtoms;
+    double *refPos;
+    double vacancyRadius;
+    double cellDims[3];
+    int PBC[3];
+    
+    /* nearest input atom to each site (-1 if none within the vacancy radius) */
+    int *nearest;
+    
+    /* input positions when the atoms were last checked */
+    double *lastPos;
+    
+    /* boxes of the reference sites */
+    struct Boxes *refBoxes;
+    
+    /* statistics of the last classification */
+    int NChecked;
+    int NMoved;
+};
 
 #if PY_MAJOR_VERSION >= 3
     #define MOD_ERROR_VAL NULL
@@ -32,10 +66,12 @@
 #endif
 
 static PyObject* findDefects(PyObject*, PyObject*);
+static PyObject* newDefectSites(PyObject*, PyObject*);
+static PyObject* defectSitesStats(PyObject*, PyObject*);
 static int findDefectClusters(int, double *, int *, int *, struct Boxes *, double, double *, int *);
 static int findDefectNeighbours(int, int, int, int *, double *, struct Boxes *, double, double *, int *);
 static int basicDefectClassification(double, int, char *,int *, double *, int, char *, int *, double *, int *,
-        double *, int *, int *, int *, int *, int *);
+        double *, int *, int *, int *, int *, int *, PyObject *, struct DefectSites *, double);
 static int identifySplitInterstitials(int, int *, int, int *, int *, double *, double *, int *, double *, int *, double);
 static int identifySplitInterstitialsOld(int, int *, int, int *, int *, double *, double *, int *, double *, int *, double);
 static int refineDefectsUsingAcna(int, int *, int, int *, double, int *, double *, double *, double *, double *, int, int *);
@@ -48,6 +84,8 @@ static int checkVacancyACNARecursive(int, int, int *, int *, int *, struct Neigh
  *******************************************************************************/
 static struct PyMethodDef module_methods[] = {
     {"findDefects", findDefects, METH_VARARGS, "Find point defects"},
+    {"newDefectSites", newDefectSites, METH_VARARGS, "Return a new capsule of reference sites for the incremental defect classification"},
+    {"defectSitesStats", defectSitesStats, METH_VARARGS, "Return the number of sites checked and atoms moved in the last incremental classification"},
     {NULL, NULL, 0, NULL}
 };
 
@@ -67,18 +105,264 @@ MOD_INIT(_defects)
     return MOD_SUCCESS_VAL(mod);
 }
 
+/*******************************************************************************
+ ** Free the arrays of the defect sites
+ *******************************************************************************/
+static void
+clearDefectSites(struct DefectSites *sites)
+{
+    free(sites->nearest);
+    free(sites->lastPos);
+    if (sites->refBoxes != NULL) freeBoxes(sites->refBoxes);
+    sites->nearest = NULL;
+    sites->lastPos = NULL;
+    sites->refBoxes = NULL;
+    sites->refPos = NULL;
+}
+
+/*******************************************************************************
+ ** Destructor of the defect sites capsule
+ *******************************************************************************/
+static void
+deleteDefectSites(PyObject *capsule)
+{
+    struct DefectSites *sites = (struct DefectSites *) PyCapsule_GetPointer(capsule, DEFECT_SITES_CAPSULE_NAME);
+    
+    if (sites != NULL)
+    {
+        clearDefectSites(sites);
+        free(sites);
+    }
+}
+
+/*******************************************************************************
+ ** Return a new (empty) defect sites capsule
+ *******************************************************************************/
+static PyObject*
+newDefectSites(PyObject *self, PyObject *args)
+{
+    struct DefectSites *sites;
+    PyObject *capsule;
+    
+    
+    sites = calloc(1, sizeof(struct DefectSites));
+    if (sites == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate defect sites");
+        return NULL;
+    }
+    
+    capsule = PyCapsule_New(sites, DEFECT_SITES_CAPSULE_NAME, deleteDefectSites);
+    if (capsule == NULL) free(sites);
+    
+    return capsule;
+}
+
+/*******************************************************************************
+ ** Return the number of sites checked and atoms moved in the last classification
+ *******************************************************************************/
+static PyObject*
+defectSitesStats(PyObject *self, PyObject *args)
+{
+    PyObject *capsule;
+    struct DefectSites *sites;
+    
+    
+    if (!PyArg_ParseTuple(args, "O", &capsule))
+        return NULL;
+    
+    sites = (struct DefectSites *) PyCapsule_GetPointer(capsule, DEFECT_SITES_CAPSULE_NAME);
+    if (sites == NULL) return NULL;
+    
+    return Py_BuildValue("ii", sites->NChecked, sites->NMoved);
+}
+
+/*******************************************************************************
+ ** Return the nearest input atom within the vacancy radius of the reference
+ ** site, skipping atoms that are not possible interstitials (if given). Returns
+ ** -1 if there is none or -2 if the site could not be boxed.
+ *******************************************************************************/
+static int
+nearestAtomToSite(int site, double *refPos, double *pos, struct Boxes *boxes, double vacRad2, double *cellDims,
+        int *PBC, int *possibleInterstitial)
+{
+    int boxNebList[27], boxIndex, j, boxNebListSize;
+    int nearestIndex = -1;
+    int i3 = 3 * site;
+    double refxpos, refypos, refzpos;
+    double nearestSep2 = 9999.0;
+    
+    refxpos = refPos[i3    ];
+    refypos = refPos[i3 + 1];
+    refzpos = refPos[i3 + 2];
+    
+    /* get box index of this site */
+    boxIndex = boxIndexOfAtom(refxpos, refypos, refzpos, boxes);
+    if (boxIndex < 0) return -2;
+    
+    /* find neighbouring boxes */
+    boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
+    
+    /* loop over neighbouring boxes */
+    for (j = 0; j < boxNebListSize; j++)
+    {
+        int checkBox, k;
+        
+        checkBox = boxNebList[j];
+        
+        /* loop over all input atoms in the box */
+        for (k = boxes->boxOffsets[checkBox]; k < boxes->boxOffsets[checkBox + 1]; k++)
+        {
+            int index, index3;
+            double sep2;
+            
+            /* index of this input atom */
+            index = boxes->boxAtoms[k];
+            index3 = 3 * index;
+            
+            /* atomic separation of possible vacancy and possible interstitial */
+            sep2 = atomicSeparation2(pos[index3], pos[index3 + 1], pos[index3 + 2], refxpos, refypos, refzpos,
+                                     cellDims[0], cellDims[1], cellDims[2],
+                                     PBC[0], PBC[1], PBC[2]);
+            
+            /* the closest atom within the vacancy radius (that does not already belong to another site) */
+            if (sep2 < vacRad2 && sep2 < nearestSep2)
+            {
+                if (possibleInterstitial == NULL || possibleInterstitial[index])
+                {
+                    nearestSep2 = sep2;
+                    nearestIndex = index;
+                }
+            }
+        }
+    }
+    
+    return nearestIndex;
+}
+
+/*******************************************************************************
+ ** Set up the defect sites for the given lattices, if they are not already for
+ ** them. Returns 1 if they were set up (all sites must be checked), 0 if they
+ ** can be reused or -1 on error.
+ *******************************************************************************/
+static int
+setupDefectSites(struct DefectSites *sites, int NAtoms, double *pos, int refNAtoms, double *refPos,
+        double vacancyRadius, double approxBoxWidth, int *PBC, double *cellDims)
+{
+    int i;
+    
+    
+    /* check whether the sites can be reused */
+    if (sites->nearest != NULL && sites->NAtoms == NAtoms && sites->refNAtoms == refNAtoms &&
+            sites->refPos == refPos && sites->vacancyRadius == vacancyRadius)
+    {
+        int same = 1;
+        
+        for (i = 0; i < 3; i++)
+            if (sites->cellDims[i] != cellDims[i] || sites->PBC[i] != PBC[i]) same = 0;
+        
+        if (same) return 0;
+    }
+    
+    /* set up again */
+    clearDefectSites(sites);
+    sites->nearest = malloc(((refNAtoms > 0) ? refNAtoms : 1) * sizeof(int));
+    sites->lastPos = malloc(3 * ((NAtoms > 0) ? NAtoms : 1) * sizeof(double));
+    if (sites->nearest == NULL || sites->lastPos == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate defect sites");
+        clearDefectSites(sites);
+        return -1;
+    }
+    
+    sites->refBoxes = setupBoxes(approxBoxWidth, PBC, cellDims);
+    if (sites->refBoxes == NULL)
+    {
+        clearDefectSites(sites);
+        return -1;
+    }
+    if (putAtomsInBoxes(refNAtoms, refPos, sites->refBoxes))
+    {
+        /* the boxes have already been freed */
+        sites->refBoxes = NULL;
+        clearDefectSites(sites);
+        return -1;
+    }
+    
+    sites->NAtoms = NAtoms;
+    sites->refNAtoms = refNAtoms;
+    sites->refPos = refPos;
+    sites->vacancyRadius = vacancyRadius;
+    for (i = 0; i < 3; i++)
+    {
+        sites->cellDims[i] = cellDims[i];
+        sites->PBC[i] = PBC[i];
+    }
+    for (i = 0; i < 3 * NAtoms; i++) sites->lastPos[i] = pos[i];
+    
+    return 1;
+}
+
+/*******************************************************************************
+ ** Mark the reference sites within the vacancy radius of the given point
+ *******************************************************************************/
+static int
+markSitesNearPoint(double *point, struct DefectSites *sites, double vacRad2, char *checkSite)
+{
+    int boxNebList[27], boxIndex, j, boxNebListSize;
+    struct Boxes *boxes = sites->refBoxes;
+    double *refPos = sites->refPos;
+    
+    
+    boxIndex = boxIndexOfAtom(point[0], point[1], point[2], boxes);
+    if (boxIndex < 0) return 1;
+    
+    boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
+    for (j = 0; j < boxNebListSize; j++)
+    {
+        int k, checkBox = boxNebList[j];
+        
+        for (k = boxes->boxOffsets[checkBox]; k < boxes->boxOffsets[checkBox + 1]; k++)
+        {
+            int site = boxes->boxAtoms[k];
+            double sep2;
+            
+            sep2 = atomicSeparation2(point[0], point[1], point[2], refPos[3*site], refPos[3*site+1], refPos[3*site+2],
+                                     sites->cellDims[0], sites->cellDims[1], sites->cellDims[2],
+                                     sites->PBC[0], sites->PBC[1], sites->PBC[2]);
+            
+            if (sep2 < vacRad2) checkSite[site] = 1;
+        }
+    }
+    
+    return 0;
+}
+
 /*******************************************************************************
  * do the basic defect classification: vacancy/interstitial/antisite
+ * 
+ * The nearest input atom to each reference site is found in parallel. The
+ * sites are then classified in order, as if they had been done serially: if
+ * the nearest atom to a site already belongs to an earlier site, the site is
+ * checked again for the nearest atom that does not, so the result does not
+ * depend on the number of threads.
+ * 
+ * If sites are given (incremental mode) the nearest atoms are kept across
+ * calls and only found again for the sites within the vacancy radius of atoms
+ * that moved more than moveThreshold since they were last checked (the result
+ * is the same as without sites if the threshold is zero).
  *******************************************************************************/
 static int
 basicDefectClassification(double vacancyRadius, int NAtoms, char *specieList, int* specie, double *pos,
         int refNAtoms, char *specieListRef, int *specieRef, double *refPos, int *PBC, double *cellDims,
-        int *counters, int *vacancies, int *interstitials, int *antisites, int *onAntisites)
+        int *counters, int *vacancies, int *interstitials, int *antisites, int *onAntisites, PyObject *spatialIndex,
+        struct DefectSites *sites, double moveThreshold)
 {
-    int boxstat, i;
+    int boxstat, i, status, errorCount, NChecked;
     int *possibleVacancy, *possibleInterstitial;
-    int *possibleAntisite, *possibleOnAntisite;
+    int *possibleAntisite, *possibleOnAntisite, *nearest;
     int NVacancies, NInterstitials, NAntisites;
+    char *checkSite;
     double approxBoxWidth, vacRad2;
     struct Boxes *boxes;
     
@@ -88,51 +372,149 @@ basicDefectClassification(double vacancyRadius, int NAtoms, char *specieList, in
      * ie. don't want too many boxes
      */
     approxBoxWidth = (vacancyRadius > 3.0) ? vacancyRadius : 3.0;
-    
-    /* box atoms */
-    boxes = setupBoxes(approxBoxWidth, PBC, cellDims);
-    if (boxes == NULL) return 1;
-    boxstat = putAtomsInBoxes(NAtoms, pos, boxes);
-    if (boxstat) return 2;
+    vacRad2 = vacancyRadius * vacancyRadius;
     
     /* allocate local arrays for checking atoms */
-    possibleVacancy = malloc(refNAtoms * sizeof(int));
-    if (possibleVacancy == NULL)
+    possibleVacancy = malloc(((refNAtoms > 0) ? refNAtoms : 1) * sizeof(int));
+    possibleInterstitial = malloc(((NAtoms > 0) ? NAtoms : 1) * sizeof(int));
+    possibleAntisite = malloc(((refNAtoms > 0) ? refNAtoms : 1) * sizeof(int));
+    possibleOnAntisite = malloc(((refNAtoms > 0) ? refNAtoms : 1) * sizeof(int));
+    checkSite = malloc(((refNAtoms > 0) ? refNAtoms : 1) * sizeof(char));
+    nearest = (sites == NULL) ? malloc(((refNAtoms > 0) ? refNAtoms : 1) * sizeof(int)) : NULL;
+    if (possibleVacancy == NULL || possibleInterstitial == NULL || possibleAntisite == NULL ||
+            possibleOnAntisite == NULL || checkSite == NULL || (sites == NULL && nearest == NULL))
     {
-        PyErr_SetString(PyExc_MemoryError, "Could not allocate possibleVacancy");
-        freeBoxes(boxes);
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate defect classification arrays");
+        free(possibleVacancy);
+        free(possibleInterstitial);
+        free(possibleAntisite);
+        free(possibleOnAntisite);
+        free(checkSite);
+        free(nearest);
         return 3;
     }
     
-    possibleInterstitial = malloc(NAtoms * sizeof(int));
-    if (possibleInterstitial == NULL)
+    /* which sites must be checked */
+    if (sites == NULL) status = 1;
+    else status = setupDefectSites(sites, NAtoms, pos, refNAtoms, refPos, vacancyRadius, approxBoxWidth, PBC, cellDims);
+    if (status < 0)
     {
-        PyErr_SetString(PyExc_MemoryError, "Could not allocate possibleInterstitial");
-        freeBoxes(boxes);
         free(possibleVacancy);
+        free(possibleInterstitial);
+        free(possibleAntisite);
+        free(possibleOnAntisite);
+        free(checkSite);
         return 4;
     }
+    else if (status)
+    {
+        /* all sites */
+        for (i = 0; i < refNAtoms; i++) checkSite[i] = 1;
+        if (sites != NULL) sites->NMoved = NAtoms;
+    }
+    else
+    {
+        double moveThreshold2 = moveThreshold * moveThreshold;
+        char *moved;
+        
+        /* find the atoms that moved since they were last checked */
+        moved = malloc(((NAtoms > 0) ? NAtoms : 1) * sizeof(char));
+        if (moved == NULL)
+        {
+            PyErr_SetString(PyExc_MemoryError, "Could not allocate moved");
+            free(possibleVacancy);
+            free(possibleInterstitial);
+            free(possibleAntisite);
+            free(possibleOnAntisite);
+            free(checkSite);
+            return 4;
+        }
+        
+        #pragma omp parallel for num_threads(prefs_numThreads)
+        for (i = 0; i < NAtoms; i++)
+        {
+            double *last = &sites->lastPos[3 * i];
+            double sep2;
+            
+            sep2 = atomicSeparation2(pos[3*i], pos[3*i+1], pos[3*i+2], last[0], last[1], last[2],
+                                     cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
+            moved[i] = (sep2 > moveThreshold2 || (moveThreshold2 == 0.0 && (pos[3*i] != last[0] ||
+                        pos[3*i+1] != last[1] || pos[3*i+2] != last[2])));
+        }
+        
+        /* check the sites near the old and new positions of the atoms that moved */
+        for (i = 0; i < refNAtoms; i++) checkSite[i] = 0;
+        sites->NMoved = 0;
+        errorCount = 0;
+        for (i = 0; i < NAtoms; i++)
+        {
+            if (moved[i])
+            {
+                int j;
+                
+                errorCount += markSitesNearPoint(&sites->lastPos[3 * i], sites, vacRad2, checkSite);
+                errorCount += markSitesNearPoint(&pos[3 * i], sites, vacRad2, checkSite);
+                for (j = 0; j < 3; j++) sites->lastPos[3 * i + j] = pos[3 * i + j];
+                sites->NMoved++;
+            }
+        }
+        free(moved);
+        
+        if (errorCount)
+        {
+            clearDefectSites(sites);
+            free(possibleVacancy);
+            free(possibleInterstitial);
+            free(possibleAntisite);
+            free(possibleOnAntisite);
+            free(checkSite);
+            return 7;
+        }
+    }
+    if (sites != NULL) nearest = sites->nearest;
     
-    possibleAntisite = malloc(refNAtoms * sizeof(int));
-    if (possibleAntisite == NULL)
+    NChecked = 0;
+    for (i = 0; i < refNAtoms; i++) NChecked += checkSite[i];
+    if (sites != NULL) sites->NChecked = NChecked;
+    
+    /* box atoms (using the shared boxes of the spatial index if possible) */
+    boxes = getSharedBoxes(spatialIndex, approxBoxWidth, PBC, cellDims, pos);
+    if (boxes != NULL && boxes->NAtoms != NAtoms) boxes = NULL;
+    if (boxes == NULL)
     {
-        PyErr_SetString(PyExc_MemoryError, "Could not allocate possibleAntisite");
-        freeBoxes(boxes);
-        free(possibleInterstitial);
-        free(possibleVacancy);
-        return 5;
+        boxstat = 0;
+        if (PyErr_Occurred()) boxstat = 1;
+        else
+        {
+            boxes = setupBoxes(approxBoxWidth, PBC, cellDims);
+            if (boxes == NULL) boxstat = 1;
+            else if (putAtomsInBoxes(NAtoms, pos, boxes)) boxstat = 2;
+        }
+        if (boxstat)
+        {
+            if (sites != NULL) clearDefectSites(sites);
+            else free(nearest);
+            free(possibleVacancy);
+            free(possibleInterstitial);
+            free(possibleAntisite);
+            free(possibleOnAntisite);
+            free(checkSite);
+            return boxstat;
+        }
     }
     
-    possibleOnAntisite = malloc(refNAtoms * sizeof(int));
-    if (possibleOnAntisite == NULL)
+    /* find the nearest input atom to each site that must be checked (in parallel) */
+    errorCount = 0;
+    #pragma omp parallel for reduction(+: errorCount) num_threads(prefs_numThreads)
+    for (i = 0; i < refNAtoms; i++)
     {
-        PyErr_SetString(PyExc_MemoryError, "Could not allocate possibleOnAntisite");
-        freeBoxes(boxes);
-        free(possibleAntisite);
-        free(possibleInterstitial);
-        free(possibleVacancy);
-        return 6;
+        if (checkSite[i])
+        {
+            nearest[i] = nearestAtomToSite(i, refPos, pos, boxes, vacRad2, cellDims, PBC, NULL);
+            if (nearest[i] == -2) errorCount++;
+        }
     }
+    free(checkSite);
     
     /* initialise arrays */
     for (i = 0; i < NAtoms; i++) possibleInterstitial[i] = 1;
@@ -142,135 +524,57 @@ basicDefectClassification(double vacancyRadius, int NAtoms, char *specieList, in
         possibleAntisite[i] = 1;
     }
     
-    vacRad2 = vacancyRadius * vacancyRadius;
-    
-    /* loop over reference sites */
-    for (i = 0; i < refNAtoms; i++)
+    /* classify the sites in order */
+    for (i = 0; i < refNAtoms && !errorCount; i++)
     {
-        int boxNebList[27], boxIndex, j, boxNebListSize;
-        int nearestIndex = -1;
-        int occupancyCount = 0;
-        int i3 = 3 * i;
-        double refxpos, refypos, refzpos;
-        double nearestSep2 = 9999.0;
-
-        refxpos = refPos[i3    ];
-        refypos = refPos[i3 + 1];
-        refzpos = refPos[i3 + 2];
-
-        /* get box index of this atom */
-        boxIndex = boxIndexOfAtom(refxpos, refypos, refzpos, boxes);
-        if (boxIndex < 0)
-        {
-            freeBoxes(boxes);
-            free(possibleAntisite);
-            free(possibleInterstitial);
-            free(possibleVacancy);
-            free(possibleOnAntisite);
-            return 7;
-        }
-
-        /* find neighbouring boxes */
-        boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
-
-//        printf("Checking site %d for occupancy (%lf, %lf, %lf)\n", i, refxpos, refypos, refzpos);
+        int nearestIndex = nearest[i];
+        
+        /* the nearest atom already belongs to an earlier site (only if the vacancy radius is very large) */
+        if (nearestIndex >= 0 && !possibleInterstitial[nearestIndex])
+            nearestIndex = nearestAtomToSite(i, refPos, pos, boxes, vacRad2, cellDims, PBC, possibleInterstitial);
+        if (nearestIndex == -2) errorCount++;
         
-        /* loop over neighbouring boxes */
-        for (j = 0; j < boxNebListSize; j++)
-        {
-            int checkBox, k;
-
-            checkBox = boxNebList[j];
-
-            /* loop over all input atoms in the box */
-            for (k = 0; k < boxes->boxNAtoms[checkBox]; k++)
-            {
-                int index, index3;
-                double xpos, ypos, zpos, sep2;
-
-                /* index of this input atom */
-                index = boxes->boxAtoms[checkBox][k];
-
-                /* atom position */
-                index3 = 3 * index;
-                xpos = pos[index3    ];
-                ypos = pos[index3 + 1];
-                zpos = pos[index3 + 2];
-
-                /* atomic separation of possible vacancy and possible interstitial */
-                sep2 = atomicSeparation2(xpos, ypos, zpos, refxpos, refypos, refzpos,
-                                         cellDims[0], cellDims[1], cellDims[2],
-                                         PBC[0], PBC[1], PBC[2]);
-
-                /* if within vacancy radius, is it an antisite or normal lattice point */
-                if (sep2 < vacRad2)
-                {
-//                    printf("  Input atom %d within vac rad: sep = %lf (%lf, %lf, %lf)\n", index, sqrt(sep2), xpos, ypos, zpos);
-                    
-                    /* check whether this is the closest atom to this vacancy */
-                    if (sep2 < nearestSep2)
-                    {
-                        /* assume that the vacancy radius is chosen so that atoms cannot belong to multiple sites */
-                        //if (!possibleInterstitial[index])
-                        //{
-                        //    char errstring[256];
-                        //    sprintf(errstring, "Input atom associated with multiple reference sites (index = %d, site = %d).", index, i);
-                        //    PyErr_SetString(PyExc_RuntimeError, errstring);
-                        //    freeBoxes(boxes);
-                        //    free(possibleOnAntisite);
-                        //    free(possibleAntisite);
-                        //    free(possibleInterstitial);
-                        //    free(possibleVacancy);
-                        //    return 8;
-                        //}
-
-                        if (possibleInterstitial[index])
-                        {
-                            nearestSep2 = sep2;
-                            nearestIndex = index;
-                        }
-                    }
-                    
-                    occupancyCount++;
-                }
-            }
-        }
-
         /* classify - check the atom that was closest to this site (within the vacancy radius) */
-        if (nearestIndex != -1)
+        if (nearestIndex >= 0)
         {
             char symtemp[3], symtemp2[3];
             int comp;
             
-//            printf("Classifying site %d: nearest index = %d (sep = %lf)\n", i, nearestIndex, sqrt(nearestSep2));
-
             /* this site is filled; now we check if antisite or normal site */
             symtemp[0] = specieList[3*specie[nearestIndex]];
             symtemp[1] = specieList[3*specie[nearestIndex]+1];
             symtemp[2] = '\0';
-
+            
             symtemp2[0] = specieListRef[3*specieRef[i]];
             symtemp2[1] = specieListRef[3*specieRef[i]+1];
             symtemp2[2] = '\0';
-
+            
             comp = strcmp(symtemp, symtemp2);
             /* symbols match, so not antisite */
             if (comp == 0) possibleAntisite[i] = 0;
             /* symbols do not match => antisite */
             else possibleOnAntisite[i] = nearestIndex;
-
+            
             /* not an interstitial or vacancy */
             possibleInterstitial[nearestIndex] = 0;
             possibleVacancy[i] = 0;
-
-//            if (occupancyCount > 1)
-//                printf("INFO: Occupancy for site %d = %d\n", i, occupancyCount);
         }
     }
     
     /* free box arrays */
     freeBoxes(boxes);
-
+    if (sites == NULL) free(nearest);
+    
+    if (errorCount)
+    {
+        if (sites != NULL) clearDefectSites(sites);
+        free(possibleVacancy);
+        free(possibleInterstitial);
+        free(possibleAntisite);
+        free(possibleOnAntisite);
+        return 7;
+    }
+    
     /* now classify defects */
     NVacancies = 0;
     NInterstitials = 0;
@@ -576,7 +880,7 @@ identifySplitInterstitialsOld(int NVacancies, int *vacancies, int NInterstitials
    
    /* build positions array of all defects */
    NDefects = NVacancies + NInterstitials;
-   defectPos = malloc(3 * NDefects * sizeof(double));
+   defectPos = malloc(3 * ((NDefects > 0) ? NDefects : 1) * sizeof(double));
    if (defectPos == NULL)
    {
        PyErr_SetString(PyExc_MemoryError, "Could not allocate defectPos");
@@ -627,7 +931,7 @@ identifySplitInterstitialsOld(int NVacancies, int *vacancies, int NInterstitials
    }
    
    /* number of defects per cluster */
-   NDefectsCluster = malloc(NDefects * sizeof(int));
+   NDefectsCluster = malloc(((NDefects > 0) ? NDefects : 1) * sizeof(int));
    if (NDefectsCluster == NULL)
    {
        PyErr_SetString(PyExc_MemoryError, "Could not allocate NDefectsCluster");
@@ -637,7 +941,7 @@ identifySplitInterstitialsOld(int NVacancies, int *vacancies, int NInterstitials
    }
    
    /* cluster number */
-   defectClusterSplit = malloc(NDefects * sizeof(int));
+   defectClusterSplit = malloc(((NDefects > 0) ? NDefects : 1) * sizeof(int));
    if (defectClusterSplit == NULL)
    {
        PyErr_SetString(PyExc_MemoryError, "Could not allocate defectClusterSplit");
@@ -661,13 +965,18 @@ identifySplitInterstitialsOld(int NVacancies, int *vacancies, int NInterstitials
        return 6;
    }
    
-   NDefectsCluster = realloc(NDefectsCluster, NClusters * sizeof(int));
-   if (NDefectsCluster == NULL)
+   /* shrink (realloc to zero size may return NULL, so there must be at least one cluster) */
+   if (NClusters > 0)
    {
-       PyErr_SetString(PyExc_MemoryError, "Could not reallocate NDefectsCluster");
-       free(NDefectsCluster);
-       free(defectClusterSplit);
-       return 7;
+       int *tmp = realloc(NDefectsCluster, NClusters * sizeof(int));
+       if (tmp == NULL)
+       {
+           PyErr_SetString(PyExc_MemoryError, "Could not reallocate NDefectsCluster");
+           free(NDefectsCluster);
+           free(defectClusterSplit);
+           return 7;
+       }
+       NDefectsCluster = tmp;
    }
    
    NVacNew = NVacancies;
@@ -1171,12 +1480,12 @@ refineDefectsUsingAcnaOld(int NVacancies, int *vacancies, int NInterstitials, in
             checkBox = boxNebList[j];
             
             /* now loop over all reference atoms in the box */
-            for (k = 0; k < boxes->boxNAtoms[checkBox]; k++)
+            for (k = boxes->boxOffsets[checkBox]; k < boxes->boxOffsets[checkBox + 1]; k++)
             {
                 int index, intIndex;
                 double xpos, ypos, zpos, sep2;
 
-                intIndex = boxes->boxAtoms[checkBox][k];
+                intIndex = boxes->boxAtoms[k];
                 index = interstitials[intIndex];
                 
                 /* skip if this interstitial has already been detected as lattice atom */
@@ -1301,14 +1610,17 @@ findDefects(PyObject *self, PyObject *args)
     PyArrayObject *cellDimsIn=NULL;
     PyArrayObject *driftVectorIn=NULL;
     PyArrayObject *acnaArrayIn=NULL;
+    PyObject *spatialIndex=NULL;
+    PyObject *sitesCapsule=NULL;
     
     int i, boxstat, status, defectCounters[4] = {0};
     int NDefects, NAntisites, NInterstitials, NVacancies;
     int *NDefectsCluster, *NDefectsClusterNew;
     int NClusters, NSplitInterstitials;
     int NVacNew, NIntNew, NAntNew, NSplitNew, numInCluster;
-    double approxBoxWidth, *refPos;
+    double approxBoxWidth, *refPos, moveThreshold = 0.0;
     struct Boxes *boxes;
+    struct DefectSites *sites = NULL;
 #ifdef DEBUG
     double basicTime = 0, splitTime = 0, acnaTime = 0, totalTime = 0;
     
@@ -1318,7 +1630,7 @@ findDefects(PyObject *self, PyObject *args)
 #endif
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "iiiO!O!O!O!O!O!O!iO!O!O!iO!O!O!O!O!didO!O!O!O!O!O!iiO!iiO!O!iiii", &includeVacs, &includeInts, &includeAnts,
+    if (!PyArg_ParseTuple(args, "iiiO!O!O!O!O!O!O!iO!O!O!iO!O!O!O!O!didO!O!O!O!O!O!iiO!iiO!O!iiii|OOd", &includeVacs, &includeInts, &includeAnts,
             &PyArray_Type, &NDefectsTypeIn, &PyArray_Type, &vacanciesIn, &PyArray_Type, &interstitialsIn, &PyArray_Type, &antisitesIn,
             &PyArray_Type, &onAntisitesIn, &PyArray_Type, &exclSpecInputIn, &PyArray_Type, &exclSpecRefIn, &NAtoms, &PyList_Type, 
             &specieListIn, &PyArray_Type, &specieIn, &PyArray_Type, &posIn, &refNAtoms, &PyList_Type, &specieListRefIn, &PyArray_Type, 
@@ -1326,9 +1638,17 @@ findDefects(PyObject *self, PyObject *args)
             &clusterRadius, &PyArray_Type, &defectClusterIn, &PyArray_Type, &vacSpecCountIn, &PyArray_Type, &intSpecCountIn, &PyArray_Type,
             &antSpecCountIn, &PyArray_Type, &onAntSpecCountIn, &PyArray_Type, &splitIntSpecCountIn, &minClusterSize, &maxClusterSize,
             &PyArray_Type, &splitInterstitialsIn, &identifySplits, &driftCompensation, &PyArray_Type, &driftVectorIn, &PyArray_Type,
-            &acnaArrayIn, &acnaStructureType, &filterSpecies, &identifySplitsOld, &refineAcnaOld))
+            &acnaArrayIn, &acnaStructureType, &filterSpecies, &identifySplitsOld, &refineAcnaOld,
+            &spatialIndex, &sitesCapsule, &moveThreshold))
         return NULL;
     
+    /* reference sites kept across frames (not used with drift compensation, the sites move) */
+    if (sitesCapsule != NULL && sitesCapsule != Py_None && !driftCompensation)
+    {
+        sites = (struct DefectSites *) PyCapsule_GetPointer(sitesCapsule, DEFECT_SITES_CAPSULE_NAME);
+        if (sites == NULL) return NULL;
+    }
+    
     if (not_intVector(NDefectsTypeIn)) return NULL;
     NDefectsType = pyvector_to_Cptr_int(NDefectsTypeIn);
     
@@ -1434,7 +1754,8 @@ findDefects(PyObject *self, PyObject *args)
     
     /* basic defect classification: interstitials, vacancies and antisites */
     status = basicDefectClassification(vacancyRadius, NAtoms, specieList, specie, pos, refNAtoms, specieListRef, specieRef, refPos, 
-            PBC, cellDims, defectCounters, vacancies, interstitials, antisites, onAntisites);
+            PBC, cellDims, defectCounters, vacancies, interstitials, antisites, onAntisites, spatialIndex,
+            sites, moveThreshold);
     free(specieList);
     free(specieListRef);
     if (status)
@@ -1651,7 +1972,7 @@ findDefects(PyObject *self, PyObject *args)
         
         /* build positions array of all defects */
         NDefects = NVacancies + NInterstitials + NAntisites + 3 * NSplitInterstitials;
-        defectPos = malloc(3 * NDefects * sizeof(double));
+        defectPos = malloc(3 * ((NDefects > 0) ? NDefects : 1) * sizeof(double));
         if (defectPos == NULL)
         {
             PyErr_SetString(PyExc_MemoryError, "Could not allocate defectPos");
@@ -1741,7 +2062,7 @@ findDefects(PyObject *self, PyObject *args)
         }
         
         /* number of defects per cluster */
-        NDefectsCluster = malloc(NDefects * sizeof(int));
+        NDefectsCluster = malloc(((NDefects > 0) ? NDefects : 1) * sizeof(int));
         if (NDefectsCluster == NULL)
         {
             PyErr_SetString(PyExc_MemoryError, "Could not allocate NDefectsCluster");
@@ -1764,12 +2085,18 @@ findDefects(PyObject *self, PyObject *args)
             return NULL;
         }
         
-        NDefectsCluster = realloc(NDefectsCluster, NClusters * sizeof(int));
-        if (NDefectsCluster == NULL)
+        /* shrink (realloc to zero size may return NULL, so there must be at least one cluster) */
+        if (NClusters > 0)
         {
-            PyErr_SetString(PyExc_MemoryError, "Could not reallocate NDefectsCluster");
-            if (driftCompensation) free(refPos);
-            return NULL;
+            int *tmp = realloc(NDefectsCluster, NClusters * sizeof(int));
+            if (tmp == NULL)
+            {
+                PyErr_SetString(PyExc_MemoryError, "Could not reallocate NDefectsCluster");
+                if (driftCompensation) free(refPos);
+                free(NDefectsCluster);
+                return NULL;
+            }
+            NDefectsCluster = tmp;
         }
         
         /* first we have to adjust the number of atoms in clusters containing split interstitials */
@@ -1791,7 +2118,7 @@ findDefects(PyObject *self, PyObject *args)
         }
         
         /* now limit by size */
-        NDefectsClusterNew = calloc(NClusters, sizeof(int));
+        NDefectsClusterNew = calloc((NClusters > 0) ? NClusters : 1, sizeof(int));
         if (NDefectsClusterNew == NULL)
         {
             PyErr_SetString(PyExc_MemoryError, "Could not reallocate NDefectsClusterNew");
@@ -2038,9 +2365,9 @@ static int findDefectNeighbours(int index, int clusterID, int numInCluster, int*
     {
         boxIndex = boxNebList[i];
         
-        for (j=0; j<boxes->boxNAtoms[boxIndex]; j++)
+        for (j = boxes->boxOffsets[boxIndex]; j < boxes->boxOffsets[boxIndex + 1]; j++)
         {
-            index2 = boxes->boxAtoms[boxIndex][j];
+            index2 = boxes->boxAtoms[j];
             
             /* skip itself or if already searched */
             if ((index == index2) || (atomCluster[index2] != -1)) continue;
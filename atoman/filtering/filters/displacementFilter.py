@@ -88,8 +88,11 @@ class DisplacementFilter(base.BaseFilter):
         # new scalars array
         scalars = np.zeros(len(visibleAtoms), dtype=np.float64)
         
+        # reference positions of the input atoms (the atoms may have been reordered)
+        refPos = inputState.matchingPositions(refState)
+        
         # call C library
-        NVisible = _filtering.displacementFilter(visibleAtoms, scalars, inputState.pos, refState.pos, refState.cellDims, 
+        NVisible = _filtering.displacementFilter(visibleAtoms, scalars, inputState.pos, refPos, refState.cellDims, 
                                                  inputState.PBC, minDisplacement, maxDisplacement, NScalars, fullScalars,
                                                  filteringEnabled, driftCompensation, driftVector, NVectors, fullVectors)
         
@@ -12,7 +12,9 @@
 #include <math.h>
 #include "visclibs/utilities.h"
 #include "visclibs/boxeslib.h"
+#include "visclibs/neb_list.h"
 #include "visclibs/array_utils.h"
+#include "gui/preferences.h"
 
 #if PY_MAJOR_VERSION >= 3
     #define MOD_ERROR_VAL NULL
@@ -47,6 +49,7 @@ static PyObject* slipFilter(PyObject*, PyObject*);
 static PyObject* genericScalarFilter(PyObject *, PyObject *);
 static PyObject* cropDefectsFilter(PyObject *self, PyObject *args);
 static PyObject* sliceDefectsFilter(PyObject *self, PyObject *args);
+static PyObject* predicateFilter(PyObject *self, PyObject *args);
 
 
 /*******************************************************************************
@@ -70,6 +73,7 @@ static struct PyMethodDef module_methods[] = {
     {"genericScalarFilter", genericScalarFilter, METH_VARARGS, "Generic scalar filter"},
     {"cropDefectsFilter", cropDefectsFilter, METH_VARARGS, "Crop defects filter"},
     {"sliceDefectsFilter", sliceDefectsFilter, METH_VARARGS, "Slice defects filter"},
+    {"predicateFilter", predicateFilter, METH_VARARGS, "Apply a list of predicate filters in a single pass"},
     {NULL, NULL, 0, NULL}
 };
 
@@ -1096,7 +1100,8 @@ chargeFilter(PyObject *self, PyObject *args)
  **     - fullScalars: the full list of previously calculated scalars
  **     - NVectors: the number of previously calculated vector values
  **     - fullVectors: the full list of previously calculated vectors
- **     - approxBoxWidth: the approximate size to use when decomposing the system
+ **     - approxBoxWidth: the maximum bond length (cutoff of the neighbour list)
+ **     - spatialIndex: optional spatial index of all the atoms (shared boxes and Verlet lists)
  *******************************************************************************/
 static PyObject* 
 coordNumFilter(PyObject *self, PyObject *args)
@@ -1113,16 +1118,17 @@ coordNumFilter(PyObject *self, PyObject *args)
     PyArrayObject *cellDimsIn=NULL;
     PyArrayObject *fullScalarsIn=NULL;
     PyArrayObject *fullVectors=NULL;
-    int i, count, NVisibleNew, boxstat;
+    PyObject *spatialIndex=NULL;
+    int i, count, NVisibleNew;
     double *visiblePos;
-    struct Boxes *boxes;
+    struct NeighbourListCSR *nebList;
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!O!iO!O!dO!O!O!iiiO!iiO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn,
+    if (!PyArg_ParseTuple(args, "O!O!O!iO!O!dO!O!O!iiiO!iiO!|O", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn,
             &PyArray_Type, &specieIn, &NSpecies, &PyArray_Type, &bondMinArrayIn, &PyArray_Type, &bondMaxArrayIn,
             &approxBoxWidth, &PyArray_Type, &cellDimsIn, &PyArray_Type, &PBCIn, &PyArray_Type, &coordArrayIn,
             &minCoordNum, &maxCoordNum, &NScalars, &PyArray_Type, &fullScalarsIn, &filteringEnabled, &NVectors,
-            &PyArray_Type, &fullVectors))
+            &PyArray_Type, &fullVectors, &spatialIndex))
         return NULL;
     
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -1188,89 +1194,66 @@ coordNumFilter(PyObject *self, PyObject *args)
         visiblePos[i3 + 2] = pos[ind3 + 2];
     }
     
-    /* box visible atoms */
-    boxes = setupBoxes(approxBoxWidth, PBC, cellDims);
-    if (boxes == NULL)
-    {
-        free(visiblePos);
-        return NULL;
-    }
-    boxstat = putAtomsInBoxes(NVisible, visiblePos, boxes);
+    /* neighbour list of visible atoms (from the Verlet list of the spatial index if there is one); the
+     * cutoff is slightly larger than the maximum bond length since bonds of exactly that length count */
+    nebList = visibleNeighbourList(spatialIndex, NVisible, visibleAtoms, pos, visiblePos, cellDims, PBC,
+            approxBoxWidth * (1.0 + 1e-8), prefs_numThreads);
     
     /* free visible pos */
     free(visiblePos);
     
-    /* return if there was an error during boxing */
-    if (boxstat) return NULL;
-    
-    /* initialise coord array */
-    for (i = 0; i < NVisible; i++) coordArray[i] = 0;
+    /* return if there was an error building the neighbour list */
+    if (nebList == NULL) return NULL;
     
-    /* loop over visible atoms */
+    /* count the bonds of each visible atom */
     count = 0;
+    #pragma omp parallel for reduction(+: count) num_threads(prefs_numThreads)
     for (i = 0; i < NVisible; i++)
     {
-        int j, index, speca, boxNebListSize, boxIndex, boxNebList[27];
+        int k, index, speca, numBonds;
         
         /* index and species of this atom */
         index = visibleAtoms[i];
         speca = specie[index];
         
-        /* get the box index of this atom */
-        boxIndex = boxIndexOfAtom(pos[3*index], pos[3*index+1], pos[3*index+2], boxes);
-        if (boxIndex < 0)
+        /* loop over neighbours */
+        numBonds = 0;
+        for (k = nebList->offsets[i]; k < nebList->offsets[i + 1]; k++)
         {
-            freeBoxes(boxes);
-            return NULL;
-        }
-        
-        /* find neighbouring boxes */
-        boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
-        
-        /* loop over box neighbourhood */
-        for (j = 0; j < boxNebListSize; j++)
-        {
-            int checkBox = boxNebList[j];
-            int k;
+            int specb, visIndex, index2;
+            double sep2;
+            
+            /* index of this atom */
+            visIndex = nebList->neighbours[k].index;
+            index2 = visibleAtoms[visIndex];
             
-            for (k = 0; k < boxes->boxNAtoms[checkBox]; k++)
+            /* species of the second atom */
+            specb = specie[index2];
+            
+            /* if no bond was specified for this pair we skip it */
+            if (bondMinArray[speca*NSpecies+specb] == 0.0 && bondMaxArray[speca*NSpecies+specb] == 0.0)
+                continue;
+            
+            /* atomic separation (recalculated, the bond lengths are checked with the squared separation) */
+            sep2 = atomicSeparation2(pos[3*index], pos[3*index+1], pos[3*index+2], 
+                                     pos[3*index2], pos[3*index2+1], pos[3*index2+2], 
+                                     cellDims[0], cellDims[1], cellDims[2], 
+                                     PBC[0], PBC[1], PBC[2]);
+            
+            /* check if these atoms are bonded */
+            if (sep2 >= bondMinArray[speca*NSpecies+specb] && sep2 <= bondMaxArray[speca*NSpecies+specb])
             {
-                int specb, visIndex, index2;
-                double sep2;
-
-                /* index of this atom */
-                visIndex = boxes->boxAtoms[checkBox][k];
-                index2 = visibleAtoms[visIndex];
-                
-                /* we only need to check each pair once */
-                if (index >= index2) continue;
-                
-                /* species of the second atom */
-                specb = specie[index2];
+                numBonds++;
                 
-                /* if no bond was specified for this pair we skip it */
-                if (bondMinArray[speca*NSpecies+specb] == 0.0 && bondMaxArray[speca*NSpecies+specb] == 0.0)
-                    continue;
-                
-                /* atomic separation */
-                sep2 = atomicSeparation2(pos[3*index], pos[3*index+1], pos[3*index+2], 
-                                         pos[3*index2], pos[3*index2+1], pos[3*index2+2], 
-                                         cellDims[0], cellDims[1], cellDims[2], 
-                                         PBC[0], PBC[1], PBC[2]);
-                
-                /* check if these atoms are bonded */
-                if (sep2 >= bondMinArray[speca*NSpecies+specb] && sep2 <= bondMaxArray[speca*NSpecies+specb])
-                {
-                    coordArray[i]++;
-                    coordArray[visIndex]++;
-                    count++;
-                }
+                /* we only count each pair once */
+                if (index < index2) count++;
             }
         }
+        coordArray[i] = numBonds;
     }
     
-    /* free boxes memory */
-    freeBoxes(boxes);
+    /* free neighbour list */
+    freeNeighbourListCSR(nebList);
 
     /* filter by coordination number, if required */
     if (filteringEnabled)
@@ -1714,8 +1697,8 @@ slipFilter(PyObject *self, PyObject *args)
     free(visiblePos);
     if (boxstat)
     {
+        /* the boxes are freed by putAtomsInBoxes on error */
         if (driftCompensation) free(refPos);
-        freeBoxes(boxes);
         return NULL;
     }
     
@@ -1832,11 +1815,11 @@ slipFilter(PyObject *self, PyObject *args)
             }
             
             /* loop over atoms in box */
-            for (k = 0; k < boxes->boxNAtoms[boxIndex]; k++)
+            for (k = boxes->boxOffsets[boxIndex]; k < boxes->boxOffsets[boxIndex + 1]; k++)
             {
                 int visIndex, index2;
                 
-                visIndex = boxes->boxAtoms[boxIndex][k];
+                visIndex = boxes->boxAtoms[k];
                 index2 = IIND1(visibleAtoms, visIndex);
                 
                 if (index < index2)
@@ -1963,3 +1946,305 @@ slipFilter(PyObject *self, PyObject *args)
     
     return Py_BuildValue("i", NVisible);
 }
+
+
+/*******************************************************************************
+ ** Predicate filters (must match the codes in predicateFilter.py)
+ *******************************************************************************/
+#define PREDICATE_SPECIES 0
+#define PREDICATE_CROP_BOX 1
+#define PREDICATE_CROP_SPHERE 2
+#define PREDICATE_SLICE 3
+#define PREDICATE_CHARGE 4
+#define PREDICATE_ATOM_ID 5
+#define PREDICATE_SCALAR 6
+
+struct Predicate
+{
+    int type;
+    int NParams;
+    double *params;
+    int NIParams;
+    int *iparams;
+    double *ddata;
+    int *idata;
+    double mag;
+    double normal[3];
+};
+
+/*******************************************************************************
+ ** Parse a predicate tuple (type, double params, int params, per atom data)
+ *******************************************************************************/
+static int
+parsePredicate(PyObject *item, struct Predicate *pred)
+{
+    PyArrayObject *paramsIn=NULL;
+    PyArrayObject *iparamsIn=NULL;
+    PyArrayObject *dataIn=NULL;
+    int NParams, NIParams;
+    
+    
+    if (!PyArg_ParseTuple(item, "iO!O!O!", &pred->type, &PyArray_Type, &paramsIn, &PyArray_Type, &iparamsIn,
+            &PyArray_Type, &dataIn))
+        return -1;
+    
+    if (not_doubleVector(paramsIn)) return -1;
+    pred->params = pyvector_to_Cptr_double(paramsIn);
+    pred->NParams = (int) PyArray_DIM(paramsIn, 0);
+    
+    if (not_intVector(iparamsIn)) return -1;
+    pred->iparams = pyvector_to_Cptr_int(iparamsIn);
+    pred->NIParams = (int) PyArray_DIM(iparamsIn, 0);
+    
+    /* species and atom IDs are ints, everything else is doubles */
+    pred->ddata = NULL;
+    pred->idata = NULL;
+    if (pred->type == PREDICATE_SPECIES || pred->type == PREDICATE_ATOM_ID)
+    {
+        if (not_intVector(dataIn)) return -1;
+        pred->idata = pyvector_to_Cptr_int(dataIn);
+    }
+    else
+    {
+        if (not_doubleVector(dataIn)) return -1;
+        pred->ddata = pyvector_to_Cptr_double(dataIn);
+    }
+    
+    /* check the number of parameters */
+    switch (pred->type)
+    {
+        case PREDICATE_SPECIES:
+            NParams = 0;
+            NIParams = pred->NIParams;
+            break;
+        case PREDICATE_CROP_BOX:
+            NParams = 6;
+            NIParams = 4;
+            break;
+        case PREDICATE_CROP_SPHERE:
+            NParams = 7;
+            NIParams = 4;
+            break;
+        case PREDICATE_SLICE:
+            NParams = 6;
+            NIParams = 1;
+            break;
+        case PREDICATE_CHARGE:
+        case PREDICATE_SCALAR:
+            NParams = 2;
+            NIParams = 0;
+            break;
+        case PREDICATE_ATOM_ID:
+            NParams = 0;
+            NIParams = pred->NIParams - pred->NIParams % 2;
+            break;
+        default:
+            PyErr_Format(PyExc_ValueError, "Unrecognised predicate type: %d", pred->type);
+            return -1;
+    }
+    if (pred->NParams != NParams || pred->NIParams != NIParams)
+    {
+        PyErr_Format(PyExc_ValueError, "Wrong number of parameters for predicate type %d", pred->type);
+        return -1;
+    }
+    
+    /* normalise the slice plane normal (as in sliceFilter) */
+    if (pred->type == PREDICATE_SLICE)
+    {
+        double *p = pred->params;
+        
+        pred->mag = sqrt(p[3] * p[3] + p[4] * p[4] + p[5] * p[5]);
+        pred->normal[0] = p[3] / pred->mag;
+        pred->normal[1] = p[4] / pred->mag;
+        pred->normal[2] = p[5] / pred->mag;
+    }
+    
+    return 0;
+}
+
+/*******************************************************************************
+ ** Return 1 if the atom passes the predicate (the tests are the same as in the
+ ** individual filters above)
+ *******************************************************************************/
+static int
+evaluatePredicate(struct Predicate *pred, int index)
+{
+    int j;
+    double *p = pred->params;
+    int *ip = pred->iparams;
+    
+    
+    switch (pred->type)
+    {
+        case PREDICATE_SPECIES:
+            for (j = 0; j < pred->NIParams; j++)
+                if (pred->idata[index] == ip[j]) return 1;
+            return 0;
+        
+        case PREDICATE_CROP_BOX:
+        {
+            double *r = &pred->ddata[3 * index];
+            int add = 1;
+            
+            for (j = 0; j < 3; j++)
+                if (ip[j] && (r[j] < p[2 * j] || r[j] > p[2 * j + 1])) add = 0;
+            
+            return (add && !ip[3]) || (!add && ip[3]);
+        }
+        
+        case PREDICATE_CROP_SPHERE:
+        {
+            double sep2;
+            
+            sep2 = atomicSeparation2(pred->ddata[3*index], pred->ddata[3*index+1], pred->ddata[3*index+2],
+                                     p[0], p[1], p[2], p[4], p[5], p[6], ip[0], ip[1], ip[2]);
+            
+            return (sep2 < p[3] * p[3]) ? ip[3] != 0 : ip[3] == 0;
+        }
+        
+        case PREDICATE_SLICE:
+        {
+            double xd, yd, zd, dotProd, distanceToPlane;
+            
+            xd = pred->ddata[3*index] - p[0];
+            yd = pred->ddata[3*index+1] - p[1];
+            zd = pred->ddata[3*index+2] - p[2];
+            
+            dotProd = xd * pred->normal[0] + yd * pred->normal[1] + zd * pred->normal[2];
+            distanceToPlane = dotProd / pred->mag;
+            
+            return (ip[0] && distanceToPlane > 0) || (!ip[0] && distanceToPlane < 0);
+        }
+        
+        case PREDICATE_CHARGE:
+        case PREDICATE_SCALAR:
+            return !(pred->ddata[index] < p[0] || pred->ddata[index] > p[1]);
+        
+        case PREDICATE_ATOM_ID:
+            for (j = 0; j < pred->NIParams; j += 2)
+                if (pred->idata[index] >= ip[j] && pred->idata[index] <= ip[j + 1]) return 1;
+            return 0;
+    }
+    
+    return 0;
+}
+
+/*******************************************************************************
+ ** Apply a list of predicate filters in a single pass: the predicates are
+ ** evaluated in parallel for each visible atom, then the visible atoms and the
+ ** full scalars/vectors are compacted once (each column in parallel)
+ *******************************************************************************/
+static PyObject*
+predicateFilter(PyObject *self, PyObject *args)
+{
+    int NVisibleIn, *visibleAtoms, NScalars, NVectors, NPredicates;
+    double *fullScalars;
+    char *visible;
+    struct Predicate *preds;
+    PyArrayObject *visibleAtomsIn=NULL;
+    PyObject *predicatesIn=NULL;
+    PyArrayObject *fullScalarsIn=NULL;
+    PyArrayObject *fullVectors=NULL;
+    
+    int i, NVisible;
+    
+    /* parse and check arguments from Python */
+    if (!PyArg_ParseTuple(args, "O!O!iO!iO!", &PyArray_Type, &visibleAtomsIn, &PyList_Type, &predicatesIn,
+            &NScalars, &PyArray_Type, &fullScalarsIn, &NVectors, &PyArray_Type, &fullVectors))
+        return NULL;
+    
+    if (not_intVector(visibleAtomsIn)) return NULL;
+    visibleAtoms = pyvector_to_Cptr_int(visibleAtomsIn);
+    NVisibleIn = (int) PyArray_DIM(visibleAtomsIn, 0);
+    
+    if (not_doubleVector(fullScalarsIn)) return NULL;
+    fullScalars = pyvector_to_Cptr_double(fullScalarsIn);
+    
+    if (not_doubleVector(fullVectors)) return NULL;
+    
+    /* parse the predicates */
+    NPredicates = (int) PyList_Size(predicatesIn);
+    preds = malloc((NPredicates > 0 ? NPredicates : 1) * sizeof(struct Predicate));
+    if (preds == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate predicates");
+        return NULL;
+    }
+    for (i = 0; i < NPredicates; i++)
+    {
+        if (parsePredicate(PyList_GET_ITEM(predicatesIn, i), &preds[i]))
+        {
+            free(preds);
+            return NULL;
+        }
+    }
+    
+    /* evaluate the predicates (in order, stopping at the first that fails) */
+    visible = malloc((NVisibleIn > 0 ? NVisibleIn : 1) * sizeof(char));
+    if (visible == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate visible");
+        free(preds);
+        return NULL;
+    }
+    
+    #pragma omp parallel for num_threads(prefs_numThreads)
+    for (i = 0; i < NVisibleIn; i++)
+    {
+        int j, index;
+        
+        index = visibleAtoms[i];
+        visible[i] = 1;
+        for (j = 0; j < NPredicates; j++)
+        {
+            if (!evaluatePredicate(&preds[j], index))
+            {
+                visible[i] = 0;
+                break;
+            }
+        }
+    }
+    free(preds);
+    
+    /* compact the visible atoms and each scalar/vector column */
+    NVisible = 0;
+    for (i = 0; i < NVisibleIn; i++) NVisible += visible[i];
+    
+    #pragma omp parallel for schedule(dynamic) num_threads(prefs_numThreads)
+    for (i = 0; i < 1 + NScalars + NVectors; i++)
+    {
+        int j, count;
+        
+        count = 0;
+        if (i == 0)
+        {
+            for (j = 0; j < NVisibleIn; j++)
+                if (visible[j]) visibleAtoms[count++] = visibleAtoms[j];
+        }
+        else if (i <= NScalars)
+        {
+            double *scalars = &fullScalars[NVisibleIn * (i - 1)];
+            
+            for (j = 0; j < NVisibleIn; j++)
+                if (visible[j]) scalars[count++] = scalars[j];
+        }
+        else
+        {
+            int offset = NVisibleIn * (i - 1 - NScalars);
+            
+            for (j = 0; j < NVisibleIn; j++)
+            {
+                if (visible[j])
+                {
+                    DIND2(fullVectors, offset + count, 0) = DIND2(fullVectors, offset + j, 0);
+                    DIND2(fullVectors, offset + count, 1) = DIND2(fullVectors, offset + j, 1);
+                    DIND2(fullVectors, offset + count, 2) = DIND2(fullVectors, offset + j, 2);
+                    count++;
+                }
+            }
+        }
+    }
+    free(visible);
+    
+    return Py_BuildValue("i", NVisible);
+}
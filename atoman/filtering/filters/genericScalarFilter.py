@@ -8,6 +8,7 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 from . import base
 from . import _filtering
+from . import predicateFilter
 
 
 class GenericScalarFilterSettings(base.BaseSettings):
@@ -28,6 +29,16 @@ class GenericScalarFilter(base.BaseFilter):
     Generic scalar filter.
     
     """
+    def predicate(self, filterInput, settings):
+        """Return the per atom test of the filter."""
+        if filterInput.defectFilterSelected:
+            return None
+        
+        scalarsArray = filterInput.inputState.scalarsDict[settings.getSetting("scalarsName")]
+        params = [settings.getSetting("minVal"), settings.getSetting("maxVal")]
+        
+        return predicateFilter.makePredicate(predicateFilter.SCALAR, scalarsArray, params)
+    
     def apply(self, filterInput, settings):
         """Apply the filter."""
         # unpack inputs
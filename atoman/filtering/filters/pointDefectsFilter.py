@@ -29,6 +29,11 @@ use of a fixed vacancy radius does not always work well by itself.
     
     Render spaghetti
         Render spaghetti as described in [1]_.
+    
+    Incremental
+        When filtering a sequence, keep the reference site of each input atom from the previous frame and only
+        check the sites near atoms that have moved more than the threshold since they were last checked. With a
+        threshold of zero the result is the same as checking every site. Not used with drift compensation.
 
 .. [1] A. F. Calder et al. *Philos. Mag.* **90** (2010) 863-884;
        `doi: 10.1080/14786430903117141 <http://dx.doi.org/10.1080/14786430903117141>`_.
@@ -36,6 +41,9 @@ use of a fixed vacancy radius does not always work well by itself.
 """
 from __future__ import absolute_import
 from __future__ import unicode_literals
+import logging
+import weakref
+
 import numpy as np
 
 from . import base
@@ -85,12 +93,64 @@ class PointDefectsFilterSettings(base.BaseSettings):
         self.registerSetting("bondThicknessPOV", default=0.4)
         self.registerSetting("bondNumSides", default=5)
         self.registerSetting("drawSpaghetti", default=False)
+        self.registerSetting("incremental", default=False)
+        self.registerSetting("incrementalThreshold", default=0.0)
         
         # old methods for calculating certain things
         self.registerSetting("splitIntsOld", default=False)
         self.registerSetting("acnaOld", default=False)
 
 
+class DefectSitesCache(object):
+    """
+    Reference sites of the input atoms kept across the frames of a sequence (it belongs to
+    the Filterer), for the incremental defect classification.
+    
+    """
+    def __init__(self):
+        self.logger = logging.getLogger(__name__ + ".DefectSitesCache")
+        
+        # (capsule, reference lattice, reference positions version, reference positions, atom IDs) by vacancy radius
+        self._entries = {}
+        
+        # statistics of the last classification
+        self.checked = 0
+        self.moved = 0
+    
+    def clear(self):
+        """
+        Remove the reference sites.
+        
+        """
+        self._entries = {}
+    
+    def sites(self, inputLattice, refLattice, vacancyRadius):
+        """
+        Return the reference sites (in a capsule) for the given lattices, new ones if the
+        reference lattice or the input atoms have changed.
+        
+        """
+        key = float(vacancyRadius)
+        entry = self._entries.get(key)
+        if (entry is not None and entry[1]() is refLattice and entry[2] == refLattice.positionsVersion and
+                entry[3] is refLattice.pos and np.array_equal(entry[4], inputLattice.atomID)):
+            return entry[0]
+        
+        self.logger.debug("New reference sites: vacancy radius %f (%d sites)", key, refLattice.NAtoms)
+        capsule = _defects.newDefectSites()
+        self._entries[key] = (capsule, weakref.ref(refLattice), refLattice.positionsVersion, refLattice.pos,
+                              np.array(inputLattice.atomID))
+        
+        return capsule
+    
+    def updateStats(self, capsule):
+        """
+        Store the number of sites checked and atoms moved in the last classification.
+        
+        """
+        self.checked, self.moved = _defects.defectSitesStats(capsule)
+
+
 class PointDefectsFilter(base.BaseFilter):
     """
     Point defects filter.
@@ -191,6 +251,11 @@ class PointDefectsFilter(base.BaseFilter):
         splitOld = settings.getSetting("splitIntsOld")
         acnaOld = settings.getSetting("acnaOld")
         
+        # reference sites from the previous frame
+        sites = None
+        if settings.getSetting("incremental") and not driftCompensation and filterInput.defectSitesCache is not None:
+            sites = filterInput.defectSitesCache.sites(inputLattice, refLattice, vacancyRadius)
+        
         # call C library
         self.logger.debug("Calling C library")
         _defects.findDefects(showVacancies, showInterstitials, showAntisites, NDefectsByType, vacancies, interstitials,
@@ -200,7 +265,13 @@ class PointDefectsFilter(base.BaseFilter):
                              inputLattice.PBC, vacancyRadius, findClusters, neighbourRadius, defectCluster,
                              vacSpecCount, intSpecCount, antSpecCount, onAntSpecCount, splitIntSpecCount,
                              minClusterSize, maxClusterSize, splitInterstitials, identifySplitInts, driftCompensation,
-                             driftVector, acnaArray, acnaStructureType, int(filterSpecies), int(splitOld), int(acnaOld))
+                             driftVector, acnaArray, acnaStructureType, int(filterSpecies), int(splitOld), int(acnaOld),
+                             filterInput.spatialIndex, sites, settings.getSetting("incrementalThreshold"))
+        
+        if sites is not None:
+            filterInput.defectSitesCache.updateStats(sites)
+            self.logger.debug("Incremental classification: %d sites checked, %d atoms moved",
+                              filterInput.defectSitesCache.checked, filterInput.defectSitesCache.moved)
         
         # summarise
         NDef = NDefectsByType[0]
@@ -0,0 +1,65 @@
+"""
+Apply a run of consecutive predicate filters in a single pass.
+
+A predicate filter keeps or removes each visible atom depending only on that atom (species,
+crop box, crop sphere, slice, charge, atom ID and scalar filters). The Filterer collects the
+predicates of consecutive filters of this kind and applies them all at once: the predicates
+are evaluated in parallel and the visible atoms, scalars and vectors are compacted once. The
+result is identical to applying the filters one after the other.
+
+A predicate is a tuple (type, double parameters, int parameters, per atom data).
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import numpy as np
+
+from . import base
+from . import _filtering
+
+
+# predicate types (must match the codes in filtering.c)
+SPECIES = 0
+CROP_BOX = 1
+CROP_SPHERE = 2
+SLICE = 3
+CHARGE = 4
+ATOM_ID = 5
+SCALAR = 6
+
+
+def makePredicate(predicateType, data, params=(), iparams=()):
+    """
+    Return a predicate tuple of the given type, per atom data and parameters.
+    
+    """
+    return (predicateType, np.asarray(params, dtype=np.float64), np.asarray(iparams, dtype=np.int32), data)
+
+
+class PredicateFilter(base.BaseFilter):
+    """
+    Applies a list of predicates in a single pass.
+    
+    """
+    def apply(self, filterInput, predicates):
+        """Apply the predicates."""
+        # unpack inputs
+        NScalars = filterInput.NScalars
+        fullScalars = filterInput.fullScalars
+        NVectors = filterInput.NVectors
+        fullVectors = filterInput.fullVectors
+        visibleAtoms = filterInput.visibleAtoms
+        
+        # call C library
+        self.logger.debug("Applying %d predicates", len(predicates))
+        NVisible = _filtering.predicateFilter(visibleAtoms, list(predicates), NScalars, fullScalars, NVectors,
+                                              fullVectors)
+        
+        # resize visible atoms
+        visibleAtoms.resize(NVisible, refcheck=False)
+        
+        # result
+        result = base.FilterResult()
+        
+        return result
@@ -46,8 +46,8 @@ def configuration(parent_package='', top_path=None):
     config.add_extension("_filtering",
                          ["filtering.c"],
                          include_dirs=[incdir],
-                         depends=boxesdeps + utildeps + arraydeps,
-                         libraries=["boxeslib", "utilities", "array_utils"])
+                         depends=boxesdeps + utildeps + nebdeps + arraydeps,
+                         libraries=["boxeslib", "utilities", "neb_list", "array_utils"])
     
     config.add_extension("_bubbles",
                          ["bubbles.c"],
@@ -37,6 +37,7 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 from . import base
 from . import _filtering
+from . import predicateFilter
 
 
 class SliceFilterSettings(base.BaseSettings):
@@ -61,6 +62,16 @@ class SliceFilter(base.BaseFilter):
     Slice filter.
     
     """
+    def predicate(self, filterInput, settings):
+        """Return the per atom test of the filter (defects are sliced separately)."""
+        if filterInput.defectFilterSelected:
+            return None
+        
+        params = [settings.getSetting(name) for name in ("x0", "y0", "z0", "xn", "yn", "zn")]
+        iparams = [int(settings.getSetting("invert"))]
+        
+        return predicateFilter.makePredicate(predicateFilter.SLICE, filterInput.inputState.pos, params, iparams)
+    
     def apply(self, filterInput, settings):
         """Apply the filter."""
         # unpack inputs
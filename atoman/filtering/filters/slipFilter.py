@@ -74,8 +74,11 @@ class SlipFilter(base.BaseFilter):
         # new scalars array
         scalars = np.zeros(len(visibleAtoms), dtype=np.float64)
         
+        # reference positions of the input atoms (the atoms may have been reordered)
+        refPos = inputState.matchingPositions(refState)
+        
         # call C library
-        NVisible = _filtering.slipFilter(visibleAtoms, scalars, inputState.pos, refState.pos, inputState.cellDims,
+        NVisible = _filtering.slipFilter(visibleAtoms, scalars, inputState.pos, refPos, inputState.cellDims,
                                          inputState.PBC, minSlip, maxSlip, NScalars, fullScalars, filteringEnabled,
                                          driftCompensation, driftVector, NVectors, fullVectors, cutoff, tol)
         
@@ -13,6 +13,7 @@ import numpy as np
 
 from . import base
 from . import _filtering
+from . import predicateFilter
 
 
 class SpeciesFilterSettings(base.BaseSettings):
@@ -31,6 +32,29 @@ class SpeciesFilter(base.BaseFilter):
     The species filter.
     
     """
+    def visibleSpecies(self, specieList, settings):
+        """Return the indexes of the visible species."""
+        visibleSpecieList = settings.getSetting("visibleSpeciesList")
+        
+        # make visible specie array
+        visSpecArray = []
+        for i, sym in enumerate(specieList):
+            if sym in visibleSpecieList:
+                visSpecArray.append(i)
+        visSpecArray = np.asarray(visSpecArray, dtype=np.int32)
+        
+        return visSpecArray
+    
+    def predicate(self, filterInput, settings):
+        """Return the per atom test of the filter."""
+        if filterInput.defectFilterSelected:
+            return None
+        
+        inputState = filterInput.inputState
+        visSpecArray = self.visibleSpecies(inputState.specieList, settings)
+        
+        return predicateFilter.makePredicate(predicateFilter.SPECIES, inputState.specie, iparams=visSpecArray)
+    
     def apply(self, filterInput, settings):
         """Apply the filter."""
         # check the inputs are correct
@@ -48,15 +72,8 @@ class SpeciesFilter(base.BaseFilter):
         visibleAtoms = filterInput.visibleAtoms
         specieList = inputState.specieList
         
-        # settings
-        visibleSpecieList = settings.getSetting("visibleSpeciesList")
-        
         # make visible specie array
-        visSpecArray = []
-        for i, sym in enumerate(specieList):
-            if sym in visibleSpecieList:
-                visSpecArray.append(i)
-        visSpecArray = np.asarray(visSpecArray, dtype=np.int32)
+        visSpecArray = self.visibleSpecies(specieList, settings)
         
         # call C library to filter by species
         NVisible = _filtering.specieFilter(visibleAtoms, visSpecArray, inputState.specie, NScalars, fullScalars,
@@ -221,3 +221,37 @@ class TestACNAFCC(unittest.TestCase):
         scalars = result.getScalars()["ACNA"]
         for i in range(len(filterInput.visibleAtoms)):
             self.assertEqual(1, scalars[i])
+
+    def test_ACNAFCCThreadsDeterministic(self):
+        """
+        ACNA fcc same result for any number of threads
+        
+        """
+        # settings
+        settings = acnaFilter.AcnaFilterSettings()
+        settings.updateSetting("maxBondDistance", 3.8)
+        
+        # set PBC and displace the atoms
+        self.lattice.PBC[:] = 1
+        rng = np.random.RandomState(11)
+        self.lattice.pos += rng.uniform(-0.3, 0.3, size=len(self.lattice.pos))
+        
+        results = []
+        for numThreads in (1, 3, 4):
+            # filter input
+            filterInput = base.FilterInput()
+            filterInput.inputState = self.lattice
+            filterInput.visibleAtoms = np.arange(self.lattice.NAtoms, dtype=np.int32)
+            filterInput.NScalars = 0
+            filterInput.fullScalars = np.empty(0, np.float64)
+            filterInput.NVectors = 0
+            filterInput.fullVectors = np.empty(0, np.float64)
+            
+            # call filter
+            _preferences.setNumThreads(numThreads)
+            result = self.filter.apply(filterInput, settings)
+            results.append(result.getScalars()["ACNA"])
+        
+        # results are identical
+        for scalars in results[1:]:
+            self.assertTrue(np.array_equal(scalars, results[0]))
@@ -373,3 +373,38 @@ class TestBondOrderFCC(unittest.TestCase):
         scalarsQ6 = result.getScalars()["Q6"]
         for i in range(NVis):
             self.assertAlmostEqual(0.575, scalarsQ6[i], places=3)
+
+    def test_bondOrderFCCThreadsDeterministic(self):
+        """
+        Bond order fcc same result for any number of threads
+        
+        """
+        # settings
+        settings = bondOrderFilter.BondOrderFilterSettings()
+        settings.updateSetting("maxBondDistance", 3.5)
+        
+        # set PBC and displace the atoms
+        self.lattice.PBC[:] = 1
+        rng = np.random.RandomState(11)
+        self.lattice.pos += rng.uniform(-0.25, 0.25, size=len(self.lattice.pos))
+        
+        results = []
+        for numThreads in (1, 3, 4):
+            # filter input
+            filterInput = base.FilterInput()
+            filterInput.inputState = self.lattice
+            filterInput.visibleAtoms = np.arange(self.lattice.NAtoms, dtype=np.int32)
+            filterInput.NScalars = 0
+            filterInput.fullScalars = np.empty(0, np.float64)
+            filterInput.NVectors = 0
+            filterInput.fullVectors = np.empty(0, np.float64)
+            
+            # call filter
+            _preferences.setNumThreads(numThreads)
+            result = self.filter.apply(filterInput, settings)
+            results.append(result.getScalars())
+        
+        # results are identical
+        for scalars in results[1:]:
+            self.assertTrue(np.array_equal(scalars["Q4"], results[0]["Q4"]))
+            self.assertTrue(np.array_equal(scalars["Q6"], results[0]["Q6"]))
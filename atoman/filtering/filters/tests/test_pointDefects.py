@@ -156,3 +156,85 @@ class TestPointDefectsFilter(unittest.TestCase):
         self.assertEqual(len(filterInput.onAntisites), 1)
         self.assertEqual(filterInput.onAntisites[0], 30)
         self.assertEqual(len(filterInput.splitInterstitials), 0)
+    
+    def test_pointDefectsIncremental(self):
+        """
+        Point defects incremental
+        
+        """
+        settings = pointDefectsFilter.PointDefectsFilterSettings()
+        settings.updateSetting("vacancyRadius", 1.3)
+        settings.updateSetting("identifySplitInts", False)
+        incrementalSettings = pointDefectsFilter.PointDefectsFilterSettings()
+        incrementalSettings.updateSetting("vacancyRadius", 1.3)
+        incrementalSettings.updateSetting("identifySplitInts", False)
+        incrementalSettings.updateSetting("incremental", True)
+        cache = pointDefectsFilter.DefectSitesCache()
+        
+        # a sequence of frames: all atoms vibrate in the first, then a few atoms move each frame
+        rng = np.random.RandomState(25)
+        pos = self.inp.pos.reshape((-1, 3))
+        for frame in range(5):
+            if frame == 0:
+                pos += rng.uniform(-0.3, 0.3, size=pos.shape)
+            else:
+                moved = rng.choice(self.inp.NAtoms, 20, replace=False)
+                pos[moved] += rng.uniform(-1.5, 1.5, size=(len(moved), 3))
+            
+            filterInput = self.makeFilterInput()
+            self.filter.apply(filterInput, settings)
+            incrementalInput = self.makeFilterInput()
+            incrementalInput.defectSitesCache = cache
+            self.filter.apply(incrementalInput, incrementalSettings)
+            
+            # same defects as checking every site
+            self.assertGreater(len(filterInput.vacancies), 0)
+            for name in ("vacancies", "interstitials", "antisites", "onAntisites"):
+                self.assertTrue(np.array_equal(getattr(filterInput, name), getattr(incrementalInput, name)))
+            
+            # only the sites near the atoms that moved were checked
+            if frame == 0:
+                self.assertEqual(cache.checked, self.ref.NAtoms)
+            else:
+                self.assertEqual(cache.moved, 20)
+                self.assertLess(cache.checked, self.ref.NAtoms // 10)
+        
+        # new sites if the reference lattice changes
+        capsule = cache.sites(self.inp, self.ref, 1.3)
+        self.assertIs(cache.sites(self.inp, self.ref, 1.3), capsule)
+        self.ref.pos[0] += 0.1
+        self.ref.positionsVersion += 1
+        self.assertIsNot(cache.sites(self.inp, self.ref, 1.3), capsule)
+    
+    def test_pointDefectsIncrementalBadReference(self):
+        """
+        Point defects incremental with a bad reference position
+        
+        """
+        settings = pointDefectsFilter.PointDefectsFilterSettings()
+        settings.updateSetting("incremental", True)
+        cache = pointDefectsFilter.DefectSitesCache()
+        self.ref.pos[0] = np.nan
+        
+        # fails cleanly, also when the sites are set up again
+        for _ in range(2):
+            filterInput = self.makeFilterInput()
+            filterInput.defectSitesCache = cache
+            with self.assertRaises(RuntimeError):
+                self.filter.apply(filterInput, settings)
+    
+    def test_pointDefectsNoClusters(self):
+        """
+        Point defects clusters with no defects
+        
+        """
+        self.inp = copy.deepcopy(self.ref)
+        settings = pointDefectsFilter.PointDefectsFilterSettings()
+        settings.updateSetting("findClusters", True)
+        
+        filterInput = self.makeFilterInput()
+        result = self.filter.apply(filterInput, settings)
+        
+        self.assertEqual(len(filterInput.vacancies), 0)
+        self.assertEqual(len(filterInput.interstitials), 0)
+        self.assertEqual(len(result.getClusterList()), 0)
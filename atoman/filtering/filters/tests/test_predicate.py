@@ -0,0 +1,171 @@
+"""
+Unit tests for applying predicate filters in a single pass
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import unittest
+
+import numpy as np
+
+from ....system import lattice
+from .. import atomIdFilter
+from .. import base
+from .. import chargeFilter
+from .. import cropBoxFilter
+from .. import cropSphereFilter
+from .. import genericScalarFilter
+from .. import predicateFilter
+from .. import sliceFilter
+from .. import speciesFilter
+
+
+################################################################################
+
+class TestPredicateFilter(unittest.TestCase):
+    """
+    Test predicate filters applied in a single pass
+    
+    """
+    def setUp(self):
+        """
+        Called before each test
+        
+        """
+        # random lattice of two species
+        rng = np.random.RandomState(22)
+        NAtoms = 2000
+        self.lattice = lattice.Lattice()
+        self.lattice.cellDims[:] = 20.0
+        self.lattice.PBC[:] = 1
+        self.lattice.addAtoms(rng.choice(["Fe", "Cr"], NAtoms), rng.uniform(0.0, 20.0, size=(NAtoms, 3)),
+                              charges=rng.uniform(-2.0, 2.0, NAtoms))
+        self.lattice.scalarsDict["test"] = rng.uniform(0.0, 1.0, NAtoms)
+        
+        # a scalar and a vector for each atom that must be compacted with the visible atoms
+        self.scalars = rng.uniform(0.0, 1.0, NAtoms)
+        self.vectors = rng.uniform(0.0, 1.0, size=(NAtoms, 3))
+        
+        # the filters
+        self.filters = []
+        
+        settings = cropSphereFilter.CropSphereFilterSettings()
+        settings.updateSetting("xCentre", 1.0)
+        settings.updateSetting("yCentre", 2.0)
+        settings.updateSetting("zCentre", 3.0)
+        settings.updateSetting("radius", 3.5)
+        settings.updateSetting("invertSelection", True)
+        self.filters.append((cropSphereFilter.CropSphereFilter("Crop sphere"), settings))
+        
+        settings = sliceFilter.SliceFilterSettings()
+        settings.updateSetting("x0", 10.0)
+        settings.updateSetting("y0", 10.0)
+        settings.updateSetting("xn", 1.0)
+        settings.updateSetting("yn", 2.0)
+        settings.updateSetting("zn", -0.5)
+        self.filters.append((sliceFilter.SliceFilter("Slice"), settings))
+        
+        settings = chargeFilter.ChargeFilterSettings()
+        settings.updateSetting("minCharge", -1.5)
+        settings.updateSetting("maxCharge", 1.8)
+        self.filters.append((chargeFilter.ChargeFilter("Charge"), settings))
+        
+        settings = atomIdFilter.AtomIdFilterSettings()
+        settings.updateSetting("filterString", "10-900,1000,1200-")
+        self.filters.append((atomIdFilter.AtomIdFilter("Atom ID"), settings))
+        
+        settings = genericScalarFilter.GenericScalarFilterSettings()
+        settings.updateSetting("scalarsName", "test")
+        settings.updateSetting("minVal", 0.1)
+        settings.updateSetting("maxVal", 0.95)
+        self.filters.append((genericScalarFilter.GenericScalarFilter("Scalar: test"), settings))
+        
+        settings = speciesFilter.SpeciesFilterSettings()
+        settings.updateSetting("visibleSpeciesList", ["Fe"])
+        self.filters.append((speciesFilter.SpeciesFilter("Species"), settings))
+        
+        settings = cropBoxFilter.CropBoxFilterSettings()
+        settings.updateSetting("yEnabled", True)
+        settings.updateSetting("ymin", 1.0)
+        settings.updateSetting("ymax", 17.0)
+        settings.updateSetting("zEnabled", True)
+        settings.updateSetting("zmin", 2.0)
+        settings.updateSetting("zmax", 19.0)
+        self.filters.append((cropBoxFilter.CropBoxFilter("Crop box"), settings))
+    
+    def tearDown(self):
+        """
+        Called after each test
+        
+        """
+        # remove refs
+        self.lattice = None
+        self.scalars = None
+        self.vectors = None
+        self.filters = None
+    
+    def makeFilterInput(self, visibleAtoms, scalars, vectors):
+        """
+        Return a filter input for the given visible atoms, scalars and vectors
+        
+        """
+        filterInput = base.FilterInput()
+        filterInput.inputState = self.lattice
+        filterInput.visibleAtoms = visibleAtoms
+        filterInput.NScalars = 1
+        filterInput.fullScalars = scalars.copy()
+        filterInput.NVectors = 1
+        filterInput.fullVectors = vectors.copy()
+        filterInput.defectFilterSelected = False
+        
+        return filterInput
+    
+    def test_predicateFilter(self):
+        """
+        Predicate filters in a single pass
+        
+        """
+        # apply the filters one after the other
+        visibleAtoms = np.arange(self.lattice.NAtoms, dtype=np.int32)
+        scalars = self.scalars
+        vectors = self.vectors
+        for filterObject, settings in self.filters:
+            filterInput = self.makeFilterInput(visibleAtoms, scalars, vectors)
+            filterObject.apply(filterInput, settings)
+            scalars = filterInput.fullScalars[:len(visibleAtoms)]
+            vectors = filterInput.fullVectors[:len(visibleAtoms)]
+        self.assertGreater(len(visibleAtoms), 0)
+        self.assertLess(len(visibleAtoms), self.lattice.NAtoms // 4)
+        
+        # apply them in one pass
+        fusedAtoms = np.arange(self.lattice.NAtoms, dtype=np.int32)
+        filterInput = self.makeFilterInput(fusedAtoms, self.scalars, self.vectors)
+        predicates = [filterObject.predicate(filterInput, settings) for filterObject, settings in self.filters]
+        predicateFilter.PredicateFilter("Predicate").apply(filterInput, predicates)
+        
+        self.assertTrue(np.array_equal(fusedAtoms, visibleAtoms))
+        self.assertTrue(np.array_equal(filterInput.fullScalars[:len(fusedAtoms)], scalars))
+        self.assertTrue(np.array_equal(filterInput.fullVectors[:len(fusedAtoms)], vectors))
+        self.assertTrue(np.array_equal(self.scalars[fusedAtoms], scalars))
+    
+    def test_predicateDefects(self):
+        """
+        Predicate filters are not used when filtering defects
+        
+        """
+        filterInput = self.makeFilterInput(np.arange(self.lattice.NAtoms, dtype=np.int32), self.scalars, self.vectors)
+        filterInput.defectFilterSelected = True
+        for filterObject, settings in self.filters:
+            self.assertIsNone(filterObject.predicate(filterInput, settings))
+    
+    def test_emptyAtomID(self):
+        """
+        Predicate of an empty atom ID filter
+        
+        """
+        settings = atomIdFilter.AtomIdFilterSettings()
+        fusedAtoms = np.arange(self.lattice.NAtoms, dtype=np.int32)
+        filterInput = self.makeFilterInput(fusedAtoms, self.scalars, self.vectors)
+        predicate = atomIdFilter.AtomIdFilter("Atom ID").predicate(filterInput, settings)
+        predicateFilter.PredicateFilter("Predicate").apply(filterInput, [predicate])
+        self.assertEqual(len(fusedAtoms), 0)
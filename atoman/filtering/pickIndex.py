@@ -0,0 +1,140 @@
+"""
+Nearest neighbour index over the visible atoms and defects of a Filterer.
+
+The index is built (lazily) once after each run of the filters and reused for every pick
+and neighbour lookup until the filters are run again (see `Filterer.getPickIndex`).
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import logging
+import time
+
+import numpy as np
+
+from ..visclibs import kdtree
+
+
+# types of the picked objects
+ATOM = 0
+VACANCY = 1
+INTERSTITIAL = 2
+ANTISITE = 3
+SPLIT_INTERSTITIAL = 4
+
+
+class PickIndex(object):
+    """
+    k-d tree of the visible atoms and defects of a Filterer.
+    
+    Each point has a type, the index of the object in the list of its type (`visibleAtoms`,
+    `vacancies`, `interstitials`, `onAntisites` or split interstitial number) and the index
+    of its atom in the input (or, for vacancies and the vacancy of a split interstitial,
+    reference) lattice.
+    
+    """
+    def __init__(self, filterer):
+        self.logger = logging.getLogger(__name__)
+        buildTime = time.time()
+        
+        inputState = filterer.inputState
+        refState = filterer.refState
+        self._inputState = inputState
+        self.version = inputState.positionsVersion
+        self.pos = inputState.pos
+        
+        inputPos = np.reshape(inputState.pos, (-1, 3))
+        inputRadii = np.asarray(inputState.specieCovalentRadius, dtype=np.float64)
+        if refState is not None:
+            refPos = np.reshape(refState.pos, (-1, 3))
+            refRadii = np.asarray(refState.specieCovalentRadius, dtype=np.float64)
+        
+        # (positions, type, indexes, atom indexes, radii) of each type of object
+        parts = []
+        
+        visibleAtoms = filterer.visibleAtoms
+        parts.append((inputPos[visibleAtoms], ATOM, np.arange(len(visibleAtoms), dtype=np.int32), visibleAtoms,
+                      inputRadii[inputState.specie[visibleAtoms]]))
+        
+        # vacancies are a bit bigger when picking
+        vacancies = filterer.vacancies
+        if len(vacancies):
+            parts.append((refPos[vacancies], VACANCY, np.arange(len(vacancies), dtype=np.int32), vacancies,
+                          refRadii[refState.specie[vacancies]] * 1.2))
+        
+        for atoms, objectType in ((filterer.interstitials, INTERSTITIAL), (filterer.onAntisites, ANTISITE)):
+            if len(atoms):
+                parts.append((inputPos[atoms], objectType, np.arange(len(atoms), dtype=np.int32), atoms,
+                              inputRadii[inputState.specie[atoms]]))
+        
+        # split interstitials are (vacancy, interstitial, interstitial)
+        splitInts = np.reshape(filterer.splitInterstitials, (-1, 3))
+        if len(splitInts):
+            pos = np.empty((len(splitInts), 3, 3), np.float64)
+            radii = np.empty((len(splitInts), 3), np.float64)
+            pos[:, 0] = refPos[splitInts[:, 0]]
+            radii[:, 0] = refRadii[refState.specie[splitInts[:, 0]]]
+            for i in (1, 2):
+                pos[:, i] = inputPos[splitInts[:, i]]
+                radii[:, i] = inputRadii[inputState.specie[splitInts[:, i]]]
+            parts.append((pos.reshape((-1, 3)), SPLIT_INTERSTITIAL,
+                          np.repeat(np.arange(len(splitInts), dtype=np.int32), 3), splitInts.ravel(), radii.ravel()))
+        
+        self.types = np.concatenate([np.full(len(part[2]), part[1], dtype=np.int32) for part in parts])
+        self.indexes = np.concatenate([part[2] for part in parts])
+        self.atomIndexes = np.concatenate([np.asarray(part[3], dtype=np.int32) for part in parts])
+        self.radii = np.concatenate([part[4] for part in parts])
+        self._tree = kdtree.KDTree(np.concatenate([part[0] for part in parts]).ravel())
+        
+        self.logger.debug("Built pick index of %d objects in %f s", len(self._tree), time.time() - buildTime)
+    
+    def __len__(self):
+        return len(self._tree)
+    
+    def isValid(self, inputState):
+        """
+        Return True if the index was built for the given input lattice and its positions have not changed.
+        
+        """
+        return (inputState is self._inputState and inputState.pos is self.pos and
+                inputState.positionsVersion == self.version)
+    
+    def _result(self, points, separations):
+        """Return the types, indexes and separations of the given points."""
+        return self.types[points], self.indexes[points], separations
+    
+    def nearest(self, point, k=1):
+        """
+        Return the types, indexes and (centre) separations of the k nearest objects to the point.
+        
+        Objects are ordered by separation. Atoms come before defects at the same separation.
+        
+        """
+        return self._result(*self._tree.nearest(point, k=k))
+    
+    def withinRadius(self, point, radius):
+        """
+        Return the types, indexes and (centre) separations of the objects within the radius of the point.
+        
+        Objects are ordered by separation. Atoms come before defects at the same separation.
+        
+        """
+        return self._result(*self._tree.withinRadius(point, radius))
+    
+    def pick(self, point):
+        """
+        Return the type, index and separation of the object nearest the point, or None if there are no objects.
+        
+        The separation is from the surface of the object (zero if the point is inside it).
+        
+        """
+        points, separations = self._tree.nearest(point, k=1)
+        if not len(points):
+            return None
+        
+        point = points[0]
+        separation = max(separations[0] - self.radii[point], 0.0)
+        
+        return int(self.types[point]), int(self.indexes[point]), separation
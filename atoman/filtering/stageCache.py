@@ -0,0 +1,169 @@
+"""
+In-memory cache of the results of the stages of a filter pipeline.
+
+After each filter is applied the Filterer stores its state (visible atoms, defects,
+scalars, vectors, cluster lists, ...) keyed by the inputs of the pipeline and the names
+and settings of that filter and all the filters before it. When the filters are run
+again the Filterer resumes from the last stage that is in the cache, so only the
+filters after the first changed one are applied.
+
+The total size of the cache is capped; the least recently used stages are removed
+first.
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import collections
+import logging
+
+import numpy as np
+import six
+
+
+# approximate size of an item of a list (cluster lists are lists of Python ints)
+_ITEM_SIZE = 32
+
+
+def freeze(value):
+    """
+    Return a hashable version of the value (lists, arrays and dicts are converted to tuples).
+    
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((freeze(key), freeze(val)) for key, val in six.iteritems(value)))
+    
+    elif isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(freeze(val) for val in value)
+    
+    elif isinstance(value, np.generic):
+        return value.item()
+    
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    
+    return value
+
+
+def stateSize(state):
+    """
+    Return the approximate size (in bytes) of a stage state dict.
+    
+    """
+    size = 0
+    for value in six.itervalues(state):
+        if hasattr(value, "nbytes"):
+            # arrays and visible columns
+            size += value.nbytes
+        
+        elif isinstance(value, dict):
+            size += sum(val.nbytes for val in six.itervalues(value) if isinstance(val, np.ndarray))
+        
+        elif isinstance(value, list):
+            size += sum(len(item) if hasattr(item, "__len__") else 1 for item in value) * _ITEM_SIZE
+    
+    return size
+
+
+class StageCache(object):
+    """
+    Cache of the states after each stage of a filter pipeline, with a size cap and LRU eviction.
+    
+    A maxSize of zero disables the cache.
+    
+    """
+    def __init__(self, maxSize=536870912):
+        self.logger = logging.getLogger(__name__ + ".StageCache")
+        self.maxSize = maxSize
+        
+        # states (and their sizes) by key, least recently used first
+        self._entries = collections.OrderedDict()
+        self.size = 0
+        
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def __contains__(self, key):
+        return key in self._entries
+    
+    @property
+    def enabled(self):
+        """
+        True if the cache is enabled.
+        
+        """
+        return self.maxSize > 0
+    
+    def setMaxSize(self, maxSize):
+        """
+        Set the maximum size of the cache (in bytes), removing stages if required.
+        
+        """
+        if maxSize < 0:
+            raise ValueError("Stage cache size cannot be negative (%r)" % maxSize)
+        
+        self.maxSize = maxSize
+        self.evict()
+    
+    def get(self, key):
+        """
+        Return the state stored for the key, or None if it is not in the cache.
+        
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        # mark as recently used
+        self._entries[key] = entry
+        self.hits += 1
+        
+        return entry[0]
+    
+    def put(self, key, state):
+        """
+        Store the state for the key, removing the least recently used stages if the cache is too big.
+        
+        States bigger than the cache are not stored.
+        
+        """
+        size = stateSize(state)
+        if not self.enabled or size > self.maxSize:
+            return
+        
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+        
+        self._entries[key] = (state, size)
+        self.size += size
+        
+        self.evict()
+    
+    def evict(self):
+        """
+        Remove the least recently used stages until the cache is within its size cap.
+        
+        """
+        while self._entries and self.size > self.maxSize:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            self.logger.debug("Evicted stage (%d bytes)", size)
+    
+    def clear(self):
+        """
+        Remove all stages from the cache.
+        
+        """
+        self._entries.clear()
+        self.size = 0
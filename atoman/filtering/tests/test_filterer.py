@@ -9,12 +9,18 @@ import copy
 import unittest
 
 import numpy as np
+import six
 
 from ..import filterer
+from .. import pickIndex
 from ...lattice_gen import lattice_gen_bcc
+from ...system.lattice import Lattice
 from ..filters import acnaFilter
 from ..filters import bondOrderFilter
+from ..filters import chargeFilter
+from ..filters import clusterFilter
 from ..filters import cropBoxFilter
+from ..filters import pointDefectsFilter
 from six.moves import range
 
 
@@ -157,5 +163,212 @@ class TestFilterer(unittest.TestCase):
         self.assertTrue("ACNA structure count" in self.filterer.structureCounterDicts)
         self.assertTrue("BCC" in self.filterer.structureCounterDicts["ACNA structure count"])
         # self.assertEqual(self.filterer.structureCounterDicts["ACNA structure count"]["BCC"], nvis)
+    
+    def test_pickIndex(self):
+        """
+        Filterer pick index
+        
+        """
+        # move an atom to an interstitial site
+        self.inputState.pos[0:3] = [7.175, 8.61, 7.175]
+        
+        # point defects
+        settings = pointDefectsFilter.PointDefectsFilterSettings()
+        settings.updateSetting("vacancyRadius", 1.3)
+        self.filterer.runFilters(["Point defects"], [settings], self.inputState, self.refState)
+        self.assertEqual(len(self.filterer.vacancies), 1)
+        self.assertEqual(len(self.filterer.interstitials), 1)
+        
+        # built once and reused
+        index = self.filterer.getPickIndex()
+        self.assertIs(self.filterer.getPickIndex(), index)
+        self.assertEqual(len(index), 2)
+        
+        # picking
+        self.assertEqual(index.pick(self.refState.pos[0:3]), (pickIndex.VACANCY, 0, 0.0))
+        objectType, objectIndex, sep = index.pick(self.inputState.pos[0:3] + [0.0, 0.0, 2.0])
+        self.assertEqual((objectType, objectIndex), (pickIndex.INTERSTITIAL, 0))
+        self.assertAlmostEqual(sep, 2.0 - self.inputState.specieCovalentRadius[self.inputState.specie[0]])
+        types, indexes, seps = index.withinRadius(self.inputState.pos[0:3], 100.0)
+        self.assertTrue(np.array_equal(types, [pickIndex.INTERSTITIAL, pickIndex.VACANCY]))
+        self.assertTrue(np.array_equal(indexes, [0, 0]))
+        
+        # visible atoms (the index is rebuilt after the filters are run again)
+        self.inputState.pos[0:3] = self.refState.pos[0:3]
+        self.filterer.runFilters([], [], self.inputState, self.refState)
+        index = self.filterer.getPickIndex()
+        self.assertEqual(len(index), self.inputState.NAtoms)
+        for i in (0, 17, 1999):
+            self.assertEqual(index.pick(self.inputState.pos[3*i:3*i+3]), (pickIndex.ATOM, i, 0.0))
+        types, indexes, seps = index.nearest(self.inputState.pos[3:6], k=9)
+        self.assertTrue(np.all(types == pickIndex.ATOM))
+        self.assertEqual(indexes[0], 1)
+        self.assertTrue(np.allclose(seps[1:], 2.87 * np.sqrt(3.0) / 2.0))
+        
+        # rebuilt if the positions change
+        self.inputState.positionsChanged()
+        self.assertIsNot(self.filterer.getPickIndex(), index)
+    
+    def test_stageCache(self):
+        """
+        Filterer stage cache
+        
+        """
+        acnaSettings = acnaFilter.AcnaFilterSettings()
+        acnaSettings.updateSetting("maxBondDistance", 4.0)
+        cropBoxSettings = cropBoxFilter.CropBoxFilterSettings()
+        cropBoxSettings.updateSetting("xEnabled", True)
+        cropBoxSettings.updateSetting("xmin", 0.0)
+        cropBoxSettings.updateSetting("xmax", 10.0)
+        filterNames = ["ACNA", "Crop box"]
+        filterSettings = [acnaSettings, cropBoxSettings]
+        
+        def checkResult(nvis):
+            """Check the result matches a filterer with no cache."""
+            fresh = filterer.Filterer(DummyVoroOpts())
+            fresh.stageCache.setMaxSize(0)
+            fresh.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+            self.assertEqual(len(self.filterer.visibleAtoms), nvis)
+            self.assertTrue(np.array_equal(self.filterer.visibleAtoms, fresh.visibleAtoms))
+            self.assertEqual(sorted(self.filterer.scalarsDict.keys()), sorted(fresh.scalarsDict.keys()))
+            for key, scalars in six.iteritems(fresh.scalarsDict):
+                self.assertTrue(np.array_equal(self.filterer.scalarsDict[key], scalars))
+            self.assertEqual(self.filterer.structureCounterDicts, fresh.structureCounterDicts)
+        
+        # both stages are run and cached
+        self.filterer.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+        self.assertEqual(len(self.filterer.stageCache), 2)
+        self.assertEqual(self.filterer.stageCache.hits, 0)
+        checkResult(700)
+        
+        # changing the crop box resumes after the ACNA stage
+        cropBoxSettings.updateSetting("xmax", 5.0)
+        self.filterer.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+        self.assertEqual(self.filterer.stageCache.hits, 1)
+        self.assertEqual(len(self.filterer.stageCache), 3)
+        checkResult(400)
+        
+        # going back to the first crop box reuses everything (the cached arrays are not changed by later runs)
+        cropBoxSettings.updateSetting("xmax", 10.0)
+        self.filterer.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+        self.assertEqual(self.filterer.stageCache.hits, 2)
+        self.assertEqual(len(self.filterer.stageCache), 3)
+        checkResult(700)
+        
+        # moving the atoms invalidates all the stages
+        self.inputState.pos[0] += 0.1
+        self.inputState.positionsChanged()
+        self.filterer.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+        self.assertEqual(self.filterer.stageCache.hits, 2)
+        checkResult(700)
+        
+        # a different lattice clears the cache
+        self.filterer.runFilters(filterNames, filterSettings, copy.deepcopy(self.inputState), self.refState)
+        self.assertEqual(len(self.filterer.stageCache), 2)
         
+        # changing the atom data invalidates all the stages
+        inputState = copy.deepcopy(self.inputState)
+        chargeSettings = chargeFilter.ChargeFilterSettings()
+        chargeSettings.updateSetting("minCharge", 0.5)
+        self.filterer.runFilters(["Charge"], [chargeSettings], inputState, self.refState)
+        self.assertEqual(len(self.filterer.visibleAtoms), 0)
+        inputState.charge[:256] = 1.0
+        inputState.dataChanged()
+        self.filterer.runFilters(["Charge"], [chargeSettings], inputState, self.refState)
+        self.assertEqual(len(self.filterer.visibleAtoms), 256)
+    
+    def test_stageCachePBC(self):
+        """
+        Filterer stage cache with PBC changed in place
+        
+        """
+        lattice = Lattice()
+        lattice.setDims([10.0, 10.0, 10.0])
+        lattice.addAtom("Fe", [0.2, 5.0, 5.0], 0.0)
+        lattice.addAtom("Fe", [9.8, 5.0, 5.0], 0.0)
+        lattice.PBC[:] = 1
+        clusterSettings = clusterFilter.ClusterFilterSettings()
+        clusterSettings.updateSetting("neighbourRadius", 1.0)
+        clusterSettings.updateSetting("minClusterSize", 2)
+        
+        self.filterer.runFilters(["Cluster"], [clusterSettings], lattice, lattice)
+        self.assertTrue(np.array_equal(self.filterer.visibleAtoms, [0, 1]))
+        self.assertEqual(len(self.filterer.clusterList), 1)
+        
+        # the atoms are not neighbours without PBC in x
+        lattice.PBC[0] = 0
+        self.filterer.runFilters(["Cluster"], [clusterSettings], lattice, lattice)
+        self.assertEqual(len(self.filterer.visibleAtoms), 0)
+        self.assertEqual(len(self.filterer.clusterList), 0)
+        
+        # or if the cell is larger
+        lattice.PBC[0] = 1
+        lattice.cellDims[0] = 20.0
+        self.filterer.runFilters(["Cluster"], [clusterSettings], lattice, lattice)
+        self.assertEqual(len(self.filterer.visibleAtoms), 0)
+    
+    def test_verletLists(self):
+        """
+        Filterer Verlet lists
+        
+        """
+        acnaSettings = acnaFilter.AcnaFilterSettings()
+        acnaSettings.updateSetting("maxBondDistance", 4.0)
+        cropBoxSettings = cropBoxFilter.CropBoxFilterSettings()
+        cropBoxSettings.updateSetting("xEnabled", True)
+        cropBoxSettings.updateSetting("xmin", 0.0)
+        cropBoxSettings.updateSetting("xmax", 2.0)
+        self.filterer.stageCache.setMaxSize(0)
+        
+        # off by default
+        self.assertIsNone(self.filterer.verletCache)
+        self.filterer.runFilters(["ACNA"], [acnaSettings], self.inputState, self.refState)
+        expected = self.filterer.scalarsDict["ACNA"].copy()
+        
+        # built once all atoms are visible and reused for the next frame
+        self.filterer.toggleVerletLists(True)
+        cache = self.filterer.verletCache
+        self.filterer.runFilters(["ACNA"], [acnaSettings], self.inputState, self.refState)
+        self.assertTrue(np.array_equal(self.filterer.scalarsDict["ACNA"], expected))
+        self.filterer.runFilters(["ACNA"], [acnaSettings], copy.deepcopy(self.inputState), self.refState)
+        self.assertTrue(np.array_equal(self.filterer.scalarsDict["ACNA"], expected))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        
+        # not used when few atoms are visible
+        self.filterer.runFilters(["Crop box", "ACNA"], [cropBoxSettings, acnaSettings], self.inputState,
+                                 self.refState)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        
+        # freed when disabled
+        self.filterer.toggleVerletLists(False)
+        self.assertIsNone(self.filterer.verletCache)
+    
+    def test_visibleColumns(self):
+        """
+        Filterer visible scalars and vectors
+        
+        """
+        rng = np.random.RandomState(23)
+        self.inputState.scalarsDict["test"] = rng.uniform(0.0, 1.0, self.inputState.NAtoms)
+        self.inputState.vectorsDict["test"] = rng.uniform(0.0, 1.0, size=(self.inputState.NAtoms, 3))
+        
+        acnaSettings = acnaFilter.AcnaFilterSettings()
+        acnaSettings.updateSetting("maxBondDistance", 4.0)
+        cropBoxSettings = cropBoxFilter.CropBoxFilterSettings()
+        cropBoxSettings.updateSetting("xEnabled", True)
+        cropBoxSettings.updateSetting("xmin", 0.0)
+        cropBoxSettings.updateSetting("xmax", 10.0)
+        filterNames = ["Crop box", "ACNA", "Crop box"]
+        filterSettings = [cropBoxSettings, acnaSettings, cropBoxSettings]
         
+        for xmax in (10.0, 5.0):
+            cropBoxSettings.updateSetting("xmax", xmax)
+            self.filterer.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+            visibleAtoms = self.filterer.visibleAtoms
+            self.assertGreater(len(visibleAtoms), 0)
+            self.assertTrue(np.array_equal(self.filterer.latticeScalarsDict["test"],
+                                           self.inputState.scalarsDict["test"][visibleAtoms]))
+            self.assertTrue(np.array_equal(self.filterer.vectorsDict["test"],
+                                           self.inputState.vectorsDict["test"][visibleAtoms]))
+            self.assertEqual(len(self.filterer.scalarsDict["ACNA"]), len(visibleAtoms))
+            self.assertTrue(np.array_equal(self.filterer.getVisibleSet().indexes(), np.sort(visibleAtoms)))
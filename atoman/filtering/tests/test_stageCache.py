@@ -0,0 +1,83 @@
+"""
+Unit tests for the filter stage cache
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import unittest
+
+import numpy as np
+
+from .. import stageCache
+
+
+################################################################################
+
+class TestStageCache(unittest.TestCase):
+    """
+    Test the stage cache
+    
+    """
+    def makeState(self, NAtoms):
+        """
+        Make a state with the given number of visible atoms (4 bytes each)
+        
+        """
+        return {"visibleAtoms": np.arange(NAtoms, dtype=np.int32), "scalarsDict": {}, "clusterList": []}
+    
+    def test_freeze(self):
+        """
+        Stage cache freeze
+        
+        """
+        settings = {"a": [1, 2], "b": np.array([0.5, 1.5]), "c": {"x": [True]}, "d": np.float64(2.0), "e": None}
+        key = stageCache.freeze(settings)
+        hash(key)
+        self.assertEqual(key, stageCache.freeze({"e": None, "d": 2.0, "c": {"x": (True,)}, "b": [0.5, 1.5],
+                                                 "a": (1, 2)}))
+        self.assertNotEqual(key, stageCache.freeze({"a": [1, 3], "b": [0.5, 1.5], "c": {"x": [True]}, "d": 2.0,
+                                                    "e": None}))
+    
+    def test_stageCache(self):
+        """
+        Stage cache LRU eviction
+        
+        """
+        cache = stageCache.StageCache(maxSize=1000)
+        self.assertEqual(stageCache.stateSize(self.makeState(100)), 400)
+        
+        cache.put("a", self.makeState(100))
+        cache.put("b", self.makeState(100))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.size, 800)
+        
+        # use "a", so "b" is evicted when "c" is added
+        self.assertEqual(len(cache.get("a")["visibleAtoms"]), 100)
+        cache.put("c", self.makeState(60))
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        self.assertEqual(cache.size, 640)
+        self.assertEqual(cache.evictions, 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+        
+        # states bigger than the cache are not stored
+        cache.put("d", self.makeState(1000))
+        self.assertNotIn("d", cache)
+        self.assertEqual(len(cache), 2)
+        
+        # shrinking the cache
+        cache.setMaxSize(500)
+        self.assertEqual(len(cache), 1)
+        self.assertIn("c", cache)
+        with self.assertRaises(ValueError):
+            cache.setMaxSize(-1)
+        
+        # disabled
+        cache.setMaxSize(0)
+        self.assertEqual(len(cache), 0)
+        self.assertFalse(cache.enabled)
+        cache.put("e", self.makeState(0))
+        self.assertEqual(len(cache), 0)
@@ -0,0 +1,57 @@
+"""
+Unit tests for the visible columns
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import unittest
+
+import numpy as np
+
+from .. import visibleColumns
+
+
+################################################################################
+
+class TestVisibleColumns(unittest.TestCase):
+    """
+    Test the visible columns
+    
+    """
+    def test_visibleColumns(self):
+        """
+        Visible columns
+        
+        """
+        latticeScalars = np.arange(10, dtype=np.float64) * 2.0
+        latticeVectors = np.arange(30, dtype=np.float64).reshape((10, 3))
+        columns = visibleColumns.VisibleColumns()
+        columns.addColumns({"a": latticeScalars, "v": latticeVectors})
+        self.assertEqual(len(columns), 2)
+        self.assertIs(columns["a"], latticeScalars)
+        
+        # hide some atoms, then add a column for the visible atoms
+        visibleAtoms = np.asarray([1, 2, 4, 5, 7, 9], dtype=np.int32)
+        columns.select(visibleAtoms)
+        self.assertTrue(np.array_equal(columns["a"], latticeScalars[visibleAtoms]))
+        self.assertTrue(np.array_equal(columns["v"], latticeVectors[visibleAtoms]))
+        columns["b"] = np.asarray([10.0, 11.0, 12.0, 13.0, 14.0, 15.0])
+        
+        # copies are not changed when the original is compacted
+        copied = columns.copy()
+        kept = np.asarray([0, 2, 5], dtype=np.int32)
+        columns.select(kept)
+        self.assertTrue(np.array_equal(columns["a"], latticeScalars[visibleAtoms[kept]]))
+        self.assertTrue(np.array_equal(columns["v"], latticeVectors[visibleAtoms[kept]]))
+        self.assertTrue(np.array_equal(columns["b"], [10.0, 12.0, 15.0]))
+        self.assertTrue(np.array_equal(copied["a"], latticeScalars[visibleAtoms]))
+        self.assertTrue(np.array_equal(copied["b"], [10.0, 11.0, 12.0, 13.0, 14.0, 15.0]))
+        
+        # the lattice arrays are not modified
+        self.assertTrue(np.array_equal(latticeScalars, np.arange(10, dtype=np.float64) * 2.0))
+        
+        self.assertEqual(sorted(columns.keys()), ["a", "b", "v"])
+        del columns["a"]
+        self.assertNotIn("a", columns)
+        self.assertIn("a", copied)
+        self.assertEqual(columns.nbytes, 30 * 8 + 6 * 8 + 3 * 4 * 2)
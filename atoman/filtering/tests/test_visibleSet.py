@@ -0,0 +1,73 @@
+"""
+Unit tests for the visible set bitmaps
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import unittest
+
+import numpy as np
+
+from .. import visibleSet
+
+
+################################################################################
+
+class TestVisibleSet(unittest.TestCase):
+    """
+    Test the visible set
+    
+    """
+    def setUp(self):
+        """
+        Called before each test
+        
+        """
+        rng = np.random.RandomState(24)
+        self.size = 1000
+        self.a = np.unique(rng.randint(0, self.size, 400)).astype(np.int32)
+        self.b = np.unique(rng.randint(0, self.size, 300)).astype(np.int32)
+    
+    def tearDown(self):
+        """
+        Called after each test
+        
+        """
+        self.a = None
+        self.b = None
+    
+    def test_visibleSet(self):
+        """
+        Visible set
+        
+        """
+        setA = visibleSet.VisibleSet(self.size, self.a[::-1])
+        setB = visibleSet.VisibleSet(self.size, self.b)
+        self.assertEqual(len(setA), len(self.a))
+        self.assertTrue(np.array_equal(setA.indexes(), self.a))
+        self.assertEqual(setA.indexes().dtype, np.int32)
+        
+        # set operations
+        self.assertTrue(np.array_equal((setA | setB).indexes(), np.union1d(self.a, self.b)))
+        self.assertTrue(np.array_equal((setA & setB).indexes(), np.intersect1d(self.a, self.b)))
+        self.assertTrue(np.array_equal((setA - setB).indexes(), np.setdiff1d(self.a, self.b)))
+        self.assertEqual(len(setA | setB), len(np.union1d(self.a, self.b)))
+        self.assertEqual(setA | setB, setB | setA)
+        self.assertNotEqual(setA, setB)
+        
+        # membership
+        for index in range(-2, self.size + 2):
+            self.assertEqual(index in setA, index in self.a)
+        indexes = np.arange(-2, self.size + 2)
+        self.assertTrue(np.array_equal(setA.contains(indexes), np.in1d(indexes, self.a)))
+        
+        # empty sets and errors
+        empty = visibleSet.VisibleSet(self.size)
+        self.assertEqual(len(empty), 0)
+        self.assertEqual(len(empty.indexes()), 0)
+        self.assertEqual(setA | empty, setA)
+        self.assertEqual(len(visibleSet.VisibleSet(0, [])), 0)
+        with self.assertRaises(ValueError):
+            visibleSet.VisibleSet(10, [10])
+        with self.assertRaises(ValueError):
+            setA | visibleSet.VisibleSet(self.size + 1)
@@ -0,0 +1,120 @@
+"""
+Scalars and vectors of the visible atoms, gathered lazily.
+
+Columns are stored as they were created (lattice columns are the Lattice arrays themselves,
+with one value per atom), along with a selection: the positions in the column of the atoms
+that are currently visible. When a filter hides atoms only the selections are compacted
+and a column is gathered the first time it is accessed after that (for rendering, output,
+...). Columns added together share a selection, so compacting them costs the same as
+compacting one column.
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import six
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+
+class _Selection(object):
+    """Positions of the visible atoms in a group of columns (None if all of them are visible, in order)."""
+    __slots__ = ["indexes"]
+    
+    def __init__(self, indexes=None):
+        self.indexes = indexes
+
+
+class VisibleColumns(MutableMapping):
+    """
+    Mapping of names to columns (scalars or vectors) of the visible atoms.
+    
+    """
+    def __init__(self):
+        # (values, selection) by name
+        self._columns = {}
+        
+        # columns gathered since the visible atoms last changed
+        self._gathered = {}
+    
+    def __getitem__(self, name):
+        columns = self._gathered.get(name)
+        if columns is None:
+            values, selection = self._columns[name]
+            columns = values if selection.indexes is None else values[selection.indexes]
+            self._gathered[name] = columns
+        
+        return columns
+    
+    def __setitem__(self, name, values):
+        self.addColumns({name: values})
+    
+    def __delitem__(self, name):
+        del self._columns[name]
+        self._gathered.pop(name, None)
+    
+    def __iter__(self):
+        return iter(self._columns)
+    
+    def __len__(self):
+        return len(self._columns)
+    
+    def addColumns(self, columns, indexes=None):
+        """
+        Add the given columns (a dict) sharing one selection.
+        
+        By default all the values of the columns are visible, in order; otherwise `indexes`
+        are the positions of the visible atoms in the columns (for example, the visible
+        atoms for columns that have one value per atom of the lattice).
+        
+        """
+        selection = _Selection(indexes)
+        for name, values in six.iteritems(columns):
+            self._columns[name] = (values, selection)
+            self._gathered.pop(name, None)
+    
+    def select(self, kept):
+        """
+        Keep only the visible atoms at the given positions (in order) of the current visible atoms.
+        
+        """
+        for selection in self._selections():
+            selection.indexes = kept if selection.indexes is None else selection.indexes[kept]
+        self._gathered.clear()
+    
+    def copy(self):
+        """
+        Return a copy of the columns (the values are shared, the selections are not).
+        
+        """
+        selections = dict((id(selection), _Selection(selection.indexes)) for selection in self._selections())
+        
+        columns = VisibleColumns()
+        columns._columns = dict((name, (values, selections[id(selection)]))
+                                for name, (values, selection) in six.iteritems(self._columns))
+        columns._gathered = dict(self._gathered)
+        
+        return columns
+    
+    @property
+    def nbytes(self):
+        """
+        Approximate size of the columns and their selections (in bytes).
+        
+        """
+        size = sum(values.nbytes for values, _ in six.itervalues(self._columns))
+        size += sum(selection.indexes.nbytes for selection in self._selections() if selection.indexes is not None)
+        
+        return size
+    
+    def _selections(self):
+        """Return the (unique) selections of the columns."""
+        selections = {}
+        for _, selection in six.itervalues(self._columns):
+            selections[id(selection)] = selection
+        
+        return list(selections.values())
@@ -0,0 +1,129 @@
+"""
+Bitmaps of visible atoms.
+
+A VisibleSet stores one bit per atom of a lattice, in 64 bit words, so unions, intersections
+and differences of the visible atoms of several filter lists take O(N/64) operations and
+testing whether an atom is visible is O(1). The Filterer builds one for its visible atoms
+when it is first required (see `Filterer.getVisibleSet`).
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import numpy as np
+
+
+# number of bits set in each byte
+_POPCOUNT = np.asarray([bin(i).count("1") for i in range(256)], dtype=np.int64)
+
+
+class VisibleSet(object):
+    """
+    Set of the indexes of the visible atoms of a lattice with `size` atoms.
+    
+    """
+    def __init__(self, size, indexes=None):
+        self.size = int(size)
+        self._words = np.zeros((self.size + 63) // 64, dtype=np.uint64)
+        self._count = 0
+        
+        if indexes is not None and len(indexes):
+            indexes = np.asarray(indexes)
+            if indexes.min() < 0 or indexes.max() >= self.size:
+                raise ValueError("Index out of range for visible set of size %d" % self.size)
+            
+            mask = np.zeros(8 * self._words.nbytes, dtype=np.bool_)
+            mask[indexes] = True
+            self._bytes[:] = np.packbits(mask)
+            self._count = None
+    
+    @property
+    def _bytes(self):
+        """
+        The words as bytes; atom i is bit 7 - i % 8 (counting from the least significant
+        bit) of byte i // 8, as in np.packbits.
+        
+        """
+        return self._words.view(np.uint8)
+    
+    @classmethod
+    def _fromWords(cls, size, words):
+        """Return a visible set with the given words."""
+        visibleSet = cls(0)
+        visibleSet.size = size
+        visibleSet._words = words
+        visibleSet._count = None
+        
+        return visibleSet
+    
+    def __len__(self):
+        if self._count is None:
+            self._count = int(_POPCOUNT[self._bytes].sum())
+        
+        return self._count
+    
+    def __contains__(self, index):
+        index = int(index)
+        if index < 0 or index >= self.size:
+            return False
+        
+        return bool((self._bytes[index >> 3] >> (7 - (index & 7))) & 1)
+    
+    def __eq__(self, other):
+        return (isinstance(other, VisibleSet) and self.size == other.size and
+                np.array_equal(self._words, other._words))
+    
+    def __ne__(self, other):
+        return not self == other
+    
+    __hash__ = None
+    
+    def _check(self, other):
+        """Raise an error if the other set is not for a lattice of the same size."""
+        if not isinstance(other, VisibleSet):
+            raise TypeError("Expected a VisibleSet (got %s)" % type(other).__name__)
+        if other.size != self.size:
+            raise ValueError("Visible sets are of different sizes (%d != %d)" % (self.size, other.size))
+    
+    def union(self, other):
+        """Return the atoms that are visible in either set."""
+        self._check(other)
+        return self._fromWords(self.size, np.bitwise_or(self._words, other._words))
+    
+    def intersection(self, other):
+        """Return the atoms that are visible in both sets."""
+        self._check(other)
+        return self._fromWords(self.size, np.bitwise_and(self._words, other._words))
+    
+    def difference(self, other):
+        """Return the atoms that are visible in this set but not the other."""
+        self._check(other)
+        return self._fromWords(self.size, np.bitwise_and(self._words, np.invert(other._words)))
+    
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+    
+    def contains(self, indexes):
+        """
+        Return a boolean array that is True where the atom with that index is visible.
+        
+        """
+        indexes = np.asarray(indexes, dtype=np.int64)
+        result = np.zeros(len(indexes), dtype=np.bool_)
+        inRange = (indexes >= 0) & (indexes < self.size)
+        valid = indexes[inRange]
+        result[inRange] = (self._bytes[valid >> 3] >> (7 - (valid & 7)).astype(np.uint8)) & 1
+        
+        return result
+    
+    def indexes(self):
+        """
+        Return the indexes of the visible atoms (in increasing order).
+        
+        """
+        mask = np.unpackbits(self._bytes)[:self.size]
+        
+        return np.flatnonzero(mask).astype(np.int32)
@@ -258,6 +258,7 @@ class FilterList(QtGui.QWidget):
         
         # the filterer (does the filtering)
         self.filterer = filterer.Filterer(self.voronoiOptions)
+        self.filterer.stageCache.setMaxSize(self.mainWindow.preferences.generalForm.stageCacheSize * 1048576)
         
         # the renderer (does the rendering)
         self.renderer = filterListRenderer.FilterListRenderer(self)
@@ -451,6 +452,12 @@ class FilterList(QtGui.QWidget):
             # remove actors first
             self.clearActors(sequencer=sequencer)
             
+            # read columns used for colouring/vectors that were skipped when the input was read
+            if self.colouringOptions.colourBy.startswith("Lattice: "):
+                inputState.loadDeferredColumn(self.colouringOptions.colourBy[9:])
+            if self.vectorsOptions.selectedVectorsName is not None:
+                inputState.loadDeferredColumn(self.vectorsOptions.selectedVectorsName)
+            
             # apply filters
             self.filterer.runFilters(currentFilters, currentSettings, inputState, refState)
             
@@ -675,7 +682,7 @@ class FilterList(QtGui.QWidget):
         scalarsDict = inp.scalarsDict
         
         numDefault = len(filterer.Filterer.defaultFilters)
-        scalarNames = list(scalarsDict.keys())
+        scalarNames = list(scalarsDict.keys()) + inp.deferredColumnNames("scalar")
         additionalFilters = ["Scalar: {0}".format(s) for s in scalarNames]
         previousAdditionalFilters = self.allFilters[numDefault:]
         currentLen = len(self.allFilters)
@@ -252,6 +252,7 @@ class ColouringOptionsWindow(QtGui.QDialog):
         
         if scalarType.startswith("Lattice: "):
             key = scalarType[9:]
+            self.parent.pipelinePage.inputState.loadDeferredColumn(key)
             if key in self.parent.filterer.latticeScalarsDict:
                 scalarsDict = self.parent.filterer.latticeScalarsDict
             else:
@@ -362,7 +363,8 @@ class ColouringOptionsWindow(QtGui.QDialog):
         # lattice scalars dict
         inputState = self.parent.pipelinePage.inputState
         latticeScalarsDict = inputState.scalarsDict
-        latticeScalarsNames = ["Lattice: {0}".format(key) for key in list(latticeScalarsDict.keys())]
+        latticeScalarsKeys = list(latticeScalarsDict.keys()) + inputState.deferredColumnNames("scalar")
+        latticeScalarsNames = ["Lattice: {0}".format(key) for key in latticeScalarsKeys]
         
         # list of previous scalar types
         previousScalarTypes = []
@@ -226,6 +226,9 @@ class VectorsOptionsWindow(QtGui.QDialog):
         
         self.logger.debug("Refreshing vectors options (%d - %d)", self.parent.pipelinePage.pipelineIndex, self.parent.tab)
         
+        # available vectors (including those that will be read when first selected)
+        vectorsNames = list(inputState.vectorsDict.keys()) + inputState.deferredColumnNames("vector")
+        
         # set of added pairs
         currentVectors = set()
         
@@ -236,7 +239,7 @@ class VectorsOptionsWindow(QtGui.QDialog):
             
             # make this 'and' so that if a lattice is missing one specie we still
             # keep the pair in case it comes back later... 
-            if item.vectorsName not in inputState.vectorsDict:
+            if item.vectorsName not in vectorsNames:
                 self.logger.debug("  Removing vectors option: '%s'", item.vectorsName)
                 item = self.vectorsList.takeItem(i)
                 if self.selectedVectorsName == item.vectorsName:
@@ -246,7 +249,7 @@ class VectorsOptionsWindow(QtGui.QDialog):
                 currentVectors.add(item.vectorsName)
          
         # add vectors that aren't already added
-        for vectorsName in inputState.vectorsDict:
+        for vectorsName in vectorsNames:
             if vectorsName in currentVectors:
                 self.logger.debug("  Keeping vectors option: '%s'", vectorsName)
              
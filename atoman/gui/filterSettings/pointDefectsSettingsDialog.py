@@ -1,4 +1,3 @@
-
 """
 Contains GUI forms for the point defects filter.
 
@@ -33,6 +32,16 @@ class PointDefectsSettingsDialog(base.GenericSettingsDialog):
         tip = "<p>The vacancy radius is used to determine if an input atom is associated with a reference site</p>"
         self.addDoubleSpinBox("vacancyRadius", minVal=0.01, maxVal=10, step=0.1, label="Vacancy radius", toolTip=tip)
         
+        # incremental classification options
+        tip = "<p>When filtering a sequence, only check the reference sites near atoms that have moved since the "
+        tip += "previous frame (not used with drift compensation)</p>"
+        self.addCheckBox("incremental", toolTip=tip, label="Incremental", extraSlot=self.incrementalToggled)
+        tip = "<p>Atoms that have moved less than this since they were last checked are assumed to be on the same "
+        tip += "site. With zero the result is the same as checking every site.</p>"
+        self.incrementalThresholdSpin = self.addDoubleSpinBox("incrementalThreshold", minVal=0, maxVal=10, step=0.05,
+                                                              label="Move threshold", toolTip=tip,
+                                                              settingEnabled="incremental")
+        
         self.addHorizontalDivider()
         
         # defect type options
@@ -232,6 +241,13 @@ class PointDefectsSettingsDialog(base.GenericSettingsDialog):
         self.addCheckBox("drawSpaghetti", toolTip="Turn on rendering 'spaghetti'", label="Render spaghetti",
                          displayLayout=True)
     
+    def incrementalToggled(self, enabled):
+        """
+        Incremental classification toggled
+        
+        """
+        self.incrementalThresholdSpin.setEnabled(enabled)
+    
     def useAcnaToggled(self, enabled):
         """
         Use ACNA toggled
@@ -270,7 +286,7 @@ class PointDefectsSettingsDialog(base.GenericSettingsDialog):
         self.vtkThickSpin.setEnabled(enabled)
         self.povThickSpin.setEnabled(enabled)
         self.numSidesSpin.setEnabled(enabled)
-        
+    
     def toggleCalcVolsCheck(self, enabled):
         """
         Enable calc vols check box
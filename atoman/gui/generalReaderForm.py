@@ -21,6 +21,10 @@ from PySide import QtGui, QtCore
 
 from ..visutils.utilities import iconPath, resourcePath
 from ..system import latticeReaderGeneric
+from ..system import snapshot
+from ..system import trajectory
+from ..system import compression
+from ..system import parseCache
 from six.moves import range
 from six.moves import zip
 
@@ -45,9 +49,12 @@ class GeneralLatticeReaderForm(QtGui.QWidget):
         
         vbox = QtGui.QVBoxLayout()
         
-        # lattice reader
+        # lattice reader (with a cache of parsed files)
+        cacheSize = self.mainWindow.preferences.generalForm.parseCacheSize * 1048576
         self.latticeReader = latticeReaderGeneric.LatticeReaderGeneric(tmpLocation=self.tmpLocation, updateProgress=self.mainWindow.updateProgress, 
-                                                                       hideProgress=self.mainWindow.hideProgressBar)
+                                                                       hideProgress=self.mainWindow.hideProgressBar,
+                                                                       cache=parseCache.ParseCache(maxSize=cacheSize),
+                                                                       reorder=self.mainWindow.preferences.generalForm.reorderCurveName())
         
         # open dialog
         self.openLatticeButton = QtGui.QPushButton(QtGui.QIcon(iconPath('oxygen/document-open.png')), "File dialog")
@@ -151,6 +158,15 @@ class GeneralLatticeReaderForm(QtGui.QWidget):
         
         return result
     
+    def memoryMapOptions(self):
+        """
+        Return the options for reading large systems straight into memory-mapped files (from the preferences).
+        
+        """
+        threshold = self.mainWindow.preferences.generalForm.memoryMapThreshold * 1000000
+        
+        return {"memoryMapDir": self.tmpLocation, "memoryMapThreshold": threshold}
+    
     def openFile(self, filename, rouletteIndex=None, sftpPath=None, linkedLattice=None):
         """
         Open file.
@@ -171,12 +187,20 @@ class GeneralLatticeReaderForm(QtGui.QWidget):
         # status
         self.mainWindow.setStatus("Opening '%s'" % os.path.basename(filename))
         
-        # unzip if required
-        filepath, zipFlag = self.latticeReader.checkForZipped(filename)
+        # locate the file (compressed files are decompressed while they are read)
+        filepath = compression.locateFile(filename)
         
         try:
+            if filepath is None:
+                raise IOError("Could not locate file: '%s'" % filename)
+            
             # file format
-            fileFormat = self.determineFileFormat(filepath, filename)
+            if snapshot.isSnapshot(filepath):
+                fileFormat = latticeReaderGeneric.snapshotFileFormat
+            elif trajectory.isTrajectory(filepath):
+                fileFormat = latticeReaderGeneric.trajectoryFileFormat
+            else:
+                fileFormat = self.determineFileFormat(filepath, filename)
             if fileFormat is None:
                 return 1
             
@@ -187,7 +211,8 @@ class GeneralLatticeReaderForm(QtGui.QWidget):
                     return 2
 
             # open file
-            status, state = self.latticeReader.readFile(filepath, fileFormat, rouletteIndex=rouletteIndex, linkedLattice=linkedLattice)
+            status, state = self.latticeReader.readFile(filepath, fileFormat, rouletteIndex=rouletteIndex, linkedLattice=linkedLattice,
+                                                        **self.memoryMapOptions())
         
         except:
             exctype, value = sys.exc_info()[:2]
@@ -195,10 +220,6 @@ class GeneralLatticeReaderForm(QtGui.QWidget):
             self.mainWindow.displayError("Lattice reader failed!\n\n%s: %s" % (exctype, value))
             status = 255
         
-        finally:
-            # delete unzipped file if required
-            self.latticeReader.cleanUnzipped(filepath, zipFlag)
-        
         if not status:
             self.postOpenFile(state, filename, fileFormat, sftpPath, linked=linkedLattice)
     
@@ -274,7 +295,7 @@ class GeneralLatticeReaderForm(QtGui.QWidget):
         
         # read required lines
         lines = []
-        with open(filename) as f:
+        with compression.openFile(filename, text=True) as f:
             for count, line in enumerate(f):
                 if count == maxIdLen:
                     break
@@ -18,6 +18,7 @@ import math
 import functools
 import datetime
 import time
+import multiprocessing
 
 import numpy as np
 from PySide import QtGui, QtCore
@@ -28,7 +29,11 @@ from ..visutils import threading_vis
 from ..visutils.utilities import iconPath
 from . import genericForm
 from ..plotting import rdf
-from ..algebra import _vectors as vectors_c
+from ..system import snapshot
+from ..system import latticeReaderGeneric
+from ..system import prefetch
+from ..system import sftpTransfer
+from ..rendering import sequencer
 from ..plotting import plotDialog
 from . import utils
 import six
@@ -780,6 +785,7 @@ class FileTab(QtGui.QWidget):
         # file type
         outputTypeCombo = QtGui.QComboBox()
         outputTypeCombo.addItem("LATTICE")
+        outputTypeCombo.addItem("ATOMAN SNAPSHOT")
 #         outputTypeCombo.addItem("LBOMD REF")
 #         outputTypeCombo.addItem("LBOMD XYZ")
 #         outputTypeCombo.addItem("LBOMD FAILSAFE")
@@ -866,7 +872,8 @@ class FileTab(QtGui.QWidget):
             visibleAtoms = self.rendererWindow.gatherVisibleAtoms()
 
         # write Lattice
-        lattice.writeLattice(filename, visibleAtoms=visibleAtoms)
+        binary = self.outputFileType == "ATOMAN SNAPSHOT"
+        lattice.writeLattice(filename, visibleAtoms=visibleAtoms, binary=binary)
 
     def saveToFileDialog(self):
         """
@@ -886,6 +893,13 @@ class FileTab(QtGui.QWidget):
         """
         self.outputFileType = str(fileType)
 
+        # update the extension of the file name
+        root, ext = os.path.splitext(str(self.outputFileName.text()))
+        if self.outputFileType == "ATOMAN SNAPSHOT":
+            self.outputFileName.setText(root + snapshot.SNAPSHOT_EXTENSION)
+        elif ext == snapshot.SNAPSHOT_EXTENSION:
+            self.outputFileName.setText(root + ".dat")
+
 
 class ImageTab(QtGui.QWidget):
     def __init__(self, parent, mainWindow, width):
@@ -1448,6 +1462,9 @@ class ImageSequenceTab(QtGui.QWidget):
         self.overwrite = False
         self.flickerFlag = False
         self.rotateAfter = False
+        self.prefetchFrames = 2
+        self.prefetchMemory = 1024
+        self.numWorkers = 1
 #         self.createMovie = 1
 
         # layout
@@ -1608,6 +1625,48 @@ class ImageSequenceTab(QtGui.QWidget):
         rowLayout.addWidget(self.rotateAfterCheck)
         mainLayout.addWidget(row)
 
+        # prefetch frames
+        prefetchSpin = QtGui.QSpinBox()
+        prefetchSpin.setMinimum(0)
+        prefetchSpin.setMaximum(32)
+        prefetchSpin.setValue(self.prefetchFrames)
+        prefetchSpin.valueChanged[int].connect(self.prefetchFramesChanged)
+        prefetchSpin.setToolTip("<p>The number of frames to read ahead (in the background) while the current "
+                                "frame is being processed (0 to disable)</p>")
+        prefetchMemorySpin = QtGui.QSpinBox()
+        prefetchMemorySpin.setMinimum(1)
+        prefetchMemorySpin.setMaximum(1000000)
+        prefetchMemorySpin.setSuffix(" MB")
+        prefetchMemorySpin.setValue(self.prefetchMemory)
+        prefetchMemorySpin.valueChanged[int].connect(self.prefetchMemoryChanged)
+        prefetchMemorySpin.setToolTip("<p>Stop reading ahead while the frames that have been read ahead use "
+                                      "more than this much memory</p>")
+        row = QtGui.QHBoxLayout()
+        row.setContentsMargins(0, 0, 0, 0)
+        row.setAlignment(QtCore.Qt.AlignHCenter)
+        row.addWidget(QtGui.QLabel("Prefetch frames:"))
+        row.addWidget(prefetchSpin)
+        row.addWidget(QtGui.QLabel("up to"))
+        row.addWidget(prefetchMemorySpin)
+        mainLayout.addLayout(row)
+
+        # number of worker processes
+        numWorkersSpin = QtGui.QSpinBox()
+        numWorkersSpin.setMinimum(1)
+        numWorkersSpin.setMaximum(max(1, multiprocessing.cpu_count()))
+        numWorkersSpin.setValue(self.numWorkers)
+        numWorkersSpin.valueChanged[int].connect(self.numWorkersChanged)
+        numWorkersSpin.setToolTip("<p>The number of processes to render the frames in (each renders a contiguous "
+                                  "block of frames offscreen). Sequences that are rendered with POV-Ray, read over "
+                                  "SFTP, use a linked render window, draw trace vectors, eliminate flicker or rotate "
+                                  "at the end are always rendered in this window</p>")
+        row = QtGui.QHBoxLayout()
+        row.setContentsMargins(0, 0, 0, 0)
+        row.setAlignment(QtCore.Qt.AlignHCenter)
+        row.addWidget(QtGui.QLabel("Parallel workers:"))
+        row.addWidget(numWorkersSpin)
+        mainLayout.addLayout(row)
+
         # link to other renderer combo
         self.linkedRenderWindowIndex = None
         self.linkedRendererCombo = QtGui.QComboBox()
@@ -1735,35 +1794,7 @@ class ImageSequenceTab(QtGui.QWidget):
         Guess the file prefix
 
         """
-        count = 0
-        lim = None
-        for i in range(len(filename)):
-            if filename[i] == ".":
-                break
-
-            try:
-                int(filename[i])
-
-                if lim is None:
-                    lim = count
-
-            except ValueError:
-                lim = None
-
-            count += 1
-
-        if lim is None:
-            array = os.path.splitext(filename)
-
-            if array[1] == '.gz' or array[1] == '.bz2':
-                array = os.path.splitext(array[0])
-
-            filename = array[0]
-
-        else:
-            filename = filename[:lim]
-
-        return filename
+        return sequencer.guessFilePrefix(filename)
 
     def startSequencer(self):
         """
@@ -1803,86 +1834,116 @@ class ImageSequenceTab(QtGui.QWidget):
         # formatted string
         fileText = "%s%s%s" % (str(self.fileprefix.text()), self.numberFormat, pipelinePage.extension)
 
-        # check abspath (for sftp)
-        abspath = pipelinePage.abspath
-        sftpBrowser = None
-        if pipelinePage.fromSFTP:
-            self.logger.debug("Sequencing SFTP file: '%s'", abspath)
-            array = abspath.split(":")
-            sftpHost = array[0]
-            # handle case where ":"'s are in the file path
-            sftpFile = ":".join(array[1:])
-            self.logger.debug("Host: '%s'; path: '%s'", sftpHost, sftpFile)
-
-            sysDiag = self.mainWindow.systemsDialog
-            sftpDlg = sysDiag.load_system_form.sftp_browser
-            match = False
-            for i in range(sftpDlg.stackedWidget.count()):
-                w = sftpDlg.stackedWidget.widget(i)
-                if w.connectionID == sftpHost:
-                    match = True
-                    break
+        # trajectories contain all the frames in a single file
+        trajectoryFile = pipelinePage.fileFormat.name == latticeReaderGeneric.trajectoryFileFormat.name
+        transfers = None
+        if trajectoryFile:
+            if pipelinePage.fromSFTP:
+                self.logger.error("Cannot sequence a trajectory over SFTP")
+                self.mainWindow.displayError("Cannot sequence a trajectory over SFTP")
+                return
+
+            # the number of frames comes from the frame index
+            reader = self.mainWindow.systemsDialog.load_system_form.readerForm.latticeReader
+            numFrames = reader.getTrajectory(pipelinePage.abspath).numFrames
+            self.logger.debug("Sequencing trajectory with %d frames", numFrames)
 
-            if not match:
-                self.logger.error("Could not find SFTP browser for '%s'", sftpHost)
+            if self.minIndex >= numFrames:
+                self.warnFileNotPresent("frame %d" % self.minIndex, tag="first")
                 return
 
-            # browser
-            sftpBrowser = w
+            if self.maxIndex > self.minIndex:
+                if self.maxIndex >= numFrames:
+                    self.warnFileNotPresent("frame %d" % self.maxIndex, tag="last")
+                    return
+
+                maxIndex = self.maxIndex
+
+            else:
+                maxIndex = numFrames - 1
 
-        # check first file exists
-        if sftpBrowser is None:
-            firstFileExists = utilities.checkForFile(str(self.firstFileLabel.text()))
         else:
-            rp = os.path.join(os.path.dirname(sftpFile), str(self.firstFileLabel.text()))
-            self.logger.debug("Checking first file exists (SFTP): '%s'", rp)
-            firstFileExists = bool(sftpBrowser.checkPathExists(rp)) or bool(sftpBrowser.checkPathExists(rp+".gz")) or bool(sftpBrowser.checkPathExists(rp+".bz2"))
+            # check abspath (for sftp)
+            abspath = pipelinePage.abspath
+            if pipelinePage.fromSFTP:
+                self.logger.debug("Sequencing SFTP file: '%s'", abspath)
+                array = abspath.split(":")
+                sftpHost = array[0]
+                # handle case where ":"'s are in the file path
+                sftpFile = ":".join(array[1:])
+                self.logger.debug("Host: '%s'; path: '%s'", sftpHost, sftpFile)
+
+                sysDiag = self.mainWindow.systemsDialog
+                sftpDlg = sysDiag.load_system_form.sftp_browser
+                match = False
+                for i in range(sftpDlg.stackedWidget.count()):
+                    w = sftpDlg.stackedWidget.widget(i)
+                    if w.connectionID == sftpHost:
+                        match = True
+                        break
+
+                if not match:
+                    self.logger.error("Could not find SFTP browser for '%s'", sftpHost)
+                    return
 
-        if not firstFileExists:
-            self.warnFileNotPresent(str(self.firstFileLabel.text()), tag="first")
-            return
+                # list the remote directory once and download the files ahead of time
+                transfers = sftpTransfer.SequenceTransfers(w.openSFTP, os.path.dirname(sftpFile),
+                                                           self.mainWindow.tmpDirectory)
+                remoteFiles = transfers.matchSequence(fileText)
+                self.logger.debug("Found %d sequencer files on the server", len(remoteFiles))
 
-        # check last file exists
-        if self.maxIndex > self.minIndex:
-            lastFile = fileText % self.maxIndex
-            if sftpBrowser is None:
-                lastFileExists = utilities.checkForFile(lastFile)
+            # check first file exists
+            if transfers is None:
+                firstFileExists = utilities.checkForFile(str(self.firstFileLabel.text()))
             else:
-                rp = os.path.join(os.path.dirname(sftpFile), lastFile)
-                self.logger.debug("Checking last file exists (SFTP): '%s'", rp)
-                lastFileExists = bool(sftpBrowser.checkPathExists(rp)) or bool(sftpBrowser.checkPathExists(rp+".gz")) or bool(sftpBrowser.checkPathExists(rp+".bz2"))
+                firstFileExists = self.minIndex in remoteFiles
 
-            if not lastFileExists:
-                self.warnFileNotPresent(lastFile, tag="last")
+            if not firstFileExists:
+                if transfers is not None:
+                    transfers.close()
+                self.warnFileNotPresent(str(self.firstFileLabel.text()), tag="first")
                 return
 
-            maxIndex = self.maxIndex
-
-        else:
-            # find greatest file
-            self.logger.info("Auto-detecting last sequencer file")
+            # check last file exists
+            if self.maxIndex > self.minIndex:
+                lastFile = fileText % self.maxIndex
+                if transfers is None:
+                    lastFileExists = utilities.checkForFile(lastFile)
+                else:
+                    lastFileExists = self.maxIndex in remoteFiles
 
-            lastIndex = self.minIndex
-            lastFile = fileText % lastIndex
+                if not lastFileExists:
+                    if transfers is not None:
+                        transfers.close()
+                    self.warnFileNotPresent(lastFile, tag="last")
+                    return
 
-            if sftpBrowser is None:
-                def _checkForLastFile(fn):
-                    return utilities.checkForFile(fn)
+                maxIndex = self.maxIndex
 
             else:
-                def _checkForLastFile(fn):
-                    rp = os.path.join(os.path.dirname(sftpFile), lastFile)
-                    return bool(sftpBrowser.checkPathExists(rp)) or bool(sftpBrowser.checkPathExists(rp+".gz")) or bool(sftpBrowser.checkPathExists(rp+".bz2"))
+                # find greatest file
+                self.logger.info("Auto-detecting last sequencer file")
 
-            while _checkForLastFile(lastFile):
-                lastIndex += 1
+                lastIndex = self.minIndex
                 lastFile = fileText % lastIndex
 
-            lastIndex -= 1
-            lastFile = fileText % lastIndex
-            maxIndex = lastIndex
+                if transfers is None:
+                    def _checkForLastFile(fn):
+                        return utilities.checkForFile(fn)
+
+                else:
+                    def _checkForLastFile(fn):
+                        return lastIndex in remoteFiles
+
+                while _checkForLastFile(lastFile):
+                    lastIndex += 1
+                    lastFile = fileText % lastIndex
 
-            self.logger.info("Last file detected as: '%s'", lastFile)
+                lastIndex -= 1
+                lastFile = fileText % lastIndex
+                maxIndex = lastIndex
+
+                self.logger.info("Last file detected as: '%s'", lastFile)
 
         # store current input state
         origInput = copy.deepcopy(self.rendererWindow.getCurrentInputState())
@@ -1922,9 +1983,6 @@ class ImageSequenceTab(QtGui.QWidget):
             # make sure still ok to use this index
             rw2 = self.linkedRendererChanged(self.linkedRendererCombo.currentText())
 
-        if rw2 is not None:
-            saveText2 = saveText + "_2"
-
         # progress dialog
         NSteps = int((maxIndex - self.minIndex) / self.interval) + 1
         progDialog = QtGui.QProgressDialog("Running sequencer...", "Cancel", self.minIndex, NSteps)
@@ -1935,132 +1993,146 @@ class ImageSequenceTab(QtGui.QWidget):
 
         QtGui.QApplication.processEvents()
 
-        # loop over files
-        status = 0
-        previousPos = None
+        # the frames to render (numbered from zero, in this order)
+        frames = list(range(self.minIndex, maxIndex + self.interval, self.interval))
+
+        # render in worker processes if we can
+        parallel = self.numWorkers > 1 and len(frames) > 1
+        if parallel:
+            reason = None
+            if povray:
+                reason = "rendering with POV-Ray"
+            elif transfers is not None:
+                reason = "reading over SFTP"
+            elif rw2 is not None:
+                reason = "linked render window"
+            elif self.rotateAfter:
+                reason = "rotating at end"
+            elif any(fl.traceOptions.drawTraceVectors for fl in pipelinePage.filterLists):
+                reason = "drawing trace vectors"
+            elif self.flickerFlag:
+                reason = "eliminating flicker"
+
+            if reason is not None:
+                self.logger.info("Running sequencer serially (%s)", reason)
+                parallel = False
+
         try:
-            count = 0
-            for i in range(self.minIndex, maxIndex + self.interval, self.interval):
-                if sftpBrowser is None:
-                    currentFile = fileText % i
-                    self.logger.info("Current file: '%s'", currentFile)
+            if parallel:
+                job = self.makeSequencerJob(pipelinePage, origInput, reader, fileText, trajectoryFile, saveText)
+                status = self.runParallelSequencer(job, frames, progDialog)
 
-                else:
-                    # we have to copy current file locally and use that, then delete it afterwards
-                    basename = fileText % i
-                    remoteFile = os.path.join(os.path.dirname(sftpFile), basename)
-                    currentFile = os.path.join(self.mainWindow.tmpDirectory, basename)
-
-                    # check exists
-                    remoteFileTest = remoteFile
-                    fileExists = bool(sftpBrowser.checkPathExists(remoteFileTest))
-                    if not fileExists:
-                        # check gzip
-                        remoteFileTest = remoteFile + ".gz"
-                        fileExists = bool(sftpBrowser.checkPathExists(remoteFileTest))
-                        if fileExists:
-                            currentFile += ".gz"
-                        else:
-                            # check bzip
-                            remoteFileTest = remoteFile + ".bz2"
-                            fileExists = bool(sftpBrowser.checkPathExists(remoteFileTest))
-                            if fileExists:
-                                currentFile += ".bz2"
-                            else:
-                                self.logger.error("SFTP sequencer file does not exist: '%s'", remoteFile)
-                                return
-
-                    remoteFile = remoteFileTest
-
-                    # copy locally
-                    self.logger.debug("Copying file for sequencer: '%s' to '%s'", remoteFile, currentFile)
-                    # copy file and roulette if exists..,
-                    sftpBrowser.copySystem(remoteFile, currentFile)
-
-                # read in state
-                status, state = reader.readFile(currentFile, pipelinePage.fileFormat, rouletteIndex=i-1, linkedLattice=pipelinePage.linkedLattice)
-                if status:
-                    self.logger.error("Sequencer read file failed with status: %d" % status)
-                    break
+            else:
+                if transfers is not None:
+                    transfers.schedule(frames)
 
-                # eliminate flicker across PBCs
-                if self.flickerFlag:
-                    self.eliminateFlicker(state, previousPos, pipelinePage)
-                    previousPos = copy.deepcopy(state.pos)
+                status = self.runSerialSequencer(frames, progDialog, pipelinePage, origInput, reader, fileText,
+                                                 trajectoryFile, transfers, saveDir, saveText, rw2, povray)
 
-                # set PBCs the same
-                state.PBC[:] = origInput.PBC[:]
+            # exit if cancelled
+            if status == 2:
+                return
+
+            # create movie
+            if not status and self.createMovieBox.isChecked():
+                # show wait cursor
+#                 QtGui.QApplication.setOverrideCursor(QtGui.QCursor(QtCore.Qt.WaitCursor))
 
-                # attempt to read any scalars/vectors files
-                for vectorsName, vectorsFile in six.iteritems(origInput.vectorsFiles):
-                    self.logger.debug("Sequencer checking vectors file: '%s'", vectorsFile)
+                try:
+                    self.parent.createMovie(saveDir, saveText, self.createMovieBox)
 
-                    vdn, vbn = os.path.split(vectorsFile)
+                    if rw2 is not None:
+                        self.parent.createMovie(saveDir, os.path.join(saveDir, "merge%d"), self.createMovieBox, prefix="merged")
 
-                    # guess prefix
-                    guessvfn = self.guessFilePrefix(vbn)
+                finally:
+                    # set cursor to normal
+#                     QtGui.QApplication.restoreOverrideCursor()
+                    pass
 
-                    if guessvfn != vbn:
-                        ext = "." + vbn.split(".")[-1]
-                        if ext == vbn:
-                            ext = ""
+            # rotate?
+            if self.rotateAfter:
+                self.logger.debug("Running rotator after sequencer...")
+                self.parent.imageRotateTab.startRotator()
+
+        finally:
+            # stop downloading and delete the local copies (SFTP)
+            if transfers is not None:
+                transfers.close()
+                self.logger.debug("Downloaded %d bytes over SFTP", transfers.bytesDownloaded)
 
-                        vfn = "%s%s%s" % (guessvfn, self.numberFormat, ext)
-                        if len(vdn):
-                            vfn = os.path.join(vdn, vfn)
+            # the workers do not change the input of this window
+            if not parallel:
+                self.logger.debug("Reloading original input")
 
-                        vfn = vfn % i
+                # reload original input
+                pipelinePage.inputState = origInput
+                pipelinePage.postInputLoaded()
 
-                        self.logger.debug("Looking for vectors file: '%s' (%s)", vfn, os.path.exists(vfn))
-                        if os.path.exists(vfn):
-                            # read vectors file
-                            ok = True
-                            with open(vfn) as f:
-                                vectors = []
-                                try:
-                                    for line in f:
-                                        array = line.split()
-                                        array[0] = float(array[0])
-                                        array[1] = float(array[1])
-                                        array[2] = float(array[2])
+                # run filter list if didn't auto run
+                if origInput.NAtoms > self.mainWindow.preferences.renderingForm.maxAtomsAutoRun:
+                    pipelinePage.runAllFilterLists()
+
+            # close progress dialog
+            progDialog.close()
+
+    def runSerialSequencer(self, frames, progDialog, pipelinePage, origInput, reader, fileText, trajectoryFile,
+                           transfers, saveDir, saveText, rw2, povray):
+        """
+        Render the frames in this window, returning 0 on success, 1 if a frame could not
+        be read or 2 if cancelled.
 
-                                        vectors.append(array)
+        """
+        if rw2 is not None:
+            saveText2 = saveText + "_2"
 
-                                except:
-                                    self.logger.error("Error reading vector file")
-                                    ok = False
+        # frames are read ahead (in a background thread, with a separate reader) while the
+        # current frame is filtered and rendered
+        if self.prefetchFrames > 0:
+            frameReader = latticeReaderGeneric.LatticeReaderGeneric(tmpLocation=self.mainWindow.tmpDirectory,
+                                                                    cache=reader.cache, reorder=reader.reorder)
+        else:
+            frameReader = reader
+        frameArgs = (frameReader, fileText, trajectoryFile, transfers, pipelinePage, origInput)
+        prefetcher = prefetch.FramePrefetcher(lambda i: self.readSequencerFrame(i, *frameArgs), frames,
+                                              maxFrames=self.prefetchFrames,
+                                              memoryBudget=self.prefetchMemory * 1048576,
+                                              sizeOf=lambda result: 0 if result[2] is None else result[2].memoryUsage())
 
-                            if ok and len(vectors) != state.NAtoms:
-                                self.logger.error("The vector data is the wrong length")
-                                ok = False
+        # neighbour lists are reused across the frames
+        for filterList in pipelinePage.filterLists:
+            filterList.filterer.toggleVerletLists(True)
 
-                            if ok:
-                                # convert to numpy array
-                                vectors = np.asarray(vectors, dtype=np.float64)
-                                assert vectors.shape[0] == state.NAtoms and vectors.shape[1] == 3
+        # loop over files
+        status = 0
+        previousPos = None
+        try:
+            count = 0
+            for i, (currentFile, status, state) in prefetcher:
+                if status:
+                    self.logger.error("Sequencer read file failed with status: %d" % status)
+                    return 1
 
-                                state.vectorsDict[vectorsName] = vectors
-                                state.vectorsFiles[vectorsName] = vfn
+                # eliminate flicker across PBCs
+                if self.flickerFlag:
+                    self.eliminateFlicker(state, previousPos, pipelinePage)
+                    previousPos = copy.deepcopy(state.fileOrderPositions())
 
-                                self.logger.debug("Added vectors data (%s) to sequencer lattice", vectorsName)
+                # set PBCs the same
+                state.PBC[:] = origInput.PBC[:]
 
                 # set input state on current pipeline
                 pipelinePage.inputState = state
 
                 # exit if cancelled
                 if progDialog.wasCanceled():
-                    if sftpBrowser is not None:
-                        os.unlink(currentFile)
-                    return
+                    return 2
 
                 # now apply all filters
                 pipelinePage.runAllFilterLists(sequencer=True)
 
                 # exit if cancelled
                 if progDialog.wasCanceled():
-                    if sftpBrowser is not None:
-                        os.unlink(currentFile)
-                    return
+                    return 2
 
                 saveName = saveText % count
                 self.logger.info("  Saving image: '%s'", saveName)
@@ -2101,55 +2173,121 @@ class ImageSequenceTab(QtGui.QWidget):
 
                 # exit if cancelled
                 if progDialog.wasCanceled():
-                    if sftpBrowser is not None:
-                        os.unlink(currentFile)
-                    return
+                    return 2
 
-                # delete local copy of file (SFTP)
-                if sftpBrowser is not None:
-                    os.unlink(currentFile)
+                # local copy of file is no longer needed (SFTP)
+                if transfers is not None:
+                    transfers.release(i)
 
                 # update progress
                 progDialog.setValue(count)
 
                 QtGui.QApplication.processEvents()
 
-            # create movie
-            if not status and self.createMovieBox.isChecked():
-                # show wait cursor
-#                 QtGui.QApplication.setOverrideCursor(QtGui.QCursor(QtCore.Qt.WaitCursor))
+        finally:
+            # stop reading ahead
+            prefetcher.close()
 
-                try:
-                    self.parent.createMovie(saveDir, saveText, self.createMovieBox)
+            # free the neighbour lists
+            for filterList in pipelinePage.filterLists:
+                filterList.filterer.toggleVerletLists(False)
 
-                    if rw2 is not None:
-                        self.parent.createMovie(saveDir, os.path.join(saveDir, "merge%d"), self.createMovieBox, prefix="merged")
+        return 0
 
-                finally:
-                    # set cursor to normal
-#                     QtGui.QApplication.restoreOverrideCursor()
-                    pass
+    def makeSequencerJob(self, pipelinePage, origInput, reader, fileText, trajectoryFile, saveText):
+        """
+        Capture everything the worker processes need to render the sequence like this window does
 
-            # rotate?
-            if self.rotateAfter:
-                self.logger.debug("Running rotator after sequencer...")
-                self.parent.imageRotateTab.startRotator()
+        """
+        prefs = self.mainWindow.preferences
+        cache = reader.cache
+        filterLists = [sequencer.captureFilterList(filterList) for filterList in pipelinePage.filterLists]
+
+        # share the threads between the workers
+        numThreads = max(1, prefs.generalForm.openmpNumThreads // self.numWorkers)
+
+        job = sequencer.SequencerJob(pipelinePage.fileFormat, fileText, pipelinePage.abspath, trajectoryFile,
+                                     pipelinePage.linkedLattice, pipelinePage.refState, origInput, pipelinePage.PBC,
+                                     self.numberFormat, saveText, self.parent.imageFormat,
+                                     sequencer.captureRendererWindow(self.rendererWindow), filterLists,
+                                     sequencer.Snapshot(prefs.renderingForm), self.mainWindow.tmpDirectory,
+                                     cacheDirectory=None if cache is None else cache.directory,
+                                     cacheSize=0 if cache is None else cache.maxSize, numThreads=numThreads,
+                                     reorder=reader.reorder)
+
+        return job
+
+    def runParallelSequencer(self, job, frames, progDialog):
+        """
+        Render the frames in worker processes, returning 0 on success, 1 if a worker failed
+        or 2 if cancelled.
+
+        """
+        self.logger.info("Running sequencer in %d worker processes", self.numWorkers)
+
+        runner = sequencer.ParallelSequencer(job, frames, self.numWorkers)
+        try:
+            runner.start()
+
+            count = 0
+            for index, filename in runner:
+                if progDialog.wasCanceled():
+                    runner.cancel()
+                    return 2
+
+                if filename is not None:
+                    self.logger.info("  Saved image: '%s'", filename)
+                    count += 1
+                    progDialog.setValue(count)
+
+                QtGui.QApplication.processEvents()
+
+        except RuntimeError as error:
+            self.logger.error("Sequencer failed: %s", error)
+            self.mainWindow.displayError("Sequencer failed!\n\n%s" % error)
+            return 1
 
         finally:
-            self.logger.debug("Reloading original input")
+            runner.close()
 
-            # reload original input
-            pipelinePage.inputState = origInput
-            pipelinePage.postInputLoaded()
+        return 0
 
-            # run filter list if didn't auto run
-            if origInput.NAtoms > self.mainWindow.preferences.renderingForm.maxAtomsAutoRun:
-                pipelinePage.runAllFilterLists()
+    def readSequencerFrame(self, i, reader, fileText, trajectoryFile, transfers, pipelinePage, origInput):
+        """
+        Read the given sequencer frame, returning (currentFile, status, state).
 
-            # close progress dialog
-            progDialog.close()
+        This may be called in a background thread (see FramePrefetcher) so it must not
+        touch the GUI.
+
+        """
+        if trajectoryFile:
+            currentFile = pipelinePage.abspath
+            self.logger.info("Current frame: %d", i)
+
+        elif transfers is None:
+            currentFile = fileText % i
+            self.logger.info("Current file: '%s'", currentFile)
+
+        else:
+            # local copy of the file (downloaded ahead of time), deleted once released
+            try:
+                currentFile = transfers.fetch(i)
+            except IOError as error:
+                self.logger.error("SFTP sequencer file could not be copied: %s", error)
+                return None, 1, None
+
+            self.logger.info("Current file: '%s'", currentFile)
+
+        # read in state
+        status, state = reader.readFile(currentFile, pipelinePage.fileFormat, rouletteIndex=i-1,
+                                        linkedLattice=pipelinePage.linkedLattice, frameIndex=i)
+        if status:
+            return currentFile, status, None
 
+        # attempt to read any vectors files
+        sequencer.readVectorsFiles(state, origInput.vectorsFiles, self.numberFormat, i)
 
+        return currentFile, status, state
 
     def eliminateFlicker(self, state, previousPos, pipelinePage):
         """
@@ -2159,20 +2297,9 @@ class ImageSequenceTab(QtGui.QWidget):
         if previousPos is None:
             return
 
-        pbc = pipelinePage.PBC
-        if not pbc[0] and not pbc[1] and not pbc[2]:
-            return
-
-        logger = self.logger
-        logger.debug("Attempting to eliminate PBC flicker")
-
-        if len(previousPos) < len(state.pos):
-            prevNAtoms = len(previousPos)/3
-            count = vectors_c.eliminatePBCFlicker(prevNAtoms, state.pos, previousPos, state.cellDims, pbc)
-        else:
-            count = vectors_c.eliminatePBCFlicker(state.NAtoms, state.pos, previousPos, state.cellDims, pbc)
-
-        logger.debug("Modified: %d", count)
+        self.logger.debug("Attempting to eliminate PBC flicker")
+        count = sequencer.eliminateFlicker(state, previousPos, pipelinePage.PBC)
+        self.logger.debug("Modified: %d", count)
 
     def warnFileNotPresent(self, filename, tag="first"):
         """
@@ -2280,6 +2407,27 @@ class ImageSequenceTab(QtGui.QWidget):
         """
         self.interval = val
 
+    def prefetchFramesChanged(self, val):
+        """
+        Number of prefetch frames changed
+
+        """
+        self.prefetchFrames = val
+
+    def prefetchMemoryChanged(self, val):
+        """
+        Prefetch memory budget changed
+
+        """
+        self.prefetchMemory = val
+
+    def numWorkersChanged(self, val):
+        """
+        Number of worker processes changed
+
+        """
+        self.numWorkers = val
+
     def numberFormatChanged(self, text):
         """
         Change number format
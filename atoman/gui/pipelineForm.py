@@ -25,7 +25,6 @@ import numpy as np
 
 from ..visutils.utilities import iconPath
 from . import filterList
-from . import picker
 from .dialogs import infoDialogs
 from . import utils
 from ..rendering import highlight
@@ -242,35 +241,17 @@ class PipelineForm(QtGui.QWidget):
             shift[1] = dlg.shiftYSpin.value()
             shift[2] = dlg.shiftZSpin.value()
             
-            # loop over atoms
             if shift[0] or shift[1] or shift[2]:
                 self.logger.debug("Shifting cell: x = %f; y = %f; z = %f", shift[0], shift[1], shift[2])
                 
-                # progress update interval
-                progressInterval = int(lattice.NAtoms / 10)
-                if progressInterval < 50:
-                    progressInterval = 50
-                elif progressInterval > 500:
-                    progressInterval = 500
-                
                 # set override cursor
                 QtGui.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
                 try:
                     # add progress dialog
                     self.mainWindow.updateProgress(0, lattice.NAtoms, "Shifting cell")
                     
-                    # loop over atoms
-                    for i in range(lattice.NAtoms):
-                        i3 = 3 * i
-                        for j in range(3):
-                            lattice.pos[i3 + j] += shift[j]
-                        
-                        # progress
-                        if i % progressInterval == 0:
-                            self.mainWindow.updateProgress(i, lattice.NAtoms, "Shifting cell")
-                    
-                    # wrap atoms back into periodic cell
-                    lattice.wrapAtoms()
+                    # shift atoms and wrap back into periodic cell
+                    lattice.shiftAtoms(shift, updateProgress=self.mainWindow.updateProgress)
                 
                 finally:
                     self.mainWindow.hideProgressBar()
@@ -318,69 +299,21 @@ class PipelineForm(QtGui.QWidget):
                 self.logger.warning("Replicating cell: this will modify the current input state everywhere")
                 self.logger.debug("Replicating cell: %r", repDirs)
                 
-                # TODO: write in C
                 lattice = self.inputState
-                newpos = np.empty(3, np.float64)
-                cellDims = lattice.cellDims
                 
-                # calculate final number of atoms
-                numfin = lattice.NAtoms
-                for i in range(3):
-                    numfin += numfin * repDirs[i]
-                numadd = numfin - lattice.NAtoms
+                # calculate number of atoms to add
+                numadd = lattice.NAtoms * (np.prod(repDirs + 1) - 1)
                 self.logger.debug("Replicating cell: adding %d atoms", numadd)
                 
-                # progress update interval
-                progressInterval = int(numadd / 10)
-                if progressInterval < 50:
-                    progressInterval = 50
-                elif progressInterval > 500:
-                    progressInterval = 500
-                
                 # set override cursor
                 QtGui.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
                 try:
                     # add progress dialog
                     self.mainWindow.updateProgress(0, numadd, "Replicating cell")
                     
-                    # loop over directions
-                    count = 0
-                    for i in range(3):
-                        self.logger.debug("Replicating along axis %d: %d times", i, repDirs[i])
-                        
-                        # store num atoms at beginning of this direction
-                        NAtoms = lattice.NAtoms
-                        
-                        # loop over number of replications in this direction
-                        for j in range(repDirs[i]):
-                            # loop over atoms
-                            for k in range(NAtoms):
-                                # attributes to copy to new atom
-                                sym = lattice.atomSym(k)
-                                q = lattice.charge[k]
-                                scalarVals = {}
-                                for name, scalarsArray in six.iteritems(lattice.scalarsDict):
-                                    scalarVals[name] = scalarsArray[k]
-                                vectorVals = {}
-                                for name, vectorsArray in six.iteritems(lattice.vectorsDict):
-                                    vectorVals[name] = vectorsArray[k]
-                                
-                                # new position
-                                pos = lattice.atomPos(k)
-                                newpos[:] = pos[:]
-                                newpos[i] += (j + 1) * cellDims[i]
-                                
-                                # add atom
-                                lattice.addAtom(sym, newpos, q, scalarVals=scalarVals, vectorVals=vectorVals)
-                                
-                                # progress
-                                count += 1
-                                if count % progressInterval == 0:
-                                    self.mainWindow.updateProgress(count, numadd, "Replicating cell")
-                                    
-                        # change cell dimension
-                        lattice.cellDims[i] += cellDims[i] * repDirs[i]
-                        self.logger.debug("New cellDims along axis %d: %f", i, lattice.cellDims[i])
+                    # replicate the cell
+                    lattice.replicate(repDirs, updateProgress=self.mainWindow.updateProgress)
+                    self.logger.debug("New cellDims: %r", lattice.cellDims)
                 
                 finally:
                     self.mainWindow.hideProgressBar()
@@ -782,18 +715,17 @@ class PipelineForm(QtGui.QWidget):
         Builds an array containing all (unique) visible atoms.
         
         """
-        visibleAtomsFull = None
+        visibleSet = None
         for filterList_ in self.filterLists:
-            visibleAtoms = filterList_.filterer.visibleAtoms
-            
-            if visibleAtomsFull is None:
-                visibleAtomsFull = visibleAtoms
+            if visibleSet is None:
+                visibleSet = filterList_.filterer.getVisibleSet()
             else:
-                visibleAtomsFull = np.append(visibleAtomsFull, visibleAtoms)
+                visibleSet = visibleSet | filterList_.filterer.getVisibleSet()
         
-        visibleAtomsFull = np.unique(visibleAtomsFull)
+        if visibleSet is None:
+            return np.empty(0, np.int32)
         
-        return visibleAtomsFull
+        return visibleSet.indexes()
     
     def broadcastToRenderers(self, method, args=(), kwargs={}, globalBcast=False):
         """
@@ -825,33 +757,6 @@ class PipelineForm(QtGui.QWidget):
         # loop over filter lists
         filterLists = self.filterLists
         
-        # states
-        refState = self.refState
-        inputState = self.inputState
-        
-        # we don't want PBCs when picking
-        pickPBC = np.zeros(3, np.int32)
-        
-        # min/max pos for boxing
-        # we need the min/max of ref/input/pickPos
-        minPos = np.zeros(3, np.float64)
-        maxPos = np.zeros(3, np.float64)
-        for i in range(3):
-            # set to min ref pos
-            minPos[i] = min(refState.pos[i::3])
-            maxPos[i] = max(refState.pos[i::3])
-            
-            # see if min input pos is less
-            minPos[i] = min(minPos[i], min(inputState.pos[i::3]))
-            maxPos[i] = max(maxPos[i], max(inputState.pos[i::3]))
-            
-            # see if picked pos is less
-            minPos[i] = min(minPos[i], pickPos[i])
-            maxPos[i] = max(maxPos[i], pickPos[i])
-        
-        logger.debug("Min pos for picker: %r", minPos)
-        logger.debug("Max pos for picker: %r", maxPos)
-        
         # loop over filter lists, looking for closest object to pick pos
         minSepIndex = -1
         minSep = 9999999.0
@@ -873,15 +778,10 @@ class PipelineForm(QtGui.QWidget):
             latticeScalarsDict = filterer.latticeScalarsDict
             vectorsDict = filterer.vectorsDict
             
-            result = np.empty(3, np.float64)
-            
-            status = picker.pickObject(visibleAtoms, vacancies, interstitials, onAntisites, splitInts, pickPos,
-                                       inputState.pos, refState.pos, pickPBC, inputState.cellDims,
-                                       inputState.specie, refState.specie, inputState.specieCovalentRadius,
-                                       refState.specieCovalentRadius, result)
-            
-            if status:
-                raise RuntimeError("Picker exited with non zero status (%d)" % status)
+            # nearest object (the index is built once after each run of the filters)
+            result = filterer.getPickIndex().pick(pickPos)
+            if result is None:
+                continue
             
             tmp_type, tmp_index, tmp_sep = result
             
@@ -968,7 +868,7 @@ class PipelineForm(QtGui.QWidget):
         visible = False
         visibleFilterList = None
         for filterList_ in self.filterLists:
-            if index in filterList_.filterer.visibleAtoms:
+            if index in filterList_.filterer.getVisibleSet():
                 visible = True
                 visibleFilterList = filterList_
                 break
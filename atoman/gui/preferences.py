@@ -859,6 +859,19 @@ class GeneralSettingsForm(GenericPreferencesSettingsForm):
         systems. This does not effect systems that are currently loaded or systems
         that are generated.
     
+    **MEMORY_MAP_THRESHOLD**
+        Systems with at least this many million atoms will have their per-atom data
+        (positions, species, charges, IDs, scalars and vectors) stored in memory-mapped
+        files in the temporary directory after they are loaded, rather than in RAM.
+        The default is "0" which disables memory-mapping.
+    
+    **PARSE_CACHE_SIZE**
+        The maximum size of the cache of parsed files (in MB), which is stored in the
+        Atoman data directory. Files that were parsed before (and have not changed
+        since) are loaded from the cache instead of being parsed again. When the cache
+        is full the least recently used files are removed. Setting this to "0"
+        disables the cache.
+    
     """
     def __init__(self, parent):
         super(GeneralSettingsForm, self).__init__(parent)
@@ -922,8 +935,116 @@ class GeneralSettingsForm(GenericPreferencesSettingsForm):
             row.addWidget(check)
         self.layout.addRow("Default PBCs", row)
         
+        # memory-map threshold
+        self.memoryMapThreshold = int(self.settings.value("memoryMap/threshold", 0))
+        self.logger.debug("Memory-map threshold (initial value): %d", self.memoryMapThreshold)
+        memoryMapSpin = QtGui.QSpinBox()
+        memoryMapSpin.setMinimum(0)
+        memoryMapSpin.setMaximum(9999)
+        memoryMapSpin.setSuffix(" M atoms")
+        memoryMapSpin.setValue(self.memoryMapThreshold)
+        memoryMapSpin.valueChanged.connect(self.memoryMapThresholdChanged)
+        memoryMapSpin.setToolTip('<p>Store the atom data of systems with at least this many million atoms in '
+                                 'memory-mapped files, rather than in RAM. "0" disables memory-mapping.</p>')
+        self.layout.addRow("Memory-map threshold", memoryMapSpin)
+        
+        # parse cache size
+        self.parseCacheSize = int(self.settings.value("parseCache/maxSize", 0))
+        self.logger.debug("Parse cache size (initial value): %d", self.parseCacheSize)
+        parseCacheSpin = QtGui.QSpinBox()
+        parseCacheSpin.setMinimum(0)
+        parseCacheSpin.setMaximum(1000000)
+        parseCacheSpin.setSuffix(" MB")
+        parseCacheSpin.setValue(self.parseCacheSize)
+        parseCacheSpin.valueChanged.connect(self.parseCacheSizeChanged)
+        parseCacheSpin.setToolTip('<p>Maximum size of the cache of parsed files. Files in the cache are loaded '
+                                  'without being parsed again. "0" disables the cache.</p>')
+        self.layout.addRow("Parse cache size", parseCacheSpin)
+        
+        # reorder atoms on load
+        self.reorderCurve = str(self.settings.value("reorder/curve", "None"))
+        self.logger.debug("Reorder curve (initial value): %s", self.reorderCurve)
+        reorderCombo = QtGui.QComboBox()
+        reorderCombo.addItems(["None", "Morton", "Hilbert"])
+        reorderCombo.setCurrentIndex(max(0, reorderCombo.findText(self.reorderCurve)))
+        reorderCombo.currentIndexChanged[str].connect(self.reorderCurveChanged)
+        reorderCombo.setToolTip('<p>Order the atoms of subsequently loaded systems along a space-filling curve, so '
+                                'atoms that are close in space are close in memory (the filters run faster). '
+                                'Atoms are still written and matched to the reference in the order of the file.</p>')
+        self.layout.addRow("Reorder atoms on load", reorderCombo)
+        
+        # filter stage cache size
+        self.stageCacheSize = int(self.settings.value("stageCache/maxSize", 512))
+        self.logger.debug("Stage cache size (initial value): %d", self.stageCacheSize)
+        stageCacheSpin = QtGui.QSpinBox()
+        stageCacheSpin.setMinimum(0)
+        stageCacheSpin.setMaximum(1000000)
+        stageCacheSpin.setSuffix(" MB")
+        stageCacheSpin.setValue(self.stageCacheSize)
+        stageCacheSpin.valueChanged.connect(self.stageCacheSizeChanged)
+        stageCacheSpin.setToolTip('<p>Maximum size of the results kept for each filter of each filter list. When a '
+                                  'list is applied again it is resumed from the first filter that changed. '
+                                  '"0" disables the cache.</p>')
+        self.layout.addRow("Filter stage cache size", stageCacheSpin)
+        
         self.init()
     
+    def reorderCurveName(self):
+        """
+        Return the curve to reorder atoms along when loading them ("morton" or "hilbert"), or None.
+        
+        """
+        return None if self.reorderCurve == "None" else self.reorderCurve.lower()
+    
+    def reorderCurveChanged(self, text):
+        """
+        Reorder curve has changed
+        
+        """
+        self.reorderCurve = str(text)
+        self.settings.setValue("reorder/curve", self.reorderCurve)
+        self.logger.debug("Updated reorder curve: %s", self.reorderCurve)
+        
+        # update the lattice reader
+        readerForm = self.parent.mainWindow.systemsDialog.load_system_form.readerForm
+        readerForm.latticeReader.reorder = self.reorderCurveName()
+    
+    def stageCacheSizeChanged(self, val):
+        """
+        Filter stage cache size has changed
+        
+        """
+        self.stageCacheSize = val
+        self.settings.setValue("stageCache/maxSize", val)
+        self.logger.debug("Updated stage cache size: %d", val)
+        
+        # update the caches of all the filter lists
+        for pipelinePage in self.parent.mainWindow.mainToolbar.pipelineList:
+            for filterList in pipelinePage.filterLists:
+                filterList.filterer.stageCache.setMaxSize(val * 1048576)
+    
+    def parseCacheSizeChanged(self, val):
+        """
+        Parse cache size has changed
+        
+        """
+        self.parseCacheSize = val
+        self.settings.setValue("parseCache/maxSize", val)
+        self.logger.debug("Updated parse cache size: %d", val)
+        
+        # update the cache used by the lattice reader
+        readerForm = self.parent.mainWindow.systemsDialog.load_system_form.readerForm
+        readerForm.latticeReader.cache.setMaxSize(val * 1048576)
+    
+    def memoryMapThresholdChanged(self, val):
+        """
+        Memory-map threshold has changed
+        
+        """
+        self.memoryMapThreshold = val
+        self.settings.setValue("memoryMap/threshold", val)
+        self.logger.debug("Updated memory-map threshold: %d", val)
+    
     def defaultPBCChanged(self, axis, state):
         """
         Default PBC has changed
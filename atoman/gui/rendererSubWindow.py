@@ -18,12 +18,11 @@ import vtk
 import numpy as np
 
 from ..visutils.utilities import iconPath
-from ..visutils import utilities
 from .dialogs import simpleDialogs
 from .dialogs import onScreenInfoDialog
 from ..rendering import renderer
 from .outputDialog import OutputDialog
-from ..rendering.text import vtkRenderWindowText
+from ..rendering import text
 from ..system.lattice import Lattice
 import six
 from six.moves import range
@@ -714,311 +713,15 @@ class RendererWindow(QtGui.QWidget):
         if inputState is None:
             inputState = Lattice()
         
-        # add lattice attributes
-        self.logger.debug("Adding Lattice attributes: %r", list(inputState.attributes.keys()))
-        for key, value in six.iteritems(inputState.attributes):
-            self.onScreenInfo[key] = value
+        # gather the information
+        self.onScreenInfo = text.makeOnScreenInfo(inputState, self.getCurrentRefState(), self.getFilterLists())
         
-        # atom count
-        self.onScreenInfo["Atom count"] = (inputState.NAtoms,)
-        
-        # Lattice attributes
-        for key, value in six.iteritems(inputState.attributes):
-            if key == "Time":
-                self.onScreenInfo[key] = tuple(utilities.simulationTimeLine(value).split())
-            
-            else:
-                self.onScreenInfo[key] = (value,)        
-
-        # lattice temperature
-        if not "Temperature" in inputState.attributes:
-            temperature = inputState.calcTemperature()
-            if temperature is not None:
-                self.onScreenInfo["Temperature"] = ("%.3f" % temperature,)
-        
-        # filter lists
-        filterLists = self.getFilterLists()
-        
-        # visible counts always recalculated
-        visCountActive = False
-        visCount = 0
-        numClusters = 0
-        for filterList in filterLists:
-            if filterList.visible:
-                if not filterList.defectFilterSelected:
-                    visCountActive = True
-                    visCount += len(filterList.filterer.visibleAtoms)
-                
-                numClusters += len(filterList.filterer.clusterList)
-        
-        if numClusters:
-            self.onScreenInfo["Cluster count"] = (numClusters,)
-        
-        if visCountActive:
-            self.onScreenInfo["Visible count"] = (visCount,)
-        
-            visSpecCount = np.zeros(len(inputState.specieList), np.int32)
-            for filterList in filterLists:
-                if filterList.visible and not filterList.defectFilterSelected and len(filterList.filterer.visibleAtoms):
-                    if len(visSpecCount) == len(filterList.filterer.visibleSpecieCount):
-                        visSpecCount = np.add(visSpecCount, filterList.filterer.visibleSpecieCount)
-        
-            specieList = inputState.specieList
-            self.onScreenInfo["Visible species count"] = []
-            for i, cnt in enumerate(visSpecCount):
-                self.onScreenInfo["Visible species count"].append((cnt, specieList[i]))
-        
-        # structure counters
-        for filterList in filterLists:
-            for key, structureCounterDict in six.iteritems(filterList.filterer.structureCounterDicts):
-                self.logger.debug("Adding on-screen info for structure counter: '%s'", key)
-                self.onScreenInfo[key] = []
-                
-                for structure in sorted(structureCounterDict.keys()):
-                    self.logger.debug("  %d %s" % (structureCounterDict[structure], structure))
-                    self.onScreenInfo[key].append((structureCounterDict[structure], structure))
-        
-        # defects counts
-        defectFilterActive = False
-        NVac = 0
-        NInt = 0
-        NAnt = 0
-        showVacs = False
-        showInts = False
-        showAnts = False
-        for filterList in filterLists:
-            if filterList.visible and filterList.defectFilterSelected:
-                defectFilterActive = True
-                
-                NVac += len(filterList.filterer.vacancies)
-                NSplit = len(filterList.filterer.splitInterstitials) // 3
-                NInt += len(filterList.filterer.interstitials) + NSplit
-                NAnt += len(filterList.filterer.antisites)
-                
-                # defects settings
-                defectsSettings = filterList.getCurrentFilterSettings()[0].getSettings()
-                
-                if defectsSettings.getSetting("showVacancies"):
-                    showVacs = True
-                
-                if defectsSettings.getSetting("showInterstitials"):
-                    showInts = True
-                
-                if defectsSettings.getSetting("showAntisites"):
-                    showAnts = True
-                
-            elif filterList.visible and len(filterList.filterer.bubbleList):
-                # bubbles (temporary)
-                showVacs = True
-                defectFilterActive = True
-                NVac += len(filterList.filterer.vacancies)
-        
-        if defectFilterActive:
-            refState = self.getCurrentRefState()
-            
-            # defect specie counters
-            vacSpecCount = np.zeros(len(refState.specieList), np.int32)
-            intSpecCount = np.zeros(len(inputState.specieList), np.int32)
-            antSpecCount = np.zeros((len(refState.specieList), len(inputState.specieList)), np.int32)
-            splitSpecCount = np.zeros((len(inputState.specieList), len(inputState.specieList)), np.int32)
-            for filterList in filterLists:
-                if filterList.visible and filterList.defectFilterSelected:
-                    if len(vacSpecCount) == len(filterList.filterer.vacancySpecieCount):
-                        vacSpecCount = np.add(vacSpecCount, filterList.filterer.vacancySpecieCount)
-                    if len(intSpecCount) == len(filterList.filterer.interstitialSpecieCount):
-                        intSpecCount = np.add(intSpecCount, filterList.filterer.interstitialSpecieCount)
-                    if len(antSpecCount) == len(filterList.filterer.antisiteSpecieCount):
-                        antSpecCount = np.add(antSpecCount, filterList.filterer.antisiteSpecieCount)
-                    if len(splitSpecCount) == len(filterList.filterer.splitIntSpecieCount):
-                        splitSpecCount = np.add(splitSpecCount, filterList.filterer.splitIntSpecieCount)
-            
-            # now add to dict
-            self.onScreenInfo["Defect count"] = []
-            
-            if showVacs:
-                self.onScreenInfo["Defect count"].append((NVac, "vacancies"))
-            
-            if showInts:
-                self.onScreenInfo["Defect count"].append((NInt, "interstitials"))
-            
-            if showAnts:
-                self.onScreenInfo["Defect count"].append((NAnt, "antisites"))
-            
-            specListInput = inputState.specieList
-            specListRef = refState.specieList
-            specRGBInput = inputState.specieRGB
-            specRGBRef = refState.specieRGB
-            
-            self.onScreenInfo["Defect species count"] = []
-            
-            if showVacs:
-                for i, cnt in enumerate(vacSpecCount):
-                    self.onScreenInfo["Defect species count"].append([(cnt, specListRef[i], "vacancies"), specRGBRef[i]])
-            
-            if showInts:
-                for i, cnt in enumerate(intSpecCount):
-                    self.onScreenInfo["Defect species count"].append([(cnt, specListInput[i], "interstitials"), specRGBInput[i]])
-                
-                if defectsSettings.getSetting("identifySplitInts"):
-                    for i in range(len(specListInput)):
-                        for j in range(i, len(specListInput)):
-                            N = splitSpecCount[i][j]
-                            if j == i:
-                                rgb = specRGBInput[i]
-                            else:
-                                rgb = (specRGBInput[i] + specRGBInput[j]) / 2.0
-                            
-                            self.onScreenInfo["Defect species count"].append([(N, "%s-%s" % (specListInput[i], specListInput[j]), "split ints"), rgb])
-            
-            if showAnts:
-                for i in range(len(specListRef)):
-                    for j in range(len(specListInput)):
-                        if i == j:
-                            continue
-                        self.onScreenInfo["Defect species count"].append([(antSpecCount[i][j], "%s on %s" % (specListInput[j], specListRef[i]), "antisites"), specRGBRef[i]])
-        
-        # alignment/position stuff
-        topyLeft = self.vtkRenWinInteract.height() - 5
-        topxLeft = 5
-        topyRight = self.vtkRenWinInteract.height() - 5
-        topxRight = self.vtkRenWinInteract.width() - 220
-        
-        # loop over selected text
-        for i in range(len(selectedText)):
-            settings = selectedText[i]
-            item = settings.title
-            
-            try:
-                line = self.onScreenInfo[item]
-            
-            except KeyError:
-                self.logger.debug("Item '%s' not in onScreenInfo dict", item)
-            
-            else:
-                if item == "Visible species count":
-                    for j, specline in enumerate(line):
-                        r, g, b = inputState.specieRGB[j]
-                        r, g, b = self.checkTextRGB(r, g, b)
-                        
-                        if settings.position == "Top left":
-                            xpos = topxLeft
-                            ypos = topyLeft
-                        else:
-                            xpos = topxRight
-                            ypos = topyRight
-                        
-                        # make text string
-                        text = settings.makeText(specline)
-                        
-                        # add actor
-                        actor = vtkRenderWindowText(text, 20, xpos, ypos, r, g, b)
-                        
-                        if settings.position == "Top left":
-                            topyLeft -= 20
-                        else:
-                            topyRight -= 20
-                        
-                        self.onScreenInfoActors.AddItem(actor)
-                
-                elif item == "Defect count":
-                    for specline in line:
-                        r = g = b = 0
-                        r, g, b = self.checkTextRGB(r, g, b)
-                        
-                        if settings.position == "Top left":
-                            xpos = topxLeft
-                            ypos = topyLeft
-                        else:
-                            xpos = topxRight
-                            ypos = topyRight
-                        
-                        # make text string
-                        text = settings.makeText(specline)
-                        
-                        # add actor
-                        actor = vtkRenderWindowText(text, 20, xpos, ypos, r, g, b)
-                        
-                        if settings.position == "Top left":
-                            topyLeft -= 20
-                        else:
-                            topyRight -= 20
-                        
-                        self.onScreenInfoActors.AddItem(actor)
-                
-                elif item == "Defect species count":
-                    for array in line:
-                        lineArgs = array[0]
-                        r, g, b = array[1]
-                        r, g, b = self.checkTextRGB(r, g, b)
-                        
-                        if settings.position == "Top left":
-                            xpos = topxLeft
-                            ypos = topyLeft
-                        else:
-                            xpos = topxRight
-                            ypos = topyRight
-                        
-                        # make text string
-                        text = settings.makeText(lineArgs)
-                        
-                        # add actor
-                        actor = vtkRenderWindowText(text, 20, xpos, ypos, r, g, b)
-                        
-                        if settings.position == "Top left":
-                            topyLeft -= 20
-                        else:
-                            topyRight -= 20
-                        
-                        self.onScreenInfoActors.AddItem(actor)
-                
-                elif type(line) is list:
-                    for subl in line:
-                        r = g = b = 0
-                        r, g, b = self.checkTextRGB(r, g, b)
-                        
-                        if settings.position == "Top left":
-                            xpos = topxLeft
-                            ypos = topyLeft
-                        else:
-                            xpos = topxRight
-                            ypos = topyRight
-                        
-                        # make text string
-                        text = settings.makeText(subl)
-                        
-                        # add actor
-                        actor = vtkRenderWindowText(text, 20, xpos, ypos, r, g, b)
-                        
-                        if settings.position == "Top left":
-                            topyLeft -= 20
-                        else:
-                            topyRight -= 20
-                        
-                        self.onScreenInfoActors.AddItem(actor)
-                
-                else:
-                    r = g = b = 0
-                    r, g, b = self.checkTextRGB(r, g, b)
-                    
-                    if settings.position == "Top left":
-                        xpos = topxLeft
-                        ypos = topyLeft
-                    else:
-                        xpos = topxRight
-                        ypos = topyRight
-                    
-                    # make text string
-                    text = settings.makeText(line)
-                    
-                    # add actor
-                    actor = vtkRenderWindowText(text, 20, xpos, ypos, r, g, b)
-                    
-                    if settings.position == "Top left":
-                        topyLeft -= 20
-                    else:
-                        topyRight -= 20
-                    
-                    self.onScreenInfoActors.AddItem(actor)
+        # make the text actors
+        actors = text.makeOnScreenInfoActors(self.onScreenInfo, selectedText, inputState,
+                                             self.vtkRenWinInteract.width(), self.vtkRenWinInteract.height(),
+                                             self.blackBackground)
+        for actor in actors:
+            self.onScreenInfoActors.AddItem(actor)
         
         # add to render window
         self.onScreenInfoActors.InitTraversal()
@@ -1038,15 +741,7 @@ class RendererWindow(QtGui.QWidget):
         Check rgb values.
         
         """
-        if self.blackBackground:
-            if r == g == b == 0:
-                r = b = g = 1
-        
-        else:
-            if r == g == b == 1:
-                r = b = g = 0
-        
-        return r, g, b
+        return text.checkTextRGB(r, g, b, self.blackBackground)
     
     def closeEvent(self, event):
         """
@@ -358,6 +358,15 @@ class SFTPBrowser(QtGui.QGroupBox):
             self.logger.debug("File does exist: '%s'", pathn)
             return pathn
     
+    def openSFTP(self):
+        """
+        Open a new SFTP session on the existing connection
+        
+        """
+        self.logger.debug("Opening SFTP session: '%s@%s'", self.username, self.hostname)
+        
+        return self.ssh.open_sftp()
+    
     def lookForRoulette(self, fn):
         """
         Look for linked Roulette file
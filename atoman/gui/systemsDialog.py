@@ -17,7 +17,6 @@ import functools
 import copy
 
 from PySide import QtGui, QtCore
-import numpy as np
 
 from ..visutils.utilities import iconPath
 from .genericForm import GenericForm
@@ -25,6 +24,7 @@ from . import generalReaderForm
 from . import latticeGeneratorForms
 from . import sftpDialog
 from .dialogs import infoDialogs
+from ..system import latticeReaderGeneric
 from .filterList import FilterList
 from six.moves import range
 
@@ -140,7 +140,8 @@ class LoadSystemForm(GenericForm):
         
         """
         # default PBC
-        state.PBC[:] = self.mainWindow.preferences.generalForm.defaultPBC[:]
+        generalSettings = self.mainWindow.preferences.generalForm
+        state.PBC[:] = generalSettings.defaultPBC[:]
         
         # load file
         self.systemsDialog.file_loaded(state, filename, fileFormat, sftpPath, linked)
@@ -306,6 +307,14 @@ class SystemsDialog(QtGui.QWidget):
             reloadAction.setStatusTip("Reload selected system(s)")
             reloadAction.triggered.connect(self.reload_system)
             
+            # go to frame action (trajectories only)
+            goToFrameAction = QtGui.QAction("Go to frame", self)
+            goToFrameAction.setToolTip("Load a different frame of the trajectory")
+            goToFrameAction.setStatusTip("Load a different frame of the trajectory")
+            goToFrameAction.triggered.connect(functools.partial(self.goToFrame, index))
+            goToFrameAction.setEnabled(item.fileFormat is not None and
+                                       item.fileFormat.name == latticeReaderGeneric.trajectoryFileFormat.name)
+            
             # load scalar data action
             loadScalarAction = QtGui.QAction("Load scalar data", self)
             loadScalarAction.setToolTip("Load scalar data from a file")
@@ -323,6 +332,7 @@ class SystemsDialog(QtGui.QWidget):
             menu.addAction(loadVectorAction)
             menu.addAction(duplicateAction)
             menu.addAction(reloadAction)
+            menu.addAction(goToFrameAction)
             menu.addAction(removeAction)
             
             # show menu
@@ -388,28 +398,18 @@ class SystemsDialog(QtGui.QWidget):
                 self.logger.debug("Got file name containing scalar data: '%s'", filename)
                 
                 # load file...
-                with open(filename) as f:
-                    scalars = []
-                    try:
-                        for line in f:
-                            scalars.append(float(line))
-                    
-                    except:
-                        self.logger.error("Error reading scalar file")
-                        self.mainWindow.displayError("Could not read scalar file.")
-                        return
+                try:
+                    scalars = latticeReaderGeneric.readDataFile(filename, lattice.NAtoms)
                 
-                if len(scalars) != lattice.NAtoms:
-                    self.logger.error("The scalar data is the wrong length")
-                    self.mainWindow.displayError("The scalar data is the wrong length")
+                except (IOError, ValueError) as error:
+                    self.logger.error("Error reading scalar file: %s", error)
+                    self.mainWindow.displayError("Could not read scalar file.\n\n%s" % error)
                     return
                 
-                # convert to numpy array
-                scalars = np.asarray(scalars, dtype=np.float64)
-                
-                # store on lattice
-                lattice.scalarsDict[scalarName] = scalars
+                # store on lattice (the file is in the order of the atoms in the file)
+                lattice.scalarsDict[scalarName] = lattice.fromFileOrder(scalars)
                 lattice.scalarsFiles[scalarName] = filename
+                lattice.dataChanged()
                 
                 self.logger.info("Added '%s' scalars to '%s'", scalarName, item.displayName)
                 
@@ -478,34 +478,18 @@ class SystemsDialog(QtGui.QWidget):
                 self.logger.debug("Got file name containing vector data: '%s'", filename)
                 
                 # load file...
-                with open(filename) as f:
-                    vectors = []
-                    try:
-                        for line in f:
-                            array = line.split()
-                            array[0] = float(array[0])
-                            array[1] = float(array[1])
-                            array[2] = float(array[2])
-                            
-                            vectors.append(array)
-                    
-                    except:
-                        self.logger.error("Error reading vector file")
-                        self.mainWindow.displayError("Could not read vector file.")
-                        return
+                try:
+                    vectors = latticeReaderGeneric.readDataFile(filename, lattice.NAtoms, numColumns=3)
                 
-                if len(vectors) != lattice.NAtoms:
-                    self.logger.error("The vector data is the wrong length")
-                    self.mainWindow.displayError("The vector data is the wrong length")
+                except (IOError, ValueError) as error:
+                    self.logger.error("Error reading vector file: %s", error)
+                    self.mainWindow.displayError("Could not read vector file.\n\n%s" % error)
                     return
                 
-                # convert to numpy array
-                vectors = np.asarray(vectors, dtype=np.float64)
-                assert vectors.shape[0] == lattice.NAtoms and vectors.shape[1] == 3
-                
-                # store on lattice
-                lattice.vectorsDict[vectorName] = vectors
+                # store on lattice (the file is in the order of the atoms in the file)
+                lattice.vectorsDict[vectorName] = lattice.fromFileOrder(vectors)
                 lattice.vectorsFiles[vectorName] = filename
+                lattice.dataChanged()
                 
                 self.logger.info("Added '%s' vectors to '%s'", vectorName, item.displayName)
         
@@ -612,43 +596,81 @@ class SystemsDialog(QtGui.QWidget):
             readerForm = loadPage.readerForm
             reader = readerForm.latticeReader
             
-            # read in state
-            status, state = reader.readFile(item.abspath, item.fileFormat, linkedLattice=item.linkedLattice)
+            # read in state (the same frame for trajectories)
+            frameIndex = item.lattice.attributes.get("Frame")
+            status, state = reader.readFile(item.abspath, item.fileFormat, linkedLattice=item.linkedLattice,
+                                            frameIndex=frameIndex, **readerForm.memoryMapOptions())
             if status:
                 self.logger.error("Reload read file failed with status: %d" % status)
                 continue
             
-            # set on item
-            item.lattice = state
-            item.changeDisplayName(item.displayName)
+            self.replaceSystemLattice(item, state)
+    
+    def goToFrame(self, index):
+        """
+        Load a different frame of a trajectory
+        
+        """
+        item = self.systems_list_widget.item(index)
+        
+        # reader
+        readerForm = self.load_system_form.readerForm
+        reader = readerForm.latticeReader
+        numFrames = reader.getTrajectory(item.abspath).numFrames
+        currentFrame = item.lattice.attributes.get("Frame", 0)
+        
+        # ask for the frame
+        frameIndex, ok = QtGui.QInputDialog.getInt(self, "Go to frame", "Frame (0 - %d):" % (numFrames - 1),
+                                                   value=currentFrame, minValue=0, maxValue=numFrames - 1)
+        if not ok or frameIndex == currentFrame:
+            return
+        
+        self.logger.info("Loading frame %d of '%s'", frameIndex, item.displayName)
+        
+        status, state = reader.readFile(item.abspath, item.fileFormat, frameIndex=frameIndex,
+                                        **readerForm.memoryMapOptions())
+        if status:
+            self.logger.error("Read frame failed with status: %d" % status)
+            return
+        
+        self.replaceSystemLattice(item, state)
+    
+    def replaceSystemLattice(self, item, state):
+        """
+        Replace the Lattice of the given item, updating the pipelines that use it
+        
+        """
+        # set on item
+        item.lattice = state
+        item.changeDisplayName(item.displayName)
+        
+        # remove info window
+        if item.infoDialog is not None:
+            item.infoDialog.accept()
+            item.infoDialog.close()
+            item.infoDialog = None
+        
+        # need index of this item
+        t = self.systems_list_widget.indexFromItem(item)
+        index = t.row()
+        self.logger.debug("  Item index: %d (%s)", index, item.displayName)
+        
+        # set on pipeline pages
+        for pp in self.mainWindow.mainToolbar.pipelineList:
+            refIndex, inputIndex = pp.getCurrentStateIndexes()
             
-            # remove info window
-            if item.infoDialog is not None:
-                item.infoDialog.accept()
-                item.infoDialog.close()
-                item.infoDialog = None
+            changed = False
+            if refIndex == index:
+                pp.refState = state
+                changed = True
             
-            # need index of this item
-            t = self.systems_list_widget.indexFromItem(item)
-            index = t.row()
-            self.logger.debug("  Item index: %d (%s)", index, item.displayName)
+            if inputIndex == index:
+                pp.inputState = state
+                changed = True
             
-            # set on pipeline pages
-            for pp in self.mainWindow.mainToolbar.pipelineList:
-                refIndex, inputIndex = pp.getCurrentStateIndexes()
-                
-                changed = False
-                if refIndex == index:
-                    pp.refState = state
-                    changed = True
-                
-                if inputIndex == index:
-                    pp.inputState = state
-                    changed = True
-                
-                if changed:
-#                     pp.runAllFilterLists()
-                    pp.postInputLoaded()
+            if changed:
+#                 pp.runAllFilterLists()
+                pp.postInputLoaded()
     
     def load_help_page(self):
         """
@@ -13,7 +13,6 @@ import numpy as np
 
 from ..system.lattice import Lattice
 from . import lattice_gen_utils
-from six.moves import range
 
 
 ################################################################################
@@ -124,26 +123,11 @@ class RockSaltLatticeGenerator(object):
         lattice.setDims(dims)
         
         # generate lattice
-        count = 0
-        totalQ = 0.0
-        for i in range(iStop):
-            for j in range(jStop):
-                for k in range(kStop):
-                    for l in range(8):
-                        # position of new atom
-                        rx_tmp = pos_uc[3*l+0] + i * a0
-                        ry_tmp = pos_uc[3*l+1] + j * a0
-                        rz_tmp = pos_uc[3*l+2] + k * a0
-                        
-                        # skip if outside lattice (ie when making extra cell to get surface for non-periodic boundaries)
-                        if (rx_tmp > dims[0]+0.0001) or (ry_tmp > dims[1]+0.0001) or (rz_tmp > dims[2]+0.0001):
-                            continue
-                        
-                        # add to lattice structure
-                        lattice.addAtom(sym_uc[l], (rx_tmp, ry_tmp, rz_tmp), q_uc[l])
-                        
-                        totalQ += q_uc[l]
-                        count += 1
+        pos, ucIndex = lattice_gen_utils.replicateUnitCell(pos_uc[:3 * 8], a0, (iStop, jStop, kStop), dims)
+        charges = q_uc[ucIndex]
+        lattice.addAtoms(np.asarray(sym_uc)[ucIndex], pos, charges)
+        totalQ = np.sum(charges)
+        count = len(ucIndex)
         
         NAtoms = count
         
@@ -8,10 +8,41 @@ Utilities common to multiple lattice generators
 from __future__ import absolute_import
 from __future__ import unicode_literals
 import math
+
+import numpy as np
 from six.moves import range
 
 ################################################################################
 
+def replicateUnitCell(pos_uc, a0, stops, dims):
+    """
+    Replicate the unit cell positions over the given number of cells.
+    
+    Atoms are ordered as if looping over cells in x, y and z (z fastest) and
+    then over the atoms in the unit cell. Atoms that lie outside the lattice
+    dimensions (ie. when making an extra cell to get a surface for
+    non-periodic boundaries) are skipped.
+    
+    Returns the positions of the atoms, shape (N, 3), and the index of each
+    atom within the unit cell.
+    
+    """
+    pos_uc = np.asarray(pos_uc, dtype=np.float64).reshape((-1, 3))
+    
+    # offsets of each cell
+    cells = np.indices(stops, dtype=np.float64).reshape((3, -1)).T * a0
+    
+    # positions of all atoms
+    pos = (cells[:, np.newaxis, :] + pos_uc[np.newaxis, :, :]).reshape((-1, 3))
+    ucIndex = np.tile(np.arange(len(pos_uc)), len(cells))
+    
+    # skip if outside lattice
+    inside = np.all(pos <= np.asarray(dims, dtype=np.float64) + 0.0001, axis=1)
+    
+    return pos[inside], ucIndex[inside]
+
+################################################################################
+
 def fixChargesOnFixedBoundaries(lattice):
     """
     Fix charges on fixed boundaries:
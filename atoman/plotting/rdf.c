@@ -31,7 +31,7 @@
 
 static PyObject* calculateRDF(PyObject*, PyObject*);
 static int computeHistogram(int, int, int*, double*, int*, double*, int*, int*, double,
-        double, double, double*);
+        double, double, double*, PyObject*);
 static void normaliseRDF(int, int, int, int, double, double, double*, double*);
 
 
@@ -89,14 +89,15 @@ calculateRDF(PyObject *self, PyObject *args)
     PyArrayObject *posIn=NULL;
     PyArrayObject *cellDimsIn=NULL;
     PyArrayObject *rdfIn=NULL;
+    PyObject *spatialIndex=NULL;
     int i, status, *sel1, *sel2, sel1cnt, sel2cnt, duplicates;
     double interval;
     
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!O!iiO!O!dddiO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &specieIn,
+    if (!PyArg_ParseTuple(args, "O!O!O!iiO!O!dddiO!|O", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &specieIn,
             &PyArray_Type, &posIn, &specieID1, &specieID2, &PyArray_Type, &cellDimsIn, &PyArray_Type, &pbcIn, &start,
-            &finish, &interval, &numBins, &PyArray_Type, &rdfIn))
+            &finish, &interval, &numBins, &PyArray_Type, &rdfIn, &spatialIndex))
         return NULL;
     
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -165,7 +166,7 @@ calculateRDF(PyObject *self, PyObject *args)
     
     /* compute the histogram for the RDF */
     status = computeHistogram(numAtoms, numVisible, visibleAtoms, pos, pbc, cellDims, 
-            sel1, sel2, start, finish, interval, rdf);
+            sel1, sel2, start, finish, interval, rdf, spatialIndex);
     
     /* free memory used for selections */
     free(sel1);
@@ -187,9 +188,9 @@ calculateRDF(PyObject *self, PyObject *args)
  *******************************************************************************/
 static int
 computeHistogram(int NAtoms, int NVisible, int *visibleAtoms, double *pos, int *PBC, double *cellDims,
-        int *sel1, int *sel2, double start, double finish, double interval, double *hist)
+        int *sel1, int *sel2, double start, double finish, double interval, double *hist, PyObject *spatialIndex)
 {
-    int i, errorCount, boxstat;
+    int i, errorCount;
     double *visiblePos, approxBoxWidth;
     const double start2 = start * start;
     const double finish2 = finish * finish;
@@ -219,15 +220,9 @@ computeHistogram(int NAtoms, int NVisible, int *visibleAtoms, double *pos, int *
     
     /* spatial decomposition - box width must be at least `finish` */
     approxBoxWidth = finish;
-    boxes = setupBoxes(approxBoxWidth, PBC, cellDims);
-    if (boxes == NULL)
-    {
-        if (NAtoms != NVisible) free(visiblePos);
-        return 2;
-    }
-    boxstat = putAtomsInBoxes(NVisible, visiblePos, boxes);
+    boxes = boxVisibleAtoms(spatialIndex, approxBoxWidth, PBC, cellDims, pos, NVisible, visibleAtoms, visiblePos);
     if (NAtoms != NVisible) free(visiblePos);
-    if (boxstat) return 3;
+    if (boxes == NULL) return 2;
     
     /* loop over visible atoms */
     errorCount = 0;
@@ -262,13 +257,13 @@ computeHistogram(int NAtoms, int NVisible, int *visibleAtoms, double *pos, int *
                 int k;
                 int checkBox = boxNebList[j];
                 
-                for (k = 0; k < boxes->boxNAtoms[checkBox]; k++)
+                for (k = boxes->boxOffsets[checkBox]; k < boxes->boxOffsets[checkBox + 1]; k++)
                 {
                     int visIndex, index2, ind23;
                     double sep2;
                     
                     /* the index of this atom in the visibleAtoms array */
-                    visIndex = boxes->boxAtoms[checkBox][k];
+                    visIndex = boxes->boxAtoms[k];
                     
                     /* skip if this atom is not in the second selection */
                     if (!sel2[visIndex]) continue;
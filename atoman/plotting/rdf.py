@@ -10,6 +10,7 @@ import logging
 import numpy as np
 
 from . import _rdf
+from ..visclibs import spatialIndex
 
 
 class RDFCalculator(object):
@@ -69,7 +70,7 @@ class RDFCalculator(object):
         # call the C extension to calculate the RDF
         _rdf.calculateRDF(visibleAtoms, inputLattice.specie, inputLattice.pos, speciesIndex1,
                           speciesIndex2, inputLattice.cellDims, inputLattice.PBC, binMin,
-                          binMax, binWidth, numBins, rdfArray)
+                          binMax, binWidth, numBins, rdfArray, spatialIndex.forLattice(inputLattice))
         
         # x values for plotting the RDF
         xvals = np.arange(binMin + binWidth / 2.0, binMax, binWidth, dtype=np.float64)
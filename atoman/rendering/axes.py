@@ -8,6 +8,26 @@ from __future__ import unicode_literals
 import vtk
 
 
+def makeAxesActor():
+    """
+    Create the axes actor.
+    
+    """
+    axes = vtk.vtkAxesActor()
+    axes.SetShaftTypeToCylinder()
+    axes.GetXAxisCaptionActor2D().GetCaptionTextProperty().SetColor(1, 0, 0)
+    axes.GetXAxisCaptionActor2D().GetCaptionTextProperty().SetFontFamilyToArial()
+    axes.GetXAxisCaptionActor2D().GetCaptionTextProperty().ShadowOff()
+    axes.GetYAxisCaptionActor2D().GetCaptionTextProperty().SetColor(0, 1, 0)
+    axes.GetYAxisCaptionActor2D().GetCaptionTextProperty().SetFontFamilyToArial()
+    axes.GetYAxisCaptionActor2D().GetCaptionTextProperty().ShadowOff()
+    axes.GetZAxisCaptionActor2D().GetCaptionTextProperty().SetColor(0, 0, 1)
+    axes.GetZAxisCaptionActor2D().GetCaptionTextProperty().SetFontFamilyToArial()
+    axes.GetZAxisCaptionActor2D().GetCaptionTextProperty().ShadowOff()
+    
+    return axes
+
+
 class Axes(object):
     """
     Axes object.
@@ -15,17 +35,7 @@ class Axes(object):
     """
     def __init__(self, renWinInteract):
         # create axes
-        self._axes = vtk.vtkAxesActor()
-        self._axes.SetShaftTypeToCylinder()
-        self._axes.GetXAxisCaptionActor2D().GetCaptionTextProperty().SetColor(1, 0, 0)
-        self._axes.GetXAxisCaptionActor2D().GetCaptionTextProperty().SetFontFamilyToArial()
-        self._axes.GetXAxisCaptionActor2D().GetCaptionTextProperty().ShadowOff()
-        self._axes.GetYAxisCaptionActor2D().GetCaptionTextProperty().SetColor(0, 1, 0)
-        self._axes.GetYAxisCaptionActor2D().GetCaptionTextProperty().SetFontFamilyToArial()
-        self._axes.GetYAxisCaptionActor2D().GetCaptionTextProperty().ShadowOff()
-        self._axes.GetZAxisCaptionActor2D().GetCaptionTextProperty().SetColor(0, 0, 1)
-        self._axes.GetZAxisCaptionActor2D().GetCaptionTextProperty().SetFontFamilyToArial()
-        self._axes.GetZAxisCaptionActor2D().GetCaptionTextProperty().ShadowOff()
+        self._axes = makeAxesActor()
         
         # create axes marker
         self._marker = vtk.vtkOrientationMarkerWidget()
@@ -7,7 +7,6 @@ Renderer for the FilterList object.
 """
 from __future__ import absolute_import
 from __future__ import unicode_literals
-import copy
 import logging
 
 import numpy as np
@@ -255,15 +254,20 @@ class FilterListRenderer(object):
             inputState = self._filterer.inputState
             refState = self._filterer.refState
             
-            # previous positions to draw trace vector from
+            # previous positions to draw trace vector from, matched to the input atoms by their
+            # index in the files (the previous positions are stored in the order of the file)
+            previousPos = None
             if self._tracePreviousPos is None:
-                self._tracePreviousPos = refState.pos
+                if refState.NAtoms == inputState.NAtoms:
+                    previousPos = inputState.matchingPositions(refState)
+            elif len(self._tracePreviousPos) == 3 * inputState.NAtoms:
+                previousPos = inputState.fromFileOrder(self._tracePreviousPos.reshape((-1, 3))).ravel()
             
-            # check lengths are the same
-            if len(self._tracePreviousPos) == len(inputState.pos):
+            # check the number of atoms is the same
+            if previousPos is not None:
                 # calculate displacements from previous positions
                 calc = bondRenderer.DisplacmentVectorCalculator()
-                result = calc.calculateDisplacementVectors(inputState.pos, self._tracePreviousPos, inputState.PBC,
+                result = calc.calculateDisplacementVectors(inputState.pos, previousPos, inputState.PBC,
                                                            inputState.cellDims, visibleAtoms, scalars.getNumpy())
                 traceCoords, traceVectors, traceScalars = result
                 
@@ -300,7 +304,7 @@ class FilterListRenderer(object):
                 self._logger.warning("Cannot compute trace with differing number of atoms between steps")
             
             # store positions for next time
-            self._tracePreviousPos = copy.deepcopy(inputState.pos)
+            self._tracePreviousPos = np.array(inputState.fileOrderPositions(), copy=True)
     
     def _renderDisplacmentVectorsList(self, atomList, lut, name):
         """Render displacement for the given list of atoms."""
@@ -317,9 +321,10 @@ class FilterListRenderer(object):
             # scalars array
             scalars = self._getScalarsArray(inputState, atomList)
             
-            # calculate displacement vectors
+            # calculate displacement vectors (from the same atom of the reference)
             calc = bondRenderer.DisplacmentVectorCalculator()
-            result = calc.calculateDisplacementVectors(inputState.pos, refState.pos, inputState.PBC,
+            refPos = inputState.matchingPositions(refState)
+            result = calc.calculateDisplacementVectors(inputState.pos, refPos, inputState.PBC,
                                                        inputState.cellDims, atomList, scalars.getNumpy())
             bondCoords, bondVectors, bondScalars = result
             if not len(bondCoords.getNumpy()):
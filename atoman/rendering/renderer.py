@@ -26,6 +26,28 @@ from . import axes
 from six.moves import range
 
 
+def writeRenderWindowImage(renWin, filename, imageFormat):
+    """
+    Write the contents of the render window to an image file.
+    
+    """
+    w2if = vtk.vtkWindowToImageFilter()
+    w2if.SetInput(renWin)
+    
+    if imageFormat == "jpg":
+        writer = vtk.vtkJPEGWriter()
+    
+    elif imageFormat == "png":
+        writer = vtk.vtkPNGWriter()
+        
+    elif imageFormat == "tif":
+        writer = vtk.vtkTIFFWriter()
+    
+    writer.SetInputConnection(w2if.GetOutputPort())
+    writer.SetFileName(filename)
+    writer.Write()
+
+
 class Renderer(object):
     def __init__(self, parent):
         
@@ -322,30 +344,13 @@ class Renderer(object):
         if renderType == "VTK":
             filename = "%s.%s" % (fileprefix, imageFormat)
             
-            renWin = self.renWin
-            
-            w2if = vtk.vtkWindowToImageFilter()
-            w2if.SetInput(renWin)
-            
-            if imageFormat == "jpg":
-                writer = vtk.vtkJPEGWriter()
-            
-            elif imageFormat == "png":
-                writer = vtk.vtkPNGWriter()
-                
-            elif imageFormat == "tif":
-                writer = vtk.vtkTIFFWriter()
-            
-            writer.SetInputConnection(w2if.GetOutputPort())
-            
             if not overwrite:
                 count = 0
                 while os.path.exists(filename):
                     count += 1
                     filename = "%s(%d).%s" % (fileprefix, count, imageFormat)
             
-            writer.SetFileName(filename)
-            writer.Write()
+            writeRenderWindowImage(self.renWin, filename, imageFormat)
         
         elif renderType == "POV":
             self.logger.debug("Rendering using POV-Ray")
@@ -17,6 +17,7 @@ from . import povrayWriters
 from .. import utils
 from .. import _rendering
 from ...filtering import bonds
+from ...visclibs import spatialIndex
 from six.moves import range
 
 
@@ -146,7 +147,8 @@ class BondCalculator(object):
         # call C library
         status = bonds.calculateBonds(visibleAtoms, inputState.pos, inputState.specie, len(inputState.specieList),
                                       bondMinArray, bondMaxArray, maxBond, maxBondsPerAtom, inputState.cellDims,
-                                      inputState.PBC, bondArray, NBondsArray, bondVectorArray, bondSpecieCounter)
+                                      inputState.PBC, bondArray, NBondsArray, bondVectorArray, bondSpecieCounter,
+                                      spatialIndex.forLattice(inputState))
         
         if status:
             if status == 1:
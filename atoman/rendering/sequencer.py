@@ -0,0 +1,768 @@
+"""
+Running the image sequencer in worker processes.
+
+The frames of a sequence are split into contiguous blocks, one block per worker process.
+Each worker reads, filters and renders its frames in an offscreen render window, using a
+copy of the pipeline that is captured from the GUI when the sequencer is started (the
+filter lists and their settings, the colouring/display options, the camera, cell frame,
+axes and on-screen text), and saves the images with the same names as the serial
+sequencer would.
+
+Eliminating flicker across periodic boundaries makes each frame depend on the (corrected)
+previous frame, so sequences with it enabled are rendered serially in the GUI.
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import copy
+import logging
+import traceback
+import multiprocessing
+
+import numpy as np
+import vtk
+from PySide import QtCore
+import six
+from six.moves import queue
+from six.moves import range
+
+from . import cell
+from . import axes
+from . import text
+from . import renderer
+from . import filterListRenderer
+from ..algebra import _vectors as vectors_c
+from ..filtering import filterer
+from ..system import latticeReaderGeneric
+from ..system import parseCache
+from ..system import compression
+from ..system.atoms import elements
+
+
+# types of attribute that are copied when capturing an object
+_PLAIN_TYPES = (bool, float, np.ndarray, type(None)) + six.integer_types + six.string_types
+
+
+def _isPlain(value):
+    """
+    Return True if the value is made of plain types only (so it can be copied to another process).
+    
+    """
+    if isinstance(value, _PLAIN_TYPES):
+        return True
+    
+    if isinstance(value, (list, tuple)):
+        return all(_isPlain(item) for item in value)
+    
+    if isinstance(value, dict):
+        return all(_isPlain(key) and _isPlain(item) for key, item in six.iteritems(value))
+    
+    return False
+
+
+class Snapshot(object):
+    """
+    Plain copy of the attributes of an object (eg. an options form), that can be sent
+    to a worker process in place of the object. Extra attributes can be passed as
+    keyword arguments.
+    
+    """
+    def __init__(self, obj=None, **kwargs):
+        if obj is not None:
+            for name, value in six.iteritems(vars(obj)):
+                if _isPlain(value):
+                    setattr(self, name, copy.deepcopy(value))
+        
+        for name, value in six.iteritems(kwargs):
+            setattr(self, name, value)
+
+
+class CapturedWidget(object):
+    """
+    The state of a widget (answers the same queries as the widget did).
+    
+    """
+    def __init__(self, widget):
+        self._value = widget.value() if hasattr(widget, "value") else None
+        self._text = str(widget.text()) if hasattr(widget, "text") else None
+        self._checked = bool(widget.isChecked()) if hasattr(widget, "isChecked") else None
+    
+    def value(self):
+        return self._value
+    
+    def text(self):
+        return self._text
+    
+    def isChecked(self):
+        return self._checked
+
+
+class CapturedListItem(Snapshot):
+    """
+    The state of a (checkable) list widget item.
+    
+    """
+    def __init__(self, item):
+        super(CapturedListItem, self).__init__(item, _checked=item.checkState() == QtCore.Qt.Checked)
+    
+    def checkState(self):
+        return QtCore.Qt.Checked if self._checked else QtCore.Qt.Unchecked
+
+
+class CapturedList(object):
+    """
+    The state of a list widget (and its items).
+    
+    """
+    def __init__(self, listWidget):
+        self._items = [CapturedListItem(listWidget.item(i)) for i in range(listWidget.count())]
+    
+    def count(self):
+        return len(self._items)
+    
+    def item(self, index):
+        return self._items[index]
+
+
+def captureFilterList(filterList):
+    """
+    Capture the filters, settings and options of a filter list.
+    
+    """
+    colouring = filterList.colouringOptions
+    colouringOptions = Snapshot(colouring,
+                                chargeMinSpin=CapturedWidget(colouring.chargeMinSpin),
+                                chargeMaxSpin=CapturedWidget(colouring.chargeMaxSpin),
+                                scalarBarTextEdit3=CapturedWidget(colouring.scalarBarTextEdit3),
+                                scalarMinSpins=dict((key, CapturedWidget(widget)) for key, widget in
+                                                    six.iteritems(colouring.scalarMinSpins)),
+                                scalarMaxSpins=dict((key, CapturedWidget(widget)) for key, widget in
+                                                    six.iteritems(colouring.scalarMaxSpins)),
+                                scalarBarTexts=dict((key, CapturedWidget(widget)) for key, widget in
+                                                    six.iteritems(colouring.scalarBarTexts)))
+    
+    settings = [settingsGui.getSettings() for settingsGui in filterList.getCurrentFilterSettings()]
+    
+    return Snapshot(filterNames=list(filterList.getCurrentFilterNames()),
+                    filterSettings=copy.deepcopy(settings),
+                    visible=filterList.visible,
+                    static=filterList.isStaticList(),
+                    defectFilterSelected=filterList.defectFilterSelected,
+                    driftCompensation=filterList.driftCompButton.isChecked(),
+                    scalarBar=filterList.scalarBarButton.isChecked(),
+                    colouringOptions=colouringOptions,
+                    displayOptions=Snapshot(filterList.displayOptions),
+                    vectorsOptions=Snapshot(filterList.vectorsOptions),
+                    bondsOptions=Snapshot(filterList.bondsOptions,
+                                          bondsList=CapturedList(filterList.bondsOptions.bondsList)),
+                    traceOptions=Snapshot(filterList.traceOptions),
+                    voronoiOptions=Snapshot(filterList.voronoiOptions))
+
+
+def captureRendererWindow(rendererWindow):
+    """
+    Capture the view of a render window (size, background, camera, cell frame, axes and on-screen text).
+    
+    """
+    camera = rendererWindow.renderer.camera
+    latticeFrame = rendererWindow.renderer.latticeFrame
+    selectedText = rendererWindow.textSelector.selectedText()
+    
+    return Snapshot(size=tuple(rendererWindow.vtkRenWin.GetSize()),
+                    textArea=(rendererWindow.vtkRenWinInteract.width(), rendererWindow.vtkRenWinInteract.height()),
+                    background=tuple(rendererWindow.vtkRen.GetBackground()),
+                    blackBackground=rendererWindow.blackBackground,
+                    aaFrames=rendererWindow.currentAAFrames,
+                    pipelineIndex=rendererWindow.currentPipelineIndex,
+                    pipelineString=rendererWindow.currentPipelineString,
+                    camera=Snapshot(position=camera.GetPosition(),
+                                    focalPoint=camera.GetFocalPoint(),
+                                    viewUp=camera.GetViewUp(),
+                                    viewAngle=camera.GetViewAngle(),
+                                    parallelProjection=bool(camera.GetParallelProjection()),
+                                    parallelScale=camera.GetParallelScale()),
+                    cellFrame=bool(latticeFrame.visible),
+                    cellFrameBounds=tuple(latticeFrame.source.GetBounds()),
+                    cellFrameColour=tuple(latticeFrame.currentColour),
+                    axes=rendererWindow.renderer.axes.isEnabled(),
+                    selectedText=[text.TextSettings.fromItem(item) for item in selectedText])
+
+
+class SequencerJob(object):
+    """
+    Everything a worker needs to read, filter and render frames of a sequence.
+    
+    The file name of frame i is fileText % i (or abspath for trajectories) and the image
+    for the n'th frame is saved as saveText % n (with the image format as extension).
+    
+    """
+    def __init__(self, fileFormat, fileText, abspath, trajectoryFile, linkedLattice, refState, origInput, PBC,
+                 numberFormat, saveText, imageFormat, window, filterLists, renderingPrefs, tmpDirectory,
+                 cacheDirectory=None, cacheSize=0, numThreads=1, reorder=None):
+        self.fileFormat = fileFormat
+        self.fileText = fileText
+        self.abspath = abspath
+        self.trajectoryFile = trajectoryFile
+        self.linkedLattice = linkedLattice
+        self.refState = refState
+        self.origInput = origInput
+        self.PBC = np.asarray(PBC, dtype=np.int32)
+        self.numberFormat = numberFormat
+        self.saveText = saveText
+        self.imageFormat = imageFormat
+        self.window = window
+        self.filterLists = filterLists
+        self.renderingPrefs = renderingPrefs
+        self.tmpDirectory = tmpDirectory
+        self.cacheDirectory = cacheDirectory
+        self.cacheSize = cacheSize
+        self.numThreads = numThreads
+        self.reorder = reorder
+        
+        # element properties and bonds (they can be edited in the GUI)
+        self.elements = copy.deepcopy(vars(elements))
+
+
+################################################################################
+
+def guessFilePrefix(filename):
+    """
+    Guess the file prefix (the part of the file name before the number).
+    
+    """
+    count = 0
+    lim = None
+    for i in range(len(filename)):
+        if filename[i] == ".":
+            break
+        
+        try:
+            int(filename[i])
+            
+            if lim is None:
+                lim = count
+        
+        except ValueError:
+            lim = None
+        
+        count += 1
+    
+    if lim is None:
+        array = os.path.splitext(filename)
+        
+        if array[1] == '.gz' or array[1] == '.bz2':
+            array = os.path.splitext(array[0])
+        
+        filename = array[0]
+    
+    else:
+        filename = filename[:lim]
+    
+    return filename
+
+
+def readVectorsFiles(state, vectorsFiles, numberFormat, index):
+    """
+    Read the vectors files that go with the given frame (guessing their names from
+    the vectors files of the original input).
+    
+    """
+    logger = logging.getLogger(__name__)
+    
+    for vectorsName, vectorsFile in six.iteritems(vectorsFiles):
+        logger.debug("Sequencer checking vectors file: '%s'", vectorsFile)
+        
+        vdn, vbn = os.path.split(vectorsFile)
+        if compression.isCompressed(vbn):
+            vbn = os.path.splitext(vbn)[0]
+        
+        # guess prefix
+        guessvfn = guessFilePrefix(vbn)
+        
+        if guessvfn != vbn:
+            ext = "." + vbn.split(".")[-1]
+            if ext == vbn:
+                ext = ""
+            
+            vfn = "%s%s%s" % (guessvfn, numberFormat, ext)
+            if len(vdn):
+                vfn = os.path.join(vdn, vfn)
+            
+            vfn = vfn % index
+            
+            # compressed versions of the file are found too
+            filepath = compression.locateFile(vfn)
+            logger.debug("Looking for vectors file: '%s' (%s)", vfn, filepath is not None)
+            if filepath is not None:
+                # read vectors file
+                try:
+                    vectors = latticeReaderGeneric.readDataFile(filepath, state.NAtoms, numColumns=3)
+                
+                except (IOError, ValueError) as error:
+                    logger.error("Error reading vector file: %s", error)
+                
+                else:
+                    state.vectorsDict[vectorsName] = state.fromFileOrder(vectors)
+                    state.vectorsFiles[vectorsName] = filepath
+                    
+                    logger.debug("Added vectors data (%s) to sequencer lattice", vectorsName)
+
+
+def readFrame(reader, filename, fileFormat, index, linkedLattice, vectorsFiles, numberFormat):
+    """
+    Read frame index of a sequence from the given file (plus any vectors files),
+    returning (status, state).
+    
+    """
+    status, state = reader.readFile(filename, fileFormat, rouletteIndex=index-1, linkedLattice=linkedLattice,
+                                    frameIndex=index)
+    if status:
+        return status, None
+    
+    # attempt to read any vectors files
+    readVectorsFiles(state, vectorsFiles, numberFormat, index)
+    
+    return status, state
+
+
+def eliminateFlicker(state, previousPos, PBC):
+    """
+    Attempt to eliminate flicker across PBCs (moves atoms that crossed a periodic
+    boundary since the previous frame back), returning the number of modified positions.
+    
+    The previous positions are in the order of the file (see Lattice.fileOrderPositions).
+    
+    """
+    if previousPos is None:
+        return 0
+    
+    if not PBC[0] and not PBC[1] and not PBC[2]:
+        return 0
+    
+    # previous positions of the atoms of this frame (matched by their index in the files)
+    if state.permutation is not None:
+        if len(previousPos) != 3 * state.NAtoms:
+            return 0
+        previousPos = previousPos.reshape((-1, 3))[state.permutation].ravel()
+    
+    NAtoms = min(len(previousPos) // 3, state.NAtoms)
+    count = vectors_c.eliminatePBCFlicker(NAtoms, state.pos, previousPos, state.cellDims, PBC)
+    if count:
+        state.positionsChanged()
+    
+    return count
+
+
+################################################################################
+
+class _NullInteractor(object):
+    """
+    Stands in for the interactor of a render window (there is nothing to reinitialise offscreen).
+    
+    """
+    def ReInitialize(self):
+        pass
+
+
+class _NullActorsOptions(object):
+    """
+    Stands in for the actors options of a filter list.
+    
+    """
+    def refresh(self, actorsDict):
+        pass
+
+
+class OffscreenRendererWindow(object):
+    """
+    Offscreen render window set up like the captured render window (stands in for the
+    RendererWindow when rendering filter lists in a worker).
+    
+    """
+    def __init__(self, window):
+        self.window = window
+        self.blackBackground = window.blackBackground
+        self.currentPipelineIndex = window.pipelineIndex
+        self.currentPipelineString = window.pipelineString
+        self.vtkRenWinInteract = _NullInteractor()
+        self.onScreenInfoActors = []
+        
+        # render window
+        self.vtkRenWin = vtk.vtkRenderWindow()
+        self.vtkRenWin.SetOffScreenRendering(1)
+        self.vtkRenWin.SetSize(*window.size)
+        if hasattr(self.vtkRenWin, "SetAAFrames"):
+            self.vtkRenWin.SetAAFrames(window.aaFrames)
+        
+        # renderer
+        self.vtkRen = vtk.vtkRenderer()
+        self.vtkRen.SetBackground(*window.background)
+        self.vtkRenWin.AddRenderer(self.vtkRen)
+        
+        # camera
+        self.camera = self.vtkRen.GetActiveCamera()
+        self.camera.SetPosition(window.camera.position)
+        self.camera.SetFocalPoint(window.camera.focalPoint)
+        self.camera.SetViewUp(window.camera.viewUp)
+        self.camera.SetViewAngle(window.camera.viewAngle)
+        self.camera.SetParallelProjection(window.camera.parallelProjection)
+        self.camera.SetParallelScale(window.camera.parallelScale)
+        
+        # cell frame
+        self.latticeFrame = cell.CellOutline(self.vtkRen)
+        if window.cellFrame:
+            bounds = window.cellFrameBounds
+            self.latticeFrame.setColour(window.cellFrameColour)
+            self.latticeFrame.add(bounds[::2], bounds[1::2])
+        
+        # axes (drawn in the corner, like the orientation marker on screen)
+        self.axesRen = None
+        if window.axes:
+            self.vtkRenWin.SetNumberOfLayers(2)
+            self.axesRen = vtk.vtkRenderer()
+            self.axesRen.SetLayer(1)
+            self.axesRen.SetViewport(0, 0, 0.25, 0.25)
+            self.axesRen.InteractiveOff()
+            self.axesRen.AddViewProp(axes.makeAxesActor())
+            self.vtkRenWin.AddRenderer(self.axesRen)
+    
+    def refreshOnScreenInfo(self, inputState, refState, filterLists):
+        """
+        Refresh the on-screen information.
+        
+        """
+        for actor in self.onScreenInfoActors:
+            self.vtkRen.RemoveActor(actor)
+        self.onScreenInfoActors = []
+        
+        if not len(self.window.selectedText):
+            return
+        
+        onScreenInfo = text.makeOnScreenInfo(inputState, refState, filterLists)
+        width, height = self.window.textArea
+        self.onScreenInfoActors = text.makeOnScreenInfoActors(onScreenInfo, self.window.selectedText, inputState,
+                                                              width, height, self.blackBackground)
+        for actor in self.onScreenInfoActors:
+            self.vtkRen.AddActor(actor)
+    
+    def saveImage(self, fileprefix, imageFormat):
+        """
+        Render and save the image, returning the file name.
+        
+        """
+        # point the axes camera in the same direction as the camera
+        if self.axesRen is not None:
+            axesCamera = self.axesRen.GetActiveCamera()
+            axesCamera.SetPosition(self.camera.GetPosition())
+            axesCamera.SetFocalPoint(self.camera.GetFocalPoint())
+            axesCamera.SetViewUp(self.camera.GetViewUp())
+            self.axesRen.ResetCamera()
+        
+        self.vtkRen.ResetCameraClippingRange()
+        self.vtkRenWin.Render()
+        
+        filename = "%s.%s" % (fileprefix, imageFormat)
+        renderer.writeRenderWindowImage(self.vtkRenWin, filename, imageFormat)
+        
+        return filename
+
+
+class _OffscreenPipeline(object):
+    """
+    Stands in for the pipeline page (and main window) of the filter lists in a worker.
+    
+    """
+    def __init__(self, window, job):
+        self.rendererWindows = [window]
+        self.pipelineIndex = window.currentPipelineIndex
+        self.mainToolbar = Snapshot(currentPipelineString=window.currentPipelineString)
+        self.mainWindow = Snapshot(tmpDirectory=job.tmpDirectory,
+                                   preferences=Snapshot(renderingForm=job.renderingPrefs))
+        self.inputState = None
+        self.refState = job.refState
+        self.scalarBarAdded = False
+
+
+class OffscreenFilterList(object):
+    """
+    Stands in for a filter list in a worker: applies the captured filters and renders
+    the result in the offscreen render window.
+    
+    """
+    def __init__(self, snapshot, pipeline):
+        self.logger = logging.getLogger(__name__ + ".OffscreenFilterList")
+        self.snapshot = snapshot
+        self.visible = snapshot.visible
+        self.defectFilterSelected = snapshot.defectFilterSelected
+        self.pipelinePage = pipeline
+        self.filterTab = pipeline
+        self.mainWindow = pipeline.mainWindow
+        self.scalarBarButton = Snapshot(isChecked=lambda: snapshot.scalarBar)
+        self.colouringOptions = snapshot.colouringOptions
+        self.displayOptions = snapshot.displayOptions
+        self.vectorsOptions = snapshot.vectorsOptions
+        self.bondsOptions = snapshot.bondsOptions
+        self.traceOptions = snapshot.traceOptions
+        self.voronoiOptions = snapshot.voronoiOptions
+        self.actorsOptions = _NullActorsOptions()
+        
+        self.filterer = filterer.Filterer(self.voronoiOptions)
+        self.filterer.toggleDriftCompensation(snapshot.driftCompensation)
+        
+        # every frame is a new lattice, so there are no stages to reuse
+        self.filterer.stageCache.setMaxSize(0)
+        
+        # neighbour lists are reused across the frames
+        self.filterer.toggleVerletLists(True)
+        self.renderer = filterListRenderer.FilterListRenderer(self)
+    
+    def applyList(self, inputState, refState):
+        """
+        Apply the filters to the given input and render the result.
+        
+        """
+        self.renderer.removeActors(sequencer=True)
+        
+        # read columns used for colouring/vectors that were skipped when the input was read
+        if self.colouringOptions.colourBy.startswith("Lattice: "):
+            inputState.loadDeferredColumn(self.colouringOptions.colourBy[9:])
+        if self.vectorsOptions.selectedVectorsName is not None:
+            inputState.loadDeferredColumn(self.vectorsOptions.selectedVectorsName)
+        
+        # apply filters and render
+        self.filterer.runFilters(self.snapshot.filterNames, self.snapshot.filterSettings, inputState, refState)
+        self.renderer.render(sequencer=True)
+        
+        if self.visible:
+            self.renderer.addActors()
+
+
+class SequencerWorker(object):
+    """
+    Reads, filters and renders frames of a sequence offscreen.
+    
+    """
+    def __init__(self, job):
+        self.logger = logging.getLogger(__name__ + ".SequencerWorker")
+        self.job = job
+        
+        # same element properties and number of threads as the GUI
+        elements.__dict__.update(copy.deepcopy(job.elements))
+        from ..gui import _preferences
+        _preferences.setNumThreads(job.numThreads)
+        
+        # reader (sharing the parse cache)
+        cache = None
+        if job.cacheSize > 0:
+            cache = parseCache.ParseCache(directory=job.cacheDirectory, maxSize=job.cacheSize)
+        self.reader = latticeReaderGeneric.LatticeReaderGeneric(tmpLocation=job.tmpDirectory, cache=cache,
+                                                                reorder=job.reorder)
+        
+        # render window, pipeline and filter lists
+        self.window = OffscreenRendererWindow(job.window)
+        self.pipeline = _OffscreenPipeline(self.window, job)
+        self.filterLists = [OffscreenFilterList(snapshot, self.pipeline) for snapshot in job.filterLists]
+        
+        # static lists are applied once, to the input the sequencer was started from
+        self.pipeline.inputState = job.origInput
+        for filterList in self.filterLists:
+            if filterList.snapshot.static:
+                filterList.applyList(job.origInput, job.refState)
+    
+    def readFrame(self, index):
+        """
+        Read frame index.
+        
+        """
+        job = self.job
+        filename = job.abspath if job.trajectoryFile else job.fileText % index
+        self.logger.info("Current file: '%s' (frame %d)", filename, index)
+        
+        status, state = readFrame(self.reader, filename, job.fileFormat, index, job.linkedLattice,
+                                  job.origInput.vectorsFiles, job.numberFormat)
+        if status:
+            raise IOError("Could not read sequencer file: '%s' (frame %d)" % (filename, index))
+        
+        # set PBCs the same
+        state.PBC[:] = job.origInput.PBC[:]
+        
+        return state
+    
+    def renderFrame(self, count, state):
+        """
+        Apply the filter lists to the frame and save the image (number count), returning the file name.
+        
+        """
+        self.pipeline.inputState = state
+        self.pipeline.scalarBarAdded = False
+        for filterList in self.filterLists:
+            if not filterList.snapshot.static:
+                filterList.applyList(state, self.job.refState)
+        
+        self.window.refreshOnScreenInfo(state, self.job.refState, self.filterLists)
+        
+        return self.window.saveImage(self.job.saveText % count, self.job.imageFormat)
+
+
+def _runWorker(workerIndex, job, block, results, cancelled):
+    """
+    Worker process: render the block of (count, index) frames, reporting to the results queue.
+    
+    """
+    count = None
+    try:
+        worker = SequencerWorker(job)
+        
+        for count, index in block:
+            if cancelled.is_set():
+                break
+            
+            state = worker.readFrame(index)
+            filename = worker.renderFrame(count, state)
+            results.put(("frame", workerIndex, count, filename))
+    
+    except Exception:
+        results.put(("error", workerIndex, count, traceback.format_exc()))
+    
+    finally:
+        results.put(("done", workerIndex, None, None))
+
+
+def splitFrames(frames, numBlocks):
+    """
+    Split the list of frames into (at most) numBlocks contiguous blocks of nearly equal size.
+    
+    """
+    numBlocks = max(1, min(numBlocks, len(frames)))
+    size, remainder = divmod(len(frames), numBlocks)
+    
+    blocks = []
+    start = 0
+    for i in range(numBlocks):
+        end = start + size + (1 if i < remainder else 0)
+        blocks.append(frames[start:end])
+        start = end
+    
+    return blocks
+
+
+def _context():
+    """
+    Multiprocessing context for the workers (fresh processes, not forks of the GUI).
+    
+    """
+    if hasattr(multiprocessing, "get_context"):
+        return multiprocessing.get_context("spawn")
+    
+    return multiprocessing
+
+
+class ParallelSequencer(object):
+    """
+    Run a sequence in worker processes.
+    
+    Iterating yields (count, filename) for each image that is saved (in the order they are
+    saved, which is not the frame order) and (None, None) every `timeout` seconds when
+    there is nothing new, so the caller can update the GUI. An error in a worker stops
+    all the workers and raises a RuntimeError.
+    
+    """
+    def __init__(self, job, frames, numWorkers, timeout=0.1):
+        self.logger = logging.getLogger(__name__ + ".ParallelSequencer")
+        self.job = job
+        self.blocks = splitFrames(list(enumerate(frames)), numWorkers)
+        self.timeout = timeout
+        self._processes = []
+        self._running = set()
+        self._results = None
+        self._cancelled = None
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def __iter__(self):
+        return self
+    
+    def start(self):
+        """
+        Start the workers.
+        
+        """
+        context = _context()
+        self._results = context.Queue()
+        self._cancelled = context.Event()
+        
+        for i, block in enumerate(self.blocks):
+            self.logger.debug("Starting sequencer worker %d: frames %d to %d", i, block[0][1], block[-1][1])
+            
+            process = context.Process(target=_runWorker, args=(i, self.job, block, self._results, self._cancelled))
+            process.daemon = True
+            process.start()
+            self._processes.append(process)
+            self._running.add(i)
+    
+    def __next__(self):
+        """
+        Return the next saved image (count, filename), or (None, None) if there was nothing new.
+        
+        """
+        while len(self._running):
+            try:
+                kind, workerIndex, count, value = self._results.get(timeout=self.timeout)
+            
+            except queue.Empty:
+                # check for workers that died without saying so
+                for i in list(self._running):
+                    if not self._processes[i].is_alive():
+                        self._running.discard(i)
+                        self.cancel()
+                        raise RuntimeError("Sequencer worker %d exited unexpectedly (exit code %r)" %
+                                           (i, self._processes[i].exitcode))
+                
+                return None, None
+            
+            if kind == "frame":
+                return count, value
+            
+            elif kind == "error":
+                self.cancel()
+                raise RuntimeError("Sequencer worker %d failed (image %r):\n%s" % (workerIndex, count, value))
+            
+            else:
+                self._running.discard(workerIndex)
+        
+        raise StopIteration
+    
+    # Python 2
+    next = __next__
+    
+    def cancel(self):
+        """
+        Tell the workers to stop (after the frame they are working on).
+        
+        """
+        if self._cancelled is not None:
+            self._cancelled.set()
+    
+    def close(self, timeout=10.0):
+        """
+        Stop the workers and wait for them to exit.
+        
+        """
+        self.cancel()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                self.logger.warning("Terminating sequencer worker (pid %d)", process.pid)
+                process.terminate()
+                process.join()
+        
+        self._processes = []
+        self._running = set()
@@ -0,0 +1,116 @@
+"""
+Unit tests for the parallel sequencer
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import unittest
+import tempfile
+import shutil
+
+import numpy as np
+
+from .. import sequencer
+from ...system import latticeReaderGeneric
+
+
+################################################################################
+
+class TestSequencer(unittest.TestCase):
+    """
+    Test the parallel sequencer
+    
+    """
+    def setUp(self):
+        """
+        Called before each test
+        
+        """
+        # tmp dir
+        self.tmpLocation = tempfile.mkdtemp(prefix="atomanTest")
+        
+        # file format
+        fn = os.path.join(self.tmpLocation, "file_formats.IN")
+        with open(fn, "w") as fh:
+            fh.write(latticeReaderGeneric._defaultFileFormatsFile)
+        fileFormats = latticeReaderGeneric.FileFormats()
+        fileFormats.read(fn)
+        self.fileFormat = fileFormats.getFormat("LBOMD Lattice")
+        
+        # atoms that jiggle back and forth across the periodic boundaries
+        self.cellDims = np.asarray([10.0, 10.0, 10.0])
+        rng = np.random.RandomState(1234)
+        pos = np.mod(rng.uniform(-0.3, 0.3, size=(20, 3)), self.cellDims)
+        self.numFrames = 7
+        self.fileText = os.path.join(self.tmpLocation, "lattice%04d.dat")
+        for i in range(self.numFrames):
+            with open(self.fileText % i, "w") as fh:
+                fh.write("%d\n" % len(pos))
+                fh.write("%f %f %f\n" % tuple(self.cellDims))
+                for x, y, z in pos:
+                    fh.write("Fe %f %f %f 0.0\n" % (x, y, z))
+            pos = np.mod(pos + rng.uniform(-0.2, 0.2, size=pos.shape), self.cellDims)
+        
+        reader = latticeReaderGeneric.LatticeReaderGeneric(tmpLocation=self.tmpLocation)
+        status, self.origInput = reader.readFile(self.fileText % 0, self.fileFormat)
+        self.assertEqual(status, 0)
+    
+    def tearDown(self):
+        """
+        Called after each test
+        
+        """
+        # remove tmp dir
+        shutil.rmtree(self.tmpLocation)
+    
+    def makeJob(self):
+        """
+        Job rendering the test frames (with no filter lists).
+        
+        """
+        camera = sequencer.Snapshot(position=(5.0, 5.0, 40.0), focalPoint=(5.0, 5.0, 5.0), viewUp=(0.0, 1.0, 0.0),
+                                    viewAngle=30.0, parallelProjection=False, parallelScale=1.0)
+        window = sequencer.Snapshot(size=(64, 48), textArea=(64, 48), background=(1.0, 1.0, 1.0),
+                                    blackBackground=False, aaFrames=0, pipelineIndex=0, pipelineString="Pipeline 0",
+                                    camera=camera, cellFrame=True, cellFrameBounds=(0.0, 10.0, 0.0, 10.0, 0.0, 10.0),
+                                    cellFrameColour=(0, 0, 0), axes=True, selectedText=[])
+        saveText = os.path.join(self.tmpLocation, "image%04d")
+        
+        job = sequencer.SequencerJob(self.fileFormat, self.fileText, None, False, None, self.origInput,
+                                     self.origInput, [1, 1, 1], "%04d", saveText, "png", window, [],
+                                     sequencer.Snapshot(), self.tmpLocation)
+        
+        return job
+    
+    def test_splitFrames(self):
+        """
+        Sequencer split frames
+        
+        """
+        frames = list(enumerate(range(3, 40, 3)))
+        for numBlocks in range(1, 16):
+            blocks = sequencer.splitFrames(frames, numBlocks)
+            
+            # contiguous blocks, in order, of nearly equal size
+            self.assertEqual(len(blocks), min(numBlocks, len(frames)))
+            self.assertEqual([frame for block in blocks for frame in block], frames)
+            sizes = [len(block) for block in blocks]
+            self.assertLessEqual(max(sizes) - min(sizes), 1)
+    
+    def test_parallelSequencer(self):
+        """
+        Sequencer parallel workers
+        
+        """
+        job = self.makeJob()
+        frames = list(range(1, self.numFrames, 2))
+        
+        with sequencer.ParallelSequencer(job, frames, 2) as runner:
+            saved = [(count, filename) for count, filename in runner if count is not None]
+        
+        # same numbering as the serial sequencer
+        expected = [(count, job.saveText % count + ".png") for count in range(len(frames))]
+        self.assertEqual(sorted(saved), expected)
+        for _, filename in expected:
+            self.assertTrue(os.path.exists(filename))
@@ -1,4 +1,3 @@
-
 """
 On screen text
 
@@ -7,7 +6,15 @@ On screen text
 """
 from __future__ import absolute_import
 from __future__ import unicode_literals
+from __future__ import division
+import logging
+
 import vtk
+import numpy as np
+import six
+from six.moves import range
+
+from ..visutils import utilities
 
 
 
@@ -50,3 +57,301 @@ class vtkRenderWindowText(vtk.vtkTextActor):
         self.y =  y    
         self.SetDisplayPosition(self.x, self.y)
 
+
+################################################################################
+
+class TextSettings(object):
+    """
+    Settings for an item of on-screen text (a copy of a selected item in the text selector).
+    
+    """
+    def __init__(self, title, format, defaultFormat, position):
+        self.title = title
+        self.format = format
+        self.defaultFormat = defaultFormat
+        self.position = position
+    
+    @classmethod
+    def fromItem(cls, item):
+        """
+        Copy the settings of a text selector item.
+        
+        """
+        return cls(item.title, item.format, item.defaultFormat, item.position)
+    
+    def makeText(self, args):
+        """
+        Attempt to format the string with the given args.
+        Fall back to default if it fails.
+        
+        """
+        try:
+            text = self.format.format(*args)
+        
+        except:
+            logging.error("Could not apply format: '%s'; '%s'; %r", self.title, self.format, args)
+            text = self.defaultFormat.format(*args)
+        
+        return text
+
+################################################################################
+
+def checkTextRGB(r, g, b, blackBackground):
+    """
+    Check rgb values (so text is visible on the background).
+    
+    """
+    if blackBackground:
+        if r == g == b == 0:
+            r = b = g = 1
+    
+    else:
+        if r == g == b == 1:
+            r = b = g = 0
+    
+    return r, g, b
+
+################################################################################
+
+def makeOnScreenInfo(inputState, refState, filterLists):
+    """
+    Return a dict containing the on-screen information for the given input
+    lattice and (already applied) filter lists.
+    
+    """
+    logger = logging.getLogger(__name__)
+    onScreenInfo = {}
+    
+    # add lattice attributes
+    logger.debug("Adding Lattice attributes: %r", list(inputState.attributes.keys()))
+    for key, value in six.iteritems(inputState.attributes):
+        onScreenInfo[key] = value
+    
+    # atom count
+    onScreenInfo["Atom count"] = (inputState.NAtoms,)
+    
+    # Lattice attributes
+    for key, value in six.iteritems(inputState.attributes):
+        if key == "Time":
+            onScreenInfo[key] = tuple(utilities.simulationTimeLine(value).split())
+        
+        else:
+            onScreenInfo[key] = (value,)
+    
+    # lattice temperature
+    if not "Temperature" in inputState.attributes:
+        temperature = inputState.calcTemperature()
+        if temperature is not None:
+            onScreenInfo["Temperature"] = ("%.3f" % temperature,)
+    
+    # visible counts always recalculated
+    visCountActive = False
+    visCount = 0
+    numClusters = 0
+    for filterList in filterLists:
+        if filterList.visible:
+            if not filterList.defectFilterSelected:
+                visCountActive = True
+                visCount += len(filterList.filterer.visibleAtoms)
+            
+            numClusters += len(filterList.filterer.clusterList)
+    
+    if numClusters:
+        onScreenInfo["Cluster count"] = (numClusters,)
+    
+    if visCountActive:
+        onScreenInfo["Visible count"] = (visCount,)
+        
+        visSpecCount = np.zeros(len(inputState.specieList), np.int32)
+        for filterList in filterLists:
+            if filterList.visible and not filterList.defectFilterSelected and len(filterList.filterer.visibleAtoms):
+                if len(visSpecCount) == len(filterList.filterer.visibleSpecieCount):
+                    visSpecCount = np.add(visSpecCount, filterList.filterer.visibleSpecieCount)
+        
+        specieList = inputState.specieList
+        onScreenInfo["Visible species count"] = []
+        for i, cnt in enumerate(visSpecCount):
+            onScreenInfo["Visible species count"].append((cnt, specieList[i]))
+    
+    # structure counters
+    for filterList in filterLists:
+        for key, structureCounterDict in six.iteritems(filterList.filterer.structureCounterDicts):
+            logger.debug("Adding on-screen info for structure counter: '%s'", key)
+            onScreenInfo[key] = []
+            
+            for structure in sorted(structureCounterDict.keys()):
+                logger.debug("  %d %s" % (structureCounterDict[structure], structure))
+                onScreenInfo[key].append((structureCounterDict[structure], structure))
+    
+    # defects counts
+    defectFilterActive = False
+    NVac = 0
+    NInt = 0
+    NAnt = 0
+    showVacs = False
+    showInts = False
+    showAnts = False
+    identifySplitInts = False
+    for filterList in filterLists:
+        if filterList.visible and filterList.defectFilterSelected:
+            defectFilterActive = True
+            
+            NVac += len(filterList.filterer.vacancies)
+            NSplit = len(filterList.filterer.splitInterstitials) // 3
+            NInt += len(filterList.filterer.interstitials) + NSplit
+            NAnt += len(filterList.filterer.antisites)
+            
+            # defects settings (the point defects filter is first in the list)
+            if len(filterList.filterer.currentSettings):
+                defectsSettings = filterList.filterer.currentSettings[0]
+                
+                if defectsSettings.getSetting("showVacancies"):
+                    showVacs = True
+                
+                if defectsSettings.getSetting("showInterstitials"):
+                    showInts = True
+                
+                if defectsSettings.getSetting("showAntisites"):
+                    showAnts = True
+                
+                if defectsSettings.getSetting("identifySplitInts"):
+                    identifySplitInts = True
+        
+        elif filterList.visible and len(filterList.filterer.bubbleList):
+            # bubbles (temporary)
+            showVacs = True
+            defectFilterActive = True
+            NVac += len(filterList.filterer.vacancies)
+    
+    if defectFilterActive:
+        # defect specie counters
+        vacSpecCount = np.zeros(len(refState.specieList), np.int32)
+        intSpecCount = np.zeros(len(inputState.specieList), np.int32)
+        antSpecCount = np.zeros((len(refState.specieList), len(inputState.specieList)), np.int32)
+        splitSpecCount = np.zeros((len(inputState.specieList), len(inputState.specieList)), np.int32)
+        for filterList in filterLists:
+            if filterList.visible and filterList.defectFilterSelected:
+                if len(vacSpecCount) == len(filterList.filterer.vacancySpecieCount):
+                    vacSpecCount = np.add(vacSpecCount, filterList.filterer.vacancySpecieCount)
+                if len(intSpecCount) == len(filterList.filterer.interstitialSpecieCount):
+                    intSpecCount = np.add(intSpecCount, filterList.filterer.interstitialSpecieCount)
+                if len(antSpecCount) == len(filterList.filterer.antisiteSpecieCount):
+                    antSpecCount = np.add(antSpecCount, filterList.filterer.antisiteSpecieCount)
+                if len(splitSpecCount) == len(filterList.filterer.splitIntSpecieCount):
+                    splitSpecCount = np.add(splitSpecCount, filterList.filterer.splitIntSpecieCount)
+        
+        # now add to dict
+        onScreenInfo["Defect count"] = []
+        
+        if showVacs:
+            onScreenInfo["Defect count"].append((NVac, "vacancies"))
+        
+        if showInts:
+            onScreenInfo["Defect count"].append((NInt, "interstitials"))
+        
+        if showAnts:
+            onScreenInfo["Defect count"].append((NAnt, "antisites"))
+        
+        specListInput = inputState.specieList
+        specListRef = refState.specieList
+        specRGBInput = inputState.specieRGB
+        specRGBRef = refState.specieRGB
+        
+        onScreenInfo["Defect species count"] = []
+        
+        if showVacs:
+            for i, cnt in enumerate(vacSpecCount):
+                onScreenInfo["Defect species count"].append([(cnt, specListRef[i], "vacancies"), specRGBRef[i]])
+        
+        if showInts:
+            for i, cnt in enumerate(intSpecCount):
+                onScreenInfo["Defect species count"].append([(cnt, specListInput[i], "interstitials"),
+                                                             specRGBInput[i]])
+            
+            if identifySplitInts:
+                for i in range(len(specListInput)):
+                    for j in range(i, len(specListInput)):
+                        N = splitSpecCount[i][j]
+                        if j == i:
+                            rgb = specRGBInput[i]
+                        else:
+                            rgb = (specRGBInput[i] + specRGBInput[j]) / 2.0
+                        
+                        onScreenInfo["Defect species count"].append([(N, "%s-%s" % (specListInput[i],
+                                                                                     specListInput[j]),
+                                                                      "split ints"), rgb])
+        
+        if showAnts:
+            for i in range(len(specListRef)):
+                for j in range(len(specListInput)):
+                    if i == j:
+                        continue
+                    onScreenInfo["Defect species count"].append([(antSpecCount[i][j], "%s on %s" % (specListInput[j],
+                                                                                                    specListRef[i]),
+                                                                  "antisites"), specRGBRef[i]])
+    
+    return onScreenInfo
+
+################################################################################
+
+def makeOnScreenInfoActors(onScreenInfo, selectedText, inputState, width, height, blackBackground):
+    """
+    Return a list of text actors for the selected on-screen information, for a
+    render window of the given size.
+    
+    """
+    logger = logging.getLogger(__name__)
+    actors = []
+    
+    # alignment/position stuff
+    topyLeft = height - 5
+    topxLeft = 5
+    topyRight = height - 5
+    topxRight = width - 220
+    
+    # loop over selected text
+    for settings in selectedText:
+        item = settings.title
+        
+        try:
+            line = onScreenInfo[item]
+        
+        except KeyError:
+            logger.debug("Item '%s' not in onScreenInfo dict", item)
+            continue
+        
+        # list of (format args, rgb) for each line of text
+        if item == "Visible species count":
+            textLines = [(specline, inputState.specieRGB[j]) for j, specline in enumerate(line)]
+        
+        elif item == "Defect species count":
+            textLines = [(array[0], array[1]) for array in line]
+        
+        elif type(line) is list:
+            textLines = [(subl, (0, 0, 0)) for subl in line]
+        
+        else:
+            textLines = [(line, (0, 0, 0))]
+        
+        for args, rgb in textLines:
+            r, g, b = checkTextRGB(rgb[0], rgb[1], rgb[2], blackBackground)
+            
+            if settings.position == "Top left":
+                xpos = topxLeft
+                ypos = topyLeft
+            else:
+                xpos = topxRight
+                ypos = topyRight
+            
+            # make text string
+            text = settings.makeText(args)
+            
+            # add actor
+            actors.append(vtkRenderWindowText(text, 20, xpos, ypos, r, g, b))
+            
+            if settings.position == "Top left":
+                topyLeft -= 20
+            else:
+                topyRight -= 20
+    
+    return actors
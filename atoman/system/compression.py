@@ -0,0 +1,202 @@
+"""
+Reading compressed files.
+
+Compressed files are decompressed in-process while they are being read (no temporary
+files or external commands). gzip and bzip2 are always supported; xz requires the
+`lzma` module and zstd requires the `zstandard` package.
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import io
+import gzip
+import bz2
+import logging
+import threading
+
+from six.moves import queue
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _openZstd(filename):
+    """
+    Open a zstd compressed file.
+    
+    """
+    reader = zstandard.ZstdDecompressor().stream_reader(open(filename, "rb"), closefd=True)
+    
+    return io.BufferedReader(reader)
+
+
+# functions for opening compressed files (by extension)
+_openers = {
+    ".gz": lambda filename: gzip.open(filename, "rb"),
+    ".bz2": lambda filename: bz2.BZ2File(filename, "rb"),
+}
+if lzma is not None:
+    _openers[".xz"] = lambda filename: lzma.open(filename, "rb")
+if zstandard is not None:
+    _openers[".zst"] = _openZstd
+
+# supported extensions, in the order they are checked for
+COMPRESSED_EXTENSIONS = tuple(ext for ext in (".bz2", ".gz", ".xz", ".zst") if ext in _openers)
+
+
+def isCompressed(filename):
+    """
+    Return True if the file has a supported compressed file extension.
+    
+    """
+    return os.path.splitext(filename)[1] in _openers
+
+
+def locateFile(filename):
+    """
+    Return the path to the file, checking for compressed versions if it does not exist.
+    
+    Returns None if the file cannot be found.
+    
+    """
+    if os.path.exists(filename):
+        return filename
+    
+    for ext in COMPRESSED_EXTENSIONS:
+        if os.path.exists(filename + ext):
+            return filename + ext
+    
+    return None
+
+
+def openFile(filename, text=False):
+    """
+    Open a file for reading, decompressing it on the fly if it is compressed.
+    
+    Returns a binary file object, or a text one if text is True.
+    
+    """
+    ext = os.path.splitext(filename)[1]
+    if ext in _openers:
+        fh = _openers[ext](filename)
+        if text:
+            fh = io.TextIOWrapper(fh)
+    
+    else:
+        fh = io.open(filename, "r" if text else "rb")
+    
+    return fh
+
+
+class ReadAheadStream(object):
+    """
+    Wrap a (decompression) stream so the next blocks are read in a background thread.
+    
+    Lines can be read with `readline` until the first call to `read`, after which
+    blocks of `blockSize` bytes are read ahead (at most `numBlocks` at a time), so
+    decompression overlaps with whatever is done with the data (eg. parsing, which
+    releases the GIL).
+    
+    """
+    def __init__(self, stream, blockSize=8388608, numBlocks=4):
+        self.logger = logging.getLogger(__name__ + ".ReadAheadStream")
+        self.stream = stream
+        self.blockSize = blockSize
+        
+        self._queue = queue.Queue(maxsize=numBlocks)
+        self._thread = None
+        self._stop = threading.Event()
+        self._current = b""
+        self._eof = False
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _readAhead(self):
+        """
+        Read blocks from the stream (runs in the background thread).
+        
+        """
+        while not self._stop.is_set():
+            try:
+                data = self.stream.read(self.blockSize)
+            except Exception as error:
+                data = error
+            
+            # wait for space in the queue (unless we are stopped)
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(data, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            
+            if not isinstance(data, bytes) or not len(data):
+                break
+    
+    def readline(self):
+        """
+        Read a line (only before reading blocks).
+        
+        """
+        if self._thread is not None:
+            raise IOError("Cannot read lines after reading blocks")
+        
+        return self.stream.readline()
+    
+    def read(self, size):
+        """
+        Read up to size bytes (fewer only at the end of the stream).
+        
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._readAhead)
+            self._thread.daemon = True
+            self._thread.start()
+        
+        chunks = []
+        remaining = size
+        while remaining > 0:
+            if not len(self._current):
+                if self._eof:
+                    break
+                
+                data = self._queue.get()
+                if isinstance(data, Exception):
+                    self._eof = True
+                    raise data
+                if not len(data):
+                    self._eof = True
+                    break
+                self._current = data
+            
+            chunk = self._current[:remaining]
+            self._current = self._current[remaining:]
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        
+        return b"".join(chunks)
+    
+    def close(self):
+        """
+        Stop reading ahead and close the stream.
+        
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.stream.close()
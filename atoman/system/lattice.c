@@ -8,6 +8,7 @@
 #include <Python.h> // includes stdio.h, string.h, errno.h, stdlib.h
 #include <numpy/arrayobject.h>
 #include <math.h>
+#include <stdint.h>
 #include "visclibs/array_utils.h"
 
 #if PY_MAJOR_VERSION >= 3
@@ -27,6 +28,24 @@
 #endif
 
 static PyObject* wrapAtoms(PyObject*, PyObject*);
+static PyObject* spaceFillingCurveOrder(PyObject*, PyObject*);
+static uint64_t mortonKey(unsigned int *, int);
+static uint64_t hilbertKey(unsigned int *, int);
+static int compareKeys(const void *, const void *);
+
+/* number of bits per dimension in the space-filling curve keys */
+#define CURVE_BITS 21
+
+/* space-filling curves */
+#define CURVE_MORTON 0
+#define CURVE_HILBERT 1
+
+/* key of an atom on the space-filling curve */
+struct CurveKey
+{
+    uint64_t key;
+    int index;
+};
 
 
 /*******************************************************************************
@@ -34,6 +53,7 @@ static PyObject* wrapAtoms(PyObject*, PyObject*);
  *******************************************************************************/
 static struct PyMethodDef module_methods[] = {
     {"wrapAtoms", wrapAtoms, METH_VARARGS, "Wrap atoms that have left the periodic cell"},
+    {"spaceFillingCurveOrder", spaceFillingCurveOrder, METH_VARARGS, "Order the atoms along a space-filling curve"},
     {NULL, NULL, 0, NULL}
 };
 
@@ -83,3 +103,153 @@ wrapAtoms(PyObject *self, PyObject *args)
     
     return result;
 }
+
+/*******************************************************************************
+ ** Interleave the bits of the cell coordinates (Morton/Z-order key)
+ *******************************************************************************/
+static uint64_t
+mortonKey(unsigned int *X, int bits)
+{
+    int b;
+    uint64_t key = 0;
+    
+    for (b = bits - 1; b >= 0; b--)
+    {
+        key = (key << 3) | ((uint64_t) ((X[0] >> b) & 1) << 2) | ((uint64_t) ((X[1] >> b) & 1) << 1) |
+                (uint64_t) ((X[2] >> b) & 1);
+    }
+    
+    return key;
+}
+
+/*******************************************************************************
+ ** Hilbert key of the cell coordinates (transposed to the Hilbert index using
+ ** Skilling's algorithm, "Programming the Hilbert curve", AIP Conf. Proc. 707,
+ ** 381 (2004), then interleaved). X is modified.
+ *******************************************************************************/
+static uint64_t
+hilbertKey(unsigned int *X, int bits)
+{
+    int i;
+    unsigned int M = 1U << (bits - 1);
+    unsigned int P, Q, t;
+    
+    /* inverse undo */
+    for (Q = M; Q > 1; Q >>= 1)
+    {
+        P = Q - 1;
+        for (i = 0; i < 3; i++)
+        {
+            if (X[i] & Q) X[0] ^= P;
+            else
+            {
+                t = (X[0] ^ X[i]) & P;
+                X[0] ^= t;
+                X[i] ^= t;
+            }
+        }
+    }
+    
+    /* Gray encode */
+    for (i = 1; i < 3; i++) X[i] ^= X[i - 1];
+    t = 0;
+    for (Q = M; Q > 1; Q >>= 1)
+        if (X[2] & Q) t ^= Q - 1;
+    for (i = 0; i < 3; i++) X[i] ^= t;
+    
+    return mortonKey(X, bits);
+}
+
+/*******************************************************************************
+ ** Compare keys (ties are broken by index, so the order is deterministic)
+ *******************************************************************************/
+static int
+compareKeys(const void *a, const void *b)
+{
+    const struct CurveKey *k1 = a;
+    const struct CurveKey *k2 = b;
+    
+    if (k1->key != k2->key) return (k1->key > k2->key) - (k1->key < k2->key);
+    return (k1->index > k2->index) - (k1->index < k2->index);
+}
+
+/*******************************************************************************
+ ** Order the atoms along a space-filling curve (Morton or Hilbert) through
+ ** the bounding box of the atoms. order[i] is the index of the atom that
+ ** should be i-th.
+ *******************************************************************************/
+static PyObject*
+spaceFillingCurveOrder(PyObject *self, PyObject *args)
+{
+    int NAtoms, curve, *order, i, j;
+    double *pos, minPos[3], scale[3];
+    PyArrayObject *posIn=NULL;
+    PyArrayObject *orderIn=NULL;
+    struct CurveKey *keys;
+    
+    /* parse and check arguments from Python */
+    if (!PyArg_ParseTuple(args, "O!iO!", &PyArray_Type, &posIn, &curve, &PyArray_Type, &orderIn))
+        return NULL;
+    
+    if (not_doubleVector(posIn)) return NULL;
+    pos = pyvector_to_Cptr_double(posIn);
+    NAtoms = (int) PyArray_DIM(posIn, 0) / 3;
+    
+    if (not_intVector(orderIn)) return NULL;
+    order = pyvector_to_Cptr_int(orderIn);
+    if ((int) PyArray_DIM(orderIn, 0) != NAtoms)
+    {
+        PyErr_SetString(PyExc_ValueError, "Order array has the wrong length");
+        return NULL;
+    }
+    
+    if (curve != CURVE_MORTON && curve != CURVE_HILBERT)
+    {
+        PyErr_Format(PyExc_ValueError, "Unrecognised space-filling curve: %d", curve);
+        return NULL;
+    }
+    
+    if (NAtoms == 0) Py_RETURN_NONE;
+    
+    /* bounding box of the atoms (divided into 2^CURVE_BITS cells along each axis) */
+    for (j = 0; j < 3; j++)
+    {
+        double maxPos = pos[j];
+        
+        minPos[j] = pos[j];
+        for (i = 1; i < NAtoms; i++)
+        {
+            double val = pos[3 * i + j];
+            if (val < minPos[j]) minPos[j] = val;
+            else if (val > maxPos) maxPos = val;
+        }
+        scale[j] = (maxPos > minPos[j]) ? ((double) ((1U << CURVE_BITS) - 1)) / (maxPos - minPos[j]) : 0.0;
+    }
+    
+    /* keys of the atoms */
+    keys = malloc(NAtoms * sizeof(struct CurveKey));
+    if (keys == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate keys");
+        return NULL;
+    }
+    
+    #pragma omp parallel for
+    for (i = 0; i < NAtoms; i++)
+    {
+        int k;
+        unsigned int X[3];
+        
+        for (k = 0; k < 3; k++) X[k] = (unsigned int) ((pos[3 * i + k] - minPos[k]) * scale[k]);
+        keys[i].key = (curve == CURVE_HILBERT) ? hilbertKey(X, CURVE_BITS) : mortonKey(X, CURVE_BITS);
+        keys[i].index = i;
+    }
+    
+    /* sort along the curve */
+    qsort(keys, NAtoms, sizeof(struct CurveKey), compareKeys);
+    for (i = 0; i < NAtoms; i++) order[i] = keys[i].index;
+    
+    free(keys);
+    
+    Py_RETURN_NONE;
+}
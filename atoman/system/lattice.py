@@ -10,6 +10,7 @@ from __future__ import unicode_literals
 from __future__ import division
 import logging
 import copy
+import tempfile
 
 import numpy as np
 
@@ -17,9 +18,24 @@ from .atoms import elements
 from ..algebra import vectors
 from . import _lattice
 from . import _output
+import six
 from six.moves import range
 
 
+def memoryMappedArray(directory, shape, dtype):
+    """
+    Return a new (uninitialised) array stored in a memory-mapped file in the given directory.
+    
+    The file is unlinked as soon as it is mapped, so it is removed automatically when the
+    array is no longer referenced.
+    
+    """
+    with tempfile.NamedTemporaryFile(prefix="lattice-", suffix=".mmap", dir=directory) as fh:
+        array = np.memmap(fh, dtype=dtype, mode="w+", shape=shape)
+    
+    return array
+
+
 class Lattice(object):
     """
     The Lattice object.
@@ -50,15 +66,340 @@ class Lattice(object):
         self.vectorsFiles = {}
         self.attributes = {}
         
+        # columns that were skipped when reading (name -> (kind, reader)); see loadDeferredColumn
+        self.deferredColumns = {}
+        
         self.PBC = np.ones(3, np.int32)
+        
+        # incremented whenever the positions change (see positionsChanged)
+        self.positionsVersion = 0
+        
+        # incremented whenever any of the atom data changes, including the positions (see dataChanged)
+        self.dataVersion = 0
+        
+        # index in the file of each atom and index of each atom of the file, if the atoms
+        # have been reordered (see reorderAtoms), otherwise None
+        self.permutation = None
+        self.inversePermutation = None
+        
+        # backing buffers (with spare capacity) for the per-atom arrays
+        self._columnBuffers = {}
+        
+        # directory for memory-mapped per-atom arrays (None means keep them in RAM)
+        self.memoryMapDir = None
+    
+    def __deepcopy__(self, memo):
+        """
+        Copy the Lattice, keeping the per-atom arrays memory-mapped if they are on this Lattice.
+        
+        """
+        lattice = self.__class__.__new__(self.__class__)
+        memo[id(self)] = lattice
+        
+        columns = ("atomID", "specie", "pos", "charge", "scalarsDict", "vectorsDict", "_columnBuffers",
+                   "deferredColumns")
+        for key, value in six.iteritems(self.__dict__):
+            if key not in columns:
+                setattr(lattice, key, copy.deepcopy(value, memo))
+        
+        lattice._columnBuffers = {}
+        lattice.atomID = lattice._copyColumn(self.atomID)
+        lattice.specie = lattice._copyColumn(self.specie)
+        lattice.pos = lattice._copyColumn(self.pos)
+        lattice.charge = lattice._copyColumn(self.charge)
+        lattice.scalarsDict = dict((name, lattice._copyColumn(array))
+                                   for name, array in six.iteritems(self.scalarsDict))
+        lattice.vectorsDict = dict((name, lattice._copyColumn(array))
+                                   for name, array in six.iteritems(self.vectorsDict))
+        
+        # the column readers are shared (they only refer to the file)
+        lattice.deferredColumns = dict(self.deferredColumns)
+        
+        return lattice
+    
+    def memoryMap(self, directory):
+        """
+        Store the per-atom arrays (positions, species, charges, IDs, scalars
+        and vectors) in memory-mapped files in the given directory.
+        
+        The files are unlinked as soon as they are mapped, so they are removed
+        automatically when the arrays are no longer referenced. Arrays added
+        to the Lattice afterwards (eg. by `reset`, `clone` or `addAtoms`) are
+        also memory-mapped. Arrays that are already memory-mapped (eg. by the
+        reader) are not copied.
+        
+        """
+        logger = logging.getLogger(__name__)
+        logger.debug("Memory-mapping Lattice arrays in: '%s'", directory)
+        
+        self.memoryMapDir = directory
+        self._columnBuffers = {}
+        self.atomID = self._mapColumn(self.atomID)
+        self.specie = self._mapColumn(self.specie)
+        self.pos = self._mapColumn(self.pos)
+        self.charge = self._mapColumn(self.charge)
+        for name in list(self.scalarsDict.keys()):
+            self.scalarsDict[name] = self._mapColumn(self.scalarsDict[name])
+        for name in list(self.vectorsDict.keys()):
+            self.vectorsDict[name] = self._mapColumn(self.vectorsDict[name])
+    
+    def _mapColumn(self, array):
+        """
+        Return the per-atom array in a memory-mapped file (copying it if it is not already).
+        
+        """
+        if isinstance(array, np.memmap):
+            return array
+        
+        return self._copyColumn(array)
+    
+    def isMemoryMapped(self):
+        """
+        Return True if the per-atom arrays are stored in memory-mapped files.
+        
+        """
+        return self.memoryMapDir is not None or isinstance(self.pos, np.memmap)
+    
+    def _newColumn(self, shape, dtype):
+        """
+        Return a new (uninitialised) per-atom array, memory-mapped if enabled.
+        
+        """
+        if self.memoryMapDir is None or np.prod(shape) == 0:
+            return np.empty(shape, dtype)
+        
+        return memoryMappedArray(self.memoryMapDir, shape, dtype)
+    
+    def _copyColumn(self, array, dtype=None):
+        """
+        Return a copy of a per-atom array (converted to dtype, if given), memory-mapped if enabled.
+        
+        """
+        array = np.asarray(array)
+        newArray = self._newColumn(array.shape, array.dtype if dtype is None else dtype)
+        newArray[...] = array
+        
+        return newArray
+    
+    def memoryUsage(self):
+        """
+        Return the size of the per-atom arrays (in bytes).
+        
+        """
+        arrays = [self.atomID, self.specie, self.pos, self.charge]
+        arrays.extend(self.scalarsDict.values())
+        arrays.extend(self.vectorsDict.values())
+        
+        return sum(np.asarray(array).nbytes for array in arrays)
+    
+    def deferredColumnNames(self, kind):
+        """
+        Return the names of the columns of the given kind ("scalar" or "vector") that were
+        skipped when reading and have not been loaded yet.
+        
+        """
+        return sorted(name for name, (columnKind, _) in six.iteritems(self.deferredColumns) if columnKind == kind)
+    
+    def loadDeferredColumn(self, name):
+        """
+        Read a column that was skipped when the Lattice was read, storing it in the
+        scalars/vectors dict.
+        
+        Returns True if the column was loaded.
+        
+        """
+        if name not in self.deferredColumns:
+            return False
+        
+        kind, reader = self.deferredColumns[name]
+        logging.getLogger(__name__).debug("Loading deferred %s column: '%s'", kind, name)
+        data = self.fromFileOrder(reader.read(name))
+        del self.deferredColumns[name]
+        
+        if self.memoryMapDir is not None:
+            data = self._copyColumn(data)
+        
+        if kind == "scalar":
+            self.scalarsDict[name] = data
+        else:
+            self.vectorsDict[name] = data
+        self.dataChanged()
+        
+        return True
+    
+    def dataChanged(self):
+        """
+        Record that the atom data (species, charges, scalars, vectors, ...) have been
+        changed, so anything computed from them (eg. the cached stages of the filters) is
+        no longer valid.
+        
+        """
+        self.dataVersion += 1
+    
+    def positionsChanged(self):
+        """
+        Record that the positions have been changed (in place), so anything computed from
+        them (eg. the spatial index used by the filters) is no longer valid.
+        
+        """
+        self.positionsVersion += 1
+        self.dataChanged()
     
     def wrapAtoms(self):
         """
         Wrap atoms that have left the periodic cell.
         
         """
+        self.positionsChanged()
+        
         return _lattice.wrapAtoms(self.NAtoms, self.pos, self.cellDims, self.PBC)
     
+    def spaceFillingCurveOrder(self, curve="hilbert"):
+        """
+        Return the order of the atoms along a space-filling curve ("morton" or "hilbert")
+        through the bounding box of the atoms, ie. the index of the atom that should be
+        first, second, etc.
+        
+        """
+        curves = {"morton": 0, "hilbert": 1}
+        if curve not in curves:
+            raise ValueError("Unrecognised space-filling curve: '%s'" % curve)
+        
+        order = np.empty(self.NAtoms, np.int32)
+        _lattice.spaceFillingCurveOrder(np.ascontiguousarray(self.pos[:3 * self.NAtoms]), curves[curve], order)
+        
+        return order
+    
+    def reorderAtoms(self, order):
+        """
+        Reorder the atoms, so atom i becomes the atom that was order[i].
+        
+        Atoms that are close in space can be made close in memory by ordering them along a
+        space-filling curve (see `spaceFillingCurveOrder`), so the neighbour loops in the
+        filters use the cache better. The order of the atoms in the file is kept in
+        `permutation` (index in the file of each atom) and `inversePermutation` (index of
+        each atom of the file), see `toFileOrder`, `fromFileOrder` and `matchingPositions`.
+        
+        """
+        order = np.asarray(order, dtype=np.int32)
+        if order.shape != (self.NAtoms,) or (self.NAtoms and
+                                             np.any(np.bincount(order, minlength=self.NAtoms) != 1)):
+            raise ValueError("Order is not a permutation of the atoms")
+        
+        self._columnBuffers = {}
+        self.atomID = self._permuteColumn(self.atomID, order)
+        self.specie = self._permuteColumn(self.specie, order)
+        self.pos = self._permuteColumn(self.pos, order, width=3)
+        self.charge = self._permuteColumn(self.charge, order)
+        for name in list(self.scalarsDict.keys()):
+            self.scalarsDict[name] = self._permuteColumn(self.scalarsDict[name], order)
+        for name in list(self.vectorsDict.keys()):
+            self.vectorsDict[name] = self._permuteColumn(self.vectorsDict[name], order, width=3)
+        self.positionsChanged()
+        
+        self._setPermutation(order if self.permutation is None else self.permutation[order])
+    
+    def reorderAlongCurve(self, curve="hilbert"):
+        """
+        Reorder the atoms along a space-filling curve ("morton" or "hilbert").
+        
+        """
+        logging.getLogger(__name__).debug("Reordering atoms along %s curve", curve)
+        self.reorderAtoms(self.spaceFillingCurveOrder(curve))
+    
+    def _permuteColumn(self, array, order, width=1):
+        """
+        Return a copy of a per-atom array with the atoms in the given order.
+        
+        """
+        array = np.asarray(array)
+        NAtoms = len(order)
+        if array.ndim == 1 and width > 1:
+            rows = array[:width * NAtoms].reshape((-1, width))
+        else:
+            rows = array[:NAtoms]
+        newArray = self._newColumn(rows.shape if array.ndim > 1 else (width * NAtoms,), array.dtype)
+        newArray.reshape(rows.shape)[...] = rows[order]
+        
+        return newArray
+    
+    def _setPermutation(self, permutation):
+        """
+        Set the permutation from the order of the atoms in the file (None if they are in that order).
+        
+        """
+        if permutation is None:
+            self.permutation = None
+            self.inversePermutation = None
+        
+        else:
+            self.permutation = np.array(permutation, dtype=np.int32)
+            self.inversePermutation = np.empty(len(permutation), np.int32)
+            self.inversePermutation[self.permutation] = np.arange(len(permutation), dtype=np.int32)
+    
+    def toFileOrder(self, array):
+        """
+        Return a per-atom array (one row per atom) with the atoms in the order of the file.
+        
+        """
+        if self.permutation is None:
+            return array
+        
+        return np.asarray(array)[self.inversePermutation]
+    
+    def fromFileOrder(self, array):
+        """
+        Return a per-atom array given with the atoms in the order of the file (one row per
+        atom) with the atoms in the order of this Lattice.
+        
+        """
+        if self.permutation is None:
+            return array
+        
+        return np.asarray(array)[self.permutation]
+    
+    def fileOrderIndices(self, indices):
+        """
+        Return the given atom indexes sorted by the order of the atoms in the file.
+        
+        """
+        indices = np.asarray(indices, dtype=np.int32)
+        if self.permutation is None:
+            return np.sort(indices)
+        
+        return indices[np.argsort(self.permutation[indices], kind="mergesort")]
+    
+    def fileOrderPositions(self):
+        """
+        Return the positions with the atoms in the order of the file.
+        
+        """
+        pos = self.pos[:3 * self.NAtoms]
+        if self.permutation is None:
+            return pos
+        
+        return pos.reshape((-1, 3))[self.inversePermutation].ravel()
+    
+    def matchingPositions(self, other):
+        """
+        Return the positions of the other Lattice (eg. the reference) with the atoms in the
+        order of this Lattice, matching the atoms by their index in the files. The positions
+        are returned as they are if neither Lattice has been reordered.
+        
+        """
+        if self.permutation is None and other.permutation is None:
+            return other.pos
+        
+        if other.NAtoms != self.NAtoms:
+            raise ValueError("Cannot match atoms of reordered lattices with different numbers of atoms (%d != %d)" %
+                             (self.NAtoms, other.NAtoms))
+        
+        index = np.arange(self.NAtoms, dtype=np.int32) if self.permutation is None else self.permutation
+        if other.inversePermutation is not None:
+            index = other.inversePermutation[index]
+        
+        return other.pos[:3 * other.NAtoms].reshape((-1, 3))[index].ravel()
+    
     def atomSeparation(self, index1, index2, pbc):
         """
         Calculate the separation between two atoms.
@@ -97,10 +438,11 @@ class Lattice(object):
         """
         self.NAtoms = NAtoms
         
-        self.atomID = np.empty(NAtoms, np.int32)
-        self.specie = np.empty(NAtoms, np.int32)
-        self.pos = np.empty(3 * NAtoms, np.float64)
-        self.charge = np.zeros(NAtoms, np.float64)
+        self.atomID = self._newColumn(NAtoms, np.int32)
+        self.specie = self._newColumn(NAtoms, np.int32)
+        self.pos = self._newColumn(3 * NAtoms, np.float64)
+        self.charge = self._newColumn(NAtoms, np.float64)
+        self.charge[:] = 0
         
         self.specieList = []
         self.specieCount = np.empty(0, np.int32)
@@ -119,8 +461,15 @@ class Lattice(object):
         self.vectorsDict = {}
         self.vectorsFiles = {}
         self.attributes = {}
+        self.deferredColumns = {}
         
         self.PBC = np.ones(3, np.int32)
+        
+        self.permutation = None
+        self.inversePermutation = None
+        
+        self.positionsChanged()
+        self._columnBuffers = {}
     
     def calcTemperature(self, NMoving=None):
         """
@@ -197,86 +546,318 @@ class Lattice(object):
         rgbnew[0][1] = rgbtemp[1]
         rgbnew[0][2] = rgbtemp[2]
         self.specieRGB = np.append(self.specieRGB, rgbnew, axis=0)
+        self.dataChanged()
     
     def addAtom(self, sym, pos, charge, atomID=None, scalarVals={}, vectorVals={}):
         """
         Add an atom to the lattice
         
         """
-        if sym not in self.specieList:
-            self.addSpecie(sym)
-        
-        # atom ID
         if atomID is None:
             atomID = self.NAtoms
         
-        specInd = self.getSpecieIndex(sym)
+        scalars = {}
+        for scalarName, val in six.iteritems(scalarVals):
+            scalars[scalarName] = [val]
         
-        self.specieCount[specInd] += 1
+        vectors = {}
+        for vectorName, val in six.iteritems(vectorVals):
+            if len(val) == 3:
+                vectors[vectorName] = [val]
         
-        pos = np.asarray(pos, dtype=np.float64)
+        self.addAtoms([sym], [pos], [charge], atomIDs=[atomID], scalars=scalars, vectors=vectors)
+    
+    def addAtoms(self, symbols, positions, charges=None, scalars=None, vectors=None, atomIDs=None):
+        """
+        Add multiple atoms to the lattice.
         
-        self.atomID = np.append(self.atomID, np.int32(atomID))
-        self.specie = np.append(self.specie, np.int32(specInd))
-        self.pos = np.append(self.pos, pos)
-        self.charge = np.append(self.charge, np.float64(charge))
+        The per-atom arrays are stored in buffers with spare capacity that is
+        doubled when they fill up, so repeatedly adding atoms is amortised O(1)
+        per atom. Scalars/vectors stored on the Lattice that are not provided
+        for the new atoms are removed from the Lattice (as in `addAtom`).
         
-        # wrap positions
+        Parameters
+        ----------
+        symbols : sequence of str
+            The symbol of each new atom.
+        positions : array_like
+            The positions of the new atoms, shape (N, 3) or (3N,).
+        charges : array_like, optional
+            The charges of the new atoms (default is zero).
+        scalars : dict, optional
+            Maps scalar names to arrays of values for the new atoms.
+        vectors : dict, optional
+            Maps vector names to (N, 3) arrays of values for the new atoms.
+        atomIDs : array_like, optional
+            The IDs of the new atoms (default is to number them from `NAtoms`).
         
-        # min/max pos!!??
-        for i in range(3):
-            self.minPos[i] = min(self.minPos[i], pos[i])
-            self.maxPos[i] = max(self.maxPos[i], pos[i])
+        """
+        symbols = np.asarray(symbols)
+        NAdd = len(symbols)
+        positions = np.asarray(positions, dtype=np.float64).reshape((-1, 3))
+        if len(positions) != NAdd:
+            raise ValueError("Number of positions (%d) does not match number of symbols (%d)" % (len(positions),
+                                                                                               NAdd))
+        if NAdd == 0:
+            return
         
-        self.NAtoms += 1
+        if charges is None:
+            charges = np.zeros(NAdd, np.float64)
+        if atomIDs is None:
+            atomIDs = np.arange(self.NAtoms, self.NAtoms + NAdd, dtype=np.int32)
+        if scalars is None:
+            scalars = {}
+        if vectors is None:
+            vectors = {}
+        
+        # species indexes of the new atoms (new species added in order of appearance)
+        uniqueSymbols, firstIndex, inverse = np.unique(symbols, return_index=True, return_inverse=True)
+        for sym in uniqueSymbols[np.argsort(firstIndex)]:
+            self.addSpecie(six.text_type(sym))
+        specieMap = np.asarray([self.getSpecieIndex(six.text_type(sym)) for sym in uniqueSymbols], dtype=np.int32)
+        newSpecie = specieMap[inverse.reshape(-1)]
+        
+        self._appendAtoms(newSpecie, positions, charges, atomIDs, scalars, vectors)
+    
+    def _appendAtoms(self, newSpecie, positions, charges, atomIDs, scalars, vectors):
+        """
+        Append atoms, with species given as indexes into the species list.
         
+        """
         logger = logging.getLogger(__name__)
         
+        self.specieCount += np.bincount(newSpecie, minlength=len(self.specieList)).astype(np.int32)
+        
+        # skipped columns can no longer be read from the file
+        self.deferredColumns = {}
+        
+        # append to the atom data
+        NAtoms = self.NAtoms
+        NTotal = NAtoms + len(newSpecie)
+        self.atomID = self._appendToColumn("atomID", self.atomID, NAtoms, atomIDs)
+        self.specie = self._appendToColumn("specie", self.specie, NAtoms, newSpecie)
+        self.pos = self._appendToColumn("pos", self.pos, NAtoms, positions, width=3)
+        self.charge = self._appendToColumn("charge", self.charge, NAtoms, charges)
+        
+        # min/max pos
+        self.minPos[:] = np.minimum(self.minPos, positions.min(axis=0))
+        self.maxPos[:] = np.maximum(self.maxPos, positions.max(axis=0))
+        
+        self.NAtoms = NTotal
+        self.positionsChanged()
+        
+        # the new atoms follow the atoms of the file
+        if self.permutation is not None:
+            self._setPermutation(np.concatenate((self.permutation, np.arange(NAtoms, NTotal, dtype=np.int32))))
+        
         for scalarName in list(self.scalarsDict.keys()):
-            if scalarName in scalarVals:
-                newval = scalarVals[scalarName]
-                self.scalarsDict[scalarName] = np.append(self.scalarsDict[scalarName], np.float64(newval))
+            if scalarName in scalars:
+                self.scalarsDict[scalarName] = self._appendToColumn("scalar:" + scalarName,
+                                                                    self.scalarsDict[scalarName], NAtoms,
+                                                                    scalars[scalarName])
             
             else:
                 self.scalarsDict.pop(scalarName)
+                self._columnBuffers.pop("scalar:" + scalarName, None)
                 logger.warning("Removing '%s' scalars from Lattice (addAtom)", scalarName)
         
         for vectorName in list(self.vectorsDict.keys()):
-            newval = []
-            if vectorName in vectorVals:
-                newval = vectorVals[vectorName]
-            
-            if len(newval) == 3:
-                self.vectorsDict[vectorName] = np.append(self.vectorsDict[vectorName], np.asarray(newval,
-                                                         dtype=np.float64))
+            if vectorName in vectors:
+                self.vectorsDict[vectorName] = self._appendToColumn("vector:" + vectorName,
+                                                                    self.vectorsDict[vectorName], NAtoms,
+                                                                    vectors[vectorName], width=3)
             
             else:
                 self.vectorsDict.pop(vectorName)
+                self._columnBuffers.pop("vector:" + vectorName, None)
                 logger.warning("Removing '%s' vectors from Lattice (addAtom)", vectorName)
     
+    def _appendToColumn(self, key, array, NAtoms, values, width=1):
+        """
+        Append values to a per-atom array, returning the new array.
+        
+        The returned array is a view onto a buffer with spare capacity (stored
+        in `_columnBuffers`) that is doubled whenever it fills up. If the array
+        was replaced since the buffer was created the new array is adopted.
+        
+        """
+        if width == 1:
+            shape = (-1,)
+        else:
+            shape = (-1, width)
+        values = np.asarray(values, dtype=array.dtype).reshape(shape)
+        NTotal = NAtoms + len(values)
+        
+        # check the array is still a view onto the start of the buffer
+        buf = self._columnBuffers.get(key)
+        if buf is None or array.base is not buf or array.ctypes.data != buf.ctypes.data:
+            buf = array.reshape(shape)[:NAtoms]
+        
+        # grow the buffer if required
+        if len(buf) < NTotal:
+            capacity = max(NTotal, 2 * len(buf), 16)
+            newbuf = self._newColumn((capacity,) + buf.shape[1:], array.dtype)
+            newbuf[:NAtoms] = buf[:NAtoms]
+            buf = newbuf
+            self._columnBuffers[key] = buf
+        
+        buf[NAtoms:NTotal] = values
+        
+        # return a view with the same number of dimensions as the original array
+        if array.ndim == 1:
+            return buf[:NTotal].reshape(-1)
+        else:
+            return buf[:NTotal]
+    
     def removeAtom(self, index):
         """
         Remove an atom
         
         """
-        specInd = self.specie[index]
-        self.atomID = np.delete(self.atomID, index)
-        self.specie = np.delete(self.specie, index)
-        self.pos = np.delete(self.pos, [3 * index, 3 * index + 1, 3 * index + 2])
-        self.charge = np.delete(self.charge, index)
-        self.NAtoms -= 1
+        self.removeAtoms([index])
+    
+    def removeAtoms(self, indices):
+        """
+        Remove multiple atoms from the lattice.
         
-        # modify specie list / counter if required
-        self.specieCount[specInd] -= 1
-        if self.specieCount[specInd] == 0:
-            self.removeSpecie(specInd)
+        Species that no longer have any atoms are removed from the species list.
         
-        for scalarName in list(self.scalarsDict.keys()):
-            self.scalarsDict[scalarName] = np.delete(self.scalarsDict[scalarName], index)
+        Parameters
+        ----------
+        indices : array_like
+            The indexes of the atoms to remove.
+        
+        """
+        indices = np.unique(np.asarray(indices, dtype=np.int64))
+        if not len(indices):
+            return
+        if indices[0] < 0 or indices[-1] >= self.NAtoms:
+            raise IndexError("Atom index(es) out of range (NAtoms = %d)" % self.NAtoms)
+        
+        keep = np.ones(self.NAtoms, dtype=bool)
+        keep[indices] = False
+        
+        # modify specie counter
+        removedSpecie = self.specie[indices]
+        self.specieCount -= np.bincount(removedSpecie, minlength=len(self.specieList)).astype(np.int32)
+        
+        # skipped columns can no longer be read from the file
+        self.deferredColumns = {}
         
+        # compact the atom data (into new arrays; the buffers of the old ones are released)
+        self._columnBuffers = {}
+        self.atomID = self._compactColumn(self.atomID, keep)
+        self.specie = self._compactColumn(self.specie, keep)
+        self.pos = self._compactColumn(self.pos, keep, width=3)
+        self.charge = self._compactColumn(self.charge, keep)
+        for scalarName in list(self.scalarsDict.keys()):
+            self.scalarsDict[scalarName] = self._compactColumn(self.scalarsDict[scalarName], keep)
         for vectorName in list(self.vectorsDict.keys()):
-            self.vectorsDict[vectorName] = np.delete(self.vectorsDict[vectorName],
-                                                     [3 * index, 3 * index + 1, 3 * index + 2])
+            self.vectorsDict[vectorName] = self._compactColumn(self.vectorsDict[vectorName], keep, width=3)
+        self.NAtoms -= len(indices)
+        self.positionsChanged()
+        
+        # renumber the remaining atoms of the file
+        if self.permutation is not None:
+            permutation = np.empty(self.NAtoms, np.int32)
+            permutation[np.argsort(self.permutation[keep], kind="mergesort")] = np.arange(self.NAtoms, dtype=np.int32)
+            self._setPermutation(permutation)
+        
+        # remove species that no longer have any atoms (highest index first)
+        for specInd in sorted(np.unique(removedSpecie), reverse=True):
+            if self.specieCount[specInd] == 0:
+                self.removeSpecie(specInd)
+    
+    def shiftAtoms(self, shift, updateProgress=None, blockSize=1000000):
+        """
+        Shift all atoms by the given amount and wrap them back into the periodic cell.
+        
+        The shift is applied in blocks of `blockSize` atoms, calling
+        `updateProgress(n, nmax, message)` after each block if it is given.
+        
+        """
+        shift = np.asarray(shift, dtype=np.float64)
+        pos = self.pos.reshape((-1, 3))
+        for start in range(0, self.NAtoms, blockSize):
+            end = min(start + blockSize, self.NAtoms)
+            pos[start:end] += shift
+            
+            if updateProgress is not None:
+                updateProgress(end, self.NAtoms, "Shifting cell")
+        
+        self.wrapAtoms()
+    
+    def replicate(self, repDirs, updateProgress=None, blockSize=1000000):
+        """
+        Replicate the cell the given number of times along each axis.
+        
+        The new atoms are copies of the existing atoms (including charges,
+        scalars and vectors) and are numbered from the current number of atoms.
+        Replications are added in blocks of up to `blockSize` atoms, calling
+        `updateProgress(n, nmax, message)` after each block if it is given.
+        
+        Parameters
+        ----------
+        repDirs : array_like
+            The number of additional copies of the cell to add along each axis.
+        
+        """
+        # calculate final number of atoms
+        numfin = self.NAtoms
+        for i in range(3):
+            numfin += numfin * repDirs[i]
+        numadd = numfin - self.NAtoms
+        
+        count = 0
+        for i in range(3):
+            # source data is the lattice at the beginning of this direction
+            NAtoms = self.NAtoms
+            specie = self.specie[:NAtoms]
+            pos = self.pos[:3 * NAtoms].reshape((-1, 3))
+            charge = self.charge[:NAtoms]
+            scalars = dict((name, array[:NAtoms]) for name, array in six.iteritems(self.scalarsDict))
+            vectors = dict((name, array.reshape((-1, 3))[:NAtoms]) for name, array in six.iteritems(self.vectorsDict))
+            
+            for j in range(repDirs[i]):
+                offset = np.zeros(3, np.float64)
+                offset[i] = (j + 1) * self.cellDims[i]
+                
+                for start in range(0, NAtoms, blockSize):
+                    end = min(start + blockSize, NAtoms)
+                    atomIDs = np.arange(self.NAtoms, self.NAtoms + end - start, dtype=np.int32)
+                    self._appendAtoms(specie[start:end], pos[start:end] + offset, charge[start:end], atomIDs,
+                                      dict((name, array[start:end]) for name, array in six.iteritems(scalars)),
+                                      dict((name, array[start:end]) for name, array in six.iteritems(vectors)))
+                    
+                    count += end - start
+                    if updateProgress is not None:
+                        updateProgress(count, numadd, "Replicating cell")
+            
+            # change cell dimension
+            self.cellDims[i] += self.cellDims[i] * repDirs[i]
+        
+        self.dataChanged()
+    
+    def _compactColumn(self, array, keep, width=1):
+        """
+        Return a new per-atom array containing only the atoms in the `keep` mask.
+        
+        The original array is not modified, since other objects (for example the
+        scalars of a Filterer) may still refer to it.
+        
+        """
+        if width == 1:
+            rows = array[:len(keep)]
+        else:
+            rows = array.reshape((-1, width))[:len(keep)]
+        NKeep = np.count_nonzero(keep)
+        newArray = self._newColumn((NKeep,) + rows.shape[1:], array.dtype)
+        np.compress(keep, rows, axis=0, out=newArray)
+        
+        if array.ndim == 1:
+            return newArray.reshape(-1)
+        else:
+            return newArray
     
     def removeSpecie(self, index):
         """
@@ -290,9 +871,8 @@ class Lattice(object):
 #         self.specieMassAMU = np.delete(self.specieMassAMU, index)
         self.specieRGB = np.delete(self.specieRGB, index, axis=0)
         
-        for i in range(self.NAtoms):
-            if self.specie[i] > index:
-                self.specie[i] -= 1
+        self.specie[self.specie > index] -= 1
+        self.dataChanged()
     
     def calcForce(self, forceConfig):
         """
@@ -350,6 +930,7 @@ class Lattice(object):
         self.cellDims[0] = float(dimsarray[0])
         self.cellDims[1] = float(dimsarray[1])
         self.cellDims[2] = float(dimsarray[2])
+        self.dataChanged()
     
     def refreshElementProperties(self):
         """
@@ -400,11 +981,23 @@ class Lattice(object):
                 lkmcLattice.specieMass[i] = Atoms.atomicMass(sym)
                 lkmcLattice.specieMassAMU[i] = Atoms.atomicMassAMU(sym)
     
-    def writeLattice(self, filename, visibleAtoms=None):
+    def writeLattice(self, filename, visibleAtoms=None, binary=False):
         """
         Write the Lattice to the given file. If visibleAtoms is passed only write those atoms.
         
+        If binary is True the Lattice is written as a binary snapshot (see `snapshot`)
+        instead of a text lattice file.
+        
         """
+        # atoms are written in the order of the file
+        if self.permutation is not None:
+            visibleAtoms = self.fileOrderIndices(self.inversePermutation if visibleAtoms is None else visibleAtoms)
+        
+        if binary:
+            from . import snapshot
+            snapshot.writeSnapshot(self, filename, visibleAtoms=visibleAtoms)
+            return
+        
         # full lattice or just visible atoms
         if visibleAtoms is None:
             writeFullLattice = 1
@@ -421,56 +1014,34 @@ class Lattice(object):
         Copy given lattice into this instance
         
         """
-        if lattice.NAtoms != self.NAtoms:
-            self.reset(lattice.NAtoms)
-        
-        NAtoms = lattice.NAtoms
-        
-        # copy dims
-        self.cellDims[0] = lattice.cellDims[0]
-        self.cellDims[1] = lattice.cellDims[1]
-        self.cellDims[2] = lattice.cellDims[2]
+        self.NAtoms = lattice.NAtoms
+        self.cellDims = np.array(lattice.cellDims, dtype=np.float64)
         
         # specie stuff
-        NSpecies = len(lattice.specieList)
-        self.specieList = []
-        self.specieCount = np.zeros(NSpecies, np.int32)
-        self.specieMass = np.empty(NSpecies, np.float64)
-        self.specieCovalentRadius = np.empty(NSpecies, np.float64)
-        self.specieAtomicNumber = np.zeros(NSpecies, np.int32)
-        self.specieRGB = np.empty((NSpecies, 3), np.float64)
-        for i in range(NSpecies):
-            self.specieList.append(lattice.specieList[i])
-            self.specieCount[i] = lattice.specieCount[i]
-            self.specieMass[i] = lattice.specieMass[i]
-            self.specieCovalentRadius[i] = lattice.specieCovalentRadius[i]
-            self.specieAtomicNumber[i] = lattice.specieAtomicNumber[i]
-            for j in range(3):
-                self.specieRGB[i][j] = lattice.specieRGB[i][j]
+        self.specieList = list(lattice.specieList)
+        self.specieCount = np.array(lattice.specieCount, dtype=np.int32)
+        self.specieMass = np.array(lattice.specieMass, dtype=np.float64)
+        self.specieCovalentRadius = np.array(lattice.specieCovalentRadius, dtype=np.float64)
+        self.specieAtomicNumber = np.array(lattice.specieAtomicNumber, dtype=np.int32)
+        self.specieRGB = np.array(lattice.specieRGB, dtype=np.float64)
         
         # atom data
-        self.atomID = np.empty(NAtoms, np.int32)
-        self.specie = np.empty(NAtoms, np.int32)
-        self.pos = np.empty(3 * NAtoms, np.float64)
-        self.charge = np.empty(NAtoms, np.float64)
-        for i in range(NAtoms):
-            self.atomID[i] = lattice.atomID[i]
-            self.specie[i] = lattice.specie[i]
-            self.charge[i] = lattice.charge[i]
-            for j in range(3):
-                self.pos[3 * i + j] = lattice.pos[3 * i + j]
-        
-        self.minPos[0] = lattice.minPos[0]
-        self.minPos[1] = lattice.minPos[1]
-        self.minPos[2] = lattice.minPos[2]
-        self.maxPos[0] = lattice.maxPos[0]
-        self.maxPos[1] = lattice.maxPos[1]
-        self.maxPos[2] = lattice.maxPos[2]
-        
-        self.scalarsDict = copy.deepcopy(lattice.scalarsDict)
-        self.vectorsDict = copy.deepcopy(lattice.vectorsDict)
+        self._columnBuffers = {}
+        self.atomID = self._copyColumn(lattice.atomID[:lattice.NAtoms])
+        self.specie = self._copyColumn(lattice.specie[:lattice.NAtoms])
+        self.pos = self._copyColumn(lattice.pos[:3 * lattice.NAtoms])
+        self.charge = self._copyColumn(lattice.charge[:lattice.NAtoms])
+        self.positionsChanged()
+        self._setPermutation(lattice.permutation)
+        
+        self.minPos = np.array(lattice.minPos, dtype=np.float64)
+        self.maxPos = np.array(lattice.maxPos, dtype=np.float64)
+        
+        self.scalarsDict = dict((name, self._copyColumn(array)) for name, array in six.iteritems(lattice.scalarsDict))
+        self.vectorsDict = dict((name, self._copyColumn(array)) for name, array in six.iteritems(lattice.vectorsDict))
         self.scalarsFiles = copy.deepcopy(lattice.scalarsFiles)
         self.vectorsFiles = copy.deepcopy(lattice.vectorsFiles)
         self.attributes = copy.deepcopy(lattice.attributes)
+        self.deferredColumns = dict(lattice.deferredColumns)
         
         self.PBC = copy.deepcopy(lattice.PBC)
@@ -10,6 +10,7 @@
 #include <math.h>
 #include <locale.h>
 #include "visclibs/array_utils.h"
+#include "gui/preferences.h"
 
 #if PY_MAJOR_VERSION >= 3
     #define PyString_Size PyUnicode_GET_SIZE
@@ -31,72 +32,995 @@
 #endif
 
 //#define DEBUG
-#define MAX_LINE_LENGTH 512
+
+/* size of the blocks the body is read in (32 MB; grows if a single atom does not fit) */
+#define BODY_BLOCK_SIZE 33554432
+
+/* item kinds (body) */
+#define ITEM_SKIP 0
+#define ITEM_SYMBOL 1
+#define ITEM_INT 2
+#define ITEM_DOUBLE 3
+
+/* length of error messages set while parsing the body */
+#define ERROR_LENGTH 256
+
+/* error types set while parsing the body */
+#define PARSE_OK 0
+#define PARSE_IO_ERROR 1
+#define PARSE_TYPE_ERROR 2
+#define PARSE_RUNTIME_ERROR 3
+#define PARSE_MEMORY_ERROR 4
 
 struct BodyLineItem
 {
     char *key;
     char *type;
     int dim;
+    int kind;
+    PyArrayObject *array;
+};
+
+struct BodyLine
+{
+    Py_ssize_t numItems;
+    struct BodyLineItem *items;
 };
 
-struct BodyLine
-{
-    Py_ssize_t numItems;
-    struct BodyLineItem *items;
-};
+struct Body
+{
+    Py_ssize_t numLines;
+    struct BodyLine *lines;
+    Py_ssize_t numTokens;
+    Py_ssize_t atomIDToken;
+};
+
+/* symbols seen in the file (as they appear in the file) and their index in the specie list */
+struct SymbolLookup
+{
+    long numSymbols;
+    char **symbols;
+    long *indexes;
+};
+
+/* input to read from: a file or a Python file-like object (eg. a decompression stream) */
+struct Input
+{
+    FILE *INFILE;
+    PyObject *stream;
+};
+
+static PyObject* readGenericLatticeFile(PyObject*, PyObject*);
+static PyObject* getMinMaxPos(PyObject*, PyObject*);
+static PyObject* readDataFile(PyObject*, PyObject*);
+static void freeBody(struct Body);
+static char* readLine(struct Input*, char**, size_t*);
+static size_t readInput(struct Input*, char*, size_t);
+static void closeInput(struct Input*);
+static char* nextToken(char**, const char*);
+static double parseDouble(char*, char**);
+static long parseLong(char*, char**);
+static int parseAtom(char**, struct Body*, const char*, int, long, long, char**, long*, char**, char*);
+static long lookupSymbol(struct SymbolLookup*, char*, PyObject*, long**);
+static int readBody(struct Input*, struct Body*, const char*, int, long, PyObject*, long**, PyObject*, const char*);
+static void freeSymbolLookup(struct SymbolLookup);
+static PyArrayObject* newBodyArray(int, npy_intp*, int, PyObject*);
+
+
+/*******************************************************************************
+ ** List of python methods available in this module
+ *******************************************************************************/
+static struct PyMethodDef module_methods[] = {
+    {"readGenericLatticeFile", readGenericLatticeFile, METH_VARARGS, "Read generic Lattice file"},
+    {"getMinMaxPos", getMinMaxPos, METH_VARARGS, "Get the min/max pos"},
+    {"readDataFile", readDataFile, METH_VARARGS, "Read a file of per atom scalar/vector data"},
+    {NULL, NULL, 0, NULL}
+};
+
+/*******************************************************************************
+ ** Module initialisation function
+ *******************************************************************************/
+MOD_INIT(_latticeReaderGeneric)
+{
+    PyObject *mod;
+    
+    MOD_DEF(mod, "_latticeReaderGeneric", "Generic lattice reader C extension", module_methods)
+    if (mod == NULL)
+        return MOD_ERROR_VAL;
+    
+    import_array();
+    
+    return MOD_SUCCESS_VAL(mod);
+}
+
+/*******************************************************************************
+ * Free body struct
+ *******************************************************************************/
+static void
+freeBody(struct Body body)
+{
+    Py_ssize_t i;
+
+    for (i = 0; i < body.numLines; i++)
+        free(body.lines[i].items);
+
+    free(body.lines);
+}
+
+
+/*******************************************************************************
+ * Free symbol lookup
+ *******************************************************************************/
+static void
+freeSymbolLookup(struct SymbolLookup lookup)
+{
+    long i;
+
+    for (i = 0; i < lookup.numSymbols; i++)
+        free(lookup.symbols[i]);
+
+    free(lookup.symbols);
+    free(lookup.indexes);
+}
+
+/*******************************************************************************
+ * Read a line of any length into the buffer (which is grown as required).
+ * Returns NULL at end of file (or if memory could not be allocated, or reading
+ * from a stream failed, in which case the Python error is set).
+ *******************************************************************************/
+static char*
+readLine(struct Input *input, char **buffer, size_t *size)
+{
+    size_t length = 0;
+
+    if (*buffer == NULL)
+    {
+        *size = 512;
+        *buffer = malloc(*size * sizeof(char));
+        if (*buffer == NULL) return NULL;
+    }
+
+    /* read the line from the stream */
+    if (input->stream != NULL)
+    {
+        char *data;
+        Py_ssize_t dataLength;
+        PyObject *lineObj;
+
+        lineObj = PyObject_CallMethod(input->stream, "readline", NULL);
+        if (lineObj == NULL) return NULL;
+        if (PyBytes_AsStringAndSize(lineObj, &data, &dataLength) == -1 || !dataLength)
+        {
+            Py_DECREF(lineObj);
+            return NULL;
+        }
+
+        if ((size_t) dataLength >= *size)
+        {
+            char *tmp = realloc(*buffer, (dataLength + 1) * sizeof(char));
+            if (tmp == NULL)
+            {
+                Py_DECREF(lineObj);
+                return NULL;
+            }
+            *buffer = tmp;
+            *size = dataLength + 1;
+        }
+        memcpy(*buffer, data, dataLength);
+        (*buffer)[dataLength] = '\0';
+        Py_DECREF(lineObj);
+
+        return *buffer;
+    }
+
+    while (fgets(*buffer + length, (int) (*size - length), input->INFILE) != NULL)
+    {
+        length += strlen(*buffer + length);
+        if ((*buffer)[length - 1] == '\n') return *buffer;
+
+        /* line did not fit in the buffer */
+        if (length == *size - 1)
+        {
+            char *tmp = realloc(*buffer, 2 * *size * sizeof(char));
+            if (tmp == NULL) return NULL;
+            *buffer = tmp;
+            *size *= 2;
+        }
+    }
+
+    /* last line of the file may not have a newline */
+    return (length) ? *buffer : NULL;
+}
+
+/*******************************************************************************
+ * Read up to length chars into the buffer, returning the number read (less
+ * than length only at the end of the input or if there was an error, in which
+ * case the Python error is set for streams).
+ *******************************************************************************/
+static size_t
+readInput(struct Input *input, char *buffer, size_t length)
+{
+    size_t total = 0;
+
+    if (input->stream == NULL) return fread(buffer, sizeof(char), length, input->INFILE);
+
+    /* read from the stream until we have enough data (read may return less than requested) */
+    while (total < length)
+    {
+        char *data;
+        Py_ssize_t dataLength;
+        PyObject *dataObj;
+
+        dataObj = PyObject_CallMethod(input->stream, "read", "n", (Py_ssize_t) (length - total));
+        if (dataObj == NULL) break;
+        if (PyBytes_AsStringAndSize(dataObj, &data, &dataLength) == -1)
+        {
+            Py_DECREF(dataObj);
+            break;
+        }
+        if (!dataLength)
+        {
+            Py_DECREF(dataObj);
+            break;
+        }
+        memcpy(buffer + total, data, dataLength);
+        total += dataLength;
+        Py_DECREF(dataObj);
+    }
+
+    return total;
+}
+
+/*******************************************************************************
+ * Close the input (streams are closed by the caller)
+ *******************************************************************************/
+static void
+closeInput(struct Input *input)
+{
+    if (input->INFILE != NULL) fclose(input->INFILE);
+    input->INFILE = NULL;
+}
+
+/*******************************************************************************
+ * Return the next token in the string (like strtok but thread safe)
+ *******************************************************************************/
+static char*
+nextToken(char **saveptr, const char *delimiter)
+{
+    char *start, *end;
+
+    start = *saveptr + strspn(*saveptr, delimiter);
+    if (*start == '\0')
+    {
+        *saveptr = start;
+        return NULL;
+    }
+
+    end = start + strcspn(start, delimiter);
+    if (*end != '\0')
+    {
+        *end = '\0';
+        end++;
+    }
+    *saveptr = end;
+
+    return start;
+}
+
+/*******************************************************************************
+ * Convert string to double. Simple decimal numbers that can be converted
+ * exactly (at most 2^53 for the digits and a power of ten up to 22) are
+ * converted directly, everything else is passed to strtod, so the result is
+ * always the same as strtod.
+ *******************************************************************************/
+static const double powersOfTen[] = {1e0, 1e1, 1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9, 1e10, 1e11, 1e12, 1e13,
+                                     1e14, 1e15, 1e16, 1e17, 1e18, 1e19, 1e20, 1e21, 1e22};
+
+static double
+parseDouble(char *string, char **endp)
+{
+    char *p = string;
+    int negative = 0, haveDigits = 0, numDigits = 0, exponent = 0;
+    unsigned long long mantissa = 0;
+    double value;
+
+    /* sign */
+    if (*p == '-' || *p == '+')
+    {
+        negative = (*p == '-');
+        p++;
+    }
+
+    /* integer part */
+    for (; *p >= '0' && *p <= '9'; p++)
+    {
+        haveDigits = 1;
+        if (mantissa || *p != '0')
+        {
+            if (numDigits < 19) mantissa = 10 * mantissa + (unsigned long long) (*p - '0');
+            numDigits++;
+        }
+    }
+
+    /* fractional part */
+    if (*p == '.')
+    {
+        for (p++; *p >= '0' && *p <= '9'; p++)
+        {
+            haveDigits = 1;
+            if (mantissa || *p != '0')
+            {
+                if (numDigits < 19) mantissa = 10 * mantissa + (unsigned long long) (*p - '0');
+                numDigits++;
+            }
+            exponent--;
+        }
+    }
+
+    /* exponent */
+    if (haveDigits && (*p == 'e' || *p == 'E'))
+    {
+        int expNegative = 0, expValue = 0;
+        char *q = p + 1;
+
+        if (*q == '-' || *q == '+')
+        {
+            expNegative = (*q == '-');
+            q++;
+        }
+
+        if (*q >= '0' && *q <= '9')
+        {
+            for (; *q >= '0' && *q <= '9'; q++)
+                if (expValue < 10000) expValue = 10 * expValue + (*q - '0');
+
+            exponent += (expNegative) ? -expValue : expValue;
+            p = q;
+        }
+    }
+
+    /* anything else is left to strtod */
+    if (!haveDigits || *p != '\0' || numDigits > 19 || mantissa > (1ULL << 53))
+        return strtod(string, endp);
+
+    if (mantissa == 0)
+        value = 0.0;
+    else if (exponent < -22 || exponent > 22)
+        return strtod(string, endp);
+    else if (exponent < 0)
+        value = (double) mantissa / powersOfTen[-exponent];
+    else
+        value = (double) mantissa * powersOfTen[exponent];
+
+    *endp = p;
+
+    return (negative) ? -value : value;
+}
+
+/*******************************************************************************
+ * Convert string to long (the same as strtol with base 10)
+ *******************************************************************************/
+static long
+parseLong(char *string, char **endp)
+{
+    char *p = string;
+    int negative = 0, numDigits = 0;
+    long value = 0;
+
+    /* sign */
+    if (*p == '-' || *p == '+')
+    {
+        negative = (*p == '-');
+        p++;
+    }
+
+    /* up to 9 digits cannot overflow */
+    for (; *p >= '0' && *p <= '9' && numDigits < 9; p++, numDigits++)
+        value = 10 * value + (*p - '0');
+
+    /* anything else is left to strtol */
+    if (!numDigits || *p != '\0')
+        return strtol(string, endp, 10);
+
+    *endp = p;
+
+    return (negative) ? -value : value;
+}
+
+/*******************************************************************************
+ * Parse the lines of one atom (i) and store the values in the arrays. Does not
+ * call the Python API so can be run in parallel. The symbol token (if any) is
+ * returned for processing later. Returns PARSE_OK on success, otherwise the
+ * type of error (with the message in errstring). Errors are reported as if the
+ * values were read one at a time: the atom ID first, then the values in order.
+ *******************************************************************************/
+static int
+parseAtom(char **atomLines, struct Body *body, const char *delimiter, int atomIndexOffset, long NAtoms, long i,
+        char **tokens, long *atomIndexOut, char **symbolOut, char *errstring)
+{
+    int readError = 0;
+    long atomIndex;
+    Py_ssize_t j, numTokens, numRead, readErrorLine = 0, atomIDLine = 0;
+    char readErrstring[ERROR_LENGTH] = "";
+
+    /* split this atom's lines into tokens (up to the first missing one) */
+    numTokens = 0;
+    for (j = 0; j < body->numLines && !readError; j++)
+    {
+        char *saveptr = atomLines[j];
+        Py_ssize_t count, numItems;
+
+        numItems = body->lines[j].numItems;
+        for (count = 0; count < numItems && !readError; count++)
+        {
+            int dimcount, dim;
+
+            dim = body->lines[j].items[count].dim;
+            for (dimcount = 0; dimcount < dim; dimcount++)
+            {
+                char *pch = nextToken(&saveptr, delimiter);
+
+                if (pch == NULL)
+                {
+                    if (dimcount) snprintf(readErrstring, ERROR_LENGTH, "dim %d != %d", dimcount, dim);
+                    else snprintf(readErrstring, ERROR_LENGTH, "%ld != %ld", (long) count, (long) numItems);
+                    readError = 1;
+                    readErrorLine = j;
+                    break;
+                }
+
+                if (numTokens == body->atomIDToken) atomIDLine = j;
+                tokens[numTokens++] = pch;
+            }
+        }
+    }
+    numRead = numTokens;
+
+    /* atom index from the atom ID */
+    if (body->atomIDToken >= 0)
+    {
+        char *endp, *pch;
+
+        if (body->atomIDToken >= numTokens)
+        {
+            snprintf(errstring, ERROR_LENGTH, "Error during body line read for atomID (%ld:%ld): %s", i,
+                    (long) readErrorLine, readErrstring);
+            return PARSE_IO_ERROR;
+        }
+
+        pch = tokens[body->atomIDToken];
+        atomIndex = parseLong(pch, &endp);
+        if (pch == endp || *endp != '\0')
+        {
+            snprintf(errstring, ERROR_LENGTH, "Could not convert atomID '%s' to integer (body line %ld:%ld)", pch, i,
+                    (long) atomIDLine);
+            return PARSE_TYPE_ERROR;
+        }
+
+        atomIndex -= (long) atomIndexOffset;
+        if (atomIndex < 0 || atomIndex >= NAtoms)
+        {
+            snprintf(errstring, ERROR_LENGTH, "Atom index error: %ld out of range (atom %ld)", atomIndex, i);
+            return PARSE_RUNTIME_ERROR;
+        }
+    }
+    else atomIndex = i;
+
+    /* convert the values */
+    *symbolOut = NULL;
+    numTokens = 0;
+    for (j = 0; j < body->numLines; j++)
+    {
+        Py_ssize_t count;
+
+        for (count = 0; count < body->lines[j].numItems; count++)
+        {
+            int dimcount;
+            struct BodyLineItem *item = &(body->lines[j].items[count]);
+
+            for (dimcount = 0; dimcount < item->dim; dimcount++)
+            {
+                char *endp, *pch;
+
+                if (numTokens == numRead)
+                {
+                    snprintf(errstring, ERROR_LENGTH, "Error during body line read (%ld:%ld): %s", i, (long) j,
+                            readErrstring);
+                    return PARSE_IO_ERROR;
+                }
+                pch = tokens[numTokens++];
+
+                if (item->kind == ITEM_SYMBOL)
+                    *symbolOut = pch;
+
+                else if (item->kind == ITEM_INT)
+                {
+                    int value;
+
+                    value = (int) parseLong(pch, &endp);
+                    if (pch == endp || *endp != '\0')
+                    {
+                        snprintf(errstring, ERROR_LENGTH, "Conversion to integer failed for '%s' (body line: %ld:%ld; key: '%s')",
+                                pch, i, (long) j, item->key);
+                        return PARSE_TYPE_ERROR;
+                    }
+
+                    if (item->dim == 1) IIND1(item->array, atomIndex) = value;
+                    else IIND2(item->array, atomIndex, dimcount) = value;
+                }
+
+                else if (item->kind == ITEM_DOUBLE)
+                {
+                    double value;
+
+                    value = parseDouble(pch, &endp);
+                    if (pch == endp || *endp != '\0')
+                    {
+                        snprintf(errstring, ERROR_LENGTH, "Conversion to double failed for '%s' (body line: %ld:%ld; key: '%s')",
+                                pch, i, (long) j, item->key);
+                        return PARSE_TYPE_ERROR;
+                    }
+
+                    if (item->dim == 1) DIND1(item->array, atomIndex) = value;
+                    else DIND2(item->array, atomIndex, dimcount) = value;
+                }
+            }
+        }
+    }
+
+    *atomIndexOut = atomIndex;
+
+    return PARSE_OK;
+}
+
+/*******************************************************************************
+ * Return the index of the symbol in the specie list, adding it to the list
+ * (and the specie count) if it is new. Symbols are added in the order they
+ * first appear in the file. Returns -1 on error (with the Python error set).
+ *******************************************************************************/
+static long
+lookupSymbol(struct SymbolLookup *lookup, char *symbol, PyObject *specieList, long **specieCount)
+{
+    int check;
+    long i, index;
+    Py_ssize_t symlen;
+    char *symbolCopy, **symbols;
+    long *indexes;
+    PyObject *symin=NULL;
+
+    /* symbols we have seen already */
+    for (i = 0; i < lookup->numSymbols; i++)
+        if (!strcmp(lookup->symbols[i], symbol))
+            return lookup->indexes[i];
+
+    /* get the symbol */
+    symin = Py_BuildValue("s", symbol);
+    if (symin == NULL) return -1;
+    symlen = PyString_Size(symin);
+    if (symlen == 1)
+    {
+        Py_DECREF(symin);
+        symin = PyString_FromFormat("%s_", symbol);
+        if (symin == NULL) return -1;
+    }
+    else if (symlen != 2)
+    {
+        char errstring[128];
+
+        snprintf(errstring, 128, "Cannot handle symbol of length %d: '%s'", (int) symlen, PyString_AsString(symin));
+        PyErr_SetString(PyExc_RuntimeError, errstring);
+        Py_DECREF(symin);
+        return -1;
+    }
+
+    /* check if it already exists in the list */
+    check = PySequence_Contains(specieList, symin);
+    if (check == -1)
+    {
+        PyErr_SetString(PyExc_RuntimeError, "Checking if symbol in specie list failed");
+        Py_DECREF(symin);
+        return -1;
+    }
+    else if (check == 0)
+    {
+        long *newCount;
+        Py_ssize_t numSpecies;
+
+        /* add to list */
+        if (PyList_Append(specieList, symin) == -1)
+        {
+            Py_DECREF(symin);
+            return -1;
+        }
+
+        numSpecies = PyList_Size(specieList);
+        newCount = realloc(*specieCount, numSpecies * sizeof(long));
+        if (newCount == NULL)
+        {
+            PyErr_SetString(PyExc_MemoryError, "Could not allocate specie count");
+            Py_DECREF(symin);
+            return -1;
+        }
+        newCount[numSpecies - 1] = 0;
+        *specieCount = newCount;
+    }
+
+    index = (long) PySequence_Index(specieList, symin);
+    Py_DECREF(symin);
+    if (index == -1)
+    {
+        PyErr_SetString(PyExc_RuntimeError, "Could not find symbol index in specieList");
+        return -1;
+    }
+
+    /* remember the symbol */
+    symbols = realloc(lookup->symbols, (lookup->numSymbols + 1) * sizeof(char *));
+    if (symbols != NULL) lookup->symbols = symbols;
+    indexes = realloc(lookup->indexes, (lookup->numSymbols + 1) * sizeof(long));
+    if (indexes != NULL) lookup->indexes = indexes;
+    symbolCopy = malloc((strlen(symbol) + 1) * sizeof(char));
+    if (symbols == NULL || indexes == NULL || symbolCopy == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate symbol lookup");
+        free(symbolCopy);
+        return -1;
+    }
+    strcpy(symbolCopy, symbol);
+    lookup->symbols[lookup->numSymbols] = symbolCopy;
+    lookup->indexes[lookup->numSymbols] = index;
+    lookup->numSymbols++;
+
+    return index;
+}
+
+/*******************************************************************************
+ * Read the body of the file. The body is read in large blocks, which are split
+ * into atoms (numLines lines per atom) and then parsed in parallel. Symbols are
+ * added to the specie list afterwards, in file order, so the specie list is the
+ * same as when reading serially. Returns 0 on success, otherwise -1 (with the
+ * Python error set).
+ *******************************************************************************/
+static int
+readBody(struct Input *input, struct Body *body, const char *delimiter, int atomIndexOffset, long NAtoms,
+        PyObject *specieList, long **specieCount, PyObject *updateProgressCallback, const char *basename)
+{
+    int eof = 0, status = 0;
+    long atomsRead = 0, maxAtoms = 0;
+    long *atomIndexes = NULL;
+    size_t bufferSize = BODY_BLOCK_SIZE, length = 0;
+    size_t *lineEnds = NULL;
+    char *buffer = NULL;
+    char **atomLines = NULL;
+    char **symbols = NULL;
+    Py_ssize_t j, k, numLines;
+    PyArrayObject *symbolArray = NULL;
+    struct SymbolLookup lookup = {0, NULL, NULL};
+
+    /* the symbol array (specie) is filled in afterwards */
+    numLines = body->numLines;
+    for (j = 0; j < numLines; j++)
+        for (k = 0; k < body->lines[j].numItems; k++)
+            if (body->lines[j].items[k].kind == ITEM_SYMBOL)
+                symbolArray = body->lines[j].items[k].array;
+
+    /* allocate buffer (extra char to terminate the last line) */
+    buffer = malloc((bufferSize + 1) * sizeof(char));
+    lineEnds = malloc((numLines + 1) * sizeof(size_t));
+    if (buffer == NULL || lineEnds == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate body buffer");
+        free(buffer);
+        free(lineEnds);
+        return -1;
+    }
+
+    /* read blocks until all atoms are read */
+    while (!status && atomsRead < NAtoms)
+    {
+        int errorType = PARSE_OK;
+        long numAtoms = 0, errorAtom;
+        size_t pos;
+        char errstring[ERROR_LENGTH];
+
+        /* fill the buffer */
+        if (!eof && length < bufferSize)
+        {
+            length += readInput(input, buffer + length, bufferSize - length);
+            if (PyErr_Occurred())
+            {
+                status = -1;
+                break;
+            }
+            if (input->INFILE != NULL && ferror(input->INFILE))
+            {
+                PyErr_SetString(PyExc_IOError, "Error reading body");
+                status = -1;
+                break;
+            }
+            if (length < bufferSize) eof = 1;
+        }
+
+        /* split the buffer into atoms */
+        pos = 0;
+        while (atomsRead + numAtoms < NAtoms)
+        {
+            int complete = 1;
+            size_t linePos = pos;
+
+            /* find the end of each of the atom's lines */
+            for (j = 0; j < numLines; j++)
+            {
+                char *nl;
+
+                if (linePos >= length)
+                {
+                    complete = 0;
+                    break;
+                }
+
+                nl = memchr(buffer + linePos, '\n', length - linePos);
+                if (nl != NULL)
+                {
+                    lineEnds[j] = (size_t) (nl - buffer);
+                    linePos = lineEnds[j] + 1;
+                }
+                else if (eof)
+                {
+                    /* last line of the file may not have a newline */
+                    lineEnds[j] = length;
+                    linePos = length;
+                }
+                else
+                {
+                    complete = 0;
+                    break;
+                }
+            }
+
+            if (!complete) break;
+
+            /* make room for the atom */
+            if (numAtoms == maxAtoms)
+            {
+                long newMax = (maxAtoms) ? 2 * maxAtoms : 1024;
+                char **newLines = realloc(atomLines, newMax * numLines * sizeof(char *));
+                long *newIndexes;
+                char **newSymbols;
+
+                if (newLines != NULL) atomLines = newLines;
+                newIndexes = realloc(atomIndexes, newMax * sizeof(long));
+                if (newIndexes != NULL) atomIndexes = newIndexes;
+                newSymbols = realloc(symbols, newMax * sizeof(char *));
+                if (newSymbols != NULL) symbols = newSymbols;
+                if ((numLines && newLines == NULL) || newIndexes == NULL || newSymbols == NULL)
+                {
+                    PyErr_SetString(PyExc_MemoryError, "Could not allocate atom lines");
+                    status = -1;
+                    break;
+                }
+                maxAtoms = newMax;
+            }
+
+            /* terminate the lines */
+            for (j = 0; j < numLines; j++)
+            {
+                atomLines[numAtoms * numLines + j] = buffer + pos;
+                buffer[lineEnds[j]] = '\0';
+                pos = lineEnds[j] + 1;
+            }
+            pos = linePos;
+            numAtoms++;
+        }
+
+        if (status) break;
+
+        /* not a single atom in the buffer */
+        if (!numAtoms)
+        {
+            char *newBuffer;
+
+            if (eof)
+            {
+                snprintf(errstring, ERROR_LENGTH, "End of file reached while reading body (atom %ld)", atomsRead);
+                PyErr_SetString(PyExc_IOError, errstring);
+                status = -1;
+                break;
+            }
+
+            /* the atom does not fit in the buffer */
+            newBuffer = realloc(buffer, (2 * bufferSize + 1) * sizeof(char));
+            if (newBuffer == NULL)
+            {
+                PyErr_SetString(PyExc_MemoryError, "Could not grow body buffer");
+                status = -1;
+                break;
+            }
+            buffer = newBuffer;
+            bufferSize *= 2;
+            continue;
+        }
+
+#ifdef DEBUG
+        printf("Parsing block of %ld atoms\n", numAtoms);
+#endif
+
+        /* parse the atoms in parallel (the first error, in file order, is kept); the GIL is
+         * released so the next block can be read meanwhile (eg. decompressed in another thread) */
+        errorAtom = numAtoms;
+        Py_BEGIN_ALLOW_THREADS
+        #pragma omp parallel num_threads(prefs_numThreads)
+        {
+            long a;
+            char threadErrstring[ERROR_LENGTH];
+            char **tokens;
+
+            tokens = malloc((body->numTokens + 1) * sizeof(char *));
+            if (tokens == NULL)
+            {
+                #pragma omp critical
+                {
+                    errorAtom = 0;
+                    errorType = PARSE_MEMORY_ERROR;
+                    strcpy(errstring, "Could not allocate tokens");
+                }
+            }
+
+            #pragma omp for schedule(static)
+            for (a = 0; a < numAtoms; a++)
+            {
+                int stat;
+
+                if (tokens == NULL) continue;
+
+                stat = parseAtom(&atomLines[a * numLines], body, delimiter, atomIndexOffset, NAtoms, atomsRead + a,
+                        tokens, &atomIndexes[a], &symbols[a], threadErrstring);
+                if (stat != PARSE_OK)
+                {
+                    #pragma omp critical
+                    {
+                        if (a < errorAtom)
+                        {
+                            errorAtom = a;
+                            errorType = stat;
+                            strcpy(errstring, threadErrstring);
+                        }
+                    }
+                }
+            }
+
+            free(tokens);
+        }
+        Py_END_ALLOW_THREADS
+
+        /* species, in file order (up to the first error) */
+        if (symbolArray != NULL)
+        {
+            long a;
+
+            for (a = 0; a < errorAtom; a++)
+            {
+                if (symbols[a] != NULL)
+                {
+                    long index = lookupSymbol(&lookup, symbols[a], specieList, specieCount);
+                    if (index == -1)
+                    {
+                        status = -1;
+                        break;
+                    }
+
+                    IIND1(symbolArray, atomIndexes[a]) = (int) index;
+                    (*specieCount)[index]++;
+                }
+            }
+
+            if (status) break;
+        }
 
-struct Body
-{
-    Py_ssize_t numLines;
-    struct BodyLine *lines;
-};
+        /* parse error */
+        if (errorAtom < numAtoms)
+        {
+            if (errorType == PARSE_IO_ERROR) PyErr_SetString(PyExc_IOError, errstring);
+            else if (errorType == PARSE_TYPE_ERROR) PyErr_SetString(PyExc_TypeError, errstring);
+            else if (errorType == PARSE_MEMORY_ERROR) PyErr_SetString(PyExc_MemoryError, errstring);
+            else PyErr_SetString(PyExc_RuntimeError, errstring);
+            status = -1;
+            break;
+        }
 
-static PyObject* readGenericLatticeFile(PyObject*, PyObject*);
-static PyObject* getMinMaxPos(PyObject*, PyObject*);
-static void freeBody(struct Body);
+        atomsRead += numAtoms;
 
+        /* keep the unused part of the buffer */
+        memmove(buffer, buffer + pos, length - pos);
+        length -= pos;
 
-/*******************************************************************************
- ** List of python methods available in this module
- *******************************************************************************/
-static struct PyMethodDef module_methods[] = {
-    {"readGenericLatticeFile", readGenericLatticeFile, METH_VARARGS, "Read generic Lattice file"},
-    {"getMinMaxPos", getMinMaxPos, METH_VARARGS, "Get the min/max pos"},
-    {NULL, NULL, 0, NULL}
-};
+        /* progress callback */
+        if (updateProgressCallback != NULL)
+        {
+            char message[512];
+            PyObject *arglist;
+            PyObject *cbres;
+
+            snprintf(message, 512, "Reading: '%s'", basename);
+            arglist = Py_BuildValue("(iis)", (int) (atomsRead - 1), (int) NAtoms, message);
+            cbres = PyObject_CallObject(updateProgressCallback, arglist);
+            Py_DECREF(arglist);
+            if (cbres == NULL) status = -1;
+            else Py_DECREF(cbres);
+        }
+    }
+
+    /* free */
+    free(buffer);
+    free(lineEnds);
+    free(atomLines);
+    free(atomIndexes);
+    free(symbols);
+    freeSymbolLookup(lookup);
+
+    return status;
+}
 
 /*******************************************************************************
- ** Module initialisation function
+ * Return a new array for a body item, from the allocator if one is given (eg. to
+ * store large arrays in memory-mapped files). The allocator is called with the
+ * shape and dtype of the array and must return a C contiguous array of them.
  *******************************************************************************/
-MOD_INIT(_latticeReaderGeneric)
+static PyArrayObject*
+newBodyArray(int nd, npy_intp *dims, int typenum, PyObject *allocator)
 {
-    PyObject *mod;
+    int i;
+    PyObject *shape=NULL;
+    PyObject *result=NULL;
+    PyArrayObject *array=NULL;
     
-    MOD_DEF(mod, "_latticeReaderGeneric", "Generic lattice reader C extension", module_methods)
-    if (mod == NULL)
-        return MOD_ERROR_VAL;
     
-    import_array();
+    if (allocator == NULL) return (PyArrayObject *) PyArray_SimpleNew(nd, dims, typenum);
     
-    return MOD_SUCCESS_VAL(mod);
-}
-
-/*******************************************************************************
- * Free body struct
- *******************************************************************************/
-static void
-freeBody(struct Body body)
-{
-    Py_ssize_t i;
-
-    for (i = 0; i < body.numLines; i++)
-        free(body.lines[i].items);
-
-    free(body.lines);
+    shape = PyTuple_New(nd);
+    if (shape == NULL) return NULL;
+    for (i = 0; i < nd; i++)
+    {
+        PyObject *dim = PyLong_FromLong((long) dims[i]);
+        if (dim == NULL)
+        {
+            Py_DECREF(shape);
+            return NULL;
+        }
+        PyTuple_SET_ITEM(shape, i, dim);
+    }
+    
+    /* the descr reference is stolen */
+    result = PyObject_CallFunction(allocator, "(NN)", shape, (PyObject *) PyArray_DescrFromType(typenum));
+    if (result == NULL) return NULL;
+    
+    /* check the array is what we asked for */
+    if (!PyArray_Check(result))
+    {
+        PyErr_SetString(PyExc_TypeError, "Allocator did not return an array");
+        Py_DECREF(result);
+        return NULL;
+    }
+    array = (PyArrayObject *) result;
+    if (PyArray_TYPE(array) != typenum || PyArray_NDIM(array) != nd || !PyArray_IS_C_CONTIGUOUS(array) ||
+            !PyArray_ISWRITEABLE(array))
+    {
+        PyErr_SetString(PyExc_TypeError, "Allocator returned an array of the wrong type");
+        Py_DECREF(result);
+        return NULL;
+    }
+    for (i = 0; i < nd; i++)
+    {
+        if (PyArray_DIM(array, i) != dims[i])
+        {
+            PyErr_SetString(PyExc_TypeError, "Allocator returned an array of the wrong shape");
+            Py_DECREF(result);
+            return NULL;
+        }
+    }
+    
+    return array;
 }
 
-
 /*******************************************************************************
  * Read generic lattice file
  *******************************************************************************/
@@ -104,24 +1028,32 @@ static PyObject*
 readGenericLatticeFile(PyObject *self, PyObject *args)
 {
     int atomIndexOffset, linkedNAtoms;
-    char *filename, *delimiter, *basename=NULL;
-    FILE *INFILE=NULL;
+    char *filename=NULL, *delimiter, *basename=NULL;
+    struct Input input = {NULL, NULL};
+    PyObject *fileObj=NULL;
     PyObject *headerList=NULL;
     PyObject *bodyList=NULL;
     PyObject *resultDict=NULL;
     PyObject *updateProgressCallback=NULL;
+    PyObject *allocator=NULL;
     
     
     /* force locale to use dots for decimal separator */
     setlocale(LC_NUMERIC, "C");
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "sO!O!sii|Os", &filename, &PyList_Type, &headerList, &PyList_Type, &bodyList, &delimiter,
-            &atomIndexOffset, &linkedNAtoms, &updateProgressCallback, &basename))
+    if (!PyArg_ParseTuple(args, "OO!O!sii|OzO", &fileObj, &PyList_Type, &headerList, &PyList_Type, &bodyList, &delimiter,
+            &atomIndexOffset, &linkedNAtoms, &updateProgressCallback, &basename, &allocator))
         return NULL;
+    if (updateProgressCallback == Py_None) updateProgressCallback = NULL;
+    if (allocator == Py_None) allocator = NULL;
+
+    /* the file can be a file name or a file-like object (eg. a decompression stream) */
+    if (PyObject_HasAttrString(fileObj, "read")) input.stream = fileObj;
+    else if (!PyArg_Parse(fileObj, "s", &filename)) return NULL;
 
 #ifdef DEBUG
-    printf("GENREADER: reading file: '%s'\n", filename);
+    printf("GENREADER: reading file: '%s'\n", (filename == NULL) ? "<stream>" : filename);
     printf("Delimiter is '%s'\n", delimiter);
 #endif
     
@@ -137,12 +1069,17 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
         printf("Have progress callback\n");
 #endif
     }
+    if (allocator != NULL && !PyCallable_Check(allocator))
+    {
+        PyErr_SetString(PyExc_TypeError, "allocator must be callable");
+        return NULL;
+    }
     
     /* open the file for reading */
-    INFILE = fopen(filename, "r");
+    if (input.stream == NULL) input.INFILE = fopen(filename, "r");
 
     /* handle error */
-    if (INFILE == NULL)
+    if (input.stream == NULL && input.INFILE == NULL)
     {
         char errstring[128];
 
@@ -155,10 +1092,13 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
     {
         int atomIDFlag = 0;
         int haveSpecieOrSymbol = 0;
-        long i, numLines, callbackInterval = 0;
+        long i, numLines;
         long NAtoms = -1;
+        long *specieCount=NULL;
+        size_t lineSize = 0;
+        char *lineBuffer=NULL;
         PyObject *specieList=NULL;
-        PyObject *specieCount=NULL;
+        PyObject *specieCountList=NULL;
         struct Body bodyFormat;
 
         /* allocate result dict */
@@ -166,7 +1106,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
         if (resultDict == NULL)
         {
             PyErr_SetString(PyExc_RuntimeError, "Could not allocate resultDict");
-            fclose(INFILE);
+            closeInput(&input);
             return NULL;
         }
 
@@ -179,7 +1119,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
         /* read header */
         for (i = 0; i < numLines; i++)
         {
-            char line[MAX_LINE_LENGTH], *pch;
+            char *line, *pch;
             long lineLength, count;
             PyObject *headerLine=NULL;
 
@@ -188,11 +1128,13 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
             lineLength = PyList_Size(headerLine);
 
             /* read line */
-            if (fgets(line, MAX_LINE_LENGTH, INFILE) == NULL)
+            line = readLine(&input, &lineBuffer, &lineSize);
+            if (line == NULL)
             {
-                PyErr_SetString(PyExc_IOError, "End of file reached while reading header");
+                if (!PyErr_Occurred()) PyErr_SetString(PyExc_IOError, "End of file reached while reading header");
                 Py_DECREF(resultDict);
-                fclose(INFILE);
+                closeInput(&input);
+                free(lineBuffer);
                 return NULL;
             }
 
@@ -210,8 +1152,9 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
                 itemTuple = PyList_GetItem(headerLine, count); // borrowed ref, no need to DECREF
                 if (!PyArg_ParseTuple(itemTuple, "ssi", &key, &type, &dim))
                 {
-                    fclose(INFILE);
+                    closeInput(&input);
                     Py_DECREF(resultDict);
+                    free(lineBuffer);
                     return NULL;
                 }
 
@@ -231,8 +1174,9 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
 
                             sprintf(errstring, "Could not convert '%s' to integer (header line: %ld; key: '%s')", pch, i, key);
                             PyErr_SetString(PyExc_TypeError, errstring);
-                            fclose(INFILE);
+                            closeInput(&input);
                             Py_DECREF(resultDict);
+                            free(lineBuffer);
                             return NULL;
                         }
                         
@@ -252,8 +1196,9 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
 
                             sprintf(errstring, "Could not convert '%s' to double (header line: %ld; key: '%s')", pch, i, key);
                             PyErr_SetString(PyExc_TypeError, errstring);
-                            fclose(INFILE);
+                            closeInput(&input);
                             Py_DECREF(resultDict);
+                            free(lineBuffer);
                             return NULL;
                         }
                         
@@ -269,8 +1214,9 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
 
                         sprintf(errstring, "Unrecognised type string: '%s'", type);
                         PyErr_SetString(PyExc_RuntimeError, errstring);
-                        fclose(INFILE);
+                        closeInput(&input);
                         Py_DECREF(resultDict);
+                        free(lineBuffer);
                         return NULL;
                     }
 
@@ -287,8 +1233,9 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
 
                         sprintf(errstring, "Could not set item in dictionary: '%s'", key);
                         PyErr_SetString(PyExc_RuntimeError, errstring);
-                        fclose(INFILE);
+                        closeInput(&input);
                         Py_DECREF(resultDict);
+                        free(lineBuffer);
                         return NULL;
                     }
                 }
@@ -306,17 +1253,19 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
                 sprintf(errstring, "Wrong length for header line %ld: %ld != %ld", i, count, lineLength);
                 PyErr_SetString(PyExc_IOError, errstring);
                 Py_DECREF(resultDict);
-                fclose(INFILE);
+                closeInput(&input);
+                free(lineBuffer);
                 return NULL;
             }
         }
+        free(lineBuffer);
 
         /* we check that NAtoms was read during the header... */
         if (NAtoms == -1)
         {
             PyErr_SetString(PyExc_RuntimeError, "Cannot autodetect NAtoms at the moment...");
             Py_DECREF(resultDict);
-            fclose(INFILE);
+            closeInput(&input);
             return NULL;
         }
         // we could do a pass through whole file to get NAtoms, then seek back to where we were...
@@ -331,7 +1280,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
                 
                 sprintf(errstring, "Number of atoms does not match linked lattice (%ld != %d)", NAtoms, linkedNAtoms);
                 Py_DECREF(resultDict);
-                fclose(INFILE);
+                closeInput(&input);
                 PyErr_SetString(PyExc_ValueError, errstring);
                 return NULL;
             }
@@ -341,28 +1290,11 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
         printf("Preparing to read body; NAtoms = %ld\n", NAtoms);
 #endif
 
-        /* callback interval */
-        if (updateProgressCallback != NULL)
-        {
-            /* callback interval */
-            if (NAtoms < 500)
-                callbackInterval = NAtoms;
-            else
-            {
-                callbackInterval = (long) (NAtoms / 10);
-                if (callbackInterval < 500)
-                    callbackInterval = 500;
-                else if (callbackInterval > 20000)
-                    callbackInterval = 20000;
-            }
-#ifdef DEBUG
-            printf("Callback interval = %ld atoms\n", callbackInterval);
-#endif
-        }
-        
         /* body format (should be faster than parsing list/tuples) */
         /* number of body lines per atom */
         bodyFormat.numLines = PyList_Size(bodyList);
+        bodyFormat.numTokens = 0;
+        bodyFormat.atomIDToken = -1;
 #ifdef DEBUG
         printf("Number of body lines per atom: %ld\n", numLines);
 #endif
@@ -373,7 +1305,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
         {
             PyErr_SetString(PyExc_MemoryError, "Cannot allocate bodyFormat.lines");
             Py_DECREF(resultDict);
-            fclose(INFILE);
+            closeInput(&input);
             return NULL;
         }
 
@@ -393,7 +1325,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
             {
                 PyErr_SetString(PyExc_MemoryError, "Cannot allocate bodyFormat.lines[].items");
                 Py_DECREF(resultDict);
-                fclose(INFILE);
+                closeInput(&input);
                 freeBody(bodyFormat);
                 return NULL;
             }
@@ -415,7 +1347,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
                 itemTuple = PyList_GetItem(lineList, j);
                 if (!PyArg_ParseTuple(itemTuple, "ssi", &key, &type, &dim))
                 {
-                    fclose(INFILE);
+                    closeInput(&input);
                     Py_DECREF(resultDict);
                     freeBody(bodyFormat);
                     return NULL;
@@ -425,6 +1357,13 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
                 bodyFormat.lines[i].items[j].key = key;
                 bodyFormat.lines[i].items[j].type = type;
                 bodyFormat.lines[i].items[j].dim = dim;
+                bodyFormat.lines[i].items[j].kind = ITEM_SKIP;
+                bodyFormat.lines[i].items[j].array = NULL;
+                
+                /* position of the atom ID in the atom's tokens */
+                if (bodyFormat.atomIDToken == -1 && !strcmp("atomID", key))
+                    bodyFormat.atomIDToken = bodyFormat.numTokens;
+                bodyFormat.numTokens += dim;
 
                 /* check if we're supposed to ignore this value... */
                 if (strcmp("SKIP", key))
@@ -435,36 +1374,50 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
                         haveSpecieOrSymbol = 1;
 
                     if (!strcmp("i", type))
+                    {
                         typenum = NPY_INT32;
+                        bodyFormat.lines[i].items[j].kind = ITEM_INT;
+                    }
                     else if (!strcmp("d", type))
+                    {
                         typenum = NPY_FLOAT64;
+                        bodyFormat.lines[i].items[j].kind = ITEM_DOUBLE;
+                    }
                     else
                     {
                         char errstring[128];
 
                         sprintf(errstring, "Unrecognised type string (body prep): '%s'", type);
                         PyErr_SetString(PyExc_RuntimeError, errstring);
-                        fclose(INFILE);
+                        closeInput(&input);
                         Py_DECREF(resultDict);
                         freeBody(bodyFormat);
                         return NULL;
                     }
 
                     shape_dim = (dim == 1) ? 1 : 2;
-                    data = (PyArrayObject *) PyArray_SimpleNew(shape_dim, np_dims, typenum);
+                    data = newBodyArray(shape_dim, np_dims, typenum, allocator);
                     if (data == NULL)
                     {
                         char errstring[128];
 
-                        sprintf(errstring, "Could not allocate ndarray: '%s'", key);
-                        PyErr_SetString(PyExc_MemoryError, errstring);
-                        fclose(INFILE);
+                        if (!PyErr_Occurred())
+                        {
+                            sprintf(errstring, "Could not allocate ndarray: '%s'", key);
+                            PyErr_SetString(PyExc_MemoryError, errstring);
+                        }
+                        closeInput(&input);
                         Py_DECREF(resultDict);
                         freeBody(bodyFormat);
                         return NULL;
                     }
 
-                    /* store in dict */
+                    /* symbol is special (converted to specie index) */
+                    if (!strcmp("Symbol", key))
+                        bodyFormat.lines[i].items[j].kind = ITEM_SYMBOL;
+                    
+                    /* store in dict (which keeps the array alive) */
+                    bodyFormat.lines[i].items[j].array = data;
                     stat = PyDict_SetItemString(resultDict, key, PyArray_Return(data));
 
                     /* decrease ref count on data */
@@ -481,7 +1434,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
                         sprintf(errstring, "Could not set item in dictionary (body prep): '%s'", key);
                         PyErr_SetString(PyExc_RuntimeError, errstring);
                         // need to free arrays too...
-                        fclose(INFILE);
+                        closeInput(&input);
                         Py_DECREF(resultDict);
                         freeBody(bodyFormat);
                         return NULL;
@@ -498,21 +1451,24 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
         /* if no atomID array was specified we create one ourselves... */
         if (!atomIDFlag)
         {
-            int stat;
-            PyObject *atomID=NULL;
+            int stat, *atomIDData;
+            npy_intp np_dims[1] = {NAtoms};
+            PyArrayObject *atomID=NULL;
 
-            atomID = PyArray_Arange(1, NAtoms + 1, 1, NPY_INT32);
+            atomID = newBodyArray(1, np_dims, NPY_INT32, allocator);
             if (atomID == NULL)
             {
-                PyErr_SetString(PyExc_MemoryError, "Could not allocate atomID array");
-                fclose(INFILE);
+                if (!PyErr_Occurred()) PyErr_SetString(PyExc_MemoryError, "Could not allocate atomID array");
+                closeInput(&input);
                 Py_DECREF(resultDict);
                 freeBody(bodyFormat);
                 return NULL;
             }
+            atomIDData = (int *) PyArray_DATA(atomID);
+            for (i = 0; i < NAtoms; i++) atomIDData[i] = (int) (i + 1);
 
             /* store in dict */
-            stat = PyDict_SetItemString(resultDict, "atomID", atomID);
+            stat = PyDict_SetItemString(resultDict, "atomID", (PyObject *) atomID);
 
             /* give up our reference to array */
             Py_DECREF(atomID);
@@ -521,7 +1477,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
             {
                 PyErr_SetString(PyExc_RuntimeError, "Could not set atomID in dictionary");
                 // need to free arrays too...
-                fclose(INFILE);
+                closeInput(&input);
                 Py_DECREF(resultDict);
                 freeBody(bodyFormat);
                 return NULL;
@@ -533,522 +1489,54 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
         if (specieList == NULL)
         {
             PyErr_SetString(PyExc_RuntimeError, "Could not create specieList\n");
-            fclose(INFILE);
+            closeInput(&input);
             Py_DECREF(resultDict);
             freeBody(bodyFormat);
             return NULL;
         }
 
-        specieCount = PyList_New(0);
-        if (specieCount == NULL)
+        /* read the body */
+#ifdef DEBUG
+        printf("Reading body...\n");
+#endif
+
+        /* read the body (in parallel) */
+        if (readBody(&input, &bodyFormat, delimiter, atomIndexOffset, NAtoms, specieList, &specieCount,
+                updateProgressCallback, basename))
         {
-            PyErr_SetString(PyExc_RuntimeError, "Could not create specieCount\n");
-            fclose(INFILE);
+            closeInput(&input);
             Py_DECREF(resultDict);
             Py_DECREF(specieList);
+            free(specieCount);
             freeBody(bodyFormat);
             return NULL;
         }
         
-        /* read the body */
-#ifdef DEBUG
-        printf("Reading body...\n");
-#endif
-
-        /* loop over all atoms */
-        numLines = bodyFormat.numLines;
-        for (i = 0; i < NAtoms; i++)
+        /* specie count list */
+        specieCountList = PyList_New(PyList_Size(specieList));
+        if (specieCountList == NULL)
         {
-            long atomIndex = -1;
-            Py_ssize_t j;
-            char *atomLines[numLines];
-
-            /* read all of this atom's lines first... */
-            for (j = 0; j < numLines; j++)
-            {
-                atomLines[j] = malloc(MAX_LINE_LENGTH * sizeof(char));
-                if (atomLines[j] == NULL)
-                {
-                    long k;
-
-                    PyErr_SetString(PyExc_MemoryError, "Could not allocate atom line");
-                    Py_DECREF(resultDict);
-                    Py_DECREF(specieList);
-                    Py_DECREF(specieCount);
-                    fclose(INFILE);
-                    for (k = 0; k < j; k++) free(atomLines[k]);
-                    freeBody(bodyFormat);
-                    return NULL;
-                }
-
-                if (fgets(atomLines[j], MAX_LINE_LENGTH, INFILE) == NULL)
-                {
-                    long k;
-                    char errstring[128];
-
-                    sprintf(errstring, "End of file reached while reading body (atom %ld)", i);
-                    PyErr_SetString(PyExc_IOError, errstring);
-                    Py_DECREF(resultDict);
-                    Py_DECREF(specieList);
-                    Py_DECREF(specieCount);
-                    fclose(INFILE);
-                    for (k = 0; k < j; k++) free(atomLines[k]);
-                    freeBody(bodyFormat);
-                    return NULL;
-                }
-            }
-            
-            /* if atomID is in file, we should parse the line once and get the atom ID */
-            /* Check that the atomID is <= NAtoms (depending if starts from one)
-             * Make an input flag/option that says if atom ID starts from 1 or 0...
-             */
-            if (atomIDFlag)
-            {
-                int foundAtomID = 0;
-
-                j = 0;
-                while(!foundAtomID && j < numLines)
-                {
-                    char *pch;
-                    char line[MAX_LINE_LENGTH];
-                    Py_ssize_t numItems, count;
-
-                    /* number of items in the line */
-                    numItems = bodyFormat.lines[j].numItems;
-
-                    /* parse for atomID */
-                    /* make a copy of line as strtok might(?) modify the original */
-                    strcpy(line, atomLines[j]);
-                    pch = strtok(line, delimiter);
-                    count = 0;
-                    while (!foundAtomID && pch != NULL && count < numItems)
-                    {
-                        char *key;
-                        int dim, dimcount;
-
-                        /* unpack item */
-                        key = bodyFormat.lines[j].items[count].key;
-                        dim = bodyFormat.lines[j].items[count].dim;
-                        
-                        dimcount = 0;
-                        while (!foundAtomID && pch != NULL && dimcount < dim)
-                        {
-                            if (!strcmp("atomID", key))
-                            {
-                                char *endp;
-                                
-                                atomIndex = strtol(pch, &endp, 10);
-                                if (pch == endp || *endp != '\0')
-                                {
-                                    char errstring[128];
-                                    long k;
-
-                                    for (k = 0; k < numLines; k++) free(atomLines[k]);
-                                    sprintf(errstring, "Could not convert atomID '%s' to integer (body line %ld:%ld)", pch, i, j);
-                                    PyErr_SetString(PyExc_TypeError, errstring);
-                                    Py_DECREF(resultDict);
-                                    fclose(INFILE);
-                                    Py_DECREF(specieList);
-                                    Py_DECREF(specieCount);
-                                    freeBody(bodyFormat);
-                                    return NULL;
-                                }
-                                
-                                foundAtomID = 1;
-                            }
-
-                            pch = strtok(NULL, delimiter);
-                            dimcount++;
-                        }
-
-                        if (!foundAtomID && dimcount != dim)
-                        {
-                            char errstring[128];
-                            long k;
-
-                            for (k = 0; k < numLines; k++) free(atomLines[k]);
-                            sprintf(errstring, "Error during body line read for atomID (%ld:%ld): dim %d != %d", i, j, dimcount, dim);
-                            PyErr_SetString(PyExc_IOError, errstring);
-                            Py_DECREF(resultDict);
-                            fclose(INFILE);
-                            Py_DECREF(specieList);
-                            Py_DECREF(specieCount);
-                            freeBody(bodyFormat);
-                            return NULL;
-                        }
-
-                        count++;
-                    }
-
-                    if (!foundAtomID && count != numItems)
-                    {
-                        char errstring[128];
-                        long k;
-
-                        for (k = 0; k < numLines; k++) free(atomLines[k]);
-                        sprintf(errstring, "Error during body line read for atomID (%ld:%ld): %ld != %ld", i, j, count, numItems);
-                        PyErr_SetString(PyExc_IOError, errstring);
-                        Py_DECREF(resultDict);
-                        fclose(INFILE);
-                        Py_DECREF(specieList);
-                        Py_DECREF(specieCount);
-                        freeBody(bodyFormat);
-                        return NULL;
-                    }
-                    
-                    j++;
-                }
-
-                /* check atomIndex in range */
-                if (foundAtomID)
-                    atomIndex -= (long) atomIndexOffset;
-                
-                if (!foundAtomID || (atomIndex < 0 || atomIndex >= NAtoms))
-                {
-                    char errstring[128];
-                    long k;
-
-                    if (foundAtomID) sprintf(errstring, "Atom index error: %ld out of range (atom %ld)", atomIndex, i);
-                    else sprintf(errstring, "Atom index not in line (atom %ld)", i);
-                    PyErr_SetString(PyExc_RuntimeError, errstring);
-                    for (k = 0; k < numLines; k++) free(atomLines[k]);
-                    fclose(INFILE);
-                    Py_DECREF(resultDict);
-                    Py_DECREF(specieList);
-                    Py_DECREF(specieCount);
-                    freeBody(bodyFormat);
-                    return NULL;
-                }
-            }
-            else atomIndex = i;
-
-            /* now read the data for real */
-            for (j = 0; j < numLines; j++)
-            {
-                char *line, *pch;
-                Py_ssize_t numItems, count;
-
-                /* number of items in the line */
-                numItems = bodyFormat.lines[j].numItems;
-
-                /* read line */
-                line = atomLines[j];
-
-                /* parse the line */
-                pch = strtok(line, delimiter);
-                count = 0;
-                while (pch != NULL && count < numItems)
-                {
-                    char *key, *type;
-                    int dim, dimcount;
-                    PyArrayObject *array=NULL;
-
-                    /* unpack item */
-                    key = bodyFormat.lines[j].items[count].key;
-                    type = bodyFormat.lines[j].items[count].type;
-                    dim = bodyFormat.lines[j].items[count].dim;
-
-                    /* get the array from the dictionary */
-                    array = (PyArrayObject *) PyDict_GetItemString(resultDict, key);
-
-                    /* read one or three values */
-                    dimcount = 0;
-                    while (pch != NULL && dimcount < dim)
-                    {
-                        if (strcmp("SKIP", key))
-                        {
-                            /* symbol is special... */
-                            if (!strcmp("Symbol", key))
-                            {
-                                int check, stat;
-                                long value;
-                                Py_ssize_t symlen, index;
-                                PyObject *symin=NULL;
-                                PyObject *valueObj=NULL;
-
-                                /* get the symbol */
-                                symin = Py_BuildValue("s", pch);
-                                symlen = PyString_Size(symin);
-                                if (symlen == 1)
-                                {
-                                    Py_XDECREF(symin);
-                                    symin = NULL;
-                                    symin = PyString_FromFormat("%s_", pch);
-                                }
-                                else if (symlen != 2)
-                                {
-                                    char errstring[128];
-                                    long k;
-
-                                    sprintf(errstring, "Cannot handle symbol of length %d: '%s'", (int) symlen, PyString_AsString(symin));
-                                    PyErr_SetString(PyExc_RuntimeError, errstring);
-                                    for (k = 0; k < numLines; k++) free(atomLines[k]);
-                                    fclose(INFILE);
-                                    Py_DECREF(resultDict);
-                                    Py_DECREF(specieList);
-                                    Py_DECREF(specieCount);
-                                    Py_XDECREF(symin);
-                                    freeBody(bodyFormat);
-                                    return NULL;
-                                }
-
-//                                printf("Symbol: '%s'\n", PyString_AsString(symin));
-
-                                /* check if it already exists in the list */
-                                check = PySequence_Contains(specieList, symin);
-
-                                /* error */
-                                if (check == -1)
-                                {
-                                    long k;
-
-                                    for (k = 0; k < numLines; k++) free(atomLines[k]);
-                                    PyErr_SetString(PyExc_RuntimeError, "Checking if symbol in specie list failed");
-                                    fclose(INFILE);
-                                    Py_DECREF(resultDict);
-                                    Py_DECREF(specieList);
-                                    Py_DECREF(specieCount);
-                                    Py_XDECREF(symin);
-                                    freeBody(bodyFormat);
-                                    return NULL;
-                                }
-                                /* symbol not in specie list */
-                                else if (check == 0)
-                                {
-                                    PyObject *init=NULL;
-
-#ifdef DEBUG
-                                    printf("Add new specie\n");
-#endif
-
-                                    /* add to list */
-                                    stat = PyList_Append(specieList, symin);
-                                    if (stat == -1)
-                                    {
-                                        long k;
-
-                                        for (k = 0; k < numLines; k++) free(atomLines[k]);
-                                        fclose(INFILE);
-                                        Py_DECREF(resultDict);
-                                        Py_DECREF(specieList);
-                                        Py_DECREF(specieCount);
-                                        Py_XDECREF(symin);
-                                        freeBody(bodyFormat);
-                                        return NULL;
-                                    }
-
-                                    init = PyLong_FromLong(0);
-                                    stat = PyList_Append(specieCount, init);
-                                    Py_XDECREF(init);
-                                    if (stat == -1)
-                                    {
-                                        long k;
-
-                                        for (k = 0; k < numLines; k++) free(atomLines[k]);
-                                        fclose(INFILE);
-                                        Py_DECREF(resultDict);
-                                        Py_DECREF(specieList);
-                                        Py_DECREF(specieCount);
-                                        Py_XDECREF(symin);
-                                        freeBody(bodyFormat);
-                                        return NULL;
-                                    }
-                                }
-
-                                /* increment specie counter */
-                                index = PySequence_Index(specieList, symin);
-                                Py_XDECREF(symin);
-                                if (index == -1)
-                                {
-                                    long k;
-
-                                    for (k = 0; k < numLines; k++) free(atomLines[k]);
-                                    PyErr_SetString(PyExc_RuntimeError, "Could not find symbol index in specieList");
-                                    fclose(INFILE);
-                                    Py_DECREF(resultDict);
-                                    Py_DECREF(specieList);
-                                    Py_DECREF(specieCount);
-                                    freeBody(bodyFormat);
-                                    return NULL;
-                                }
-
-                                valueObj = PyList_GetItem(specieCount, index);
-                                if (valueObj == NULL)
-                                {
-                                    long k;
-
-                                    for (k = 0; k < numLines; k++) free(atomLines[k]);
-                                    fclose(INFILE);
-                                    Py_DECREF(resultDict);
-                                    Py_DECREF(specieList);
-                                    Py_DECREF(specieCount);
-                                    freeBody(bodyFormat);
-                                    return NULL;
-                                }
-
-                                value = PyLong_AsLong(valueObj);
-                                value++;
-
-                                stat = PyList_SetItem(specieCount, index, PyLong_FromLong(value));
-                                if (stat == -1)
-                                {
-                                    long k;
-
-                                    for (k = 0; k < numLines; k++) free(atomLines[k]);
-                                    PyErr_SetString(PyExc_RuntimeError, "Could not set incremented specie count on list");
-                                    fclose(INFILE);
-                                    Py_DECREF(resultDict);
-                                    Py_DECREF(specieList);
-                                    Py_DECREF(specieCount);
-                                    freeBody(bodyFormat);
-                                    return NULL;
-                                }
-
-                                /* set specie value */
-                                IIND1(array, atomIndex) = (int) index;
-                            }
-                            else
-                            {
-                                if (!strcmp("i", type))
-                                {
-                                    char *endp;
-                                    int value;
-
-                                    /* convert to int */
-                                    value = (int) strtol(pch, &endp, 10);
-                                    if (pch == endp || *endp != '\0')
-                                    {
-                                        char errstring[256];
-                                        
-                                        sprintf(errstring, "Conversion to integer failed for '%s' (body line: %ld:%ld; key: '%s')", pch, i, j, key);
-                                        PyErr_SetString(PyExc_TypeError, errstring);
-                                        fclose(INFILE);
-                                        Py_DECREF(resultDict);
-                                        Py_DECREF(specieList);
-                                        Py_DECREF(specieCount);
-                                        freeBody(bodyFormat);
-                                        return NULL;
-                                    }
-                                    
-                                    if (dim == 1) IIND1(array, atomIndex) = value;
-                                    else IIND2(array, atomIndex, dimcount) = value;
-                                }
-                                else if (!strcmp("d", type))
-                                {
-                                    char *endp;
-                                    double value;
-
-                                    /* convert to double */
-                                    value = strtod(pch, &endp);
-                                    if (pch == endp || *endp != '\0')
-                                    {
-                                        char errstring[256];
-                                        
-                                        sprintf(errstring, "Conversion to double failed for '%s' (body line: %ld:%ld; key: '%s')", pch, i, j, key);
-                                        PyErr_SetString(PyExc_TypeError, errstring);
-                                        fclose(INFILE);
-                                        Py_DECREF(resultDict);
-                                        Py_DECREF(specieList);
-                                        Py_DECREF(specieCount);
-                                        freeBody(bodyFormat);
-                                        return NULL;
-                                    }
-                                    
-                                    if (dim == 1) DIND1(array, atomIndex) = value;
-                                    else DIND2(array, atomIndex, dimcount) = value;
-                                }
-                                else
-                                {
-                                    char errstring[128];
-                                    long k;
-
-                                    for (k = 0; k < numLines; k++) free(atomLines[k]);
-                                    sprintf(errstring, "Unrecognised type string (body): '%s'", type);
-                                    PyErr_SetString(PyExc_RuntimeError, errstring);
-                                    fclose(INFILE);
-                                    Py_DECREF(resultDict);
-                                    Py_DECREF(specieList);
-                                    Py_DECREF(specieCount);
-                                    freeBody(bodyFormat);
-                                    return NULL;
-                                }
-                            }
-                        }
-
-                        /* read next token */
-                        pch = strtok(NULL, delimiter);
-                        dimcount++;
-                    }
-
-                    if (dimcount != dim)
-                    {
-                        char errstring[128];
-                        long k;
-
-                        for (k = 0; k < numLines; k++) free(atomLines[k]);
-                        sprintf(errstring, "Error during body line read (%ld:%ld): dim %d != %d", i, j, dimcount, dim);
-                        PyErr_SetString(PyExc_IOError, errstring);
-                        Py_DECREF(resultDict);
-                        fclose(INFILE);
-                        Py_DECREF(specieList);
-                        Py_DECREF(specieCount);
-                        freeBody(bodyFormat);
-                        return NULL;
-                    }
-
-                    count++;
-                }
-
-                if (count != numItems)
-                {
-                    char errstring[128];
-                    long k;
-
-                    for (k = 0; k < numLines; k++) free(atomLines[k]);
-                    sprintf(errstring, "Error during body line read (%ld:%ld): %ld != %ld", i, j, count, numItems);
-                    PyErr_SetString(PyExc_IOError, errstring);
-                    Py_DECREF(resultDict);
-                    fclose(INFILE);
-                    Py_DECREF(specieList);
-                    Py_DECREF(specieCount);
-                    freeBody(bodyFormat);
-                    return NULL;
-                }
-            }
-            
-            /* free lines */
-            for (j = 0; j < numLines; j++) free(atomLines[j]);
-            
-            /* progress callback */
-            if (updateProgressCallback != NULL && (i % callbackInterval == 0 || i == NAtoms - 1))
-            {
-                char message[512];
-                PyObject *arglist;
-                PyObject *cbres;
-                
-                /* callback */
-#ifdef DEBUG
-                printf("Progress callback at: %ld atoms\n", i + 1);
-#endif
-                sprintf(message, "Reading: '%s'", basename);
-                arglist = Py_BuildValue("(iis)", (int) i, (int) NAtoms, message);
-                cbres = PyObject_CallObject(updateProgressCallback, arglist);
-                Py_DECREF(arglist);
-                if (cbres == NULL) return NULL;
-                Py_DECREF(cbres);
-            }
+            closeInput(&input);
+            Py_DECREF(resultDict);
+            Py_DECREF(specieList);
+            free(specieCount);
+            freeBody(bodyFormat);
+            return NULL;
         }
+        for (i = 0; i < PyList_Size(specieList); i++)
+            PyList_SET_ITEM(specieCountList, i, PyLong_FromLong(specieCount[i]));
+        free(specieCount);
 
         /* store specieList/Count */
         PyDict_SetItemString(resultDict, "specieList", specieList);
         Py_DECREF(specieList);
-        PyDict_SetItemString(resultDict, "specieCount", specieCount);
-        Py_DECREF(specieCount);
+        PyDict_SetItemString(resultDict, "specieCount", specieCountList);
+        Py_DECREF(specieCountList);
 
         freeBody(bodyFormat);
     }
 
-    fclose(INFILE);
+    closeInput(&input);
 
 #ifdef DEBUG
     printf("GENREADER: finished\n");
@@ -1126,3 +1614,124 @@ getMinMaxPos(PyObject *self, PyObject *args)
     
     return tuple;
 }
+
+/*******************************************************************************
+ * Read a file of per atom data (one line per atom, with numColumns values on
+ * each line, any more are ignored) into a float64 array of length NAtoms (or
+ * shape (NAtoms, numColumns) if numColumns > 1). Blank lines are skipped.
+ *******************************************************************************/
+static PyObject*
+readDataFile(PyObject *self, PyObject *args)
+{
+    int numColumns;
+    long NAtoms, count;
+    char *filename=NULL, *lineBuffer=NULL;
+    char errstring[ERROR_LENGTH];
+    size_t lineSize = 0;
+    npy_intp dims[2];
+    struct Input input = {NULL, NULL};
+    PyObject *fileObj=NULL;
+    PyArrayObject *data=NULL;
+    double *values;
+
+    /* force locale to use dots for decimal separator */
+    setlocale(LC_NUMERIC, "C");
+
+    /* parse and check arguments from Python */
+    if (!PyArg_ParseTuple(args, "Oil", &fileObj, &numColumns, &NAtoms))
+        return NULL;
+
+    if (numColumns < 1 || NAtoms < 0)
+    {
+        PyErr_SetString(PyExc_ValueError, "Invalid number of columns/atoms");
+        return NULL;
+    }
+
+    /* the file can be a file name or a file-like object (eg. a decompression stream) */
+    if (PyObject_HasAttrString(fileObj, "read")) input.stream = fileObj;
+    else if (!PyArg_Parse(fileObj, "s", &filename)) return NULL;
+
+    /* allocate the result */
+    dims[0] = (npy_intp) NAtoms;
+    dims[1] = (npy_intp) numColumns;
+    data = (PyArrayObject *) PyArray_SimpleNew((numColumns > 1) ? 2 : 1, dims, NPY_FLOAT64);
+    if (data == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate data array");
+        return NULL;
+    }
+    values = (double *) PyArray_DATA(data);
+
+    /* open the file for reading */
+    if (input.stream == NULL)
+    {
+        input.INFILE = fopen(filename, "r");
+        if (input.INFILE == NULL)
+        {
+            snprintf(errstring, ERROR_LENGTH, "%s: '%s'", strerror(errno), filename);
+            PyErr_SetString(PyExc_IOError, errstring);
+            Py_DECREF(data);
+            return NULL;
+        }
+    }
+
+    /* read the values, one line per atom */
+    count = 0;
+    errstring[0] = '\0';
+    while (readLine(&input, &lineBuffer, &lineSize) != NULL)
+    {
+        int j;
+        char *saveptr = lineBuffer, *token;
+
+        /* skip blank lines */
+        if (lineBuffer[strspn(lineBuffer, " \t\r\n")] == '\0') continue;
+
+        if (count == NAtoms)
+        {
+            snprintf(errstring, ERROR_LENGTH, "The data is the wrong length (more than %ld lines)", NAtoms);
+            break;
+        }
+
+        for (j = 0; j < numColumns; j++)
+        {
+            char *endptr;
+
+            token = nextToken(&saveptr, " \t\r\n");
+            if (token == NULL)
+            {
+                snprintf(errstring, ERROR_LENGTH, "Expected %d values on line %ld", numColumns, count + 1);
+                break;
+            }
+
+            values[count * numColumns + j] = parseDouble(token, &endptr);
+            if (*endptr != '\0')
+            {
+                snprintf(errstring, ERROR_LENGTH, "Could not convert '%.64s' to a number (line %ld)", token, count + 1);
+                break;
+            }
+        }
+        if (errstring[0] != '\0') break;
+
+        count++;
+    }
+
+    free(lineBuffer);
+    closeInput(&input);
+
+    /* errors (reading from a stream sets the Python error) */
+    if (PyErr_Occurred())
+    {
+        Py_DECREF(data);
+        return NULL;
+    }
+    if (errstring[0] == '\0' && count != NAtoms)
+        snprintf(errstring, ERROR_LENGTH, "The data is the wrong length (%ld lines, expected %ld)", count, NAtoms);
+    if (errstring[0] != '\0')
+    {
+        PyErr_SetString(PyExc_ValueError, errstring);
+        Py_DECREF(data);
+        return NULL;
+    }
+
+    return PyArray_Return(data);
+}
@@ -18,6 +18,10 @@ from . import _latticeReaderGeneric
 from .atoms import elements
 from ..visutils import utilities
 from .lattice import Lattice
+from .lattice import memoryMappedArray
+from . import snapshot
+from . import trajectory
+from . import compression
 import six
 from six.moves import range
 
@@ -249,6 +253,33 @@ class FileFormat(object):
         """
         self.atomIndexOffset = offset
     
+    def projectBody(self, keys, required=("atomID", "Symbol", "Position", "Charge")):
+        """
+        Return a copy of the body in which only the given keys (and the required ones) are
+        read; the other items are changed to SKIP so they are tokenized past without being
+        converted or stored.
+        
+        """
+        keep = set(keys)
+        keep.update(required)
+        
+        body = []
+        for bodyLine in self.body:
+            body.append([item if item[0] in keep else ("SKIP", item[1], item[2]) for item in bodyLine])
+        
+        return body
+    
+    def skippedBodyItems(self, keys, required=("atomID", "Symbol", "Position", "Charge")):
+        """
+        Return the body items (key, typecode, dim) that are not read when projecting the body onto keys.
+        
+        """
+        keep = set(keys)
+        keep.update(required)
+        keep.add("SKIP")
+        
+        return [item for bodyLine in self.body for item in bodyLine if item[0] not in keep]
+    
     def setLinkedName(self, name):
         """
         Set name of format this format is linked to
@@ -445,12 +476,129 @@ class FileFormat(object):
         return identifier
 
 
+# file formats used for binary snapshots and trajectories, which do not need a format definition
+snapshotFileFormat = FileFormat("Atoman snapshot")
+trajectoryFileFormat = FileFormat("Atoman trajectory")
+
+
+class MemoryMapAllocator(object):
+    """
+    Allocates the per-atom arrays of the C reader in memory-mapped files in the given
+    directory if the file has at least `threshold` atoms (otherwise in RAM), so files
+    that are larger than RAM can be read.
+    
+    """
+    def __init__(self, directory, threshold):
+        self.directory = directory
+        self.threshold = threshold
+        
+        # set if any arrays were memory-mapped
+        self.used = False
+    
+    def __call__(self, shape, dtype):
+        if self.threshold > 0 and shape[0] >= self.threshold:
+            self.used = True
+            return memoryMappedArray(self.directory, shape, dtype)
+        
+        return np.empty(shape, dtype)
+
+
+def _readGenericLatticeFile(filename, fileFormat, body, linkedNAtoms, updateProgress=None, allocator=None):
+    """
+    Read the file with the C reader, returning the result dict.
+    
+    Compressed files are passed as a stream that is decompressed (in a background thread)
+    while the previous block is being parsed. The per-atom arrays are allocated by the
+    allocator, if one is given (see MemoryMapAllocator).
+    
+    """
+    if compression.isCompressed(filename):
+        fileObj = compression.ReadAheadStream(compression.openFile(filename))
+    else:
+        fileObj = filename
+    
+    try:
+        args = [fileObj, fileFormat.header, body, fileFormat.getDelimiter(), fileFormat.atomIndexOffset, linkedNAtoms]
+        if updateProgress is not None or allocator is not None:
+            args.extend([updateProgress, os.path.basename(filename), allocator])
+        
+        resultDict = _latticeReaderGeneric.readGenericLatticeFile(*args)
+    
+    finally:
+        if fileObj is not filename:
+            fileObj.close()
+    
+    return resultDict
+
+
+def readDataFile(filename, NAtoms, numColumns=1):
+    """
+    Read a file of per atom scalar (numColumns=1) or vector (numColumns=3) data, returning
+    a float64 array of length NAtoms (or shape (NAtoms, numColumns)).
+    
+    Text files have one line per atom and may be compressed; NumPy binary files (.npy)
+    are also accepted. Raises IOError if the file cannot be read and ValueError if the
+    data is the wrong length or cannot be converted.
+    
+    """
+    if compression.isCompressed(filename):
+        isBinary = os.path.splitext(os.path.splitext(filename)[0])[1] == ".npy"
+    else:
+        isBinary = os.path.splitext(filename)[1] == ".npy"
+    
+    if isBinary:
+        with compression.openFile(filename) as fh:
+            data = np.load(fh)
+        
+        shape = (NAtoms,) if numColumns == 1 else (NAtoms, numColumns)
+        if data.shape != shape:
+            raise ValueError("The data is the wrong shape (%r, expected %r)" % (data.shape, shape))
+        
+        return np.ascontiguousarray(data, dtype=np.float64)
+    
+    if compression.isCompressed(filename):
+        with compression.openFile(filename) as fileObj:
+            return _latticeReaderGeneric.readDataFile(fileObj, numColumns, NAtoms)
+    
+    return _latticeReaderGeneric.readDataFile(filename, numColumns, NAtoms)
+
+
+class DeferredColumnReader(object):
+    """
+    Read body columns that were skipped when a file was read.
+    
+    """
+    def __init__(self, filename, fileFormat, NAtoms):
+        self.filename = os.path.abspath(filename)
+        self.fileFormat = fileFormat
+        self.NAtoms = NAtoms
+        
+        # used to check the file has not changed
+        stat = os.stat(self.filename)
+        self.fileKey = (stat.st_size, stat.st_mtime)
+    
+    def read(self, key):
+        """
+        Read the given column from the file (returned as float64).
+        
+        """
+        stat = os.stat(self.filename)
+        if (stat.st_size, stat.st_mtime) != self.fileKey:
+            raise IOError("File has changed since it was read: '%s'" % self.filename)
+        
+        # only the atom IDs are needed to put the values in the right place
+        body = self.fileFormat.projectBody([key], required=("atomID",))
+        resultDict = _readGenericLatticeFile(self.filename, self.fileFormat, body, self.NAtoms)
+        
+        return np.asarray(resultDict[key], dtype=np.float64)
+
+
 class LatticeReaderGeneric(object):
     """
     Generic format Lattice reader
     
     """
-    def __init__(self, tmpLocation=None, updateProgress=None, hideProgress=None):
+    def __init__(self, tmpLocation=None, updateProgress=None, hideProgress=None, cache=None, reorder=None):
         self.logger = logging.getLogger(__name__ + ".LatticeReaderGeneric")
         
         # create tmp dir if one isn't passed
@@ -465,6 +613,15 @@ class LatticeReaderGeneric(object):
         self.updateProgress = updateProgress
         self.hideProgress = hideProgress
         self.intRegex = re.compile(r'[0-9]+')
+        
+        # open trajectories (the frame index is only read once)
+        self._trajectories = {}
+        
+        # cache of parsed files (ParseCache), if any
+        self.cache = cache
+        
+        # space-filling curve to reorder the atoms along after reading ("morton" or "hilbert"), if any
+        self.reorder = reorder
     
     def __del__(self):
         # remove the temporary directory if we created it
@@ -476,37 +633,31 @@ class LatticeReaderGeneric(object):
     
     def unzipFile(self, filename):
         """
-        Unzip command
+        Decompress the file into the tmp directory, returning the path to the decompressed file.
+        
+        Not used for reading (compressed files are decompressed while they are read).
         
         """
         bn = os.path.basename(filename)
         root, ext = os.path.splitext(bn)
         filepath = os.path.join(self.tmpLocation, root)
-        if ext == ".bz2":
-            command = 'bzcat -k "%s" > "%s"' % (filename, filepath)
-        
-        elif ext == ".gz":
-            command = 'gzip -dc "%s" > "%s"' % (filename, filepath)
-        
-        else:
-            raise RuntimeError("File '%s' is not a zip file", filename)
+        if not compression.isCompressed(filename):
+            raise RuntimeError("File '%s' is not a zip file" % filename)
         
-        self.logger.debug("Running: '%s'", command)
+        self.logger.debug("Decompressing '%s' to '%s'", filename, filepath)
         
         # progress bar
         if self.updateProgress is not None:
             self.updateProgress(0, 0, "Unzipping: '%s'" % bn)
         
-        # run command
-        status = os.system(command)
-        
-        # hide progress bar
-        if self.hideProgress is not None:
-            self.hideProgress()
+        try:
+            with compression.openFile(filename) as src, open(filepath, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1048576)
         
-        # handle error
-        if status or not os.path.exists(filepath):
-            raise RuntimeError("Unzip command failed: '%s'" % command)
+        finally:
+            # hide progress bar
+            if self.hideProgress is not None:
+                self.hideProgress()
         
         return filepath
     
@@ -515,32 +666,14 @@ class LatticeReaderGeneric(object):
         Check if file exists (unzip if required)
         
         """
-        zip_exts = ('.bz2', '.gz')
-        ext = os.path.splitext(filename)[1]
-        filepath = None
-        zipFlag = False
-        if os.path.exists(filename) and ext in zip_exts:
-            # unzip
-            zipFlag = True
-            filepath = self.unzipFile(filename)
-        
-        elif os.path.exists(filename):
-            filepath = filename
-        
-        else:
-            if os.path.exists(filename + '.bz2'):
-                filename = filename + '.bz2'
-                zipFlag = True
-                filepath = self.unzipFile(filename)
-            
-            elif os.path.exists(filename + '.gz'):
-                filename = filename + '.gz'
-                zipFlag = True
-                filepath = self.unzipFile(filename)
-        
+        filepath = compression.locateFile(filename)
         if filepath is None:
             raise IOError("Could not locate file: '%s'" % filename)
         
+        zipFlag = compression.isCompressed(filepath)
+        if zipFlag:
+            filepath = self.unzipFile(filepath)
+        
         return filepath, zipFlag
     
     def cleanUnzipped(self, filepath, zipFlag):
@@ -551,60 +684,154 @@ class LatticeReaderGeneric(object):
         if zipFlag:
             os.unlink(filepath)
     
-    def readFile(self, filename, fileFormat, rouletteIndex=None, linkedLattice=None):
+    def getTrajectory(self, filename):
+        """
+        Return a TrajectoryReader for the given file, reusing an open one if the file has not changed.
+        
+        """
+        abspath = os.path.abspath(filename)
+        stat = os.stat(abspath)
+        key = (stat.st_size, stat.st_mtime)
+        
+        if abspath in self._trajectories:
+            reader, readerKey = self._trajectories[abspath]
+            if readerKey == key:
+                return reader
+            reader.close()
+        
+        reader = trajectory.TrajectoryReader(abspath)
+        self._trajectories[abspath] = (reader, key)
+        
+        return reader
+    
+    def readFile(self, filename, fileFormat, rouletteIndex=None, linkedLattice=None, frameIndex=None, columns=None,
+                 memoryMapDir=None, memoryMapThreshold=0):
         """
         Read file.
         
+        Binary snapshots and trajectories are detected automatically and loaded without
+        parsing (the file format is ignored for them). For trajectories frameIndex selects
+        the frame to read (the first frame by default).
+        
+        If columns is given only those body keys (plus atomID, Symbol, Position and Charge)
+        are stored; the other columns are skipped while parsing and are read from the file
+        when first requested (see Lattice.loadDeferredColumn).
+        
+        If the reader has a space-filling curve (reorder) the atoms are reordered along it
+        (see Lattice.reorderAlongCurve).
+        
+        If memoryMapDir is given, files with at least memoryMapThreshold atoms are stored in
+        memory-mapped files in that directory (see Lattice.memoryMap); text files are parsed
+        directly into them, so they never have to fit in RAM.
+        
         """
         self.logger.info("Reading file: '%s'", filename)
         
-        # check if zipped
-        filepath, zipFlag = self.checkForZipped(filename)
+        # binary snapshots are memory-mapped directly
+        if snapshot.isSnapshot(filename):
+            self.logger.debug("Reading binary snapshot")
+            status, state = 0, snapshot.readSnapshot(filename)
         
-        try:
-            status, state = self.readFileMain(filepath, fileFormat, rouletteIndex, linkedLattice)
+        # trajectories
+        elif trajectory.isTrajectory(filename):
+            if frameIndex is None:
+                frameIndex = 0
+            self.logger.debug("Reading trajectory frame: %d", frameIndex)
+            status, state = 0, self.getTrajectory(filename).readFrame(frameIndex)
         
-        finally:
-            self.cleanUnzipped(filepath, zipFlag)
+        else:
+            # locate the file (compressed files are decompressed while they are read)
+            filepath = compression.locateFile(filename)
+            if filepath is None:
+                raise IOError("Could not locate file: '%s'" % filename)
+            
+            allocator = None
+            if memoryMapDir is not None and memoryMapThreshold > 0:
+                allocator = MemoryMapAllocator(memoryMapDir, memoryMapThreshold)
+            
+            status, state = self.readFileMain(filepath, fileFormat, rouletteIndex, linkedLattice, columns=columns,
+                                              allocator=allocator)
         
         if status:
             self.logger.error("Generic Lattice reader failed with error code: %d", status)
         
+        # move large systems out of RAM (arrays the reader memory-mapped are not copied, but
+        # the arrays made by reordering below are mapped too)
+        elif memoryMapDir is not None and memoryMapThreshold > 0 and state.NAtoms >= memoryMapThreshold:
+            state.memoryMap(memoryMapDir)
+        
+        # order the atoms along a space-filling curve (the order of the file is kept on the Lattice)
+        if not status and self.reorder is not None:
+            state.reorderAlongCurve(self.reorder)
+        
         return status, state
     
-    def readFileMain(self, filename, fileFormat, rouletteIndex, linkedLattice):
+    def parseFile(self, filename, fileFormat, body, linkedNAtoms, allocator=None):
         """
-        Main read
+        Parse the file with the C reader, returning the result dict.
         
-        """
-        # if linked then must have same NAtoms!
-        linkedNAtoms = -1
-        if linkedLattice is not None:
-            linkedNAtoms = linkedLattice.NAtoms
+        If there is a cache the result is loaded from it, if the file has been parsed
+        (with the same format) before, otherwise it is stored in it. The per-atom arrays
+        are allocated by the allocator, if one is given.
         
-        # delimiter
-        delim = fileFormat.getDelimiter()
+        """
+        cacheKey = None
+        if self.cache is not None and self.cache.enabled:
+            cacheKey = self.cache.key(filename, fileFormat, body=body)
+            resultDict = self.cache.get(cacheKey)
+            if resultDict is not None:
+                self.logger.debug("Loaded parsed file from cache")
+                if linkedNAtoms != -1 and resultDict["NAtoms"] != linkedNAtoms:
+                    raise ValueError("Number of atoms does not match linked lattice (%d != %d)" %
+                                     (resultDict["NAtoms"], linkedNAtoms))
+                
+                return resultDict
         
         # call C lib
         if self.updateProgress is None:
-            resultDict = _latticeReaderGeneric.readGenericLatticeFile(filename, fileFormat.header, fileFormat.body,
-                                                                      delim, fileFormat.atomIndexOffset, linkedNAtoms)
+            resultDict = _readGenericLatticeFile(filename, fileFormat, body, linkedNAtoms, allocator=allocator)
         
         else:
             try:
-                bn = os.path.basename(filename)
-                resultDict = _latticeReaderGeneric.readGenericLatticeFile(filename, fileFormat.header, fileFormat.body,
-                                                                          delim, fileFormat.atomIndexOffset,
-                                                                          linkedNAtoms, self.updateProgress, bn)
+                resultDict = _readGenericLatticeFile(filename, fileFormat, body, linkedNAtoms, self.updateProgress,
+                                                     allocator=allocator)
             
             finally:
                 self.hideProgress()
         
+        if cacheKey is not None:
+            self.cache.put(cacheKey, resultDict)
+        
+        return resultDict
+    
+    def readFileMain(self, filename, fileFormat, rouletteIndex, linkedLattice, columns=None, allocator=None):
+        """
+        Main read
+        
+        """
+        # if linked then must have same NAtoms!
+        linkedNAtoms = -1
+        if linkedLattice is not None:
+            linkedNAtoms = linkedLattice.NAtoms
+        
+        # body (only the requested columns are stored)
+        if columns is None:
+            body = fileFormat.body
+        else:
+            body = fileFormat.projectBody(columns)
+        
+        # parse the file (or load the result from the cache)
+        resultDict = self.parseFile(filename, fileFormat, body, linkedNAtoms, allocator=allocator)
+        
         self.logger.debug("Keys: %r", list(resultDict.keys()))
         
         # create Lattice object
         lattice = Lattice()
         
+        # the reader stored the arrays in memory-mapped files, so the other arrays must be too
+        if allocator is not None and allocator.used:
+            lattice.memoryMapDir = allocator.directory
+        
         # number of atoms
         lattice.NAtoms = resultDict.pop("NAtoms")
         
@@ -620,7 +847,8 @@ class LatticeReaderGeneric(object):
             lattice.charge = resultDict.pop("Charge")
             needCharge = False
         elif linkedLattice is None:
-            lattice.charge = np.zeros(lattice.NAtoms, np.float64)
+            lattice.charge = lattice._newColumn((lattice.NAtoms,), np.float64)
+            lattice.charge[:] = 0
         
         # loop back over pos to get min/max pos
         minPos, maxPos = _latticeReaderGeneric.getMinMaxPos(lattice.pos)
@@ -667,15 +895,18 @@ class LatticeReaderGeneric(object):
         
         # get data from linked lattice
         if linkedLattice is not None:
+            # (the atoms of this lattice are in the order of the file)
             if needSpecie:
                 self.logger.debug("Copying specie from linked Lattice")
-                lattice.specie = copy.deepcopy(linkedLattice.specie)
+                lattice.specie = lattice._copyColumn(
+                    linkedLattice.toFileOrder(linkedLattice.specie[:linkedLattice.NAtoms]))
                 lattice.specieCount = copy.deepcopy(linkedLattice.specieCount)
                 lattice.specieList = copy.deepcopy(linkedLattice.specieList)
             
             if needCharge:
                 self.logger.debug("Copying charge from linked Lattice")
-                lattice.charge = copy.deepcopy(linkedLattice.charge)
+                lattice.charge = lattice._copyColumn(
+                    linkedLattice.toFileOrder(linkedLattice.charge[:linkedLattice.NAtoms]))
             
             if needCellDims:
                 self.logger.debug("Copying cellDims from linked lattice")
@@ -711,7 +942,7 @@ class LatticeReaderGeneric(object):
                 self.logger.debug("Saving '%s' scalar data to Lattice", key)
                 # for now we require all scalar data to be stored as float (will change this if I have time)
                 if data.dtype != np.float64:
-                    lattice.scalarsDict[key] = data.astype(np.float64)
+                    lattice.scalarsDict[key] = lattice._copyColumn(data, dtype=np.float64)
                 else:
                     lattice.scalarsDict[key] = data
             
@@ -720,13 +951,22 @@ class LatticeReaderGeneric(object):
                 self.logger.debug("Saving '%s' vector data to Lattice", key)
                 # for now we require all vector data to be stored as float (will change this if I have time)
                 if data.dtype != np.float64:
-                    lattice.vectorsDict[key] = data.astype(np.float64)
+                    lattice.vectorsDict[key] = lattice._copyColumn(data, dtype=np.float64)
                 else:
                     lattice.vectorsDict[key] = data
             
             else:
                 raise RuntimeError("Unrecognised shape data extracted from lattice: %s (%r)" % (key, data.shape))
         
+        # columns that were skipped are read from the file when first requested
+        if columns is not None:
+            skipped = fileFormat.skippedBodyItems(columns)
+            if len(skipped):
+                columnReader = DeferredColumnReader(filename, fileFormat, lattice.NAtoms)
+                for key, typecode, dim in skipped:
+                    self.logger.debug("Deferring '%s' column", key)
+                    lattice.deferredColumns[key] = ("scalar" if dim == 1 else "vector", columnReader)
+        
         # This section is specific to LKMC...
         
         # guess roulette
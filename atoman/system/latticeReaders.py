@@ -272,10 +272,11 @@ class LbomdXYZReader(GenericLatticeReader):
         ke = np.empty(NAtoms, np.float64)
         pe = np.empty(NAtoms, np.float64)
         
-        # call clib
+        # call clib (the atoms of the file are in the order of the reference file)
         status = input_c.readLBOMDXYZ(filename, state.atomID, state.pos, state.charge, ke, pe, velocityArray,
-                                      state.maxPos, state.minPos, xyzformat, state.specie, refLattice.specie,
-                                      refLattice.charge)
+                                      state.maxPos, state.minPos, xyzformat, state.specie,
+                                      refLattice.toFileOrder(refLattice.specie),
+                                      refLattice.toFileOrder(refLattice.charge))
         
         if status:
             return status, None
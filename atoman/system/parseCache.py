@@ -0,0 +1,307 @@
+"""
+On-disk cache of parsed files.
+
+The result of parsing a file with the generic reader (the header values, species and
+per-atom arrays) is stored in the cache directory, keyed by the absolute path, size and
+modification time of the file and a hash of the file format definition. Reading a file
+that is in the cache does not parse any text: the per-atom arrays are memory-mapped
+(copy-on-write) from the cache file.
+
+Each cache file has the same layout as a snapshot (preamble, JSON header and aligned
+arrays). The total size of the cache is capped; the least recently used files are
+removed first.
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import json
+import struct
+import hashlib
+import logging
+import tempfile
+
+import numpy as np
+
+from . import snapshot
+from ..visutils import utilities
+import six
+
+
+# magic string at the start of a cache file
+MAGIC = b"ATOMANPC"
+
+# current version of the format (changing this invalidates existing cache files)
+VERSION = 1
+
+# preamble: magic, version, header length
+_PREAMBLE = struct.Struct("<8sIQ")
+
+# extension of cache files
+_EXTENSION = ".cache"
+
+
+def formatHash(fileFormat, body=None):
+    """
+    Return a hash of the file format definition (the body can be overridden, eg. if it was projected).
+    
+    """
+    if body is None:
+        body = fileFormat.body
+    
+    definition = [fileFormat.header, body, fileFormat.delimiter, fileFormat.atomIndexOffset]
+    
+    return hashlib.sha1(json.dumps(definition, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ParseCache(object):
+    """
+    Cache of parsed files, with a size cap and LRU eviction.
+    
+    A maxSize of zero (the default) disables the cache.
+    
+    """
+    def __init__(self, directory=None, maxSize=0):
+        self.logger = logging.getLogger(__name__ + ".ParseCache")
+        
+        if directory is None:
+            directory = utilities.dataPath("parse_cache")
+        self.directory = directory
+        self.maxSize = maxSize
+        
+        # statistics
+        self.hits = 0
+        self.misses = 0
+    
+    @property
+    def enabled(self):
+        """
+        True if the cache is enabled.
+        
+        """
+        return self.maxSize > 0
+    
+    def setMaxSize(self, maxSize):
+        """
+        Set the maximum size of the cache (in bytes), removing files if required.
+        
+        """
+        self.maxSize = maxSize
+        if self.enabled:
+            self.evict()
+    
+    def key(self, filename, fileFormat, body=None):
+        """
+        Return the cache key for the file (parsed with the given format).
+        
+        """
+        abspath = os.path.abspath(filename)
+        stat = os.stat(abspath)
+        identity = [abspath, stat.st_size, stat.st_mtime, formatHash(fileFormat, body=body)]
+        
+        return hashlib.sha1(json.dumps(identity).encode("utf-8")).hexdigest()
+    
+    def _path(self, key):
+        """
+        Path of the cache file for the key.
+        
+        """
+        return os.path.join(self.directory, key + _EXTENSION)
+    
+    def _cacheFiles(self):
+        """
+        Return a list of (last used time, size, path) of the files in the cache.
+        
+        """
+        files = []
+        if os.path.isdir(self.directory):
+            for fn in os.listdir(self.directory):
+                if fn.endswith(_EXTENSION):
+                    path = os.path.join(self.directory, fn)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+        
+        return files
+    
+    @property
+    def size(self):
+        """
+        The total size of the files in the cache (in bytes).
+        
+        """
+        return sum(size for _, size, _ in self._cacheFiles())
+    
+    def get(self, key):
+        """
+        Return the result dict stored for the key, or None if it is not in the cache.
+        
+        """
+        if not self.enabled:
+            return None
+        
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        
+        try:
+            resultDict = self._read(path)
+        
+        except Exception as error:
+            self.logger.warning("Removing unreadable cache file '%s': %s", path, error)
+            self._remove(path)
+            self.misses += 1
+            return None
+        
+        # mark as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        
+        self.hits += 1
+        self.logger.debug("Cache hit: %s", key)
+        
+        return resultDict
+    
+    def put(self, key, resultDict):
+        """
+        Store the result dict for the key, removing the least recently used files if the cache is too big.
+        
+        """
+        if not self.enabled:
+            return
+        
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, 0o755)
+        
+        # write to a temporary file first, so a partly written file is never read (the name
+        # is unique, as files may be cached from several threads and processes at once)
+        path = self._path(key)
+        fd, tmpPath = tempfile.mkstemp(prefix=key + ".", suffix=".tmp", dir=self.directory)
+        os.close(fd)
+        try:
+            self._write(tmpPath, resultDict)
+            if os.path.exists(path):
+                os.unlink(tmpPath)
+            else:
+                os.rename(tmpPath, path)
+        
+        except Exception as error:
+            self.logger.warning("Could not write cache file '%s': %s", path, error)
+            self._remove(tmpPath)
+            return
+        
+        self.logger.debug("Cached: %s", key)
+        
+        self.evict()
+    
+    def evict(self):
+        """
+        Remove the least recently used files until the cache is within its size cap.
+        
+        """
+        files = sorted(self._cacheFiles())
+        totalSize = sum(size for _, size, _ in files)
+        while files and totalSize > self.maxSize:
+            _, size, path = files.pop(0)
+            self.logger.debug("Evicting cache file: '%s'", path)
+            if self._remove(path):
+                totalSize -= size
+    
+    def clear(self):
+        """
+        Remove all files from the cache.
+        
+        """
+        for _, _, path in self._cacheFiles():
+            self._remove(path)
+    
+    def _remove(self, path):
+        """
+        Remove a file (files that are still mapped cannot be removed on some platforms).
+        
+        """
+        try:
+            os.unlink(path)
+        except OSError:
+            return False
+        
+        return True
+    
+    def _write(self, path, resultDict):
+        """
+        Write the result dict to a cache file.
+        
+        """
+        values = {}
+        arrays = []
+        for key, value in six.iteritems(resultDict):
+            if isinstance(value, np.ndarray):
+                arrays.append((key, value))
+            else:
+                jsonValue = snapshot._jsonValue(value)
+                if jsonValue is None:
+                    raise TypeError("Cannot cache value for '%s' (%r)" % (key, type(value)))
+                values[key] = jsonValue
+        
+        header = {"values": values, "arrays": []}
+        
+        # we need the header size to compute the offsets, so iterate until it is stable
+        headerBytes = b""
+        while True:
+            offset = snapshot._alignedOffset(_PREAMBLE.size + len(headerBytes))
+            header["arrays"] = []
+            for key, array in arrays:
+                header["arrays"].append({
+                    "key": key,
+                    "dtype": array.dtype.str,
+                    "shape": list(array.shape),
+                    "offset": offset,
+                })
+                offset = snapshot._alignedOffset(offset + array.nbytes)
+            
+            newHeaderBytes = json.dumps(header, sort_keys=True).encode("utf-8")
+            if len(newHeaderBytes) == len(headerBytes):
+                break
+            headerBytes = newHeaderBytes
+        
+        with open(path, "wb") as fh:
+            fh.write(_PREAMBLE.pack(MAGIC, VERSION, len(headerBytes)))
+            fh.write(headerBytes)
+            for (key, array), info in zip(arrays, header["arrays"]):
+                fh.write(b"\0" * (info["offset"] - fh.tell()))
+                np.ascontiguousarray(array).tofile(fh)
+    
+    def _read(self, path):
+        """
+        Read a cache file, returning the result dict.
+        
+        """
+        with open(path, "rb") as fh:
+            preamble = fh.read(_PREAMBLE.size)
+            if len(preamble) != _PREAMBLE.size:
+                raise IOError("File is too short")
+            magic, version, headerLength = _PREAMBLE.unpack(preamble)
+            if magic != MAGIC or version != VERSION:
+                raise IOError("Not a cache file (or an old version)")
+            header = json.loads(fh.read(headerLength).decode("utf-8"))
+        
+        resultDict = dict(header["values"])
+        if len(header["arrays"]):
+            data = np.memmap(path, dtype=np.uint8, mode="c")
+            for info in header["arrays"]:
+                dtype = np.dtype(str(info["dtype"]))
+                shape = tuple(info["shape"])
+                start = info["offset"]
+                length = int(np.prod(shape)) * dtype.itemsize
+                if start + length > len(data):
+                    raise IOError("File is truncated")
+                resultDict[info["key"]] = data[start:start + length].view(dtype).reshape(shape)
+        
+        return resultDict
@@ -0,0 +1,164 @@
+"""
+Reading frames ahead of time.
+
+The sequencer processes frames one at a time (read, filter, render, save). A
+`FramePrefetcher` reads the next frames in a background thread while the current
+one is being processed, so reading (and decompressing/copying) overlaps with the
+filtering and rendering. The C reader and the decompressors release the GIL while
+they work.
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import sys
+import logging
+import threading
+import collections
+
+import six
+
+
+class FramePrefetcher(object):
+    """
+    Iterate over frames, reading them ahead in a background thread.
+    
+    `loadFrame(frame)` is called (in order) for each item in `frames` and the iterator
+    yields `(frame, result)` pairs. At most `maxFrames` results are held in the queue
+    and no more frames are read while the queued results use more than `memoryBudget`
+    bytes (as reported by `sizeOf(result)`). Exceptions raised by `loadFrame` are
+    re-raised when the frame is reached.
+    
+    If maxFrames is zero frames are read when they are requested (no background thread).
+    `cleanup(result)` is called for results that are still queued when the prefetcher
+    is closed (eg. to delete local copies of files).
+    
+    """
+    def __init__(self, loadFrame, frames, maxFrames=2, memoryBudget=1073741824, sizeOf=None, cleanup=None):
+        self.logger = logging.getLogger(__name__ + ".FramePrefetcher")
+        self.loadFrame = loadFrame
+        self.frames = list(frames)
+        self.maxFrames = maxFrames
+        self.memoryBudget = memoryBudget
+        self.sizeOf = sizeOf
+        self.cleanup = cleanup
+        
+        self._condition = threading.Condition()
+        self._queue = collections.deque()
+        self._queuedBytes = 0
+        self._stop = False
+        self._done = False
+        self._nextIndex = 0
+        self._thread = None
+        
+        if self.maxFrames > 0:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+    
+    def __iter__(self):
+        return self
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _load(self, frame):
+        """
+        Load a frame, returning (frame, result, exc_info, size).
+        
+        """
+        try:
+            result = self.loadFrame(frame)
+        except Exception:
+            return frame, None, sys.exc_info(), 0
+        
+        size = 0 if self.sizeOf is None else self.sizeOf(result)
+        
+        return frame, result, None, size
+    
+    def _run(self):
+        """
+        Read the frames (runs in the background thread).
+        
+        """
+        for frame in self.frames:
+            # wait for space in the queue
+            with self._condition:
+                while not self._stop and (len(self._queue) >= self.maxFrames or
+                                          (len(self._queue) and self._queuedBytes >= self.memoryBudget)):
+                    self._condition.wait()
+                
+                if self._stop:
+                    break
+            
+            self.logger.debug("Prefetching frame: %r", frame)
+            item = self._load(frame)
+            
+            with self._condition:
+                self._queue.append(item)
+                self._queuedBytes += item[3]
+                self._condition.notify_all()
+            
+            # stop at the first error
+            if item[2] is not None:
+                break
+        
+        with self._condition:
+            self._done = True
+            self._condition.notify_all()
+    
+    def __next__(self):
+        """
+        Return the next (frame, result) pair.
+        
+        """
+        # no background thread
+        if self._thread is None:
+            if self._stop or self._nextIndex >= len(self.frames):
+                raise StopIteration
+            item = self._load(self.frames[self._nextIndex])
+            self._nextIndex += 1
+        
+        else:
+            with self._condition:
+                while not len(self._queue) and not self._done:
+                    self._condition.wait()
+                
+                if not len(self._queue):
+                    raise StopIteration
+                
+                item = self._queue.popleft()
+                self._queuedBytes -= item[3]
+                self._condition.notify_all()
+        
+        frame, result, excInfo, _ = item
+        if excInfo is not None:
+            six.reraise(*excInfo)
+        
+        return frame, result
+    
+    # Python 2
+    next = __next__
+    
+    def close(self):
+        """
+        Stop reading frames (waiting for the current one to finish) and clean up queued results.
+        
+        """
+        with self._condition:
+            self._stop = True
+            self._condition.notify_all()
+        
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        
+        while len(self._queue):
+            frame, result, excInfo, size = self._queue.popleft()
+            self._queuedBytes -= size
+            if excInfo is None and self.cleanup is not None:
+                self.cleanup(result)
@@ -0,0 +1,446 @@
+"""
+Transferring sequences of files over SFTP.
+
+A `SequenceTransfers` object lists the remote directory once and matches the files of a
+sequence locally (instead of checking each file, and its compressed versions, with a
+round trip to the server). Files are downloaded ahead of time, in order, by a small pool
+of threads, each with its own SFTP channel (opened on the existing SSH connection). The
+local copies are kept on disk up to a size limit; when that is reached the least recently
+used copies that have been released are deleted first.
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import re
+import stat
+import errno
+import logging
+import threading
+import collections
+
+import six
+
+from . import compression
+
+
+# (un)compressed extensions, in order of preference
+_EXTENSIONS = ("",) + compression.COMPRESSED_EXTENSIONS
+
+# regular expression for integers (eg. in file names)
+_INT_REGEX = re.compile(r'[0-9]+')
+
+# regular expression for the number in a sequence template (eg. %04d)
+_NUMBER_REGEX = re.compile(r'%(0?)([0-9]*)d')
+
+
+def sequenceRegex(template):
+    """
+    Return a regular expression matching the file names of a sequence (and compressed
+    versions of them), for a template like "lattice%04d.dat".
+    
+    The number is in the first group of the match and the extension in the second.
+    
+    """
+    match = _NUMBER_REGEX.search(template)
+    if match is None:
+        raise ValueError("No number in sequence template: '%s'" % template)
+    
+    prefix = re.escape(template[:match.start()])
+    suffix = re.escape(template[match.end():])
+    exts = "|".join(re.escape(ext) for ext in _EXTENSIONS if ext)
+    
+    return re.compile(r"^%s([0-9]+)%s(%s)?$" % (prefix, suffix, exts))
+
+
+class SequenceTransfers(object):
+    """
+    Download the files of a sequence from a remote directory.
+    
+    `openChannel()` must return a new SFTP client (eg. `ssh.open_sftp()`); one is opened
+    for listing and one for each of the `numChannels` download threads. At most
+    `lookAhead` files are downloaded ahead of the last one that was fetched, and no more
+    are downloaded while the local copies use more than `maxDiskBytes` (the files that
+    have been released are deleted first, least recently used first).
+    
+    """
+    def __init__(self, openChannel, remoteDir, localDir, numChannels=3, lookAhead=4, maxDiskBytes=1073741824):
+        self.logger = logging.getLogger(__name__ + ".SequenceTransfers")
+        self.openChannel = openChannel
+        self.remoteDir = remoteDir
+        self.localDir = localDir
+        self.numChannels = max(1, numChannels)
+        self.lookAhead = max(1, lookAhead)
+        self.maxDiskBytes = maxDiskBytes
+        
+        # listing channel and cache of directory listings (shared by the download threads)
+        self._channel = openChannel()
+        self._listings = {}
+        self._listingLock = threading.Lock()
+        
+        # remote file names by index (see matchSequence)
+        self._remoteNames = {}
+        
+        # state of each file, by index: None (pending), "downloading", "ready" or "failed"
+        self._condition = threading.Condition()
+        self._order = []
+        self._state = {}
+        self._local = {}
+        self._errors = {}
+        self._inUse = set()
+        self._wanted = set()
+        self._released = collections.OrderedDict()
+        self._diskUsed = 0
+        self._stop = False
+        self._threads = []
+        
+        # statistics
+        self.bytesDownloaded = 0
+        self.cacheHits = 0
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def listDirectory(self, path=None):
+        """
+        Return a dict of the entries in the remote directory (name -> attributes), listing it only once.
+        
+        This is called by the download threads too (when looking for Roulette files), so
+        the listing channel is only used by one thread at a time.
+        
+        """
+        if path is None:
+            path = self.remoteDir
+        
+        with self._listingLock:
+            if path not in self._listings:
+                self.logger.debug("Listing remote directory: '%s'", path)
+                try:
+                    entries = self._channel.listdir_attr(path)
+                except IOError as error:
+                    if error.errno != errno.ENOENT:
+                        raise
+                    entries = []
+                self._listings[path] = dict((entry.filename, entry) for entry in entries)
+            
+            return self._listings[path]
+    
+    def matchSequence(self, template):
+        """
+        Match the files of the sequence in the remote directory, returning a dict of
+        remote file names by index. Uncompressed files are preferred to compressed ones.
+        
+        """
+        regex = sequenceRegex(template)
+        matches = {}
+        extensions = {}
+        for name, attrs in six.iteritems(self.listDirectory()):
+            if attrs.st_mode is not None and not stat.S_ISREG(attrs.st_mode):
+                continue
+            
+            match = regex.match(name)
+            if match is None:
+                continue
+            
+            # the number must be formatted the same way as in the template
+            index = int(match.group(1))
+            if template % index + (match.group(2) or "") != name:
+                continue
+            
+            ext = match.group(2) or ""
+            if index in matches and _EXTENSIONS.index(ext) > _EXTENSIONS.index(extensions[index]):
+                continue
+            
+            matches[index] = name
+            extensions[index] = ext
+        
+        self.logger.debug("Matched %d files in the sequence '%s'", len(matches), template)
+        with self._condition:
+            self._remoteNames.update(matches)
+        
+        return matches
+    
+    def _findRoulette(self, name):
+        """
+        Return (remote path, local name) of the Roulette file for the given file, or (None, None).
+        
+        """
+        baseName = os.path.splitext(name)[0] if compression.isCompressed(name) else name
+        if not baseName.endswith(".dat"):
+            return None, None
+        
+        result = _INT_REGEX.findall(name)
+        if not len(result):
+            return None, None
+        rouletteIndex = int(result[0]) - 1
+        
+        # local name must be "Roulette%d.OUT" % rouletteIndex for it to be picked up
+        localName = "Roulette%d.OUT" % rouletteIndex
+        
+        if localName in self.listDirectory():
+            return self._remotePath(localName), localName
+        
+        stepDir = "Step%d" % rouletteIndex
+        if stepDir in self.listDirectory(self._remotePath("..")):
+            remotePath = self._remotePath(os.path.join("..", stepDir, "Roulette.OUT"))
+            if "Roulette.OUT" in self.listDirectory(self._remotePath(os.path.join("..", stepDir))):
+                return remotePath, localName
+        
+        return None, None
+    
+    def _remotePath(self, name):
+        """
+        Path of a file in the remote directory (remote paths always use forward slashes).
+        
+        """
+        return "/".join((self.remoteDir.rstrip("/"), name.replace(os.sep, "/")))
+    
+    def schedule(self, indexes):
+        """
+        Download the files with the given indexes (in order) in the background.
+        
+        """
+        with self._condition:
+            for index in indexes:
+                if index not in self._state:
+                    self._state[index] = None
+                    self._order.append(index)
+            self._condition.notify_all()
+        
+        # start the download threads
+        while len(self._threads) < self.numChannels:
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+    
+    def _ahead(self):
+        """
+        Number of files being downloaded or downloaded and not fetched yet.
+        
+        """
+        count = 0
+        for index in self._order:
+            state = self._state[index]
+            if state == "downloading" or (state == "ready" and index not in self._inUse and
+                                          self._local[index] not in self._released):
+                count += 1
+        
+        return count
+    
+    def _nextPending(self):
+        """
+        Return the next index to download, or None if there is nothing to do yet.
+        
+        """
+        # files that are being waited for are downloaded regardless of the limits
+        for index in self._order:
+            if index in self._wanted and self._state[index] is None:
+                return index
+        
+        if self._ahead() >= self.lookAhead:
+            return None
+        
+        self._evict()
+        if self._diskUsed >= self.maxDiskBytes:
+            return None
+        
+        for index in self._order:
+            if self._state[index] is None:
+                return index
+        
+        return None
+    
+    def _run(self):
+        """
+        Download files (runs in the download threads, each with its own channel).
+        
+        """
+        channel = None
+        try:
+            while True:
+                with self._condition:
+                    while not self._stop and self._nextPending() is None:
+                        self._condition.wait()
+                    
+                    if self._stop:
+                        break
+                    
+                    index = self._nextPending()
+                    self._state[index] = "downloading"
+                
+                try:
+                    if channel is None:
+                        channel = self.openChannel()
+                    localPaths, size = self._download(channel, index)
+                
+                except Exception as error:
+                    self.logger.error("Failed to download file %d: %s", index, error)
+                    with self._condition:
+                        self._state[index] = "failed"
+                        self._errors[index] = error
+                        self._condition.notify_all()
+                
+                else:
+                    with self._condition:
+                        self._state[index] = "ready"
+                        self._local[index] = localPaths
+                        self._diskUsed += size
+                        self.bytesDownloaded += size
+                        self._condition.notify_all()
+        
+        finally:
+            if channel is not None:
+                channel.close()
+    
+    def _download(self, channel, index):
+        """
+        Download the file (and its Roulette file), returning (local paths, size).
+        
+        """
+        with self._condition:
+            name = self._remoteNames.get(index)
+        if name is None:
+            raise IOError(errno.ENOENT, "File %d of the sequence does not exist on the server" % index)
+        
+        remotePath = self._remotePath(name)
+        localPath = os.path.join(self.localDir, name)
+        self.logger.debug("Downloading: '%s' to '%s'", remotePath, localPath)
+        
+        # download to a temporary name first, so a partly downloaded file is never read
+        tmpPath = localPath + ".part"
+        try:
+            channel.get(remotePath, tmpPath)
+            os.rename(tmpPath, localPath)
+        finally:
+            if os.path.exists(tmpPath):
+                os.unlink(tmpPath)
+        localPaths = [localPath]
+        
+        rouletteRemote, rouletteName = self._findRoulette(name)
+        if rouletteRemote is not None:
+            rouletteLocal = os.path.join(self.localDir, rouletteName)
+            self.logger.debug("Downloading: '%s' to '%s'", rouletteRemote, rouletteLocal)
+            channel.get(rouletteRemote, rouletteLocal)
+            localPaths.append(rouletteLocal)
+        
+        size = sum(os.path.getsize(path) for path in localPaths)
+        
+        return tuple(localPaths), size
+    
+    def fetch(self, index):
+        """
+        Return the local path of the file with the given index (downloading it if required).
+        
+        The local copy is kept until it is released.
+        
+        """
+        with self._condition:
+            if index in self._state and self._state[index] == "ready" and self._local[index] in self._released:
+                # still on disk from before
+                del self._released[self._local[index]]
+                self.cacheHits += 1
+            
+            elif index not in self._state or self._state[index] == "failed":
+                # download this one next
+                if index in self._order:
+                    self._order.remove(index)
+                self._order.insert(0, index)
+                self._state[index] = None
+                self._errors.pop(index, None)
+            
+            self._wanted.add(index)
+            self._condition.notify_all()
+        
+        if not len(self._threads):
+            self.schedule([])
+        
+        with self._condition:
+            while self._state[index] in (None, "downloading"):
+                self._condition.wait()
+            self._wanted.discard(index)
+            
+            if self._state[index] == "failed":
+                error = self._errors[index]
+                raise IOError("Could not download file %d of the sequence: %s" % (index, error))
+            
+            self._inUse.add(index)
+            self._condition.notify_all()
+            
+            return self._local[index][0]
+    
+    def release(self, index):
+        """
+        The local copy of the file is no longer needed (it is deleted when space is required).
+        
+        """
+        with self._condition:
+            if index not in self._inUse:
+                return
+            
+            self._inUse.discard(index)
+            self._released[self._local[index]] = index
+            self._evict()
+            self._condition.notify_all()
+    
+    def _evict(self):
+        """
+        Delete released local copies (least recently used first) until within the size limit.
+        
+        """
+        while self._diskUsed > self.maxDiskBytes and len(self._released):
+            localPaths, index = self._released.popitem(last=False)
+            self._deleteLocal(index, localPaths)
+    
+    def _deleteLocal(self, index, localPaths):
+        """
+        Delete the local copy of a file.
+        
+        """
+        for path in localPaths:
+            try:
+                size = os.path.getsize(path)
+                os.unlink(path)
+            except OSError:
+                continue
+            self._diskUsed -= size
+            self.logger.debug("Deleted local copy: '%s'", path)
+        
+        # it will be downloaded again if required
+        del self._state[index]
+        del self._local[index]
+        self._order.remove(index)
+    
+    @property
+    def diskUsed(self):
+        """
+        The size of the local copies (in bytes).
+        
+        """
+        return self._diskUsed
+    
+    def close(self):
+        """
+        Stop downloading, close the channels and delete all local copies.
+        
+        """
+        with self._condition:
+            self._stop = True
+            self._condition.notify_all()
+        
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        
+        with self._condition:
+            for index, localPaths in list(self._local.items()):
+                self._deleteLocal(index, localPaths)
+            self._released.clear()
+            self._inUse.clear()
+        
+        self._channel.close()
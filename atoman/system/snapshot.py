@@ -0,0 +1,266 @@
+"""
+Binary snapshot format for Lattice objects.
+
+A snapshot file contains a fixed size preamble (magic string, format version and
+the length of the header), a JSON header describing the system (number of atoms,
+cell dimensions, PBCs, species, attributes and the layout of the per-atom arrays)
+and then the raw little-endian per-atom arrays (atom IDs, species, positions,
+charges, scalars and vectors), each aligned to `ALIGNMENT` bytes.
+
+Reading a snapshot does not parse any text: the per-atom arrays are memory-mapped
+(copy-on-write) directly from the file.
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import json
+import struct
+import logging
+
+import numpy as np
+
+from .lattice import Lattice
+import six
+
+
+# file extension for snapshots
+SNAPSHOT_EXTENSION = ".atoman"
+
+# magic string at the start of a snapshot file
+MAGIC = b"ATOMANSS"
+
+# current version of the format
+VERSION = 1
+
+# preamble: magic, version, header length
+_PREAMBLE = struct.Struct("<8sIQ")
+
+# per-atom arrays start on multiples of this many bytes
+ALIGNMENT = 64
+
+
+def isSnapshot(filename):
+    """
+    Return True if the given file is a binary snapshot.
+    
+    """
+    try:
+        with open(filename, "rb") as fh:
+            magic = fh.read(len(MAGIC))
+    except IOError:
+        return False
+    
+    return magic == MAGIC
+
+
+def _jsonValue(value):
+    """
+    Convert numpy types to their Python equivalents, return None if not possible.
+    
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+    elif isinstance(value, np.ndarray):
+        value = value.tolist()
+    
+    if value is None or isinstance(value, (six.string_types, bool, float, list) + six.integer_types):
+        return value
+    
+    return None
+
+
+def _alignedOffset(offset):
+    """
+    Round the offset up to the alignment.
+    
+    """
+    return ((offset + ALIGNMENT - 1) // ALIGNMENT) * ALIGNMENT
+
+
+def writeSnapshot(lattice, filename, visibleAtoms=None):
+    """
+    Write the Lattice to a binary snapshot. If visibleAtoms is passed only write those atoms.
+    
+    """
+    logger = logging.getLogger(__name__)
+    logger.debug("Writing snapshot: '%s'", filename)
+    
+    NAtoms = lattice.NAtoms
+    
+    # the per-atom arrays to write: (kind, name, array)
+    columns = [
+        ("atomID", None, lattice.atomID[:NAtoms]),
+        ("specie", None, lattice.specie[:NAtoms]),
+        ("pos", None, lattice.pos[:3 * NAtoms].reshape((-1, 3))),
+        ("charge", None, lattice.charge[:NAtoms]),
+    ]
+    for name in sorted(lattice.scalarsDict.keys()):
+        columns.append(("scalar", name, lattice.scalarsDict[name][:NAtoms]))
+    for name in sorted(lattice.vectorsDict.keys()):
+        columns.append(("vector", name, lattice.vectorsDict[name].reshape((-1, 3))[:NAtoms]))
+    
+    # species list and counts
+    specieList = list(lattice.specieList)
+    specieCount = [int(count) for count in lattice.specieCount]
+    
+    # only write visible atoms
+    if visibleAtoms is not None:
+        visibleAtoms = np.asarray(visibleAtoms)
+        NAtoms = len(visibleAtoms)
+        columns = [(kind, name, array[visibleAtoms]) for kind, name, array in columns]
+        
+        # only keep species that have visible atoms
+        specie = columns[1][2]
+        used = np.unique(specie)
+        specieMap = np.zeros(len(specieList), np.int32)
+        specieMap[used] = np.arange(len(used), dtype=np.int32)
+        columns[1] = ("specie", None, specieMap[specie])
+        specieList = [specieList[i] for i in used]
+        specieCount = [int(count) for count in np.bincount(specie, minlength=len(lattice.specieList))[used]]
+    
+    # lattice attributes that can be stored
+    attributes = {}
+    for key, value in six.iteritems(lattice.attributes):
+        jsonValue = _jsonValue(value)
+        if jsonValue is None:
+            logger.warning("Cannot store attribute '%s' in snapshot (%r)", key, type(value))
+        else:
+            attributes[key] = jsonValue
+    
+    # header describing the system and the layout of the per-atom arrays
+    header = {
+        "NAtoms": NAtoms,
+        "cellDims": [float(val) for val in lattice.cellDims],
+        "PBC": [int(val) for val in lattice.PBC],
+        "specieList": specieList,
+        "specieCount": specieCount,
+        "attributes": attributes,
+        "scalarsFiles": dict(lattice.scalarsFiles),
+        "vectorsFiles": dict(lattice.vectorsFiles),
+        "columns": [],
+    }
+    
+    # little-endian data types
+    dtypes = []
+    for kind, name, array in columns:
+        if kind == "atomID" or kind == "specie":
+            dtypes.append(np.dtype("<i4"))
+        else:
+            dtypes.append(np.dtype("<f8"))
+    
+    # we need the header size to compute the offsets, so iterate until it is stable
+    headerBytes = b""
+    while True:
+        offset = _alignedOffset(_PREAMBLE.size + len(headerBytes))
+        header["columns"] = []
+        for (kind, name, array), dtype in zip(columns, dtypes):
+            header["columns"].append({
+                "kind": kind,
+                "name": name,
+                "dtype": dtype.str,
+                "shape": list(array.shape),
+                "offset": offset,
+            })
+            offset = _alignedOffset(offset + array.size * dtype.itemsize)
+        
+        newHeaderBytes = json.dumps(header, sort_keys=True).encode("utf-8")
+        if len(newHeaderBytes) == len(headerBytes):
+            break
+        headerBytes = newHeaderBytes
+    
+    # write the file
+    with open(filename, "wb") as fh:
+        fh.write(_PREAMBLE.pack(MAGIC, VERSION, len(headerBytes)))
+        fh.write(headerBytes)
+        for (kind, name, array), dtype, column in zip(columns, dtypes, header["columns"]):
+            fh.write(b"\0" * (column["offset"] - fh.tell()))
+            np.ascontiguousarray(array, dtype=dtype).tofile(fh)
+
+
+def readSnapshot(filename, memoryMap=True):
+    """
+    Read a binary snapshot and return a Lattice.
+    
+    If memoryMap is True the per-atom arrays are memory-mapped (copy-on-write)
+    from the file, otherwise they are read into memory.
+    
+    """
+    logger = logging.getLogger(__name__)
+    logger.debug("Reading snapshot: '%s'", filename)
+    
+    with open(filename, "rb") as fh:
+        preamble = fh.read(_PREAMBLE.size)
+        if len(preamble) != _PREAMBLE.size:
+            raise IOError("File is too short to be a snapshot: '%s'" % filename)
+        magic, version, headerLength = _PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            raise IOError("File is not a snapshot: '%s'" % filename)
+        if version > VERSION:
+            raise IOError("Unsupported snapshot version (%d > %d): '%s'" % (version, VERSION, filename))
+        header = json.loads(fh.read(headerLength).decode("utf-8"))
+        
+        if not memoryMap:
+            dataOffset = fh.tell()
+            data = np.fromfile(fh, dtype=np.uint8)
+    
+    if memoryMap:
+        data = np.memmap(filename, dtype=np.uint8, mode="c")
+        dataOffset = 0
+    
+    NAtoms = header["NAtoms"]
+    
+    # create the lattice
+    lattice = Lattice()
+    lattice.NAtoms = NAtoms
+    lattice.cellDims = np.asarray(header["cellDims"], dtype=np.float64)
+    lattice.PBC = np.asarray(header["PBC"], dtype=np.int32)
+    
+    # species
+    lattice.specieList = list(header["specieList"])
+    numSpecies = len(lattice.specieList)
+    lattice.specieCount = np.asarray(header["specieCount"], dtype=np.int32)
+    lattice.specieMass = np.empty(numSpecies, np.float64)
+    lattice.specieCovalentRadius = np.empty(numSpecies, np.float64)
+    lattice.specieAtomicNumber = np.empty(numSpecies, np.int32)
+    lattice.specieRGB = np.empty((numSpecies, 3), np.float64)
+    lattice.refreshElementProperties()
+    
+    # the per-atom arrays are views onto the file data
+    for column in header["columns"]:
+        dtype = np.dtype(str(column["dtype"]))
+        shape = tuple(column["shape"])
+        start = column["offset"] - dataOffset
+        array = data[start:start + int(np.prod(shape)) * dtype.itemsize].view(dtype).reshape(shape)
+        if not dtype.isnative:
+            array = array.astype(dtype.newbyteorder("="))
+        
+        kind = column["kind"]
+        if kind == "atomID":
+            lattice.atomID = array
+        elif kind == "specie":
+            lattice.specie = array
+        elif kind == "pos":
+            lattice.pos = array.reshape(-1)
+        elif kind == "charge":
+            lattice.charge = array
+        elif kind == "scalar":
+            lattice.scalarsDict[column["name"]] = array
+        elif kind == "vector":
+            lattice.vectorsDict[column["name"]] = array
+        else:
+            logger.warning("Ignoring unrecognised column in snapshot: '%s'", kind)
+    
+    if NAtoms:
+        pos = lattice.pos.reshape((-1, 3))
+        lattice.minPos = pos.min(axis=0)
+        lattice.maxPos = pos.max(axis=0)
+    
+    lattice.attributes = dict(header["attributes"])
+    lattice.scalarsFiles = dict(header["scalarsFiles"])
+    lattice.vectorsFiles = dict(header["vectorsFiles"])
+    
+    logger.debug("Read snapshot with %d atoms", NAtoms)
+    
+    return lattice
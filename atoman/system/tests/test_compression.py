@@ -0,0 +1,106 @@
+"""
+Unit tests for reading compressed files
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import unittest
+import tempfile
+import shutil
+import gzip
+import bz2
+
+from .. import compression
+
+
+################################################################################
+
+class TestCompression(unittest.TestCase):
+    """
+    Test reading compressed files
+    
+    """
+    def setUp(self):
+        """
+        Called before each test
+        
+        """
+        # tmp dir
+        self.tmpLocation = tempfile.mkdtemp(prefix="atomanTest")
+        
+        # test data
+        self.lines = [b"%d line of data\n" % i for i in range(1000)]
+        self.data = b"".join(self.lines)
+    
+    def tearDown(self):
+        """
+        Called after each test
+        
+        """
+        # remove tmp dir
+        shutil.rmtree(self.tmpLocation)
+    
+    def test_locateFile(self):
+        """
+        Compression: locate file
+        
+        """
+        fn = os.path.join(self.tmpLocation, "test.dat")
+        self.assertIsNone(compression.locateFile(fn))
+        
+        with bz2.BZ2File(fn + ".bz2", "wb") as fh:
+            fh.write(self.data)
+        self.assertEqual(compression.locateFile(fn), fn + ".bz2")
+        self.assertEqual(compression.locateFile(fn + ".bz2"), fn + ".bz2")
+        
+        with open(fn, "wb") as fh:
+            fh.write(self.data)
+        self.assertEqual(compression.locateFile(fn), fn)
+    
+    def test_openFile(self):
+        """
+        Compression: open file
+        
+        """
+        fn = os.path.join(self.tmpLocation, "test.dat.gz")
+        with gzip.open(fn, "wb") as fh:
+            fh.write(self.data)
+        
+        self.assertTrue(compression.isCompressed(fn))
+        with compression.openFile(fn) as fh:
+            self.assertEqual(fh.read(), self.data)
+        with compression.openFile(fn, text=True) as fh:
+            self.assertEqual(fh.readline(), self.lines[0].decode("utf-8"))
+    
+    def test_readAheadStream(self):
+        """
+        Compression: read ahead stream
+        
+        """
+        fn = os.path.join(self.tmpLocation, "test.dat.gz")
+        with gzip.open(fn, "wb") as fh:
+            fh.write(self.data)
+        
+        # read lines, then blocks of a different size to the read ahead blocks
+        with compression.ReadAheadStream(compression.openFile(fn), blockSize=100, numBlocks=2) as stream:
+            self.assertEqual(stream.readline(), self.lines[0])
+            self.assertEqual(stream.readline(), self.lines[1])
+            offset = len(self.lines[0]) + len(self.lines[1])
+            
+            chunks = []
+            while True:
+                chunk = stream.read(77)
+                if not len(chunk):
+                    break
+                chunks.append(chunk)
+            
+            self.assertEqual(b"".join(chunks), self.data[offset:])
+            self.assertTrue(all(len(chunk) == 77 for chunk in chunks[:-1]))
+            self.assertRaises(IOError, stream.readline)
+        
+        # closing before reading everything stops the background thread
+        stream = compression.ReadAheadStream(compression.openFile(fn), blockSize=10, numBlocks=1)
+        self.assertEqual(stream.read(5), self.data[:5])
+        stream.close()
+        self.assertIsNone(stream._thread)
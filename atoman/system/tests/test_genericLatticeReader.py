@@ -9,10 +9,15 @@ import os
 import unittest
 import tempfile
 import shutil
+import gzip
+import bz2
 
 import numpy as np
+import six
 
 from .. import latticeReaderGeneric
+from .. import compression
+from .. import trajectory
 from ..lattice import Lattice
 
 
@@ -168,3 +173,359 @@ class TestReadLatticeGeneric(unittest.TestCase):
         self.assertEqual(state.specieCount[indx], 15565)
         indx = state.specieList.index("H_")
         self.assertEqual(state.specieCount[indx], 8)
+    
+    def test_readGenericMemoryMapped(self):
+        """
+        Generic reader: memory-mapped arrays
+        
+        """
+        fn = path_to_file("kenny_lattice.dat")
+        fmt = self.ffs.getFormat("LBOMD Lattice")
+        status, ref = self.reader.readFile(fn, fmt)
+        self.assertEqual(status, 0)
+        self.assertFalse(ref.isMemoryMapped())
+        
+        # the reader allocates the arrays in memory-mapped files
+        allocator = latticeReaderGeneric.MemoryMapAllocator(self.tmpLocation, 1000)
+        resultDict = latticeReaderGeneric._readGenericLatticeFile(fn, fmt, fmt.body, -1, allocator=allocator)
+        self.assertTrue(allocator.used)
+        self.assertIsInstance(resultDict["Position"], np.memmap)
+        self.assertIsInstance(resultDict["Symbol"], np.memmap)
+        
+        status, state = self.reader.readFile(fn, fmt, memoryMapDir=self.tmpLocation, memoryMapThreshold=1000)
+        self.assertEqual(status, 0)
+        self.assertTrue(state.isMemoryMapped())
+        for name in ("pos", "specie", "atomID", "charge"):
+            self.assertIsInstance(getattr(state, name), np.memmap)
+            self.assertTrue(np.array_equal(getattr(state, name), getattr(ref, name)))
+        
+        # below the threshold
+        status, state = self.reader.readFile(fn, fmt, memoryMapDir=self.tmpLocation, memoryMapThreshold=2000)
+        self.assertEqual(status, 0)
+        self.assertFalse(state.isMemoryMapped())
+    
+    def test_readGenericLongLinesUnordered(self):
+        """
+        Generic reader: long lines and unordered atom IDs
+        
+        """
+        # file format
+        fmt = latticeReaderGeneric.FileFormat("Test")
+        fmt.newHeaderLine()
+        fmt.addHeaderValue("NAtoms", "i")
+        fmt.newBodyLine()
+        fmt.addBodyValue("atomID", "i", 1)
+        fmt.addBodyValue("Symbol", "i", 1)
+        fmt.addBodyValue("Position", "d", 3)
+        fmt.addBodyValue("SKIP", "d", 1)
+        
+        # write file with lines longer than 512 characters
+        atomIDs = [3, 1, 4, 2, 5]
+        symbols = ["He", "Fe", "H", "Fe", "He"]
+        fn = os.path.join(self.tmpLocation, "long.dat")
+        with open(fn, "w") as fh:
+            fh.write("%d\n" % len(atomIDs))
+            for atomID, sym in zip(atomIDs, symbols):
+                fh.write("%d %s %r 1e-3 -2.5E+02 %s\n" % (atomID, sym, 0.1 * atomID, "1" * 600))
+        
+        status, state = self.reader.readFile(fn, fmt)
+        
+        self.assertEqual(status, 0)
+        self.assertEqual(state.NAtoms, 5)
+        self.assertEqual(state.specieList, ["He", "Fe", "H_"])
+        self.assertTrue(np.array_equal(state.specieCount, [2, 2, 1]))
+        self.assertTrue(np.array_equal(state.atomID, [1, 2, 3, 4, 5]))
+        self.assertTrue(np.array_equal(state.specie, [1, 1, 0, 2, 0]))
+        pos = state.pos.reshape((-1, 3))
+        self.assertTrue(np.array_equal(pos[:, 0], [0.1 * i for i in range(1, 6)]))
+        self.assertTrue(np.array_equal(pos[:, 1], [1e-3] * 5))
+        self.assertTrue(np.array_equal(pos[:, 2], [-2.5e2] * 5))
+    
+    def test_readGenericCompressed(self):
+        """
+        Generic reader: compressed files
+        
+        """
+        fn = path_to_file("kenny_lattice.dat")
+        fmt = self.ffs.getFormat("LBOMD Lattice")
+        status, ref = self.reader.readFile(fn, fmt)
+        self.assertEqual(status, 0)
+        
+        with open(fn, "rb") as fh:
+            data = fh.read()
+        
+        for ext in compression.COMPRESSED_EXTENSIONS:
+            if ext == ".gz":
+                with gzip.open(os.path.join(self.tmpLocation, "lattice.dat.gz"), "wb") as fh:
+                    fh.write(data)
+            elif ext == ".bz2":
+                with bz2.BZ2File(os.path.join(self.tmpLocation, "lattice.dat.bz2"), "wb") as fh:
+                    fh.write(data)
+            else:
+                continue
+            
+            # compressed file is located and decompressed while reading (no unzipped file is written)
+            before = sorted(os.listdir(self.tmpLocation))
+            status, state = self.reader.readFile(os.path.join(self.tmpLocation, "lattice.dat"), fmt)
+            self.assertEqual(sorted(os.listdir(self.tmpLocation)), before)
+            os.unlink(os.path.join(self.tmpLocation, "lattice.dat" + ext))
+            
+            self.assertEqual(status, 0)
+            self.assertEqual(state.NAtoms, ref.NAtoms)
+            self.assertEqual(state.specieList, ref.specieList)
+            self.assertTrue(np.array_equal(state.specieCount, ref.specieCount))
+            self.assertTrue(np.array_equal(state.specie, ref.specie))
+            self.assertTrue(np.array_equal(state.pos, ref.pos))
+            self.assertTrue(np.array_equal(state.charge, ref.charge))
+            self.assertTrue(np.array_equal(state.cellDims, ref.cellDims))
+    
+    def test_readGenericCompressedTruncated(self):
+        """
+        Generic reader: truncated compressed file
+        
+        """
+        fn = path_to_file("kenny_lattice.dat")
+        fmt = self.ffs.getFormat("LBOMD Lattice")
+        with open(fn, "rb") as fh:
+            data = fh.read()
+        
+        fn = os.path.join(self.tmpLocation, "lattice.dat.gz")
+        with gzip.open(fn, "wb") as fh:
+            fh.write(data[:len(data) // 2])
+        
+        with self.assertRaises(IOError):
+            self.reader.readFile(fn, fmt)
+    
+    def test_readGenericWrongFormat(self):
+        """
+        Generic reader: wrong file format
+        
+        """
+        # the atom ID is read first
+        fn = path_to_file("kenny_lattice.dat")
+        with six.assertRaisesRegex(self, TypeError, "Could not convert atomID 'Si' to integer"):
+            self.reader.readFile(fn, self.ffs.getFormat("LBOMD REF"))
+        
+        # values are converted before missing values are reported
+        fn = os.path.join(self.tmpLocation, "lattice.dat")
+        with open(fn, "w") as fh:
+            fh.write("2\n10.0 10.0 10.0\nFe 1.0 x\nFe 1.0 2.0 3.0 0.0\n")
+        with six.assertRaisesRegex(self, TypeError, "Conversion to double failed for 'x'"):
+            self.reader.readFile(fn, self.ffs.getFormat("LBOMD Lattice"))
+        
+        with open(fn, "w") as fh:
+            fh.write("2\n10.0 10.0 10.0\nFe 1.0 2.0\nFe 1.0 2.0 3.0 0.0\n")
+        with self.assertRaises(IOError):
+            self.reader.readFile(fn, self.ffs.getFormat("LBOMD Lattice"))
+    
+    def test_readGenericProjection(self):
+        """
+        Generic reader: column projection
+        
+        """
+        fn = path_to_file("anim-ref-Hdiff.xyz.gz")
+        fmt = self.ffs.getFormat("LBOMD REF")
+        status, ref = self.reader.readFile(fn, fmt)
+        self.assertEqual(status, 0)
+        
+        # only read kinetic energy
+        status, state = self.reader.readFile(fn, fmt, columns=["Kinetic energy"])
+        
+        self.assertEqual(status, 0)
+        self.assertEqual(state.NAtoms, ref.NAtoms)
+        self.assertTrue(np.array_equal(state.atomID, ref.atomID))
+        self.assertTrue(np.array_equal(state.specie, ref.specie))
+        self.assertTrue(np.array_equal(state.pos, ref.pos))
+        self.assertTrue(np.array_equal(state.charge, ref.charge))
+        self.assertEqual(list(state.scalarsDict.keys()), ["Kinetic energy"])
+        self.assertTrue(np.array_equal(state.scalarsDict["Kinetic energy"], ref.scalarsDict["Kinetic energy"]))
+        self.assertEqual(len(state.vectorsDict), 0)
+        
+        # skipped columns are read when requested
+        self.assertEqual(state.deferredColumnNames("scalar"), ["Potential energy"])
+        self.assertEqual(state.deferredColumnNames("vector"), ["Force"])
+        self.assertTrue(state.loadDeferredColumn("Potential energy"))
+        self.assertTrue(np.array_equal(state.scalarsDict["Potential energy"], ref.scalarsDict["Potential energy"]))
+        self.assertTrue(state.loadDeferredColumn("Force"))
+        self.assertTrue(np.array_equal(state.vectorsDict["Force"], ref.vectorsDict["Force"]))
+        self.assertFalse(state.loadDeferredColumn("Force"))
+        self.assertEqual(len(state.deferredColumns), 0)
+    
+    def test_readGenericReordered(self):
+        """
+        Generic reader: reorder atoms along a space-filling curve
+        
+        """
+        fn = path_to_file("anim-ref-Hdiff.xyz.gz")
+        fmt = self.ffs.getFormat("LBOMD REF")
+        status, ref = self.reader.readFile(fn, fmt)
+        self.assertEqual(status, 0)
+        self.assertIsNone(ref.permutation)
+        
+        self.reader.reorder = "hilbert"
+        status, state = self.reader.readFile(fn, fmt, columns=["Kinetic energy"])
+        self.assertEqual(status, 0)
+        
+        # atoms are reordered, keeping the order of the file
+        perm = state.permutation
+        self.assertTrue(np.array_equal(np.sort(perm), np.arange(ref.NAtoms)))
+        self.assertTrue(np.array_equal(state.atomID, ref.atomID[perm]))
+        self.assertTrue(np.array_equal(state.pos, ref.pos.reshape((-1, 3))[perm].ravel()))
+        self.assertTrue(np.array_equal(state.fileOrderPositions(), ref.pos))
+        self.assertTrue(np.array_equal(state.scalarsDict["Kinetic energy"], ref.scalarsDict["Kinetic energy"][perm]))
+        
+        # skipped columns are reordered when they are read
+        self.assertTrue(state.loadDeferredColumn("Force"))
+        self.assertTrue(np.array_equal(state.vectorsDict["Force"], ref.vectorsDict["Force"][perm]))
+        
+        # positions are matched by the order of the file
+        self.assertTrue(np.array_equal(ref.matchingPositions(state), ref.pos))
+        
+        # large systems are reordered after they are memory-mapped (trajectory frames are read into RAM)
+        trajfn = os.path.join(self.tmpLocation, "ref" + trajectory.TRAJECTORY_EXTENSION)
+        with trajectory.TrajectoryWriter(trajfn) as writer:
+            writer.addFrame(ref)
+        status, state = self.reader.readFile(trajfn, latticeReaderGeneric.trajectoryFileFormat,
+                                             memoryMapDir=self.tmpLocation, memoryMapThreshold=1)
+        self.assertEqual(status, 0)
+        self.assertTrue(state.isMemoryMapped())
+        self.assertIsInstance(state.pos, np.memmap)
+        self.assertTrue(np.array_equal(state.permutation, perm))
+        self.assertTrue(np.array_equal(state.atomID, ref.atomID[perm]))
+        self.assertTrue(np.array_equal(state.fileOrderPositions(), ref.pos))
+    
+    def test_readGenericProjectionUnordered(self):
+        """
+        Generic reader: deferred column with unordered atom IDs
+        
+        """
+        fmt = latticeReaderGeneric.FileFormat("Test")
+        fmt.newHeaderLine()
+        fmt.addHeaderValue("NAtoms", "i")
+        fmt.newBodyLine()
+        fmt.addBodyValue("atomID", "i", 1)
+        fmt.addBodyValue("Symbol", "i", 1)
+        fmt.addBodyValue("Position", "d", 3)
+        fmt.addBodyValue("Energy", "d", 1)
+        
+        atomIDs = [3, 1, 4, 2]
+        fn = os.path.join(self.tmpLocation, "unordered.dat")
+        with open(fn, "w") as fh:
+            fh.write("%d\n" % len(atomIDs))
+            for atomID in atomIDs:
+                fh.write("%d Fe 0.0 0.0 %d.0 %d.5\n" % (atomID, atomID, atomID))
+        
+        status, state = self.reader.readFile(fn, fmt, columns=[])
+        self.assertEqual(status, 0)
+        self.assertEqual(len(state.scalarsDict), 0)
+        
+        # changing the atoms means the column can no longer be read
+        lattice = Lattice()
+        lattice.clone(state)
+        lattice.removeAtoms([0])
+        self.assertEqual(len(lattice.deferredColumns), 0)
+        
+        self.assertTrue(state.loadDeferredColumn("Energy"))
+        self.assertTrue(np.array_equal(state.scalarsDict["Energy"], [1.5, 2.5, 3.5, 4.5]))
+
+
+################################################################################
+
+class TestReadDataFile(unittest.TestCase):
+    """
+    Test reading per atom data files
+    
+    """
+    def setUp(self):
+        """
+        Called before each test
+        
+        """
+        # tmp dir
+        self.tmpLocation = tempfile.mkdtemp(prefix="atomanTest")
+        
+        rng = np.random.RandomState(1234)
+        self.scalars = rng.uniform(-10.0, 10.0, size=50)
+        self.vectors = rng.uniform(-10.0, 10.0, size=(50, 3))
+    
+    def tearDown(self):
+        """
+        Called after each test
+        
+        """
+        # remove tmp dir
+        shutil.rmtree(self.tmpLocation)
+    
+    def writeText(self, name, lines, opener=open):
+        fn = os.path.join(self.tmpLocation, name)
+        with opener(fn, "wb") as fh:
+            fh.write("".join(line + "\n" for line in lines).encode("utf-8"))
+        
+        return fn
+    
+    def test_readScalars(self):
+        """
+        Read data file: scalars
+        
+        """
+        lines = ["%r" % value for value in self.scalars]
+        fn = self.writeText("scalars.dat", lines + [""])
+        scalars = latticeReaderGeneric.readDataFile(fn, len(self.scalars))
+        self.assertEqual(scalars.dtype, np.float64)
+        self.assertEqual(scalars.shape, self.scalars.shape)
+        self.assertTrue(np.array_equal(scalars, self.scalars))
+        
+        # wrong length
+        self.assertRaises(ValueError, latticeReaderGeneric.readDataFile, fn, len(self.scalars) + 1)
+        self.assertRaises(ValueError, latticeReaderGeneric.readDataFile, fn, len(self.scalars) - 1)
+        
+        # not a number
+        fn = self.writeText("bad.dat", lines[:-1] + ["1.0abc"])
+        self.assertRaises(ValueError, latticeReaderGeneric.readDataFile, fn, len(self.scalars))
+        
+        # missing file
+        fn = os.path.join(self.tmpLocation, "missing.dat")
+        self.assertRaises(IOError, latticeReaderGeneric.readDataFile, fn, len(self.scalars))
+    
+    def test_readVectors(self):
+        """
+        Read data file: vectors
+        
+        """
+        lines = ["%r %r\t%r" % tuple(vector) for vector in self.vectors]
+        fn = self.writeText("vectors.dat", lines)
+        vectors = latticeReaderGeneric.readDataFile(fn, len(self.vectors), numColumns=3)
+        self.assertEqual(vectors.shape, self.vectors.shape)
+        self.assertTrue(np.array_equal(vectors, self.vectors))
+        
+        # too few values on a line
+        fn = self.writeText("bad.dat", lines[:-1] + ["1.0 2.0"])
+        self.assertRaises(ValueError, latticeReaderGeneric.readDataFile, fn, len(self.vectors), numColumns=3)
+        
+        # compressed
+        for ext, opener in ((".gz", gzip.open), (".bz2", bz2.BZ2File)):
+            fn = self.writeText("vectors.dat" + ext, lines, opener=opener)
+            vectors = latticeReaderGeneric.readDataFile(fn, len(self.vectors), numColumns=3)
+            self.assertTrue(np.array_equal(vectors, self.vectors))
+    
+    def test_readBinary(self):
+        """
+        Read data file: binary
+        
+        """
+        fn = os.path.join(self.tmpLocation, "vectors.npy")
+        np.save(fn, self.vectors.astype(np.float32))
+        vectors = latticeReaderGeneric.readDataFile(fn, len(self.vectors), numColumns=3)
+        self.assertEqual(vectors.dtype, np.float64)
+        self.assertTrue(np.array_equal(vectors, self.vectors.astype(np.float32)))
+        
+        # wrong shape
+        self.assertRaises(ValueError, latticeReaderGeneric.readDataFile, fn, len(self.vectors))
+        
+        # compressed
+        with open(fn, "rb") as fh:
+            data = fh.read()
+        with gzip.open(fn + ".gz", "wb") as fh:
+            fh.write(data)
+        vectors = latticeReaderGeneric.readDataFile(fn + ".gz", len(self.vectors), numColumns=3)
+        self.assertTrue(np.array_equal(vectors, self.vectors.astype(np.float32)))
@@ -9,6 +9,7 @@ import os
 import unittest
 import tempfile
 import shutil
+import copy
 
 import numpy as np
 from six.moves import range
@@ -186,3 +187,278 @@ class TestLattice(unittest.TestCase):
 
         with self.assertRaises(ValueError):
             self.lattic2.getSpecieIndex("Zn")
+    
+    def test_addAtoms(self):
+        """
+        Lattice addAtoms
+        
+        """
+        lattice = self.lattic3
+        lattice.scalarsDict["KE"] = np.asarray([0.1, 0.3, 0.2], dtype=np.float64)
+        lattice.scalarsDict["PE"] = np.asarray([1.0, 2.0, 3.0], dtype=np.float64)
+        lattice.vectorsDict["Force"] = np.asarray([[1, 2, 3], [4, 5, 6], [7, 8, 9]], dtype=np.float64)
+        
+        # add enough atoms to grow the buffers more than once
+        NAdd = 40
+        syms = ["Ga", "Fe"] * (NAdd // 2)
+        pos = np.arange(3 * NAdd, dtype=np.float64).reshape((NAdd, 3))
+        charges = np.arange(NAdd, dtype=np.float64)
+        ke = np.arange(NAdd, dtype=np.float64) * 0.5
+        forces = -pos
+        lattice.addAtoms(syms, pos, charges, scalars={"KE": ke}, vectors={"Force": forces})
+        
+        self.assertEqual(lattice.NAtoms, 3 + NAdd)
+        self.assertEqual(lattice.specieList, ["Pu", "Ga", "Fe"])
+        self.assertTrue(np.array_equal(lattice.specieCount, [2, 1 + NAdd // 2, NAdd // 2]))
+        self.assertEqual(len(lattice.specie), lattice.NAtoms)
+        self.assertEqual(len(lattice.pos), 3 * lattice.NAtoms)
+        self.assertEqual(len(lattice.charge), lattice.NAtoms)
+        self.assertEqual(len(lattice.atomID), lattice.NAtoms)
+        self.assertTrue(np.array_equal(lattice.specie[3:], [1, 2] * (NAdd // 2)))
+        self.assertTrue(np.array_equal(lattice.pos[9:], pos.flatten()))
+        self.assertTrue(np.array_equal(lattice.charge[3:], charges))
+        self.assertTrue(np.array_equal(lattice.atomID[3:], np.arange(3, 3 + NAdd)))
+        self.assertTrue(np.array_equal(lattice.maxPos, pos[-1]))
+        
+        # scalars/vectors not provided are removed
+        self.assertNotIn("PE", lattice.scalarsDict)
+        self.assertTrue(np.array_equal(lattice.scalarsDict["KE"], np.concatenate(([0.1, 0.3, 0.2], ke))))
+        self.assertEqual(lattice.vectorsDict["Force"].shape, (3 + NAdd, 3))
+        self.assertTrue(np.array_equal(lattice.vectorsDict["Force"][3:], forces))
+        
+        # single atoms still work and arrays replaced externally are adopted
+        lattice.charge = lattice.charge.copy()
+        lattice.addAtom("Pu", (1, 2, 3), 4.0, atomID=99, scalarVals={"KE": 9.0}, vectorVals={"Force": [1, 1, 1]})
+        self.assertEqual(lattice.NAtoms, 4 + NAdd)
+        self.assertEqual(lattice.atomID[-1], 99)
+        self.assertEqual(lattice.charge[-1], 4.0)
+        self.assertEqual(lattice.scalarsDict["KE"][-1], 9.0)
+        self.assertTrue(np.array_equal(lattice.atomPos(lattice.NAtoms - 1), [1, 2, 3]))
+        self.assertEqual(lattice.specieCount[0], 3)
+    
+    def test_removeAtoms(self):
+        """
+        Lattice removeAtoms
+        
+        """
+        lattice = self.lattic3
+        lattice.addAtom("Fe", (4, 4, 4), 1)
+        lattice.addAtom("Pu", (5, 5, 5), 2)
+        lattice.scalarsDict["KE"] = np.asarray([0, 1, 2, 3, 4], dtype=np.float64)
+        lattice.vectorsDict["Force"] = np.arange(15, dtype=np.float64).reshape((5, 3))
+        
+        # arrays referred to elsewhere (eg. by a Filterer) are not modified
+        oldPos = lattice.pos
+        oldKE = lattice.scalarsDict["KE"]
+        oldSpecie = lattice.specie
+        
+        # removing all Ga atoms removes the specie
+        lattice.removeAtoms([4, 2])
+        self.assertEqual(lattice.NAtoms, 3)
+        self.assertEqual(lattice.specieList, ["Pu", "Fe"])
+        self.assertTrue(np.array_equal(lattice.specieCount, [2, 1]))
+        self.assertTrue(np.array_equal(lattice.specie, [0, 0, 1]))
+        self.assertTrue(np.array_equal(lattice.atomID, [0, 1, 3]))
+        self.assertTrue(np.array_equal(lattice.pos, [0, 0, 0, 0, 2, 0, 4, 4, 4]))
+        self.assertTrue(np.array_equal(lattice.charge, [0, 0, 1]))
+        self.assertTrue(np.array_equal(lattice.scalarsDict["KE"], [0, 1, 3]))
+        self.assertTrue(np.array_equal(lattice.vectorsDict["Force"], [[0, 1, 2], [3, 4, 5], [9, 10, 11]]))
+        self.assertTrue(np.array_equal(oldPos, [0, 0, 0, 0, 2, 0, 3, 1, 3, 4, 4, 4, 5, 5, 5]))
+        self.assertTrue(np.array_equal(oldKE, [0, 1, 2, 3, 4]))
+        self.assertTrue(np.array_equal(oldSpecie, [0, 0, 1, 2, 0]))
+        
+        # atoms can still be added after removing
+        lattice.addAtom("Pu", (6, 6, 6), 0)
+        self.assertEqual(lattice.NAtoms, 4)
+        self.assertTrue(np.array_equal(lattice.pos[9:], [6, 6, 6]))
+        lattice.removeAtom(3)
+        
+        lattice.removeAtom(0)
+        self.assertEqual(lattice.NAtoms, 2)
+        self.assertTrue(np.array_equal(lattice.atomID, [1, 3]))
+        self.assertTrue(np.array_equal(lattice.specieCount, [1, 1]))
+        
+        with self.assertRaises(IndexError):
+            lattice.removeAtoms([2])
+    
+    def test_shiftAtoms(self):
+        """
+        Lattice shiftAtoms
+        
+        """
+        lattice = self.lattice
+        pos = lattice.pos.copy()
+        shift = np.asarray([1.5, -2.0, 0.0])
+        
+        progress = []
+        lattice.shiftAtoms(shift, updateProgress=lambda n, nmax, msg: progress.append((n, nmax)), blockSize=5)
+        
+        expected = (pos.reshape((-1, 3)) + shift) % lattice.cellDims
+        self.assertTrue(np.allclose(lattice.pos, expected.flatten()))
+        self.assertEqual(progress[-1], (lattice.NAtoms, lattice.NAtoms))
+    
+    def test_replicate(self):
+        """
+        Lattice replicate
+        
+        """
+        lattice = self.lattic3
+        lattice.setDims([4, 4, 4])
+        lattice.scalarsDict["KE"] = np.asarray([0.1, 0.3, 0.2], dtype=np.float64)
+        lattice.vectorsDict["Force"] = np.asarray([[1, 2, 3], [4, 5, 6], [7, 8, 9]], dtype=np.float64)
+        pos = lattice.pos.copy().reshape((-1, 3))
+        
+        progress = []
+        lattice.replicate([1, 0, 2], updateProgress=lambda n, nmax, msg: progress.append((n, nmax)), blockSize=2)
+        
+        self.assertEqual(lattice.NAtoms, 18)
+        self.assertEqual(progress[-1], (15, 15))
+        self.assertTrue(np.array_equal(lattice.cellDims, [8, 4, 12]))
+        self.assertTrue(np.array_equal(lattice.specieCount, [12, 6]))
+        self.assertTrue(np.array_equal(lattice.atomID, np.arange(18)))
+        self.assertTrue(np.array_equal(lattice.specie, [0, 0, 1] * 6))
+        self.assertTrue(np.array_equal(lattice.scalarsDict["KE"], [0.1, 0.3, 0.2] * 6))
+        self.assertTrue(np.array_equal(lattice.vectorsDict["Force"], np.tile([[1, 2, 3], [4, 5, 6], [7, 8, 9]],
+                                                                             (6, 1))))
+        
+        # order of the new atoms: x replica first, then z replicas of the result
+        newpos = lattice.pos.reshape((-1, 3))
+        self.assertTrue(np.array_equal(newpos[3:6], pos + [4, 0, 0]))
+        self.assertTrue(np.array_equal(newpos[6:9], pos + [0, 0, 4]))
+        self.assertTrue(np.array_equal(newpos[9:12], pos + [4, 0, 4]))
+        self.assertTrue(np.array_equal(newpos[12:15], pos + [0, 0, 8]))
+        self.assertTrue(np.array_equal(lattice.maxPos, [7, 2, 11]))
+    
+    def test_clone(self):
+        """
+        Lattice clone
+        
+        """
+        self.lattice.scalarsDict["KE"] = np.arange(self.lattice.NAtoms, dtype=np.float64)
+        lattice = Lattice()
+        lattice.clone(self.lattice)
+        
+        self.assertEqual(lattice.NAtoms, self.lattice.NAtoms)
+        self.assertEqual(lattice.specieList, self.lattice.specieList)
+        self.assertTrue(np.array_equal(lattice.specieCount, self.lattice.specieCount))
+        self.assertTrue(np.array_equal(lattice.cellDims, self.lattice.cellDims))
+        self.assertTrue(np.array_equal(lattice.pos, self.lattice.pos))
+        self.assertTrue(np.array_equal(lattice.specie, self.lattice.specie))
+        self.assertTrue(np.array_equal(lattice.charge, self.lattice.charge))
+        self.assertTrue(np.array_equal(lattice.atomID, self.lattice.atomID))
+        self.assertTrue(np.array_equal(lattice.scalarsDict["KE"], self.lattice.scalarsDict["KE"]))
+        
+        # arrays are copies
+        lattice.pos[0] += 1.0
+        lattice.scalarsDict["KE"][0] += 1.0
+        self.assertNotEqual(lattice.pos[0], self.lattice.pos[0])
+        self.assertNotEqual(lattice.scalarsDict["KE"][0], self.lattice.scalarsDict["KE"][0])
+    
+    def test_memoryMap(self):
+        """
+        Lattice memoryMap
+        
+        """
+        lattice = self.lattic3
+        lattice.scalarsDict["KE"] = np.asarray([0.1, 0.3, 0.2], dtype=np.float64)
+        lattice.vectorsDict["Force"] = np.asarray([[1, 2, 3], [4, 5, 6], [7, 8, 9]], dtype=np.float64)
+        pos = lattice.pos.copy()
+        
+        self.assertFalse(lattice.isMemoryMapped())
+        lattice.memoryMap(self.tmpLocation)
+        self.assertTrue(lattice.isMemoryMapped())
+        self.assertIsInstance(lattice.pos, np.memmap)
+        self.assertIsInstance(lattice.scalarsDict["KE"], np.memmap)
+        self.assertIsInstance(lattice.vectorsDict["Force"], np.memmap)
+        self.assertTrue(np.array_equal(lattice.pos, pos))
+        self.assertTrue(np.array_equal(lattice.scalarsDict["KE"], [0.1, 0.3, 0.2]))
+        
+        # mapped files are removed once mapped
+        self.assertEqual(os.listdir(self.tmpLocation), [])
+        
+        # adding atoms keeps the arrays memory-mapped
+        lattice.addAtoms(["Ga"] * 20, np.ones((20, 3)), scalars={"KE": np.ones(20)},
+                         vectors={"Force": np.ones((20, 3))})
+        self.assertIsInstance(lattice.pos.base, np.memmap)
+        self.assertEqual(lattice.NAtoms, 23)
+        self.assertTrue(np.array_equal(lattice.pos[:9], pos))
+        
+        # copies are memory-mapped too
+        lattice2 = copy.deepcopy(lattice)
+        self.assertTrue(lattice2.isMemoryMapped())
+        self.assertIsInstance(lattice2.pos, np.memmap)
+        self.assertTrue(np.array_equal(lattice2.pos, lattice.pos))
+        self.assertTrue(np.array_equal(lattice2.vectorsDict["Force"], lattice.vectorsDict["Force"]))
+        self.assertEqual(lattice2.specieList, lattice.specieList)
+        
+        # C extensions work on the mapped arrays
+        lattice2.setDims([2, 2, 2])
+        lattice2.wrapAtoms()
+        self.assertTrue(np.all(lattice2.pos < 2))
+    
+    def test_reorderAtoms(self):
+        """
+        Lattice reorderAtoms
+        
+        """
+        # grid of atoms in a random order (the IDs are the indexes in the file)
+        rng = np.random.RandomState(3)
+        grid = np.asarray([(i, j, k) for i in range(4) for j in range(4) for k in range(4)], dtype=np.float64)
+        grid = grid[rng.permutation(len(grid))]
+        lattice = Lattice()
+        lattice.addAtoms(["Fe"] * 64, grid, atomIDs=np.arange(64, dtype=np.int32))
+        lattice.scalarsDict["KE"] = np.arange(64, dtype=np.float64)
+        lattice.vectorsDict["Force"] = grid.copy()
+        pos = lattice.pos.copy()
+        
+        # consecutive atoms along a Hilbert curve through a grid are neighbours
+        lattice.reorderAlongCurve("hilbert")
+        steps = np.diff(lattice.pos.reshape((-1, 3)), axis=0)
+        self.assertTrue(np.allclose(np.sum(steps * steps, axis=1), 1.0))
+        
+        # the per-atom data moves with the atoms
+        self.assertTrue(np.array_equal(lattice.atomID, lattice.permutation))
+        self.assertTrue(np.array_equal(lattice.scalarsDict["KE"], lattice.permutation))
+        self.assertTrue(np.array_equal(lattice.vectorsDict["Force"].ravel(), lattice.pos))
+        self.assertTrue(np.array_equal(lattice.inversePermutation[lattice.permutation], np.arange(64)))
+        
+        # order of the file
+        self.assertTrue(np.array_equal(lattice.fileOrderPositions(), pos))
+        self.assertTrue(np.array_equal(lattice.toFileOrder(lattice.atomID), np.arange(64)))
+        self.assertTrue(np.array_equal(lattice.fromFileOrder(np.arange(64)), lattice.atomID))
+        self.assertTrue(np.array_equal(lattice.fileOrderIndices([10, 3, 7]), sorted([10, 3, 7],
+                                                                                    key=lambda i: lattice.atomID[i])))
+        
+        # the first atoms along a Morton curve fill the first octant
+        lattice.reorderAlongCurve("morton")
+        self.assertTrue(np.all(lattice.pos[:24] <= 1.0))
+        self.assertTrue(np.array_equal(lattice.atomID, lattice.permutation))
+        
+        # atoms of another lattice are matched by their index in the file
+        ref = Lattice()
+        ref.addAtoms(["Fe"] * 64, grid + 0.5)
+        expected = (grid + 0.5)[lattice.permutation].ravel()
+        self.assertTrue(np.array_equal(lattice.matchingPositions(ref), expected))
+        ref.reorderAlongCurve("hilbert")
+        self.assertTrue(np.array_equal(lattice.matchingPositions(ref), expected))
+        self.assertTrue(np.array_equal(ref.matchingPositions(lattice), pos.reshape((-1, 3))[ref.permutation].ravel()))
+        
+        # atoms are written in the order of the file
+        with tempfile.NamedTemporaryFile() as tmpf:
+            lattice.writeLattice(tmpf.name)
+            tmpf.readline()
+            tmpf.readline()
+            written = np.asarray([[float(val) for val in line.split()[1:4]] for line in tmpf])
+            self.assertTrue(np.array_equal(written.ravel(), pos))
+        
+        # removing and adding atoms keeps the order of the file
+        lattice.removeAtoms([0, 5, 9])
+        self.assertTrue(np.array_equal(np.sort(lattice.permutation), np.arange(61)))
+        self.assertTrue(np.all(np.diff(lattice.toFileOrder(lattice.atomID)) > 0))
+        lattice.addAtoms(["Fe"], np.zeros((1, 3)), atomIDs=[100])
+        self.assertEqual(lattice.permutation[-1], 61)
+        
+        # bad orders/curves
+        self.assertRaises(ValueError, lattice.reorderAtoms, np.zeros(62, np.int32))
+        self.assertRaises(ValueError, lattice.reorderAtoms, np.arange(10))
+        self.assertRaises(ValueError, lattice.reorderAlongCurve, "peano")
@@ -0,0 +1,201 @@
+"""
+Unit tests for the parse cache
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import time
+import unittest
+import tempfile
+import shutil
+import threading
+import gzip
+
+import numpy as np
+
+from .. import latticeReaderGeneric
+from .. import parseCache
+from ..lattice import Lattice
+
+
+################################################################################
+
+def path_to_file(path):
+    return os.path.join(os.path.dirname(__file__), "..", "..", "..", "testing", path)
+
+################################################################################
+
+class TestParseCache(unittest.TestCase):
+    """
+    Test the parse cache
+    
+    """
+    def setUp(self):
+        """
+        Called before each test
+        
+        """
+        # tmp dir
+        self.tmpLocation = tempfile.mkdtemp(prefix="atomanTest")
+        self.cacheDir = os.path.join(self.tmpLocation, "cache")
+        
+        # file formats
+        fn = os.path.join(self.tmpLocation, "file_formats.IN")
+        with open(fn, "w") as fh:
+            fh.write(latticeReaderGeneric._defaultFileFormatsFile)
+        self.ffs = latticeReaderGeneric.FileFormats()
+        self.ffs.read(fn)
+        
+        # lattice reader with a cache
+        self.cache = parseCache.ParseCache(directory=self.cacheDir, maxSize=1073741824)
+        self.reader = latticeReaderGeneric.LatticeReaderGeneric(self.tmpLocation, cache=self.cache)
+    
+    def tearDown(self):
+        """
+        Called after each test
+        
+        """
+        # remove tmp dir
+        shutil.rmtree(self.tmpLocation)
+        
+        # remove refs
+        self.ffs = None
+        self.reader = None
+        self.cache = None
+    
+    def test_putGet(self):
+        """
+        Parse cache: put/get
+        
+        """
+        resultDict = {
+            "NAtoms": 3,
+            "xdim": 1.5,
+            "specieList": ["Fe", "He"],
+            "specieCount": [2, 1],
+            "Symbol": np.array([0, 1, 0], dtype=np.int32),
+            "Position": np.arange(9, dtype=np.float64).reshape((3, 3)),
+        }
+        self.assertIsNone(self.cache.get("abc"))
+        self.cache.put("abc", resultDict)
+        
+        cached = self.cache.get("abc")
+        self.assertEqual(sorted(cached.keys()), sorted(resultDict.keys()))
+        for key, value in resultDict.items():
+            if isinstance(value, np.ndarray):
+                self.assertEqual(cached[key].dtype, value.dtype)
+                self.assertTrue(np.array_equal(cached[key], value))
+            else:
+                self.assertEqual(cached[key], value)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+        
+        # corrupt files are removed
+        with open(os.path.join(self.cacheDir, "abc.cache"), "r+b") as fh:
+            fh.write(b"garbage")
+        self.assertIsNone(self.cache.get("abc"))
+        self.assertEqual(self.cache.size, 0)
+    
+    def test_evict(self):
+        """
+        Parse cache: LRU eviction
+        
+        """
+        resultDict = {"NAtoms": 1000, "Charge": np.zeros(1000, dtype=np.float64)}
+        self.cache.put("a", resultDict)
+        self.cache.put("b", resultDict)
+        fileSize = self.cache.size // 2
+        
+        # make "a" the most recently used
+        now = time.time()
+        os.utime(os.path.join(self.cacheDir, "b.cache"), (now - 10, now - 10))
+        self.assertIsNotNone(self.cache.get("a"))
+        
+        # adding a third file removes "b"
+        self.cache.setMaxSize(2 * fileSize)
+        self.cache.put("c", resultDict)
+        self.assertTrue(os.path.exists(os.path.join(self.cacheDir, "a.cache")))
+        self.assertFalse(os.path.exists(os.path.join(self.cacheDir, "b.cache")))
+        self.assertTrue(os.path.exists(os.path.join(self.cacheDir, "c.cache")))
+        
+        # disabled cache
+        self.cache.setMaxSize(0)
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.clear()
+        self.assertEqual(self.cache.size, 0)
+    
+    def test_putThreads(self):
+        """
+        Parse cache: put from several threads
+        
+        """
+        self.assertFalse(parseCache.ParseCache(directory=self.cacheDir).enabled)
+        
+        resultDict = {"NAtoms": 1000, "Charge": np.arange(1000, dtype=np.float64)}
+        threads = [threading.Thread(target=self.cache.put, args=("a", resultDict)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(os.listdir(self.cacheDir), ["a.cache"])
+        self.assertTrue(np.array_equal(self.cache.get("a")["Charge"], resultDict["Charge"]))
+    
+    def test_readFileCached(self):
+        """
+        Parse cache: reading files
+        
+        """
+        fmt = self.ffs.getFormat("LBOMD REF")
+        with open(path_to_file("anim-ref-Hdiff.xyz.gz"), "rb") as fh:
+            data = fh.read()
+        fn = os.path.join(self.tmpLocation, "ref.xyz.gz")
+        with open(fn, "wb") as fh:
+            fh.write(data)
+        
+        status, ref = self.reader.readFile(fn, fmt)
+        self.assertEqual(status, 0)
+        self.assertEqual(self.cache.misses, 1)
+        
+        # second read comes from the cache
+        status, state = self.reader.readFile(fn, fmt)
+        self.assertEqual(status, 0)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertIsInstance(state, Lattice)
+        self.assertEqual(state.NAtoms, ref.NAtoms)
+        self.assertEqual(state.specieList, ref.specieList)
+        self.assertTrue(np.array_equal(state.specieCount, ref.specieCount))
+        self.assertTrue(np.array_equal(state.atomID, ref.atomID))
+        self.assertTrue(np.array_equal(state.specie, ref.specie))
+        self.assertTrue(np.array_equal(state.pos, ref.pos))
+        self.assertTrue(np.array_equal(state.charge, ref.charge))
+        self.assertTrue(np.array_equal(state.cellDims, ref.cellDims))
+        self.assertEqual(sorted(state.scalarsDict.keys()), sorted(ref.scalarsDict.keys()))
+        for key in ref.scalarsDict:
+            self.assertTrue(np.array_equal(state.scalarsDict[key], ref.scalarsDict[key]))
+        for key in ref.vectorsDict:
+            self.assertTrue(np.array_equal(state.vectorsDict[key], ref.vectorsDict[key]))
+        
+        # linked lattice with the wrong number of atoms
+        linked = Lattice()
+        linked.NAtoms = 10
+        with self.assertRaises(ValueError):
+            self.reader.readFile(fn, fmt, linkedLattice=linked)
+        
+        # a projected read has a different key
+        status, state = self.reader.readFile(fn, fmt, columns=[])
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(len(state.scalarsDict), 0)
+        
+        # modifying the file invalidates the entry
+        with gzip.open(fn, "rb") as fh:
+            lines = fh.read().split(b"\n")
+        lines[3] = lines[3].replace(b"Pu", b"Fe", 1)
+        with gzip.open(fn, "wb") as fh:
+            fh.write(b"\n".join(lines))
+        os.utime(fn, (time.time() + 10, time.time() + 10))
+        
+        status, state = self.reader.readFile(fn, fmt)
+        self.assertEqual(self.cache.misses, 3)
+        self.assertIn("Fe", state.specieList)
@@ -0,0 +1,134 @@
+"""
+Unit tests for the frame prefetcher
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import time
+import threading
+import unittest
+
+from .. import prefetch
+
+
+################################################################################
+
+class TestFramePrefetcher(unittest.TestCase):
+    """
+    Test the frame prefetcher
+    
+    """
+    def setUp(self):
+        """
+        Called before each test
+        
+        """
+        self.loaded = []
+        self.lock = threading.Lock()
+    
+    def loadFrame(self, frame):
+        with self.lock:
+            self.loaded.append(frame)
+        
+        return frame * 10
+    
+    def waitForLoaded(self, num, timeout=5.0):
+        """
+        Wait until num frames have been loaded (or the timeout).
+        
+        """
+        end = time.time() + timeout
+        while time.time() < end:
+            with self.lock:
+                if len(self.loaded) >= num:
+                    break
+            time.sleep(0.01)
+        
+        # give the thread a chance to read more than it should
+        time.sleep(0.05)
+    
+    def test_order(self):
+        """
+        Prefetcher: order
+        
+        """
+        for maxFrames in (0, 1, 3):
+            self.loaded = []
+            with prefetch.FramePrefetcher(self.loadFrame, range(10), maxFrames=maxFrames) as prefetcher:
+                results = list(prefetcher)
+            
+            self.assertEqual(results, [(i, i * 10) for i in range(10)])
+            self.assertEqual(self.loaded, list(range(10)))
+    
+    def test_boundedQueue(self):
+        """
+        Prefetcher: bounded queue
+        
+        """
+        prefetcher = prefetch.FramePrefetcher(self.loadFrame, range(10), maxFrames=3)
+        try:
+            self.waitForLoaded(3)
+            self.assertEqual(len(self.loaded), 3)
+            
+            self.assertEqual(next(prefetcher), (0, 0))
+            self.waitForLoaded(4)
+            self.assertEqual(len(self.loaded), 4)
+        
+        finally:
+            prefetcher.close()
+    
+    def test_memoryBudget(self):
+        """
+        Prefetcher: memory budget
+        
+        """
+        # each frame uses 100 bytes so only 2 fit in the budget
+        prefetcher = prefetch.FramePrefetcher(self.loadFrame, range(10), maxFrames=5, memoryBudget=200,
+                                              sizeOf=lambda result: 100)
+        try:
+            self.waitForLoaded(2)
+            self.assertEqual(len(self.loaded), 2)
+            
+            self.assertEqual(next(prefetcher), (0, 0))
+            self.waitForLoaded(3)
+            self.assertEqual(len(self.loaded), 3)
+        
+        finally:
+            prefetcher.close()
+        
+        # a frame is always read ahead, even if it is bigger than the budget
+        prefetcher = prefetch.FramePrefetcher(self.loadFrame, range(2), maxFrames=5, memoryBudget=10,
+                                              sizeOf=lambda result: 100)
+        with prefetcher:
+            self.assertEqual(list(prefetcher), [(0, 0), (1, 10)])
+    
+    def test_error(self):
+        """
+        Prefetcher: errors
+        
+        """
+        def loadFrame(frame):
+            if frame == 2:
+                raise IOError("Could not read frame")
+            return frame
+        
+        for maxFrames in (0, 2):
+            with prefetch.FramePrefetcher(loadFrame, range(5), maxFrames=maxFrames) as prefetcher:
+                self.assertEqual(next(prefetcher), (0, 0))
+                self.assertEqual(next(prefetcher), (1, 1))
+                self.assertRaises(IOError, next, prefetcher)
+    
+    def test_close(self):
+        """
+        Prefetcher: close
+        
+        """
+        cleaned = []
+        prefetcher = prefetch.FramePrefetcher(self.loadFrame, range(10), maxFrames=3, cleanup=cleaned.append)
+        self.assertEqual(next(prefetcher), (0, 0))
+        self.waitForLoaded(4)
+        prefetcher.close()
+        
+        # the frames that were read ahead are cleaned up
+        self.assertEqual(cleaned, [10, 20, 30])
+        self.assertRaises(StopIteration, next, prefetcher)
@@ -0,0 +1,266 @@
+"""
+Unit tests for the SFTP sequence transfers
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+from .. import sftpTransfer
+
+
+################################################################################
+
+class _Attributes(object):
+    """
+    Attributes of a file (like paramiko.SFTPAttributes).
+    
+    """
+    def __init__(self, filename, st_mode):
+        self.filename = filename
+        self.st_mode = st_mode
+
+
+class _LocalSFTP(object):
+    """
+    SFTP client serving files from the local file system (only what the transfers use).
+    
+    """
+    def __init__(self, server):
+        self.server = server
+        self.closed = False
+        self.active = 0
+    
+    def listdir_attr(self, path):
+        with self.server.lock:
+            self.server.listings.append(path)
+            self.active += 1
+            if self.active > 1:
+                self.server.concurrentRequests += 1
+        
+        try:
+            # slow server
+            time.sleep(self.server.listingDelay)
+            
+            return [_Attributes(name, os.stat(os.path.join(path, name)).st_mode) for name in os.listdir(path)]
+        
+        finally:
+            with self.server.lock:
+                self.active -= 1
+    
+    def get(self, remotePath, localPath):
+        with self.server.lock:
+            self.server.downloaded.append(os.path.basename(remotePath))
+        shutil.copyfile(remotePath, localPath)
+    
+    def close(self):
+        self.closed = True
+
+
+class TestSequenceTransfers(unittest.TestCase):
+    """
+    Test the SFTP sequence transfers
+    
+    """
+    def setUp(self):
+        """
+        Called before each test
+        
+        """
+        # tmp dirs
+        self.tmpLocation = tempfile.mkdtemp(prefix="atomanTest")
+        self.remoteDir = os.path.join(self.tmpLocation, "remote")
+        self.localDir = os.path.join(self.tmpLocation, "local")
+        os.makedirs(self.remoteDir)
+        os.makedirs(self.localDir)
+        
+        # sequence of files, some compressed, plus files that should not be matched
+        self.fileSize = 100
+        names = ["lattice%04d.dat" % i for i in range(6)]
+        names[2] += ".gz"
+        names += ["lattice0003.dat.bz2", "lattice12.dat", "lattice0004.dat.old", "other0001.dat"]
+        for name in names:
+            with open(os.path.join(self.remoteDir, name), "w") as fh:
+                fh.write("x" * self.fileSize)
+        os.mkdir(os.path.join(self.remoteDir, "lattice0099.dat"))
+        
+        # server
+        self.lock = threading.Lock()
+        self.listings = []
+        self.downloaded = []
+        self.channels = []
+        self.concurrentRequests = 0
+        self.listingDelay = 0.0
+    
+    def tearDown(self):
+        """
+        Called after each test
+        
+        """
+        # remove tmp dir
+        shutil.rmtree(self.tmpLocation)
+    
+    def openChannel(self):
+        channel = _LocalSFTP(self)
+        with self.lock:
+            self.channels.append(channel)
+        
+        return channel
+    
+    def makeTransfers(self, **kwargs):
+        return sftpTransfer.SequenceTransfers(self.openChannel, self.remoteDir, self.localDir, **kwargs)
+    
+    def waitForDownloaded(self, num, timeout=5.0):
+        """
+        Wait until num files have been downloaded (or the timeout).
+        
+        """
+        end = time.time() + timeout
+        while time.time() < end:
+            with self.lock:
+                if len(self.downloaded) >= num:
+                    break
+            time.sleep(0.01)
+        
+        # give the threads a chance to download more than they should
+        time.sleep(0.05)
+    
+    def test_matchSequence(self):
+        """
+        SFTP transfers: match sequence
+        
+        """
+        with self.makeTransfers() as transfers:
+            matches = transfers.matchSequence("lattice%04d.dat")
+            self.assertEqual(matches, {0: "lattice0000.dat", 1: "lattice0001.dat", 2: "lattice0002.dat.gz",
+                                       3: "lattice0003.dat", 4: "lattice0004.dat", 5: "lattice0005.dat"})
+            
+            matches = transfers.matchSequence("lattice%d.dat")
+            self.assertEqual(matches, {12: "lattice12.dat"})
+            
+            self.assertRaises(ValueError, transfers.matchSequence, "lattice.dat")
+        
+        # the directory is only listed once
+        self.assertEqual(self.listings, [self.remoteDir])
+    
+    def test_fetch(self):
+        """
+        SFTP transfers: fetch
+        
+        """
+        # Roulette files (in the same directory or in a step directory)
+        with open(os.path.join(self.remoteDir, "Roulette0.OUT"), "w") as fh:
+            fh.write("roulette")
+        os.mkdir(os.path.join(self.tmpLocation, "Step1"))
+        with open(os.path.join(self.tmpLocation, "Step1", "Roulette.OUT"), "w") as fh:
+            fh.write("roulette")
+        
+        with self.makeTransfers(numChannels=2) as transfers:
+            transfers.matchSequence("lattice%04d.dat")
+            transfers.schedule(range(6))
+            
+            for i in range(6):
+                localPath = transfers.fetch(i)
+                self.assertEqual(os.path.dirname(localPath), self.localDir)
+                self.assertTrue(os.path.basename(localPath).startswith("lattice%04d.dat" % i))
+                self.assertEqual(os.path.getsize(localPath), self.fileSize)
+                transfers.release(i)
+            
+            # Roulette files are copied too
+            local = os.listdir(self.localDir)
+            self.assertIn("Roulette0.OUT", local)
+            self.assertIn("Roulette1.OUT", local)
+            self.assertNotIn("Roulette2.OUT", local)
+            
+            # missing files
+            self.assertRaises(IOError, transfers.fetch, 7)
+            self.assertGreaterEqual(transfers.bytesDownloaded, 6 * self.fileSize)
+        
+        # connections reused and closed, local copies deleted
+        self.assertLessEqual(len(self.channels), 3)
+        self.assertTrue(all(channel.closed for channel in self.channels))
+        self.assertEqual(os.listdir(self.localDir), [])
+        self.assertEqual(self.listings.count(self.remoteDir), 1)
+    
+    def test_listingThreads(self):
+        """
+        SFTP transfers: listing from the download threads
+        
+        """
+        # Roulette files in step directories, which are listed by the download threads
+        for i in range(6):
+            stepDir = os.path.join(self.tmpLocation, "Step%d" % i)
+            os.mkdir(stepDir)
+            with open(os.path.join(stepDir, "Roulette.OUT"), "w") as fh:
+                fh.write("roulette")
+        self.listingDelay = 0.02
+        
+        with self.makeTransfers(numChannels=3, lookAhead=6) as transfers:
+            transfers.matchSequence("lattice%04d.dat")
+            transfers.schedule(range(1, 6))
+            for i in range(1, 6):
+                transfers.fetch(i)
+                transfers.release(i)
+        
+        # the listing channel is not used by more than one thread at once and each directory is listed once
+        self.assertEqual(self.concurrentRequests, 0)
+        self.assertEqual(len(self.listings), len(set(self.listings)))
+    
+    def test_lookAhead(self):
+        """
+        SFTP transfers: look ahead
+        
+        """
+        with self.makeTransfers(numChannels=2, lookAhead=2) as transfers:
+            transfers.matchSequence("lattice%04d.dat")
+            transfers.schedule(range(1, 6))
+            
+            # only downloads ahead by the given number of files
+            self.waitForDownloaded(2)
+            self.assertEqual(sorted(self.downloaded), ["lattice0001.dat", "lattice0002.dat.gz"])
+            
+            # fetching out of order is not blocked by the look ahead
+            transfers.fetch(5)
+            self.assertIn("lattice0005.dat", self.downloaded)
+            
+            transfers.fetch(1)
+            self.waitForDownloaded(4)
+            self.assertIn("lattice0003.dat", self.downloaded)
+            self.assertNotIn("lattice0004.dat", self.downloaded)
+    
+    def test_diskLimit(self):
+        """
+        SFTP transfers: disk limit
+        
+        """
+        maxDiskBytes = 3 * self.fileSize
+        with self.makeTransfers(numChannels=1, lookAhead=6, maxDiskBytes=maxDiskBytes) as transfers:
+            transfers.matchSequence("lattice%04d.dat")
+            transfers.schedule(range(1, 6))
+            
+            self.waitForDownloaded(3)
+            self.assertEqual(len(self.downloaded), 3)
+            
+            for i in range(1, 6):
+                transfers.fetch(i)
+                transfers.release(i)
+                self.assertLessEqual(transfers.diskUsed, maxDiskBytes)
+            
+            # released files are deleted least recently used first
+            self.waitForDownloaded(5)
+            local = sorted(os.listdir(self.localDir))
+            self.assertEqual(local, ["lattice0003.dat", "lattice0004.dat", "lattice0005.dat"])
+            
+            # still on disk so not downloaded again
+            transfers.fetch(4)
+            self.assertEqual(transfers.cacheHits, 1)
+            self.assertEqual(len(self.downloaded), 5)
+            
+            # downloaded again
+            transfers.fetch(1)
+            self.assertEqual(self.downloaded.count("lattice0001.dat"), 2)
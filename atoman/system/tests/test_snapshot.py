@@ -0,0 +1,143 @@
+"""
+Unit tests for binary snapshots
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import unittest
+import tempfile
+import shutil
+
+import numpy as np
+
+from .. import snapshot
+from .. import latticeReaderGeneric
+from ..lattice import Lattice
+
+
+################################################################################
+
+def path_to_file(path):
+    return os.path.join(os.path.dirname(__file__), "..", "..", "..", "testing", path)
+
+def updateProgress(a, b, msg):
+    pass
+
+def hideProgess():
+    pass
+
+################################################################################
+
+class TestSnapshot(unittest.TestCase):
+    """
+    Test binary snapshots
+    
+    """
+    def setUp(self):
+        """
+        Called before each test
+        
+        """
+        # tmp dir
+        self.tmpLocation = tempfile.mkdtemp(prefix="atomanTest")
+        
+        # lattice
+        self.lattice = Lattice()
+        self.lattice.setDims([10.0, 11.0, 12.0])
+        self.lattice.PBC[:] = [1, 0, 1]
+        self.lattice.addAtom("Fe", [1.0, 2.0, 3.0], 0.5)
+        self.lattice.addAtom("Cr", [4.0, 5.0, 6.0], -0.5)
+        self.lattice.addAtom("Fe", [7.0, 8.0, 9.0], 0.0)
+        self.lattice.addAtom("He", [2.0, 4.0, 6.0], 1.0)
+        self.lattice.scalarsDict["KE"] = np.asarray([0.1, 0.2, 0.3, 0.4], dtype=np.float64)
+        self.lattice.vectorsDict["Force"] = np.arange(12, dtype=np.float64).reshape((4, 3))
+        self.lattice.attributes["Time"] = 12.5
+        self.lattice.attributes["Step"] = 100
+        
+        self.filename = os.path.join(self.tmpLocation, "test" + snapshot.SNAPSHOT_EXTENSION)
+    
+    def tearDown(self):
+        """
+        Called after each test
+        
+        """
+        # remove tmp dir
+        shutil.rmtree(self.tmpLocation)
+        
+        # remove refs
+        self.lattice = None
+    
+    def test_roundTrip(self):
+        """
+        Snapshot write/read
+        
+        """
+        self.lattice.writeLattice(self.filename, binary=True)
+        self.assertTrue(snapshot.isSnapshot(self.filename))
+        self.assertFalse(snapshot.isSnapshot(path_to_file("lattice.dat")))
+        
+        for memoryMap in (True, False):
+            state = snapshot.readSnapshot(self.filename, memoryMap=memoryMap)
+            
+            self.assertIsInstance(state, Lattice)
+            self.assertEqual(state.isMemoryMapped(), memoryMap)
+            self.assertEqual(state.NAtoms, 4)
+            self.assertTrue(np.allclose(state.cellDims, self.lattice.cellDims))
+            self.assertTrue(np.array_equal(state.PBC, self.lattice.PBC))
+            self.assertEqual(state.specieList, self.lattice.specieList)
+            self.assertTrue(np.array_equal(state.specieCount, self.lattice.specieCount))
+            self.assertTrue(np.allclose(state.specieMass, self.lattice.specieMass))
+            self.assertTrue(np.array_equal(state.specie, self.lattice.specie))
+            self.assertTrue(np.array_equal(state.atomID, self.lattice.atomID))
+            self.assertTrue(np.array_equal(state.pos, self.lattice.pos))
+            self.assertTrue(np.array_equal(state.charge, self.lattice.charge))
+            self.assertTrue(np.array_equal(state.scalarsDict["KE"], self.lattice.scalarsDict["KE"]))
+            self.assertTrue(np.array_equal(state.vectorsDict["Force"], self.lattice.vectorsDict["Force"]))
+            self.assertTrue(np.allclose(state.minPos, [1.0, 2.0, 3.0]))
+            self.assertTrue(np.allclose(state.maxPos, [7.0, 8.0, 9.0]))
+            self.assertEqual(state.attributes["Time"], 12.5)
+            self.assertEqual(state.attributes["Step"], 100)
+            
+            # modifying the state must not modify the file
+            state.pos[0] = 100.0
+            state.addAtom("Fe", [1.0, 1.0, 1.0], 0.0)
+            state = None
+            state = snapshot.readSnapshot(self.filename, memoryMap=memoryMap)
+            self.assertEqual(state.pos[0], 1.0)
+            self.assertEqual(state.NAtoms, 4)
+    
+    def test_visibleAtoms(self):
+        """
+        Snapshot write visible atoms
+        
+        """
+        visibleAtoms = np.asarray([0, 2, 3], dtype=np.int32)
+        self.lattice.writeLattice(self.filename, visibleAtoms=visibleAtoms, binary=True)
+        
+        state = snapshot.readSnapshot(self.filename)
+        
+        self.assertEqual(state.NAtoms, 3)
+        self.assertEqual(state.specieList, ["Fe", "He"])
+        self.assertTrue(np.array_equal(state.specieCount, [2, 1]))
+        self.assertTrue(np.array_equal(state.specie, [0, 0, 1]))
+        self.assertTrue(np.array_equal(state.atomID, self.lattice.atomID[visibleAtoms]))
+        self.assertTrue(np.array_equal(state.pos.reshape((-1, 3)), self.lattice.pos.reshape((-1, 3))[visibleAtoms]))
+        self.assertTrue(np.array_equal(state.scalarsDict["KE"], [0.1, 0.3, 0.4]))
+        self.assertTrue(np.array_equal(state.vectorsDict["Force"], self.lattice.vectorsDict["Force"][visibleAtoms]))
+    
+    def test_readFile(self):
+        """
+        Snapshot read via generic reader
+        
+        """
+        self.lattice.writeLattice(self.filename, binary=True)
+        
+        reader = latticeReaderGeneric.LatticeReaderGeneric(self.tmpLocation, updateProgress=updateProgress,
+                                                           hideProgress=hideProgess)
+        status, state = reader.readFile(self.filename, latticeReaderGeneric.snapshotFileFormat)
+        
+        self.assertEqual(status, 0)
+        self.assertIsInstance(state, Lattice)
+        self.assertEqual(state.NAtoms, 4)
+        self.assertTrue(np.array_equal(state.pos, self.lattice.pos))
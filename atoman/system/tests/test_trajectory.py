@@ -0,0 +1,216 @@
+"""
+Unit tests for trajectories
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import unittest
+import tempfile
+import shutil
+
+import numpy as np
+
+from .. import trajectory
+from .. import latticeReaderGeneric
+from ..lattice import Lattice
+
+
+################################################################################
+
+def path_to_file(path):
+    return os.path.join(os.path.dirname(__file__), "..", "..", "..", "testing", path)
+
+def updateProgress(a, b, msg):
+    pass
+
+def hideProgess():
+    pass
+
+################################################################################
+
+class TestTrajectory(unittest.TestCase):
+    """
+    Test trajectories
+    
+    """
+    def setUp(self):
+        """
+        Called before each test
+        
+        """
+        # tmp dir
+        self.tmpLocation = tempfile.mkdtemp(prefix="atomanTest")
+        
+        # lattice
+        self.lattice = Lattice()
+        self.lattice.setDims([10.0, 10.0, 10.0])
+        self.lattice.addAtom("Fe", [1.0, 2.0, 3.0], 0.5)
+        self.lattice.addAtom("Cr", [4.0, 5.0, 6.0], -0.5)
+        self.lattice.addAtom("Fe", [7.0, 8.0, 9.0], 0.0)
+        self.lattice.scalarsDict["KE"] = np.asarray([0.1, 0.2, 0.3], dtype=np.float64)
+        
+        self.filename = os.path.join(self.tmpLocation, "test" + trajectory.TRAJECTORY_EXTENSION)
+        
+        # lattice reader
+        self.reader = latticeReaderGeneric.LatticeReaderGeneric(self.tmpLocation, updateProgress=updateProgress,
+                                                                hideProgress=hideProgess)
+    
+    def tearDown(self):
+        """
+        Called after each test
+        
+        """
+        # remove tmp dir
+        shutil.rmtree(self.tmpLocation)
+        
+        # remove refs
+        self.lattice = None
+        self.reader = None
+    
+    def writeFrames(self, numFrames):
+        """
+        Write frames, shifting the positions and time each frame
+        
+        """
+        with trajectory.TrajectoryWriter(self.filename) as writer:
+            for i in range(numFrames):
+                self.lattice.attributes["Time"] = float(i)
+                writer.addFrame(self.lattice)
+                self.lattice.pos += 0.1
+                self.lattice.scalarsDict["KE"] *= 2
+    
+    def test_readFrames(self):
+        """
+        Trajectory random frame access
+        
+        """
+        pos0 = self.lattice.pos.copy()
+        self.writeFrames(5)
+        self.assertTrue(trajectory.isTrajectory(self.filename))
+        self.assertFalse(trajectory.isTrajectory(path_to_file("lattice.dat")))
+        
+        with trajectory.TrajectoryReader(self.filename) as reader:
+            self.assertEqual(reader.numFrames, 5)
+            self.assertEqual(len(reader), 5)
+            
+            for i in (3, 0, 4, 1, -1):
+                state = reader.readFrame(i)
+                frame = i % 5
+                
+                self.assertIsInstance(state, Lattice)
+                self.assertEqual(state.NAtoms, 3)
+                self.assertEqual(state.specieList, ["Fe", "Cr"])
+                self.assertTrue(np.array_equal(state.specieCount, [2, 1]))
+                self.assertTrue(np.array_equal(state.specie, [0, 1, 0]))
+                self.assertTrue(np.array_equal(state.atomID, [0, 1, 2]))
+                self.assertTrue(np.allclose(state.pos, pos0 + 0.1 * frame))
+                self.assertTrue(np.allclose(state.scalarsDict["KE"], np.asarray([0.1, 0.2, 0.3]) * 2 ** frame))
+                self.assertTrue(np.allclose(state.cellDims, [10.0, 10.0, 10.0]))
+                self.assertEqual(state.attributes["Time"], float(frame))
+                self.assertEqual(state.attributes["Frame"], frame)
+            
+            # frames are independent
+            state.pos[:] = 0
+            state.specie[:] = 1
+            state = reader.readFrame(4)
+            self.assertTrue(np.array_equal(state.specie, [0, 1, 0]))
+            self.assertTrue(np.allclose(state.pos, pos0 + 0.4))
+            
+            with self.assertRaises(IndexError):
+                reader.readFrame(5)
+    
+    def test_changingAtoms(self):
+        """
+        Trajectory with atoms added
+        
+        """
+        with trajectory.TrajectoryWriter(self.filename) as writer:
+            writer.addFrame(self.lattice)
+            self.lattice.addAtom("He", [5.0, 5.0, 5.0], 0.0, scalarVals={"KE": 0.4})
+            writer.addFrame(self.lattice)
+        
+        with trajectory.TrajectoryReader(self.filename) as reader:
+            state = reader.readFrame(1)
+            self.assertEqual(state.NAtoms, 4)
+            self.assertEqual(state.specieList, ["Fe", "Cr", "He"])
+            self.assertTrue(np.array_equal(state.specieCount, [2, 1, 1]))
+            self.assertTrue(np.array_equal(state.specie, [0, 1, 0, 2]))
+            self.assertTrue(np.array_equal(state.atomID, [0, 1, 2, 3]))
+            
+            state = reader.readFrame(0)
+            self.assertEqual(state.NAtoms, 3)
+            self.assertEqual(state.specieList, ["Fe", "Cr"])
+            self.assertTrue(np.array_equal(state.specie, [0, 1, 0]))
+    
+    def test_reorderedFrames(self):
+        """
+        Trajectory frames written in file order
+        
+        """
+        pos0 = self.lattice.pos.copy()
+        self.lattice.reorderAtoms([2, 0, 1])
+        self.writeFrames(2)
+        
+        with trajectory.TrajectoryReader(self.filename) as reader:
+            state = reader.readFrame(1)
+            self.assertIsNone(state.permutation)
+            self.assertTrue(np.array_equal(state.specie, [0, 1, 0]))
+            self.assertTrue(np.array_equal(state.atomID, [0, 1, 2]))
+            self.assertTrue(np.allclose(state.pos, pos0 + 0.1))
+            self.assertTrue(np.allclose(state.charge, [0.5, -0.5, 0.0]))
+            self.assertTrue(np.allclose(state.scalarsDict["KE"], [0.2, 0.4, 0.6]))
+    
+    def test_readFile(self):
+        """
+        Trajectory read via generic reader
+        
+        """
+        pos0 = self.lattice.pos.copy()
+        self.writeFrames(3)
+        
+        fmt = latticeReaderGeneric.trajectoryFileFormat
+        status, state = self.reader.readFile(self.filename, fmt)
+        self.assertEqual(status, 0)
+        self.assertTrue(np.allclose(state.pos, pos0))
+        
+        status, state = self.reader.readFile(self.filename, fmt, frameIndex=2)
+        self.assertEqual(status, 0)
+        self.assertTrue(np.allclose(state.pos, pos0 + 0.2))
+        self.assertEqual(self.reader.getTrajectory(self.filename).numFrames, 3)
+    
+    def test_convertSequence(self):
+        """
+        Trajectory convert file sequence
+        
+        """
+        ffs = latticeReaderGeneric.FileFormats()
+        fn = os.path.join(self.tmpLocation, "file_formats.IN")
+        with open(fn, "w") as fh:
+            fh.write(latticeReaderGeneric._defaultFileFormatsFile)
+        ffs.read(fn)
+        fmt = ffs.getFormat("LBOMD Lattice")
+        
+        # make a numbered sequence
+        for i in range(3):
+            shutil.copy(path_to_file("kenny_lattice.dat"), os.path.join(self.tmpLocation, "lattice%04d.dat" % i))
+        filenames = trajectory.sequenceFilenames(os.path.join(self.tmpLocation, "lattice%04d.dat"))
+        self.assertEqual(len(filenames), 3)
+        self.assertEqual(len(trajectory.sequenceFilenames(os.path.join(self.tmpLocation, "lattice%04d.dat"),
+                                                          minIndex=1, maxIndex=2)), 2)
+        with self.assertRaises(IOError):
+            trajectory.sequenceFilenames(os.path.join(self.tmpLocation, "lattice%04d.dat"), maxIndex=3)
+        
+        numFrames = trajectory.convertSequence(self.reader, filenames, fmt, self.filename)
+        self.assertEqual(numFrames, 3)
+        
+        status, ref = self.reader.readFile(filenames[0], fmt)
+        self.assertEqual(status, 0)
+        with trajectory.TrajectoryReader(self.filename) as reader:
+            self.assertEqual(reader.numFrames, 3)
+            state = reader.readFrame(2)
+            self.assertEqual(state.NAtoms, ref.NAtoms)
+            self.assertEqual(state.specieList, ref.specieList)
+            self.assertTrue(np.array_equal(state.specie, ref.specie))
+            self.assertTrue(np.array_equal(state.pos, ref.pos))
+            self.assertTrue(np.array_equal(state.charge, ref.charge))
@@ -0,0 +1,393 @@
+"""
+Multi-frame trajectory container.
+
+A trajectory file stores a sequence of frames (Lattices) in a single file. The file
+starts with a fixed size preamble (magic string, format version and the location
+and length of the frame index). The per-atom arrays of each frame follow, each one
+compressed separately (zlib). Species and atom IDs are usually the same for every
+frame so they are stored once, in the static section, and are only written for a
+frame if they differ from the first frame. The frame index (compressed JSON) is
+written at the end of the file, when the writer is closed.
+
+Since the frame index is read once when the file is opened, any frame can be read
+without reading the frames before it.
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import json
+import zlib
+import struct
+import logging
+
+import numpy as np
+
+from .lattice import Lattice
+from . import snapshot
+from . import compression
+import six
+
+
+# file extension for trajectories
+TRAJECTORY_EXTENSION = ".atraj"
+
+# magic string at the start of a trajectory file
+MAGIC = b"ATOMANTJ"
+
+# current version of the format
+VERSION = 1
+
+# preamble: magic, version, index offset, index length
+_PREAMBLE = struct.Struct("<8sIQQ")
+
+
+def isTrajectory(filename):
+    """
+    Return True if the given file is a trajectory.
+    
+    """
+    try:
+        with open(filename, "rb") as fh:
+            magic = fh.read(len(MAGIC))
+    except IOError:
+        return False
+    
+    return magic == MAGIC
+
+
+class TrajectoryWriter(object):
+    """
+    Write Lattices to a trajectory file, one frame at a time.
+    
+    The frame index is only written when the writer is closed.
+    
+    """
+    def __init__(self, filename, compressLevel=1):
+        self.logger = logging.getLogger(__name__ + ".TrajectoryWriter")
+        self.filename = filename
+        self.compressLevel = compressLevel
+        
+        self._static = None
+        self._frames = []
+        
+        # space for the preamble is reserved until the index is written
+        self._fh = open(filename, "wb")
+        self._fh.write(_PREAMBLE.pack(MAGIC, VERSION, 0, 0))
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    @property
+    def numFrames(self):
+        """
+        The number of frames written so far.
+        
+        """
+        return len(self._frames)
+    
+    def _writeColumn(self, kind, name, array, dtype):
+        """
+        Compress and write a per-atom array, returning its index entry.
+        
+        """
+        array = np.ascontiguousarray(array, dtype=dtype)
+        data = zlib.compress(array.tobytes(), self.compressLevel)
+        
+        offset = self._fh.tell()
+        self._fh.write(data)
+        
+        return {
+            "kind": kind,
+            "name": name,
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+            "length": len(data),
+        }
+    
+    def addFrame(self, lattice):
+        """
+        Append the Lattice to the trajectory as a new frame.
+        
+        The atoms are written in the order of the file the Lattice was read from, even if
+        they were reordered (see Lattice.reorderAlongCurve).
+        
+        """
+        if self._fh is None:
+            raise ValueError("Cannot add a frame to a closed trajectory")
+        
+        NAtoms = lattice.NAtoms
+        specieList = list(lattice.specieList)
+        specie = lattice.toFileOrder(lattice.specie[:NAtoms])
+        atomID = lattice.toFileOrder(lattice.atomID[:NAtoms])
+        
+        # the first frame defines the static columns
+        if self._static is None:
+            self._static = {
+                "NAtoms": NAtoms,
+                "specieList": specieList,
+                "specieCount": [int(count) for count in lattice.specieCount],
+                "columns": [self._writeColumn("specie", None, specie, "<i4"),
+                            self._writeColumn("atomID", None, atomID, "<i4")],
+            }
+            self._staticSpecie = np.array(specie, dtype=np.int32)
+            self._staticAtomID = np.array(atomID, dtype=np.int32)
+        
+        columns = []
+        frame = {
+            "NAtoms": NAtoms,
+            "cellDims": [float(val) for val in lattice.cellDims],
+            "PBC": [int(val) for val in lattice.PBC],
+            "attributes": {},
+            "columns": columns,
+        }
+        
+        # species and atom IDs are only written if they differ from the first frame
+        sameNAtoms = NAtoms == self._static["NAtoms"]
+        if not sameNAtoms or specieList != self._static["specieList"] or not np.array_equal(specie, self._staticSpecie):
+            frame["specieList"] = specieList
+            frame["specieCount"] = [int(count) for count in lattice.specieCount]
+            columns.append(self._writeColumn("specie", None, specie, "<i4"))
+        if not sameNAtoms or not np.array_equal(atomID, self._staticAtomID):
+            columns.append(self._writeColumn("atomID", None, atomID, "<i4"))
+        
+        # positions, charges, scalars and vectors are always written
+        pos = lattice.toFileOrder(lattice.pos[:3 * NAtoms].reshape((-1, 3)))
+        columns.append(self._writeColumn("pos", None, pos.reshape(-1), "<f8"))
+        columns.append(self._writeColumn("charge", None, lattice.toFileOrder(lattice.charge[:NAtoms]), "<f8"))
+        for name in sorted(lattice.scalarsDict.keys()):
+            scalars = lattice.toFileOrder(lattice.scalarsDict[name][:NAtoms])
+            columns.append(self._writeColumn("scalar", name, scalars, "<f8"))
+        for name in sorted(lattice.vectorsDict.keys()):
+            vectors = lattice.toFileOrder(np.asarray(lattice.vectorsDict[name]).reshape((-1, 3))[:NAtoms])
+            columns.append(self._writeColumn("vector", name, vectors, "<f8"))
+        
+        # lattice attributes that can be stored
+        for key, value in six.iteritems(lattice.attributes):
+            jsonValue = snapshot._jsonValue(value)
+            if jsonValue is None:
+                self.logger.warning("Cannot store attribute '%s' in trajectory (%r)", key, type(value))
+            else:
+                frame["attributes"][key] = jsonValue
+        
+        self._frames.append(frame)
+    
+    def close(self):
+        """
+        Write the frame index and close the file.
+        
+        """
+        if self._fh is None:
+            return
+        
+        try:
+            index = {"static": self._static, "frames": self._frames}
+            data = zlib.compress(json.dumps(index, sort_keys=True).encode("utf-8"), self.compressLevel)
+            
+            indexOffset = self._fh.tell()
+            self._fh.write(data)
+            
+            self._fh.seek(0)
+            self._fh.write(_PREAMBLE.pack(MAGIC, VERSION, indexOffset, len(data)))
+        
+        finally:
+            self._fh.close()
+            self._fh = None
+        
+        self.logger.debug("Wrote trajectory with %d frames: '%s'", len(self._frames), self.filename)
+
+
+class TrajectoryReader(object):
+    """
+    Read frames from a trajectory file.
+    
+    The frame index is read when the file is opened, after which frames can be read
+    in any order.
+    
+    """
+    def __init__(self, filename):
+        self.logger = logging.getLogger(__name__ + ".TrajectoryReader")
+        self.filename = filename
+        
+        self._fh = open(filename, "rb")
+        try:
+            preamble = self._fh.read(_PREAMBLE.size)
+            if len(preamble) != _PREAMBLE.size:
+                raise IOError("File is too short to be a trajectory: '%s'" % filename)
+            magic, version, indexOffset, indexLength = _PREAMBLE.unpack(preamble)
+            if magic != MAGIC:
+                raise IOError("File is not a trajectory: '%s'" % filename)
+            if version > VERSION:
+                raise IOError("Unsupported trajectory version (%d > %d): '%s'" % (version, VERSION, filename))
+            if not indexLength:
+                raise IOError("Trajectory has no frame index (was the writer closed?): '%s'" % filename)
+            
+            self._fh.seek(indexOffset)
+            index = json.loads(zlib.decompress(self._fh.read(indexLength)).decode("utf-8"))
+        
+        except:
+            self._fh.close()
+            raise
+        
+        self._static = index["static"]
+        self._frames = index["frames"]
+        self._staticColumns = None
+        
+        self.logger.debug("Opened trajectory with %d frames: '%s'", len(self._frames), filename)
+    
+    def __len__(self):
+        return len(self._frames)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    @property
+    def numFrames(self):
+        """
+        The number of frames in the trajectory.
+        
+        """
+        return len(self._frames)
+    
+    def close(self):
+        """
+        Close the file.
+        
+        """
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+    
+    def _readColumn(self, column):
+        """
+        Read and decompress a per-atom array.
+        
+        """
+        self._fh.seek(column["offset"])
+        data = zlib.decompress(self._fh.read(column["length"]))
+        dtype = np.dtype(str(column["dtype"]))
+        
+        # astype makes a writeable copy in native byte order
+        return np.frombuffer(data, dtype=dtype).reshape(column["shape"]).astype(dtype.newbyteorder("="))
+    
+    def readFrame(self, index):
+        """
+        Read the given frame and return a Lattice.
+        
+        """
+        if self._fh is None:
+            raise ValueError("Cannot read from a closed trajectory")
+        if index < 0:
+            index += len(self._frames)
+        if index < 0 or index >= len(self._frames):
+            raise IndexError("Frame index out of range (%d frames): %d" % (len(self._frames), index))
+        
+        frame = self._frames[index]
+        
+        # static columns are only decompressed once
+        if self._staticColumns is None:
+            self._staticColumns = dict((column["kind"], self._readColumn(column)) for column in self._static["columns"])
+        
+        # create the lattice
+        lattice = Lattice()
+        lattice.NAtoms = frame["NAtoms"]
+        lattice.cellDims = np.asarray(frame["cellDims"], dtype=np.float64)
+        lattice.PBC = np.asarray(frame["PBC"], dtype=np.int32)
+        lattice.specie = self._staticColumns["specie"].copy()
+        lattice.atomID = self._staticColumns["atomID"].copy()
+        
+        for column in frame["columns"]:
+            kind = column["kind"]
+            array = self._readColumn(column)
+            if kind == "atomID":
+                lattice.atomID = array
+            elif kind == "specie":
+                lattice.specie = array
+            elif kind == "pos":
+                lattice.pos = array
+            elif kind == "charge":
+                lattice.charge = array
+            elif kind == "scalar":
+                lattice.scalarsDict[column["name"]] = array
+            elif kind == "vector":
+                lattice.vectorsDict[column["name"]] = array
+            else:
+                self.logger.warning("Ignoring unrecognised column in trajectory: '%s'", kind)
+        
+        # species
+        lattice.specieList = list(frame.get("specieList", self._static["specieList"]))
+        numSpecies = len(lattice.specieList)
+        lattice.specieCount = np.asarray(frame.get("specieCount", self._static["specieCount"]), dtype=np.int32)
+        lattice.specieMass = np.empty(numSpecies, np.float64)
+        lattice.specieCovalentRadius = np.empty(numSpecies, np.float64)
+        lattice.specieAtomicNumber = np.empty(numSpecies, np.int32)
+        lattice.specieRGB = np.empty((numSpecies, 3), np.float64)
+        lattice.refreshElementProperties()
+        
+        if lattice.NAtoms:
+            pos = lattice.pos.reshape((-1, 3))
+            lattice.minPos = pos.min(axis=0)
+            lattice.maxPos = pos.max(axis=0)
+        
+        lattice.attributes = dict(frame["attributes"])
+        lattice.attributes["Frame"] = index
+        
+        return lattice
+
+
+def sequenceFilenames(fileText, minIndex=0, maxIndex=-1, interval=1):
+    """
+    Return the files in a numbered sequence, eg. fileText = "PuGaH%04d.xyz".
+    
+    If maxIndex is less than minIndex all the files we can find are returned
+    (stopping at the first missing file). Zipped files are included.
+    
+    """
+    filenames = []
+    i = minIndex
+    while maxIndex < minIndex or i <= maxIndex:
+        filename = fileText % i
+        filepath = compression.locateFile(filename)
+        if filepath is None:
+            if maxIndex >= minIndex:
+                raise IOError("Could not locate file in sequence: '%s'" % filename)
+            break
+        filenames.append(filepath)
+        
+        i += interval
+    
+    return filenames
+
+
+def convertSequence(reader, filenames, fileFormat, outputFilename, linkedLattice=None, updateProgress=None,
+                    compressLevel=1):
+    """
+    Convert a sequence of files (read with the given LatticeReaderGeneric) to a trajectory.
+    
+    Returns the number of frames written.
+    
+    """
+    logger = logging.getLogger(__name__)
+    logger.info("Converting %d files to trajectory: '%s'", len(filenames), outputFilename)
+    
+    numFiles = len(filenames)
+    with TrajectoryWriter(outputFilename, compressLevel=compressLevel) as writer:
+        for count, filename in enumerate(filenames):
+            if updateProgress is not None:
+                updateProgress(count, numFiles, "Converting to trajectory")
+            
+            status, state = reader.readFile(filename, fileFormat, linkedLattice=linkedLattice)
+            if status:
+                raise IOError("Could not read file (status %d): '%s'" % (status, filename))
+            
+            writer.addFrame(state)
+    
+    return numFiles
@@ -0,0 +1,207 @@
+"""
+Unit tests for the batch runner
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import sys
+import json
+import unittest
+import tempfile
+import shutil
+import subprocess
+
+import numpy as np
+
+from .. import batch
+from ..filtering import filterer
+from ..system import latticeReaderGeneric
+from ..system import trajectory
+
+
+################################################################################
+
+class TestBatch(unittest.TestCase):
+    """
+    Test the batch runner
+    
+    """
+    def setUp(self):
+        """
+        Called before each test
+        
+        """
+        # tmp dir
+        self.tmpLocation = tempfile.mkdtemp(prefix="atomanTest")
+        
+        # file formats
+        self.fileFormats = os.path.join(self.tmpLocation, "file_formats.IN")
+        with open(self.fileFormats, "w") as fh:
+            fh.write(latticeReaderGeneric._defaultFileFormatsFile)
+        
+        # simple cubic lattice; in frame i atom i is moved to an interstitial site
+        sites = [(x, y, z) for x in range(4) for y in range(4) for z in range(4)]
+        sites = 2.0 * np.asarray(sites, dtype=np.float64)
+        self.numFrames = 5
+        for i in range(self.numFrames):
+            pos = sites.copy()
+            if i > 0:
+                pos[i] += 1.0
+            with open(os.path.join(self.tmpLocation, "lattice%04d.dat" % i), "w") as fh:
+                fh.write("%d\n" % len(pos))
+                fh.write("8.0 8.0 8.0\n")
+                for x, y, z in pos:
+                    fh.write("Fe %f %f %f 0.0\n" % (x, y, z))
+    
+    def tearDown(self):
+        """
+        Called after each test
+        
+        """
+        # remove tmp dir
+        shutil.rmtree(self.tmpLocation)
+    
+    def makePipeline(self, output, filters, **options):
+        """
+        Write a pipeline definition (with any other options) and read it.
+        
+        """
+        definition = {
+            "input": "lattice%04d.dat",
+            "inputFormat": "LBOMD Lattice",
+            "ref": "lattice0000.dat",
+            "first": 1,
+            "fileFormats": "file_formats.IN",
+            "filters": filters,
+            "output": output,
+        }
+        definition.update(options)
+        fn = os.path.join(self.tmpLocation, "%s.json" % output)
+        with open(fn, "w") as fh:
+            json.dump(definition, fh)
+        
+        return batch.Pipeline.fromFile(fn)
+    
+    def test_filterSettings(self):
+        """
+        Batch filter settings
+        
+        """
+        for filterName in filterer.Filterer.defaultFilters:
+            settings = batch.makeFilterSettings(filterName)
+            self.assertTrue(type(settings).__name__.endswith("FilterSettings"))
+        
+        settings = batch.makeFilterSettings("Point defects", {"vacancyRadius": 1.1})
+        self.assertEqual(settings.getSetting("vacancyRadius"), 1.1)
+        
+        settings = batch.makeFilterSettings("Scalar: Charge", {"minVal": 0.5})
+        self.assertEqual(settings.getSetting("scalarsName"), "Charge")
+        
+        self.assertRaises(ValueError, batch.makeFilterSettings, "Not a filter")
+        self.assertRaises(ValueError, batch.makeFilterSettings, "Point defects", {"notASetting": 1})
+    
+    def test_pipeline(self):
+        """
+        Batch pipeline
+        
+        """
+        filters = [{"name": "Point defects", "settings": {"findClusters": True, "neighbourRadius": 2.5,
+                                                          "minClusterSize": 1}}]
+        pipeline = self.makePipeline("serial", filters)
+        serial = batch.runPipeline(pipeline, numWorkers=1)
+        
+        # frames are detected automatically
+        self.assertEqual([summary["frame"] for summary in serial], list(range(1, self.numFrames)))
+        
+        # each frame has one Frenkel pair
+        for summary in serial:
+            self.assertEqual(summary["vacancies"], 1)
+            self.assertEqual(summary["interstitials"], 1)
+        
+        results = np.load(os.path.join(pipeline.output, "frame000002.npz"))
+        self.assertEqual(list(results["vacancies"]), [2])
+        self.assertEqual(list(results["interstitials"]), [2])
+        self.assertEqual(len(results["clusterVacanciesOffsets"]), serial[1]["clusters"] + 1)
+        
+        with open(os.path.join(pipeline.output, "summary.csv")) as fh:
+            lines = fh.read().splitlines()
+        self.assertEqual(lines[0], ",".join(batch.SUMMARY_COLUMNS))
+        self.assertEqual(len(lines), self.numFrames)
+        
+        # same results in worker processes
+        pipeline = self.makePipeline("parallel", filters)
+        parallel = batch.runPipeline(pipeline, numWorkers=2)
+        for summary1, summary2 in zip(serial, parallel):
+            self.assertEqual(summary1, summary2)
+            fn1 = os.path.join(self.tmpLocation, "serial", "frame%06d.npz" % summary1["frame"])
+            fn2 = os.path.join(self.tmpLocation, "parallel", "frame%06d.npz" % summary2["frame"])
+            results1 = np.load(fn1)
+            results2 = np.load(fn2)
+            self.assertEqual(sorted(results1.files), sorted(results2.files))
+            for key in results1.files:
+                self.assertTrue(np.array_equal(results1[key], results2[key]))
+    
+    def test_pipelineReordered(self):
+        """
+        Batch pipeline with reordered atoms
+        
+        """
+        filters = [{"name": "Point defects", "settings": {"findClusters": True, "neighbourRadius": 2.5,
+                                                          "minClusterSize": 1}}]
+        pipeline = self.makePipeline("hilbert", filters, reorder="hilbert")
+        batch.runPipeline(pipeline, numWorkers=1)
+        
+        # indexes refer to the order of the files
+        results = np.load(os.path.join(pipeline.output, "frame000002.npz"))
+        self.assertEqual(list(results["vacancies"]), [2])
+        self.assertEqual(list(results["interstitials"]), [2])
+        self.assertEqual(list(results["clusterVacancies"]), [2])
+        
+        # displacements are calculated relative to the same atom of the reference
+        filters = [{"name": "Displacement", "settings": {"filteringEnabled": True, "minDisplacement": 1.0}}]
+        pipeline = self.makePipeline("morton", filters, reorder="morton")
+        summaries = batch.runPipeline(pipeline, numWorkers=1)
+        self.assertEqual([summary["visible"] for summary in summaries], [1] * (self.numFrames - 1))
+        results = np.load(os.path.join(pipeline.output, "frame000003.npz"))
+        self.assertEqual(list(results["visibleAtoms"]), [3])
+        
+        self.assertRaises(ValueError, self.makePipeline, "peano", filters, reorder="peano")
+    
+    def test_convert(self):
+        """
+        Batch convert to trajectory
+        
+        """
+        pipeline = self.makePipeline("convert", [], reorder="hilbert", first=0)
+        filename = os.path.join(self.tmpLocation, "lattice" + trajectory.TRAJECTORY_EXTENSION)
+        fn = os.path.join(self.tmpLocation, "convert.json")
+        self.assertEqual(batch.main(["--convert", filename, "--last", "3", fn]), 0)
+        
+        with trajectory.TrajectoryReader(filename) as reader:
+            self.assertEqual(reader.numFrames, 4)
+            state = reader.readFrame(2)
+        
+        # the frames are written in the order of the files
+        reader = latticeReaderGeneric.LatticeReaderGeneric(tmpLocation=self.tmpLocation)
+        fileFormats = latticeReaderGeneric.FileFormats()
+        fileFormats.read(self.fileFormats)
+        status, ref = reader.readFile(pipeline.inputFile(2), fileFormats.getFormat("LBOMD Lattice"))
+        self.assertEqual(status, 0)
+        self.assertEqual(state.NAtoms, ref.NAtoms)
+        self.assertTrue(np.allclose(state.pos, ref.pos))
+        
+        # the input is already a trajectory
+        pipeline.input = filename
+        self.assertRaises(ValueError, batch.convertPipeline, pipeline, filename)
+    
+    def test_noGuiImports(self):
+        """
+        Batch does not import Qt or VTK
+        
+        """
+        code = ("import sys; import atoman.batch; "
+                "print(sorted(set(m.split('.')[0] for m in sys.modules) & set(['PySide', 'PyQt4', 'PyQt5', 'vtk'])))")
+        cwd = os.path.join(os.path.dirname(__file__), "..", "..")
+        output = subprocess.check_output([sys.executable, "-c", code], cwd=cwd)
+        self.assertEqual(output.decode("utf-8").strip(), "[]")
@@ -0,0 +1,218 @@
+/*******************************************************************************
+ ** Build and query k-d trees (see kdtree.py)
+ *******************************************************************************/
+
+#define NPY_NO_DEPRECATED_API NPY_1_7_API_VERSION
+
+#include <Python.h> // includes stdio.h, string.h, errno.h, stdlib.h
+#include <numpy/arrayobject.h>
+#include "visclibs/kdtree.h"
+#include "visclibs/array_utils.h"
+#include "gui/preferences.h"
+
+#if PY_MAJOR_VERSION >= 3
+    #define MOD_ERROR_VAL NULL
+    #define MOD_SUCCESS_VAL(val) val
+    #define MOD_INIT(name) PyMODINIT_FUNC PyInit_##name(void)
+    #define MOD_DEF(ob, name, doc, methods) \
+        static struct PyModuleDef moduledef = { \
+            PyModuleDef_HEAD_INIT, name, doc, -1, methods, }; \
+        ob = PyModule_Create(&moduledef);
+#else
+    #define MOD_ERROR_VAL
+    #define MOD_SUCCESS_VAL(val)
+    #define MOD_INIT(name) void init##name(void)
+    #define MOD_DEF(ob, name, doc, methods) \
+        ob = Py_InitModule3(name, methods, doc);
+#endif
+
+static PyObject* build(PyObject*, PyObject*);
+static PyObject* nearest(PyObject*, PyObject*);
+static PyObject* withinRadius(PyObject*, PyObject*);
+static void destroyKDTree(PyObject*);
+static PyObject* resultArrays(int, int *, double *);
+
+
+/*******************************************************************************
+ ** List of python methods available in this module
+ *******************************************************************************/
+static struct PyMethodDef module_methods[] = {
+    {"build", build, METH_VARARGS, "Build a k-d tree of the given positions, returning it in a capsule"},
+    {"nearest", nearest, METH_VARARGS, "Return the indexes and squared separations of the k nearest points"},
+    {"withinRadius", withinRadius, METH_VARARGS, "Return the indexes and squared separations of the points within a radius"},
+    {NULL, NULL, 0, NULL}
+};
+
+/*******************************************************************************
+ ** Module initialisation function
+ *******************************************************************************/
+MOD_INIT(_kdtree)
+{
+    PyObject *mod;
+
+    MOD_DEF(mod, "_kdtree", "k-d tree C extension", module_methods)
+    if (mod == NULL)
+        return MOD_ERROR_VAL;
+
+    import_array();
+
+    return MOD_SUCCESS_VAL(mod);
+}
+
+/*******************************************************************************
+ ** Free the tree when the capsule is destroyed
+ *******************************************************************************/
+static void
+destroyKDTree(PyObject *capsule)
+{
+    struct KDTree *tree;
+
+    tree = (struct KDTree *) PyCapsule_GetPointer(capsule, KDTREE_CAPSULE_NAME);
+    if (tree != NULL) freeKDTree(tree);
+}
+
+/*******************************************************************************
+ ** Build a k-d tree of the given positions, returning it in a capsule
+ *******************************************************************************/
+static PyObject*
+build(PyObject *self, PyObject *args)
+{
+    int NPoints;
+    double *pos;
+    PyArrayObject *posIn=NULL;
+    PyObject *capsule;
+    struct KDTree *tree;
+
+    /* parse and check arguments from Python */
+    if (!PyArg_ParseTuple(args, "O!", &PyArray_Type, &posIn))
+        return NULL;
+
+    if (not_doubleVector(posIn)) return NULL;
+    pos = pyvector_to_Cptr_double(posIn);
+    NPoints = (int) PyArray_DIM(posIn, 0) / 3;
+
+    /* build the tree */
+    tree = buildKDTree(NPoints, pos, prefs_numThreads);
+    if (tree == NULL) return NULL;
+
+    /* capsule frees the tree when it is destroyed */
+    capsule = PyCapsule_New((void *) tree, KDTREE_CAPSULE_NAME, destroyKDTree);
+    if (capsule == NULL)
+    {
+        freeKDTree(tree);
+        return NULL;
+    }
+
+    return capsule;
+}
+
+/*******************************************************************************
+ ** Return a tuple of numpy arrays of the given indexes and squared separations
+ *******************************************************************************/
+static PyObject*
+resultArrays(int count, int *indexes, double *sep2)
+{
+    npy_intp dims[1];
+    PyArrayObject *indexesOut=NULL;
+    PyArrayObject *sep2Out=NULL;
+
+    dims[0] = (npy_intp) count;
+    indexesOut = (PyArrayObject *) PyArray_SimpleNew(1, dims, NPY_INT32);
+    if (indexesOut == NULL) return NULL;
+    sep2Out = (PyArrayObject *) PyArray_SimpleNew(1, dims, NPY_FLOAT64);
+    if (sep2Out == NULL)
+    {
+        Py_DECREF(indexesOut);
+        return NULL;
+    }
+
+    if (count > 0)
+    {
+        memcpy(PyArray_DATA(indexesOut), indexes, count * sizeof(int));
+        memcpy(PyArray_DATA(sep2Out), sep2, count * sizeof(double));
+    }
+
+    return Py_BuildValue("NN", indexesOut, sep2Out);
+}
+
+/*******************************************************************************
+ ** Return the indexes and squared separations of the k nearest points to the
+ ** given point (nearest first)
+ *******************************************************************************/
+static PyObject*
+nearest(PyObject *self, PyObject *args)
+{
+    int k, count, *indexes;
+    double *point, *sep2;
+    PyArrayObject *pointIn=NULL;
+    PyObject *capsule, *result;
+    struct KDTree *tree;
+
+    /* parse and check arguments from Python */
+    if (!PyArg_ParseTuple(args, "OO!i", &capsule, &PyArray_Type, &pointIn, &k))
+        return NULL;
+
+    tree = (struct KDTree *) PyCapsule_GetPointer(capsule, KDTREE_CAPSULE_NAME);
+    if (tree == NULL) return NULL;
+
+    if (not_doubleVector(pointIn)) return NULL;
+    point = pyvector_to_Cptr_double(pointIn);
+
+    if (k > tree->NPoints) k = tree->NPoints;
+    if (k < 0) k = 0;
+
+    /* query the tree */
+    indexes = malloc((k > 0 ? k : 1) * sizeof(int));
+    sep2 = malloc((k > 0 ? k : 1) * sizeof(double));
+    if (indexes == NULL || sep2 == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate k-d tree results");
+        free(indexes);
+        free(sep2);
+        return NULL;
+    }
+
+    count = kdtreeNearest(tree, point, k, indexes, sep2);
+    if (count < 0) result = NULL;
+    else result = resultArrays(count, indexes, sep2);
+
+    free(indexes);
+    free(sep2);
+
+    return result;
+}
+
+/*******************************************************************************
+ ** Return the indexes and squared separations of the points within the given
+ ** radius of the given point (nearest first)
+ *******************************************************************************/
+static PyObject*
+withinRadius(PyObject *self, PyObject *args)
+{
+    int count, *indexes;
+    double radius, *point, *sep2;
+    PyArrayObject *pointIn=NULL;
+    PyObject *capsule, *result;
+    struct KDTree *tree;
+
+    /* parse and check arguments from Python */
+    if (!PyArg_ParseTuple(args, "OO!d", &capsule, &PyArray_Type, &pointIn, &radius))
+        return NULL;
+
+    tree = (struct KDTree *) PyCapsule_GetPointer(capsule, KDTREE_CAPSULE_NAME);
+    if (tree == NULL) return NULL;
+
+    if (not_doubleVector(pointIn)) return NULL;
+    point = pyvector_to_Cptr_double(pointIn);
+
+    /* query the tree */
+    count = kdtreeWithinRadius(tree, point, radius, &indexes, &sep2);
+    if (count < 0) return NULL;
+
+    result = resultArrays(count, indexes, sep2);
+
+    free(indexes);
+    free(sep2);
+
+    return result;
+}
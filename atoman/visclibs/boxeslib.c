@@ -10,8 +10,14 @@
  ** 
  ** Call putAtomInBoxes() to add atoms to the boxes
  ** 
+ ** The atoms are stored in compressed-row form: the atoms in box i are
+ ** boxAtoms[boxOffsets[i]] to boxAtoms[boxOffsets[i + 1] - 1]
+ ** 
  ** The Boxes structure must be freed by calling freeBoxes()
  ** 
+ ** Call boxVisibleAtoms() to use the shared boxes of a spatial index when
+ ** possible (see atoman.visclibs.spatialIndex)
+ ** 
  *******************************************************************************/
 
 
@@ -73,79 +79,117 @@ struct Boxes * setupBoxes(double approxBoxWidth, int *PBC, double *cellDims)
     /* total number of boxes */
     boxes->totNBoxes = boxes->NBoxes[0] * boxes->NBoxes[1] * boxes->NBoxes[2];
     
-    /* amount of memory to allocate at a time */
-    boxes->allocChunk = 16;
+    boxes->NAtoms = 0;
+    boxes->pos = NULL;
+    boxes->shared = 0;
     
-    /* allocate arrays for storing counters and atoms */
-    boxes->boxNAtoms = calloc(boxes->totNBoxes, sizeof(int));
-    if (boxes->boxNAtoms == NULL)
+    /* allocate offsets (the boxes are empty until atoms are added) */
+    boxes->boxOffsets = calloc(boxes->totNBoxes + 1, sizeof(int));
+    if (boxes->boxOffsets == NULL)
     {
-        PyErr_SetString(PyExc_MemoryError, "Could not allocate boxNAtoms");
-        free(boxes);
-        return NULL;
-    }
-    boxes->boxAtoms = malloc(boxes->totNBoxes * sizeof(int *));
-    if (boxes->boxAtoms == NULL)
-    {
-        PyErr_SetString(PyExc_MemoryError, "Could not allocate boxAtoms");
-        free(boxes->boxNAtoms);
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate boxOffsets");
         free(boxes);
         return NULL;
     }
+    boxes->boxAtoms = NULL;
     
     return boxes;
 }
 
 /*******************************************************************************
- ** put atoms into boxes
+ ** put atoms into boxes (replacing any atoms already in them)
+ ** 
+ ** Two pass counting sort: count the atoms in each box, then place them in a
+ ** single array, so the atoms in each box are contiguous (and in order)
  *******************************************************************************/
 int putAtomsInBoxes(int NAtoms, double *pos, struct Boxes *boxes)
 {
-    int i, boxIndex, newsize;
-    int status = 0;
+    int i, *atomBox, *boxOffsets;
     
     
-    /* loop over all atoms */
-    for (i=0; i<NAtoms; i++)
+    /* box index of each atom */
+    atomBox = malloc(NAtoms * sizeof(int));
+    if (atomBox == NULL && NAtoms > 0)
     {
-        /* find which box this atom belongs to */
-        boxIndex = boxIndexOfAtom(pos[3*i], pos[3*i+1], pos[3*i+2], boxes);
-        
-        /* check if this box is empty or full and alloc/realloc as required */
-        if (boxes->boxNAtoms[boxIndex] == 0)
-        {
-            /* allocate this box */
-            boxes->boxAtoms[boxIndex] = malloc(boxes->allocChunk * sizeof(int));
-            if (boxes->boxAtoms[boxIndex] == NULL)
-            {
-                char errstring[128];
-                sprintf(errstring, "Could not allocate boxAtoms[%d]", boxIndex);
-                PyErr_SetString(PyExc_MemoryError, errstring);
-                freeBoxes(boxes);
-                return 1;
-            }
-        }
-        
-        else if (boxes->boxNAtoms[boxIndex] % boxes->allocChunk == 0)
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate atomBox");
+        freeBoxes(boxes);
+        return 1;
+    }
+    
+    /* first pass: count the atoms in each box */
+    boxOffsets = boxes->boxOffsets;
+    for (i = 0; i <= boxes->totNBoxes; i++) boxOffsets[i] = 0;
+    for (i = 0; i < NAtoms; i++)
+    {
+        int boxIndex = boxIndexOfAtom(pos[3*i], pos[3*i+1], pos[3*i+2], boxes);
+        if (boxIndex < 0)
         {
-            /* realloc more space */
-            newsize = boxes->boxNAtoms[boxIndex] + boxes->allocChunk;
-            boxes->boxAtoms[boxIndex] = realloc(boxes->boxAtoms[boxIndex], newsize * sizeof(int));
-            if (boxes->boxAtoms[boxIndex] == NULL)
-            {
-                char errstring[128];
-                sprintf(errstring, "Could not reallocate boxAtoms[%d]: %d", boxIndex, newsize);
-                PyErr_SetString(PyExc_MemoryError, errstring);
-                freeBoxes(boxes);
-                return 1;
-            }
+            free(atomBox);
+            freeBoxes(boxes);
+            return 1;
         }
+        atomBox[i] = boxIndex;
+        boxOffsets[boxIndex + 1]++;
+    }
+    
+    /* offset of the first atom in each box */
+    for (i = 0; i < boxes->totNBoxes; i++) boxOffsets[i + 1] += boxOffsets[i];
+    
+    /* second pass: place the atoms */
+    free(boxes->boxAtoms);
+    boxes->boxAtoms = malloc((NAtoms > 0 ? NAtoms : 1) * sizeof(int));
+    if (boxes->boxAtoms == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate boxAtoms");
+        free(atomBox);
+        freeBoxes(boxes);
+        return 1;
+    }
+    
+    /* use the offsets as the next position in each box (leaves offset i in i + 1) */
+    for (i = 0; i < NAtoms; i++) boxes->boxAtoms[boxOffsets[atomBox[i]]++] = i;
+    for (i = boxes->totNBoxes; i > 0; i--) boxOffsets[i] = boxOffsets[i - 1];
+    boxOffsets[0] = 0;
+    
+    free(atomBox);
+    
+    boxes->NAtoms = NAtoms;
+    boxes->pos = pos;
+    
+    return 0;
+}
+
+/*******************************************************************************
+ ** Return the positions of the boxed atoms in the order they are stored in the
+ ** boxes (the position of boxAtoms[k] is at 3 * k), so loops over the atoms in
+ ** neighbouring boxes read contiguous memory. Returns NULL on error. The result
+ ** must be freed by the caller.
+ *******************************************************************************/
+double * boxedPositions(struct Boxes *boxes, double *pos)
+{
+    int k, NAtoms;
+    double *boxPos;
+    
+    
+    NAtoms = boxes->boxOffsets[boxes->totNBoxes];
+    boxPos = malloc(3 * (NAtoms > 0 ? NAtoms : 1) * sizeof(double));
+    if (boxPos == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate boxPos");
+        return NULL;
+    }
+    
+    for (k = 0; k < NAtoms; k++)
+    {
+        int ind3 = 3 * boxes->boxAtoms[k];
+        int k3 = 3 * k;
         
-        /* add atom to box */
-        boxes->boxAtoms[boxIndex][boxes->boxNAtoms[boxIndex]++] = i;
+        boxPos[k3    ] = pos[ind3    ];
+        boxPos[k3 + 1] = pos[ind3 + 1];
+        boxPos[k3 + 2] = pos[ind3 + 2];
     }
     
-    return status;
+    return boxPos;
 }
 
 /*******************************************************************************
@@ -401,15 +445,145 @@ int getBoxNeighbourhood(int mainBox, int* boxNeighbourList, struct Boxes *boxes)
  ** free boxes memory
  *******************************************************************************/
 void freeBoxes(struct Boxes *boxes)
+{
+    /* shared boxes are freed by their spatial index */
+    if (boxes->shared) return;
+    
+    free(boxes->boxAtoms);
+    free(boxes->boxOffsets);
+    free(boxes);
+}
+
+/*******************************************************************************
+ ** Return the shared boxes of all atoms from the spatial index (a Python
+ ** object, see atoman.visclibs.spatialIndex), or NULL if there are none for
+ ** the given positions and box parameters (or if there was an error, in which
+ ** case the Python error is set). The boxes belong to the spatial index.
+ *******************************************************************************/
+struct Boxes * getSharedBoxes(PyObject *spatialIndex, double approxBoxWidth, int *PBC, double *cellDims, double *pos)
 {
     int i;
+    PyObject *capsule;
+    struct Boxes *boxes;
+    
     
+    if (spatialIndex == NULL || spatialIndex == Py_None) return NULL;
     
-    for (i = 0; i < boxes->totNBoxes; i++)
+    capsule = PyObject_CallMethod(spatialIndex, "boxes", "d(iii)(ddd)", approxBoxWidth, PBC[0], PBC[1], PBC[2],
+            cellDims[0], cellDims[1], cellDims[2]);
+    if (capsule == NULL) return NULL;
+    if (capsule == Py_None)
     {
-        if (boxes->boxNAtoms[i]) free(boxes->boxAtoms[i]);
+        Py_DECREF(capsule);
+        return NULL;
     }
-    free(boxes->boxAtoms);
-    free(boxes->boxNAtoms);
-    free(boxes);
+    
+    /* the spatial index keeps a reference to the capsule */
+    boxes = (struct Boxes *) PyCapsule_GetPointer(capsule, BOXES_CAPSULE_NAME);
+    Py_DECREF(capsule);
+    if (boxes == NULL) return NULL;
+    
+    /* check the boxes are for these positions */
+    if (boxes->pos != pos) return NULL;
+    for (i = 0; i < 3; i++)
+        if (boxes->PBC[i] != PBC[i] || boxes->cellDims[i] != cellDims[i]) return NULL;
+    
+    return boxes;
+}
+
+/*******************************************************************************
+ ** Return the boxes of the visible atoms (the boxes contain indexes into
+ ** visibleAtoms and are the same as boxing visiblePos). The shared boxes of the
+ ** spatial index (which may be NULL or None) are used if all atoms are visible,
+ ** or derived from if most are (without having to box them again). Returns NULL
+ ** on error. The result must be freed with freeBoxes.
+ *******************************************************************************/
+struct Boxes * boxVisibleAtoms(PyObject *spatialIndex, double approxBoxWidth, int *PBC, double *cellDims, double *pos,
+        int NVisible, int *visibleAtoms, double *visiblePos)
+{
+    struct Boxes *shared, *boxes;
+    
+    
+    /* shared boxes of all atoms */
+    shared = getSharedBoxes(spatialIndex, approxBoxWidth, PBC, cellDims, pos);
+    if (shared == NULL && PyErr_Occurred()) return NULL;
+    
+    /* the subset must be in order for the boxes to be the same, and worth doing */
+    if (shared != NULL && NVisible <= shared->NAtoms && 8 * NVisible >= shared->NAtoms)
+    {
+        int i, ordered = 1;
+        
+        for (i = 0; i < NVisible; i++)
+        {
+            if (visibleAtoms[i] < 0 || visibleAtoms[i] >= shared->NAtoms || (i && visibleAtoms[i] <= visibleAtoms[i - 1]))
+            {
+                ordered = 0;
+                break;
+            }
+        }
+        
+        /* all atoms are visible: use the shared boxes */
+        if (ordered && NVisible == shared->NAtoms) return shared;
+        
+        /* derive the boxes of the visible atoms from the shared boxes */
+        if (ordered)
+        {
+            int *visibleIndex;
+            
+            visibleIndex = malloc(shared->NAtoms * sizeof(int));
+            if (visibleIndex == NULL)
+            {
+                PyErr_SetString(PyExc_MemoryError, "Could not allocate visibleIndex");
+                return NULL;
+            }
+            for (i = 0; i < shared->NAtoms; i++) visibleIndex[i] = -1;
+            for (i = 0; i < NVisible; i++) visibleIndex[visibleAtoms[i]] = i;
+            
+            boxes = malloc(sizeof(struct Boxes));
+            if (boxes == NULL)
+            {
+                PyErr_SetString(PyExc_MemoryError, "Could not allocate boxes");
+                free(visibleIndex);
+                return NULL;
+            }
+            *boxes = *shared;
+            boxes->shared = 0;
+            boxes->NAtoms = NVisible;
+            boxes->pos = visiblePos;
+            boxes->boxOffsets = malloc((boxes->totNBoxes + 1) * sizeof(int));
+            boxes->boxAtoms = malloc((NVisible > 0 ? NVisible : 1) * sizeof(int));
+            if (boxes->boxOffsets == NULL || boxes->boxAtoms == NULL)
+            {
+                PyErr_SetString(PyExc_MemoryError, "Could not allocate boxes");
+                freeBoxes(boxes);
+                free(visibleIndex);
+                return NULL;
+            }
+            
+            /* keep the visible atoms of each shared box (in order) */
+            boxes->boxOffsets[0] = 0;
+            for (i = 0; i < boxes->totNBoxes; i++)
+            {
+                int k, count = boxes->boxOffsets[i];
+                
+                for (k = shared->boxOffsets[i]; k < shared->boxOffsets[i + 1]; k++)
+                {
+                    int index = visibleIndex[shared->boxAtoms[k]];
+                    if (index >= 0) boxes->boxAtoms[count++] = index;
+                }
+                boxes->boxOffsets[i + 1] = count;
+            }
+            
+            free(visibleIndex);
+            
+            return boxes;
+        }
+    }
+    
+    /* box the visible atoms */
+    boxes = setupBoxes(approxBoxWidth, PBC, cellDims);
+    if (boxes == NULL) return NULL;
+    if (putAtomsInBoxes(NVisible, visiblePos, boxes)) return NULL;
+    
+    return boxes;
 }
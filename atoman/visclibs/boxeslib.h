@@ -6,6 +6,11 @@
 #ifndef BOXESLIB_SET
 #define BOXESLIB_SET
 
+#include <Python.h>
+
+/* name of the capsules holding shared boxes (see atoman.visclibs.spatialIndex) */
+#define BOXES_CAPSULE_NAME "atoman.visclibs.Boxes"
+
 /* create structure for containing boxes data */
 struct Boxes
 {
@@ -14,23 +19,32 @@ struct Boxes
     int PBC[3];
     double cellDims[3];
     
-    int *boxNAtoms;
-    int **boxAtoms;
+    /* atoms in box i are boxAtoms[boxOffsets[i]] to boxAtoms[boxOffsets[i + 1] - 1] */
+    int *boxOffsets;
+    int *boxAtoms;
     
     int totNBoxes;
     int NBoxes[3];
     double boxWidth[3];
     
-    int allocChunk;
+    /* atoms that were boxed (pos is only kept to check shared boxes) */
+    int NAtoms;
+    double *pos;
+    
+    /* shared boxes belong to a spatial index and are not freed by freeBoxes */
+    int shared;
 };
 
 /* available functions */
 struct Boxes * setupBoxes(double, int *, double *);
 int boxIndexOfAtom( double, double, double, struct Boxes *);
 int putAtomsInBoxes(int, double *, struct Boxes *);
+double * boxedPositions(struct Boxes *, double *);
 void freeBoxes(struct Boxes *);
 void boxIJKIndices(int, int *, int, struct Boxes *);
 int boxIndexFromIJK(int, int, int, struct Boxes *);
 int getBoxNeighbourhood(int, int *, struct Boxes *);
+struct Boxes * getSharedBoxes(PyObject *, double, int *, double *, double *);
+struct Boxes * boxVisibleAtoms(PyObject *, double, int *, double *, double *, int, int *, double *);
 
 #endif
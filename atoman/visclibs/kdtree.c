@@ -0,0 +1,474 @@
+#include <Python.h> // includes stdio.h, string.h, errno.h, stdlib.h
+#include <math.h>
+#include "visclibs/kdtree.h"
+
+
+/* a point found by a query: (squared separation, index) */
+struct KDNeighbour
+{
+    int index;
+    double sep2;
+};
+
+/* bounded max-heap of the nearest points found so far */
+struct KDHeap
+{
+    int k;
+    int size;
+    struct KDNeighbour *items;
+};
+
+/* growable list of the points found by a radius query */
+struct KDList
+{
+    int size;
+    int capacity;
+    struct KDNeighbour *items;
+};
+
+static void selectMedian(int *, double *, int, int, int, int);
+static void buildRange(struct KDTree *, double *, int, int);
+static int isWorse(struct KDNeighbour *, struct KDNeighbour *);
+static int compare_kdneighbours(const void *, const void *);
+static void heapPush(struct KDHeap *, int, double);
+static void nearestRange(struct KDTree *, double *, int, int, struct KDHeap *);
+static int addIfWithinRadius(struct KDTree *, double *, double, int, struct KDList *);
+static int withinRadiusRange(struct KDTree *, double *, double, int, int, struct KDList *);
+
+/* ranges larger than this are built in separate tasks */
+#define KDTREE_TASK_SIZE 65536
+
+
+/*******************************************************************************
+ ** Reorder index[lo:hi] so that the point at k has the k'th smallest value
+ ** along dim (three-way partitioning, so repeated coordinates of lattice
+ ** positions do not degrade it)
+ *******************************************************************************/
+static void selectMedian(int *index, double *pos, int lo, int hi, int k, int dim)
+{
+    while (hi - lo > 1)
+    {
+        int i, lt, gt, tmp;
+        double a, b, c, pivot;
+
+        /* median of three pivot */
+        a = pos[3 * index[lo] + dim];
+        b = pos[3 * index[(lo + hi) / 2] + dim];
+        c = pos[3 * index[hi - 1] + dim];
+        if ((a <= b && b <= c) || (c <= b && b <= a)) pivot = b;
+        else if ((b <= a && a <= c) || (c <= a && a <= b)) pivot = a;
+        else pivot = c;
+
+        /* [lo, lt) < pivot, [lt, gt) == pivot, [gt, hi) > pivot */
+        lt = lo;
+        i = lo;
+        gt = hi;
+        while (i < gt)
+        {
+            double value = pos[3 * index[i] + dim];
+
+            if (value < pivot)
+            {
+                tmp = index[lt];
+                index[lt++] = index[i];
+                index[i++] = tmp;
+            }
+            else if (value > pivot)
+            {
+                tmp = index[--gt];
+                index[gt] = index[i];
+                index[i] = tmp;
+            }
+            else i++;
+        }
+
+        if (k < lt) hi = lt;
+        else if (k >= gt) lo = gt;
+        else return;
+    }
+}
+
+/*******************************************************************************
+ ** Build the tree over the range [lo, hi), splitting along the dimension with
+ ** the widest extent
+ *******************************************************************************/
+static void buildRange(struct KDTree *tree, double *pos, int lo, int hi)
+{
+    int i, mid, dim;
+    double minPos[3], maxPos[3], extent;
+
+    if (hi - lo <= KDTREE_LEAF_SIZE) return;
+
+    /* extent of the range */
+    for (i = 0; i < 3; i++)
+    {
+        minPos[i] = pos[3 * tree->index[lo] + i];
+        maxPos[i] = minPos[i];
+    }
+    for (i = lo + 1; i < hi; i++)
+    {
+        int j, index3 = 3 * tree->index[i];
+
+        for (j = 0; j < 3; j++)
+        {
+            double value = pos[index3 + j];
+            if (value < minPos[j]) minPos[j] = value;
+            if (value > maxPos[j]) maxPos[j] = value;
+        }
+    }
+
+    dim = 0;
+    extent = maxPos[0] - minPos[0];
+    for (i = 1; i < 3; i++)
+    {
+        if (maxPos[i] - minPos[i] > extent)
+        {
+            dim = i;
+            extent = maxPos[i] - minPos[i];
+        }
+    }
+
+    /* split at the median */
+    mid = (lo + hi) / 2;
+    selectMedian(tree->index, pos, lo, hi, mid, dim);
+    tree->splitDim[mid] = dim;
+
+    /* the two halves are independent */
+    #pragma omp task if (mid - lo > KDTREE_TASK_SIZE)
+    buildRange(tree, pos, lo, mid);
+    #pragma omp task if (hi - mid - 1 > KDTREE_TASK_SIZE)
+    buildRange(tree, pos, mid + 1, hi);
+    #pragma omp taskwait
+}
+
+/*******************************************************************************
+ ** Build a k-d tree of the given points (the positions are copied)
+ *******************************************************************************/
+struct KDTree * buildKDTree(int NPoints, double *pos, int numThreads)
+{
+    int i;
+    struct KDTree *tree;
+
+
+    tree = malloc(sizeof(struct KDTree));
+    if (tree == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate k-d tree");
+        return NULL;
+    }
+    tree->NPoints = NPoints;
+    tree->index = malloc(NPoints * sizeof(int));
+    tree->splitDim = malloc(NPoints * sizeof(int));
+    tree->pos = malloc(3 * NPoints * sizeof(double));
+    if (NPoints > 0 && (tree->index == NULL || tree->splitDim == NULL || tree->pos == NULL))
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate k-d tree arrays");
+        freeKDTree(tree);
+        return NULL;
+    }
+
+    for (i = 0; i < NPoints; i++)
+    {
+        tree->index[i] = i;
+        tree->splitDim[i] = -1;
+    }
+
+    /* build the tree */
+    #pragma omp parallel num_threads(numThreads)
+    {
+        #pragma omp single
+        buildRange(tree, pos, 0, NPoints);
+    }
+
+    /* store the positions in tree order */
+    #pragma omp parallel for num_threads(numThreads)
+    for (i = 0; i < NPoints; i++)
+    {
+        int i3 = 3 * i;
+        int index3 = 3 * tree->index[i];
+
+        tree->pos[i3    ] = pos[index3    ];
+        tree->pos[i3 + 1] = pos[index3 + 1];
+        tree->pos[i3 + 2] = pos[index3 + 2];
+    }
+
+    return tree;
+}
+
+/*******************************************************************************
+ ** Free the k-d tree
+ *******************************************************************************/
+void freeKDTree(struct KDTree *tree)
+{
+    if (tree != NULL)
+    {
+        free(tree->index);
+        free(tree->splitDim);
+        free(tree->pos);
+        free(tree);
+    }
+}
+
+/*******************************************************************************
+ ** Order found points by separation, then index (so ties are deterministic)
+ *******************************************************************************/
+static int isWorse(struct KDNeighbour *a, struct KDNeighbour *b)
+{
+    return (a->sep2 > b->sep2 || (a->sep2 == b->sep2 && a->index > b->index));
+}
+
+static int compare_kdneighbours(const void *a, const void *b)
+{
+    struct KDNeighbour *na = (struct KDNeighbour *) a;
+    struct KDNeighbour *nb = (struct KDNeighbour *) b;
+
+    if (isWorse(na, nb)) return 1;
+    else if (isWorse(nb, na)) return -1;
+    else return 0;
+}
+
+/*******************************************************************************
+ ** Add a point to the heap if it is nearer than the worst point in it
+ *******************************************************************************/
+static void heapPush(struct KDHeap *heap, int index, double sep2)
+{
+    int i;
+    struct KDNeighbour item;
+
+    item.index = index;
+    item.sep2 = sep2;
+
+    if (heap->size < heap->k)
+    {
+        /* sift up */
+        i = heap->size++;
+        while (i > 0)
+        {
+            int parent = (i - 1) / 2;
+            if (!isWorse(&item, &heap->items[parent])) break;
+            heap->items[i] = heap->items[parent];
+            i = parent;
+        }
+        heap->items[i] = item;
+    }
+    else if (isWorse(&heap->items[0], &item))
+    {
+        /* replace the root and sift down */
+        i = 0;
+        while (1)
+        {
+            int child = 2 * i + 1;
+            if (child >= heap->size) break;
+            if (child + 1 < heap->size && isWorse(&heap->items[child + 1], &heap->items[child])) child++;
+            if (!isWorse(&heap->items[child], &item)) break;
+            heap->items[i] = heap->items[child];
+            i = child;
+        }
+        heap->items[i] = item;
+    }
+}
+
+/*******************************************************************************
+ ** Nearest neighbour search over the range [lo, hi)
+ *******************************************************************************/
+static void nearestRange(struct KDTree *tree, double *point, int lo, int hi, struct KDHeap *heap)
+{
+    int i, mid, dim;
+    double diff, sep2;
+
+    /* leaf */
+    if (hi - lo <= KDTREE_LEAF_SIZE)
+    {
+        for (i = lo; i < hi; i++)
+        {
+            double dx = point[0] - tree->pos[3*i];
+            double dy = point[1] - tree->pos[3*i+1];
+            double dz = point[2] - tree->pos[3*i+2];
+
+            heapPush(heap, tree->index[i], dx * dx + dy * dy + dz * dz);
+        }
+
+        return;
+    }
+
+    /* node */
+    mid = (lo + hi) / 2;
+    dim = tree->splitDim[mid];
+    diff = point[dim] - tree->pos[3 * mid + dim];
+
+    sep2 = 0.0;
+    for (i = 0; i < 3; i++)
+    {
+        double d = point[i] - tree->pos[3 * mid + i];
+        sep2 += d * d;
+    }
+    heapPush(heap, tree->index[mid], sep2);
+
+    /* near side first, then the far side if it could hold a nearer point */
+    if (diff <= 0.0)
+    {
+        nearestRange(tree, point, lo, mid, heap);
+        if (heap->size < heap->k || diff * diff <= heap->items[0].sep2)
+            nearestRange(tree, point, mid + 1, hi, heap);
+    }
+    else
+    {
+        nearestRange(tree, point, mid + 1, hi, heap);
+        if (heap->size < heap->k || diff * diff <= heap->items[0].sep2)
+            nearestRange(tree, point, lo, mid, heap);
+    }
+}
+
+/*******************************************************************************
+ ** Find the k nearest points to the given point. The (original) indexes and
+ ** squared separations are stored in order of separation (ties by index).
+ ** Returns the number found (k or the number of points if less) or -1 on error.
+ *******************************************************************************/
+int kdtreeNearest(struct KDTree *tree, double *point, int k, int *indexes, double *sep2)
+{
+    int i;
+    struct KDHeap heap;
+
+
+    if (k > tree->NPoints) k = tree->NPoints;
+    if (k <= 0) return 0;
+
+    heap.k = k;
+    heap.size = 0;
+    heap.items = malloc(k * sizeof(struct KDNeighbour));
+    if (heap.items == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate k-d tree heap");
+        return -1;
+    }
+
+    nearestRange(tree, point, 0, tree->NPoints, &heap);
+
+    qsort(heap.items, heap.size, sizeof(struct KDNeighbour), compare_kdneighbours);
+    for (i = 0; i < heap.size; i++)
+    {
+        indexes[i] = heap.items[i].index;
+        sep2[i] = heap.items[i].sep2;
+    }
+
+    free(heap.items);
+
+    return k;
+}
+
+/*******************************************************************************
+ ** Add point i of the tree to the list if it is within the radius
+ *******************************************************************************/
+static int addIfWithinRadius(struct KDTree *tree, double *point, double radius2, int i, struct KDList *list)
+{
+    double dx, dy, dz, sep2;
+
+    dx = point[0] - tree->pos[3*i];
+    dy = point[1] - tree->pos[3*i+1];
+    dz = point[2] - tree->pos[3*i+2];
+    sep2 = dx * dx + dy * dy + dz * dz;
+
+    if (sep2 <= radius2)
+    {
+        if (list->size == list->capacity)
+        {
+            struct KDNeighbour *items;
+
+            list->capacity = (list->capacity > 0) ? 2 * list->capacity : 64;
+            items = realloc(list->items, list->capacity * sizeof(struct KDNeighbour));
+            if (items == NULL)
+            {
+                PyErr_SetString(PyExc_MemoryError, "Could not reallocate k-d tree results");
+                return 1;
+            }
+            list->items = items;
+        }
+
+        list->items[list->size].index = tree->index[i];
+        list->items[list->size].sep2 = sep2;
+        list->size++;
+    }
+
+    return 0;
+}
+
+/*******************************************************************************
+ ** Radius search over the range [lo, hi)
+ *******************************************************************************/
+static int withinRadiusRange(struct KDTree *tree, double *point, double radius2, int lo, int hi, struct KDList *list)
+{
+    int i, mid, dim;
+    double diff;
+
+    /* leaf */
+    if (hi - lo <= KDTREE_LEAF_SIZE)
+    {
+        for (i = lo; i < hi; i++)
+            if (addIfWithinRadius(tree, point, radius2, i, list)) return 1;
+
+        return 0;
+    }
+
+    /* node */
+    mid = (lo + hi) / 2;
+    if (addIfWithinRadius(tree, point, radius2, mid, list)) return 1;
+
+    /* only visit the sides the sphere overlaps */
+    dim = tree->splitDim[mid];
+    diff = point[dim] - tree->pos[3 * mid + dim];
+
+    if (diff <= 0.0 || diff * diff <= radius2)
+    {
+        if (withinRadiusRange(tree, point, radius2, lo, mid, list)) return 1;
+    }
+    if (diff >= 0.0 || diff * diff <= radius2)
+    {
+        if (withinRadiusRange(tree, point, radius2, mid + 1, hi, list)) return 1;
+    }
+
+    return 0;
+}
+
+/*******************************************************************************
+ ** Find the points within the given radius of the given point. Arrays of the
+ ** (original) indexes and squared separations are allocated and returned in
+ ** order of separation (ties by index). Returns the number found or -1 on error.
+ *******************************************************************************/
+int kdtreeWithinRadius(struct KDTree *tree, double *point, double radius, int **indexes, double **sep2)
+{
+    int i;
+    struct KDList list;
+
+
+    list.size = 0;
+    list.capacity = 0;
+    list.items = NULL;
+
+    if (radius >= 0.0 && withinRadiusRange(tree, point, radius * radius, 0, tree->NPoints, &list))
+    {
+        free(list.items);
+        return -1;
+    }
+
+    qsort(list.items, list.size, sizeof(struct KDNeighbour), compare_kdneighbours);
+
+    *indexes = malloc(list.size * sizeof(int));
+    *sep2 = malloc(list.size * sizeof(double));
+    if (list.size > 0 && (*indexes == NULL || *sep2 == NULL))
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate k-d tree results");
+        free(*indexes);
+        free(*sep2);
+        free(list.items);
+        return -1;
+    }
+
+    for (i = 0; i < list.size; i++)
+    {
+        (*indexes)[i] = list.items[i].index;
+        (*sep2)[i] = list.items[i].sep2;
+    }
+    free(list.items);
+
+    return list.size;
+}
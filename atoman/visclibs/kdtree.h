@@ -0,0 +1,31 @@
+
+/*******************************************************************************
+ ** k-d tree for nearest neighbour queries on a fixed set of points
+ *******************************************************************************/
+
+#ifndef KDTREE_SET
+#define KDTREE_SET
+
+/* name of the capsules holding k-d trees (see atoman.visclibs.kdtree) */
+#define KDTREE_CAPSULE_NAME "atoman.visclibs.KDTree"
+
+/* implicit balanced k-d tree: the node of the range [lo, hi) is the point at
+ * mid = (lo + hi) / 2, points in [lo, mid) are not greater and points in
+ * (mid, hi) are not less than it along splitDim[mid]; ranges of up to
+ * KDTREE_LEAF_SIZE points are leaves */
+struct KDTree
+{
+    int NPoints;
+    double *pos;
+    int *index;
+    int *splitDim;
+};
+
+#define KDTREE_LEAF_SIZE 8
+
+struct KDTree * buildKDTree(int, double *, int);
+void freeKDTree(struct KDTree *);
+int kdtreeNearest(struct KDTree *, double *, int, int *, double *);
+int kdtreeWithinRadius(struct KDTree *, double *, double, int **, double **);
+
+#endif
@@ -0,0 +1,70 @@
+"""
+k-d tree for nearest neighbour queries.
+
+The tree is built once over a fixed set of positions and can then be queried any number
+of times (for example by the picker, see `atoman.filtering.pickIndex`). Separations are
+not periodic.
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import numpy as np
+
+from . import _kdtree
+
+
+class KDTree(object):
+    """
+    k-d tree of the given positions (pos[3*i:3*i+3] is the position of point i).
+    
+    """
+    def __init__(self, pos):
+        self.pos = np.ascontiguousarray(pos, dtype=np.float64)
+        if len(self.pos) % 3:
+            raise ValueError("Length of positions array must be a multiple of 3")
+        self.NPoints = len(self.pos) // 3
+        self._tree = _kdtree.build(self.pos)
+    
+    def __len__(self):
+        return self.NPoints
+    
+    @staticmethod
+    def _point(point):
+        """Return the point as an array of 3 doubles."""
+        point = np.ascontiguousarray(point, dtype=np.float64)
+        if point.shape != (3,):
+            raise ValueError("Point must have 3 components")
+        
+        return point
+    
+    def nearest(self, point, k=1):
+        """
+        Return the indexes of and the separations to the k nearest points to the given point.
+        
+        The points are ordered by separation (then index). Fewer than k points are returned
+        if there are not enough points in the tree.
+        
+        """
+        if k < 0:
+            raise ValueError("Number of nearest points must not be negative")
+        
+        indexes, sep2 = _kdtree.nearest(self._tree, self._point(point), int(k))
+        
+        return indexes, np.sqrt(sep2)
+    
+    def withinRadius(self, point, radius):
+        """
+        Return the indexes of and the separations to the points within the given radius of the point.
+        
+        The points are ordered by separation (then index).
+        
+        """
+        if radius < 0:
+            raise ValueError("Radius must not be negative")
+        
+        indexes, sep2 = _kdtree.withinRadius(self._tree, self._point(point), float(radius))
+        
+        return indexes, np.sqrt(sep2)
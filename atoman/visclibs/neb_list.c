@@ -7,150 +7,360 @@
 
 
 static int addAtomToNebList(int, int, double, struct NeighbourList2 *);
+static int findNeighbours(int, double *, double *, int, struct Boxes *, double *, int *, double, struct Neighbour *);
+static int compare_nebs_index(const void *, const void *);
+static void sortNeighboursByIndex(struct NeighbourListCSR *, int);
+static struct NeighbourListCSR * getVerletCandidates(PyObject *, int, double, int *, double *);
+static int filterCandidates(int, double *, struct NeighbourListCSR *, int *, double *, int *, double, struct Neighbour *);
 
 
-struct NeighbourList * constructNeighbourList(int NAtoms, double *pos, struct Boxes *boxes, double *cellDims, int *PBC, double maxSep2)
+/*******************************************************************************
+ ** Find the neighbours of atom i (within maxSep2), in the order the boxes in its
+ ** neighbourhood and the atoms in them are stored. The neighbours are stored in
+ ** the given array if it is not NULL. Returns the number of neighbours.
+ *******************************************************************************/
+static int findNeighbours(int i, double *pos, double *boxPos, int boxIndex, struct Boxes *boxes, double *cellDims,
+        int *PBC, double maxSep2, struct Neighbour *neighbours)
+{
+    int j, count, boxNebListSize, boxNebList[27];
+    double rxa, rya, rza;
+    
+    
+    /* atom position */
+    rxa = pos[3*i];
+    rya = pos[3*i+1];
+    rza = pos[3*i+2];
+    
+    /* find neighbouring boxes */
+    boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
+    
+    /* loop over box neighbourhood */
+    count = 0;
+    for (j = 0; j < boxNebListSize; j++)
+    {
+        int k;
+        
+        boxIndex = boxNebList[j];
+        
+        /* loop over atoms in box (positions are contiguous in boxPos) */
+        for (k = boxes->boxOffsets[boxIndex]; k < boxes->boxOffsets[boxIndex + 1]; k++)
+        {
+            int indexb = boxes->boxAtoms[k];
+            double sep2;
+            
+            if (indexb == i) continue;
+            
+            /* separation */
+            sep2 = atomicSeparation2(rxa, rya, rza, boxPos[3*k], boxPos[3*k+1], boxPos[3*k+2], cellDims[0], cellDims[1],
+                    cellDims[2], PBC[0], PBC[1], PBC[2]);
+            
+            /* check if neighbour */
+            if (sep2 < maxSep2)
+            {
+                if (neighbours != NULL)
+                {
+                    neighbours[count].index = indexb;
+                    neighbours[count].separation = sqrt(sep2);
+                }
+                count++;
+            }
+        }
+    }
+    
+    return count;
+}
+
+/*******************************************************************************
+ ** Construct the neighbour list of all the (boxed) atoms, in compressed-row
+ ** form. The atoms are processed in parallel: the neighbours of each atom are
+ ** counted, the counts are summed to give the offsets and then the neighbours
+ ** are stored. The neighbours of each atom are found in the same order whatever
+ ** the number of threads, so the result is deterministic.
+ *******************************************************************************/
+struct NeighbourListCSR * constructNeighbourListCSR(int NAtoms, double *pos, struct Boxes *boxes, double *cellDims,
+        int *PBC, double maxSep2, int numThreads)
 {
-    int i, j, k, boxIndex, indexb, newsize;
-    int boxNebList[27];
-    double rxa, rya, rza, rxb, ryb, rzb, sep2;
-    struct NeighbourList *nebList;
+    int i, errorCount, *atomBox;
+    double *boxPos;
+    struct NeighbourListCSR *nebList;
     
     
     /* allocate neb list */
-    nebList = malloc(NAtoms * sizeof(struct NeighbourList));
+    nebList = malloc(sizeof(struct NeighbourListCSR));
     if (nebList == NULL)
     {
         PyErr_SetString(PyExc_MemoryError, "Could not allocate nebList");
         return NULL;
     }
+    nebList->NAtoms = NAtoms;
+    nebList->neighbours = NULL;
+    nebList->offsets = malloc((NAtoms + 1) * sizeof(int));
+    atomBox = malloc((NAtoms > 0 ? NAtoms : 1) * sizeof(int));
+    if (nebList->offsets == NULL || atomBox == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate nebList offsets");
+        free(atomBox);
+        freeNeighbourListCSR(nebList);
+        return NULL;
+    }
     
-    /* initialise */
-    for (i = 0; i < NAtoms; i++)
+    /* positions in the order they are stored in the boxes */
+    boxPos = boxedPositions(boxes, pos);
+    if (boxPos == NULL)
     {
-        nebList[i].chunk = 16;
-        nebList[i].neighbourCount = 0;
+        free(atomBox);
+        freeNeighbourListCSR(nebList);
+        return NULL;
     }
     
-    /* loop over atoms */
+    /* first pass: count the neighbours of each atom */
+    errorCount = 0;
+    nebList->offsets[0] = 0;
+    #pragma omp parallel for reduction(+: errorCount) num_threads(numThreads)
     for (i = 0; i < NAtoms; i++)
     {
-        int boxNebListSize;
-        
-        /* atom position */
-        rxa = pos[3*i];
-        rya = pos[3*i+1];
-        rza = pos[3*i+2];
-        
         /* get box index of this atom */
-        boxIndex = boxIndexOfAtom(rxa, rya, rza, boxes);
-        if (boxIndex < 0)
+        atomBox[i] = boxIndexOfAtom(pos[3*i], pos[3*i+1], pos[3*i+2], boxes);
+        if (atomBox[i] < 0)
         {
-            freeNeighbourList(nebList, NAtoms);
-            return NULL;
+            errorCount++;
+            nebList->offsets[i + 1] = 0;
         }
+        else nebList->offsets[i + 1] = findNeighbours(i, pos, boxPos, atomBox[i], boxes, cellDims, PBC, maxSep2, NULL);
+    }
+    if (errorCount)
+    {
+        free(boxPos);
+        free(atomBox);
+        freeNeighbourListCSR(nebList);
+        return NULL;
+    }
+    
+    /* offsets */
+    for (i = 0; i < NAtoms; i++) nebList->offsets[i + 1] += nebList->offsets[i];
+    
+    /* second pass: store the neighbours */
+    nebList->neighbours = malloc((nebList->offsets[NAtoms] > 0 ? nebList->offsets[NAtoms] : 1) * sizeof(struct Neighbour));
+    if (nebList->neighbours == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate nebList neighbours");
+        free(boxPos);
+        free(atomBox);
+        freeNeighbourListCSR(nebList);
+        return NULL;
+    }
+    
+    #pragma omp parallel for num_threads(numThreads)
+    for (i = 0; i < NAtoms; i++)
+        findNeighbours(i, pos, boxPos, atomBox[i], boxes, cellDims, PBC, maxSep2, nebList->neighbours + nebList->offsets[i]);
+    
+    free(boxPos);
+    free(atomBox);
+    
+    return nebList;
+}
+
+/*******************************************************************************
+ ** Free the neighbour list (compressed-row form)
+ *******************************************************************************/
+void freeNeighbourListCSR(struct NeighbourListCSR *nebList)
+{
+    free(nebList->offsets);
+    free(nebList->neighbours);
+    free(nebList);
+}
+
+/*******************************************************************************
+ ** Compare neighbours by index
+ *******************************************************************************/
+static int compare_nebs_index(const void *a, const void *b)
+{
+    const struct Neighbour *n1 = a;
+    const struct Neighbour *n2 = b;
+    
+    return (n1->index > n2->index) - (n1->index < n2->index);
+}
+
+/*******************************************************************************
+ ** Sort the neighbours of each atom by index
+ *******************************************************************************/
+static void sortNeighboursByIndex(struct NeighbourListCSR *nebList, int numThreads)
+{
+    int i;
+    
+    #pragma omp parallel for num_threads(numThreads)
+    for (i = 0; i < nebList->NAtoms; i++)
+        qsort(nebList->neighbours + nebList->offsets[i], nebList->offsets[i + 1] - nebList->offsets[i],
+                sizeof(struct Neighbour), compare_nebs_index);
+}
+
+/*******************************************************************************
+ ** Return the Verlet list of candidate neighbours of all atoms from the
+ ** spatial index (a Python object, see atoman.visclibs.spatialIndex), or NULL
+ ** if there is none for the given cutoff or too few atoms are visible for it to
+ ** be worth using (or if there was an error, in which case the Python error is
+ ** set). The list belongs to the spatial index. The candidates include all
+ ** pairs within the cutoff (plus a skin) for the current positions.
+ *******************************************************************************/
+static struct NeighbourListCSR * getVerletCandidates(PyObject *spatialIndex, int NVisible, double maxSep, int *PBC,
+        double *cellDims)
+{
+    PyObject *capsule;
+    struct NeighbourListCSR *candidates;
+    
+    
+    if (spatialIndex == NULL || spatialIndex == Py_None) return NULL;
+    
+    capsule = PyObject_CallMethod(spatialIndex, "verletList", "d(iii)(ddd)i", maxSep, PBC[0], PBC[1], PBC[2],
+            cellDims[0], cellDims[1], cellDims[2], NVisible);
+    if (capsule == NULL) return NULL;
+    if (capsule == Py_None)
+    {
+        Py_DECREF(capsule);
+        return NULL;
+    }
+    
+    /* the spatial index keeps a reference to the capsule */
+    candidates = (struct NeighbourListCSR *) PyCapsule_GetPointer(capsule, NEBLIST_CAPSULE_NAME);
+    Py_DECREF(capsule);
+    
+    return candidates;
+}
+
+/*******************************************************************************
+ ** Keep the candidates of a visible atom that are visible and within the
+ ** cutoff, storing them (with visible indexes) if neighbours is not NULL.
+ ** Returns the number of neighbours.
+ *******************************************************************************/
+static int filterCandidates(int index, double *pos, struct NeighbourListCSR *candidates, int *visibleIndex,
+        double *cellDims, int *PBC, double maxSep2, struct Neighbour *neighbours)
+{
+    int k, count;
+    
+    
+    count = 0;
+    for (k = candidates->offsets[index]; k < candidates->offsets[index + 1]; k++)
+    {
+        int index2 = candidates->neighbours[k].index;
+        double sep2;
         
-        /* find neighbouring boxes */
-        boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
+        if (visibleIndex[index2] < 0) continue;
         
-        /* loop over box neighbourhood */
-        for (j = 0; j < boxNebListSize; j++)
+        sep2 = atomicSeparation2(pos[3*index], pos[3*index+1], pos[3*index+2], pos[3*index2], pos[3*index2+1],
+                pos[3*index2+2], cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
+        
+        if (sep2 < maxSep2)
         {
-            boxIndex = boxNebList[j];
-            
-            /* loop over atoms in box */
-            for (k = 0; k < boxes->boxNAtoms[boxIndex]; k++)
+            if (neighbours != NULL)
             {
-                indexb = boxes->boxAtoms[boxIndex][k];
-                
-                if (indexb == i) continue;
-                
-                /* atom position */
-                rxb = pos[3*indexb];
-                ryb = pos[3*indexb+1];
-                rzb = pos[3*indexb+2];
-                
-                /* separation */
-                sep2 = atomicSeparation2(rxa, rya, rza, rxb, ryb, rzb, cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
-                
-                /* check if neighbour */
-                if (sep2 < maxSep2)
-                {
-                    /* check if need to resize neighbour pointers */
-                    if (nebList[i].neighbourCount == 0)
-                    {
-                        nebList[i].neighbour = malloc(nebList[i].chunk * sizeof(int));
-                        if (nebList[i].neighbour == NULL)
-                        {
-                            char errstring[128];
-                            sprintf(errstring, "Could not allocate nebList[%d].neighbour\n", i);
-                            PyErr_SetString(PyExc_MemoryError, errstring);
-                            freeNeighbourList(nebList, NAtoms);
-                            return NULL;
-                        }
-                        nebList[i].neighbourSep = malloc(nebList[i].chunk * sizeof(double));
-                        if (nebList[i].neighbourSep == NULL)
-                        {
-                            char errstring[128];
-                            sprintf(errstring, "Could not allocate nebList[%d].neighbourSep\n", i);
-                            PyErr_SetString(PyExc_MemoryError, errstring);
-                            freeNeighbourList(nebList, NAtoms);
-                            return NULL;
-                        }
-                    }
-                    else if (nebList[i].neighbourCount % nebList[i].chunk == 0)
-                    {
-                        newsize = nebList[i].neighbourCount + nebList[i].chunk;
-                        nebList[i].neighbour = realloc(nebList[i].neighbour, newsize * sizeof(int));
-                        if (nebList[i].neighbour == NULL)
-                        {
-                            char errstring[128];
-                            sprintf(errstring, "Could not reallocate nebList[%d].neighbour\n", i);
-                            PyErr_SetString(PyExc_MemoryError, errstring);
-                            freeNeighbourList(nebList, NAtoms);
-                            return NULL;
-                        }
-                        nebList[i].neighbourSep = realloc(nebList[i].neighbourSep, newsize * sizeof(double));
-                        if (nebList[i].neighbourSep == NULL)
-                        {
-                            char errstring[128];
-                            sprintf(errstring, "Could not reallocate nebList[%d].neighbourSep\n", i);
-                            PyErr_SetString(PyExc_MemoryError, errstring);
-                            freeNeighbourList(nebList, NAtoms);
-                            return NULL;
-                        }
-                    }
-                    
-                    /* add neighbour */
-                    nebList[i].neighbour[nebList[i].neighbourCount] = indexb;
-                    nebList[i].neighbourSep[nebList[i].neighbourCount] = sqrt(sep2);
-                    nebList[i].neighbourCount++;
-                    
-//                    if (i < 1)
-//                        printf("NEB OF %d: %d; sep %lf\n", i, indexb, sqrt(sep2));
-                }
+                neighbours[count].index = visibleIndex[index2];
+                neighbours[count].separation = sqrt(sep2);
             }
+            count++;
         }
-//        if (i < 1)
-//            printf("NUM NEBS FOR %d: %d\n", i, nebList[i].neighbourCount);
     }
     
-    return nebList;
+    return count;
 }
 
-void freeNeighbourList(struct NeighbourList *nebList, int size)
+/*******************************************************************************
+ ** Construct the neighbour list (compressed-row form, indexes into visibleAtoms)
+ ** of the visible atoms within maxSep. If the spatial index (which may be NULL
+ ** or None) has a Verlet list for this cutoff its candidates are filtered by
+ ** the cutoff, otherwise the visible atoms are boxed and the list is built.
+ ** The neighbours of each atom are sorted by index, so the list is the same
+ ** either way.
+ *******************************************************************************/
+struct NeighbourListCSR * visibleNeighbourList(PyObject *spatialIndex, int NVisible, int *visibleAtoms, double *pos,
+        double *visiblePos, double *cellDims, int *PBC, double maxSep, int numThreads)
 {
-    int i;
+    int i, *visibleIndex;
+    double maxSep2 = maxSep * maxSep;
+    struct Boxes *boxes;
+    struct NeighbourListCSR *candidates, *nebList;
     
-    for (i = 0; i < size; i++)
+    
+    /* candidates from the Verlet list */
+    candidates = getVerletCandidates(spatialIndex, NVisible, maxSep, PBC, cellDims);
+    if (candidates == NULL && PyErr_Occurred()) return NULL;
+    if (candidates != NULL)
     {
-        if (nebList[i].neighbourCount > 0)
+        for (i = 0; i < NVisible; i++)
         {
-            free(nebList[i].neighbour);
-            free(nebList[i].neighbourSep);
+            if (visibleAtoms[i] < 0 || visibleAtoms[i] >= candidates->NAtoms)
+            {
+                candidates = NULL;
+                break;
+            }
         }
     }
-    free(nebList);
+    
+    /* no candidates: box the visible atoms */
+    if (candidates == NULL)
+    {
+        boxes = boxVisibleAtoms(spatialIndex, maxSep, PBC, cellDims, pos, NVisible, visibleAtoms, visiblePos);
+        if (boxes == NULL) return NULL;
+        nebList = constructNeighbourListCSR(NVisible, visiblePos, boxes, cellDims, PBC, maxSep2, numThreads);
+        freeBoxes(boxes);
+        if (nebList != NULL) sortNeighboursByIndex(nebList, numThreads);
+        
+        return nebList;
+    }
+    
+    /* visible index of each atom */
+    visibleIndex = malloc((candidates->NAtoms > 0 ? candidates->NAtoms : 1) * sizeof(int));
+    if (visibleIndex == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate visibleIndex");
+        return NULL;
+    }
+    for (i = 0; i < candidates->NAtoms; i++) visibleIndex[i] = -1;
+    for (i = 0; i < NVisible; i++) visibleIndex[visibleAtoms[i]] = i;
+    
+    /* allocate neb list */
+    nebList = malloc(sizeof(struct NeighbourListCSR));
+    if (nebList == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate nebList");
+        free(visibleIndex);
+        return NULL;
+    }
+    nebList->NAtoms = NVisible;
+    nebList->neighbours = NULL;
+    nebList->offsets = malloc((NVisible + 1) * sizeof(int));
+    if (nebList->offsets == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate nebList offsets");
+        free(visibleIndex);
+        freeNeighbourListCSR(nebList);
+        return NULL;
+    }
+    
+    /* first pass: count the neighbours */
+    nebList->offsets[0] = 0;
+    #pragma omp parallel for num_threads(numThreads)
+    for (i = 0; i < NVisible; i++)
+        nebList->offsets[i + 1] = filterCandidates(visibleAtoms[i], pos, candidates, visibleIndex, cellDims, PBC, maxSep2, NULL);
+    for (i = 0; i < NVisible; i++) nebList->offsets[i + 1] += nebList->offsets[i];
+    
+    /* second pass: store them */
+    nebList->neighbours = malloc((nebList->offsets[NVisible] > 0 ? nebList->offsets[NVisible] : 1) * sizeof(struct Neighbour));
+    if (nebList->neighbours == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate nebList neighbours");
+        free(visibleIndex);
+        freeNeighbourListCSR(nebList);
+        return NULL;
+    }
+    #pragma omp parallel for num_threads(numThreads)
+    for (i = 0; i < NVisible; i++)
+        filterCandidates(visibleAtoms[i], pos, candidates, visibleIndex, cellDims, PBC, maxSep2,
+                nebList->neighbours + nebList->offsets[i]);
+    
+    free(visibleIndex);
+    sortNeighboursByIndex(nebList, numThreads);
+    
+    return nebList;
 }
 
 /*************************************************/
@@ -193,97 +403,6 @@ static int addAtomToNebList(int mainIndex, int nebIndex, double sep, struct Neig
     return 0;
 }
 
-struct NeighbourList2 * constructNeighbourList2(int NAtoms, double *pos, struct Boxes *boxes, double *cellDims, int *PBC, double maxSep2)
-{
-    int i, j, k, boxIndex, indexb;
-    int boxNebList[27];
-    double rxa, rya, rza, rxb, ryb, rzb, sep2;
-    struct NeighbourList2 *nebList;
-    
-    
-    /* allocate neb list */
-    nebList = malloc(NAtoms * sizeof(struct NeighbourList2));
-    if (nebList == NULL)
-    {
-        PyErr_SetString(PyExc_MemoryError, "Could not allocate nebList");
-        return NULL;
-    }
-    
-    /* initialise */
-    for (i = 0; i < NAtoms; i++)
-    {
-        nebList[i].chunk = 16;
-        nebList[i].neighbourCount = 0;
-        nebList[i].neighbour = NULL;
-    }
-    
-    /* loop over atoms */
-    for (i = 0; i < NAtoms; i++)
-    {
-        int boxNebListSize;
-        
-        /* atom position */
-        rxa = pos[3*i];
-        rya = pos[3*i+1];
-        rza = pos[3*i+2];
-        
-        /* get box index of this atom */
-        boxIndex = boxIndexOfAtom(rxa, rya, rza, boxes);
-        if (boxIndex < 0)
-        {
-            freeNeighbourList2(nebList, NAtoms);
-            return NULL;
-        }
-        
-        /* find neighbouring boxes */
-        boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
-        
-        /* loop over box neighbourhood */
-        for (j = 0; j < boxNebListSize; j++)
-        {
-            boxIndex = boxNebList[j];
-            
-            /* loop over atoms in box */
-            for (k=0; k<boxes->boxNAtoms[boxIndex]; k++)
-            {
-                indexb = boxes->boxAtoms[boxIndex][k];
-                
-                if (indexb <= i) continue;
-                
-                /* atom position */
-                rxb = pos[3*indexb];
-                ryb = pos[3*indexb+1];
-                rzb = pos[3*indexb+2];
-                
-                /* separation */
-                sep2 = atomicSeparation2(rxa, rya, rza, rxb, ryb, rzb, cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
-                
-                /* check if neighbour */
-                if (sep2 < maxSep2)
-                {
-                    int addstat;
-                    double sep = sqrt(sep2);
-                    
-                    addstat = addAtomToNebList(i, indexb, sep, nebList);
-                    if (addstat)
-                    {
-                        freeNeighbourList2(nebList, NAtoms);
-                        return NULL;
-                    }
-                    addstat = addAtomToNebList(indexb, i, sep, nebList);
-                    if (addstat)
-                    {
-                        freeNeighbourList2(nebList, NAtoms);
-                        return NULL;
-                    }
-                }
-            }
-        }
-    }
-    
-    return nebList;
-}
-
 /*******************************************************************************
  * Construct neighbour lists for "ref" atoms where the neighbour lists contain
  * "input" atoms only. If separation is very close to 0 we don't add it.
@@ -294,7 +413,7 @@ struct NeighbourList2 * constructNeighbourList2DiffPos(int NAtomsRef, double *re
     int boxstat;
     double approxBoxWidth;
     double maxSep2 = maxSep * maxSep;
-    double rxb, ryb, rzb, sep2;
+    double rxb, ryb, rzb, sep2, *boxPos;
     struct Boxes *boxes;
     struct NeighbourList2 *nebList;
     
@@ -306,12 +425,21 @@ struct NeighbourList2 * constructNeighbourList2DiffPos(int NAtomsRef, double *re
     boxstat = putAtomsInBoxes(NAtomsInp, inpPos, boxes);
     if (boxstat) return NULL;
     
+    /* input positions in the order they are stored in the boxes */
+    boxPos = boxedPositions(boxes, inpPos);
+    if (boxPos == NULL)
+    {
+        freeBoxes(boxes);
+        return NULL;
+    }
+    
     /* allocate neb list */
     nebList = malloc(NAtomsRef * sizeof(struct NeighbourList2));
     if (nebList == NULL)
     {
         PyErr_SetString(PyExc_MemoryError, "Could not allocate nebList");
         freeBoxes(boxes);
+        free(boxPos);
         return NULL;
     }
     
@@ -341,6 +469,7 @@ struct NeighbourList2 * constructNeighbourList2DiffPos(int NAtomsRef, double *re
         {
             freeNeighbourList2(nebList, NAtomsRef);
             freeBoxes(boxes);
+            free(boxPos);
             return NULL;
         }
         
@@ -355,15 +484,15 @@ struct NeighbourList2 * constructNeighbourList2DiffPos(int NAtomsRef, double *re
             boxIndex = boxNebList[j];
             
             /* loop over atoms in box */
-            for (k = 0; k < boxes->boxNAtoms[boxIndex]; k++)
+            for (k = boxes->boxOffsets[boxIndex]; k < boxes->boxOffsets[boxIndex + 1]; k++)
             {
-                int indexb = boxes->boxAtoms[boxIndex][k];
-                int indb3 = indexb * 3;
+                int indexb = boxes->boxAtoms[k];
+                int k3 = k * 3;
                 
                 /* atom position */
-                rxb = inpPos[indb3    ];
-                ryb = inpPos[indb3 + 1];
-                rzb = inpPos[indb3 + 2];
+                rxb = boxPos[k3    ];
+                ryb = boxPos[k3 + 1];
+                rzb = boxPos[k3 + 2];
                 
                 /* separation */
                 sep2 = atomicSeparation2(rxa, rya, rza, rxb, ryb, rzb, cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
@@ -381,6 +510,7 @@ struct NeighbourList2 * constructNeighbourList2DiffPos(int NAtomsRef, double *re
                         {
                             freeNeighbourList2(nebList, NAtomsRef);
                             freeBoxes(boxes);
+                            free(boxPos);
                             return NULL;
                         }
                     }
@@ -391,6 +521,8 @@ struct NeighbourList2 * constructNeighbourList2DiffPos(int NAtomsRef, double *re
     
     freeBoxes(boxes);
     
+    free(boxPos);
+    
     return nebList;
 }
 
@@ -2,26 +2,28 @@
 #ifndef NEB_LIST_SET
 #define NEB_LIST_SET
 
-/* create structure for containing boxes data */
-struct NeighbourList
-{
-    int neighbourCount;
-    int chunk;
-    int *neighbour;
-    double *neighbourSep;
-};
-
-struct NeighbourList * constructNeighbourList(int, double *, struct Boxes *, double *, int *, double);
-
-void freeNeighbourList(struct NeighbourList *, int);
-
-
 struct Neighbour
 {
     int index;
     double separation;
 };
 
+/* neighbour list in compressed-row form: the neighbours of atom i are
+ * neighbours[offsets[i]] to neighbours[offsets[i + 1] - 1] */
+struct NeighbourListCSR
+{
+    int NAtoms;
+    int *offsets;
+    struct Neighbour *neighbours;
+};
+
+/* name of the capsules holding Verlet lists (see atoman.visclibs.spatialIndex) */
+#define NEBLIST_CAPSULE_NAME "atoman.visclibs.NeighbourList"
+
+struct NeighbourListCSR * constructNeighbourListCSR(int, double *, struct Boxes *, double *, int *, double, int);
+struct NeighbourListCSR * visibleNeighbourList(PyObject *, int, int *, double *, double *, double *, int *, double, int);
+void freeNeighbourListCSR(struct NeighbourListCSR *);
+
 struct NeighbourList2
 {
     int neighbourCount;
@@ -29,7 +31,6 @@ struct NeighbourList2
     struct Neighbour *neighbour;
 };
 
-struct NeighbourList2 * constructNeighbourList2(int, double *, struct Boxes *, double *, int *, double);
 struct NeighbourList2 * constructNeighbourList2DiffPos(int, double *, int, double *, double *, int *, double);
 void freeNeighbourList2(struct NeighbourList2 *, int);
 int compare_nebs_separation(const void *, const void *);
@@ -22,7 +22,23 @@ def configuration(parent_package='', top_path=None):
                        include_dirs=[incdirs])
     config.add_library("array_utils", ["array_utils.c"], depends=["array_utils.h"],
                        include_dirs=[incdirs])
+    config.add_library("kdtree", ["kdtree.c"], depends=["kdtree.h"], include_dirs=[incdirs])
 
+    # add extensions
+    config.add_extension("_spatialIndex",
+                         ["spatialIndex.c"],
+                         libraries=["boxeslib", "utilities", "neb_list", "array_utils"],
+                         include_dirs=[incdirs],
+                         depends=["boxeslib.h", "boxeslib.c", "utilities.h", "utilities.c", "neb_list.h",
+                                  "neb_list.c", "array_utils.h", "array_utils.c",
+                                  os.path.join("..", "gui", "preferences.h")])
+    config.add_extension("_kdtree",
+                         ["_kdtree.c"],
+                         libraries=["kdtree", "array_utils"],
+                         include_dirs=[incdirs],
+                         depends=["kdtree.h", "kdtree.c", "array_utils.h", "array_utils.c",
+                                  os.path.join("..", "gui", "preferences.h")])
+    
     # add extensions (for testing)
     config.add_extension("tests._test_boxeslib",
                          ["tests/test_boxeslib.c"],
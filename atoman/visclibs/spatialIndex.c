@@ -0,0 +1,209 @@
+/*******************************************************************************
+ ** Build the shared boxes and Verlet lists of a spatial index (see spatialIndex.py)
+ *******************************************************************************/
+
+#define NPY_NO_DEPRECATED_API NPY_1_7_API_VERSION
+
+#include <Python.h> // includes stdio.h, string.h, errno.h, stdlib.h
+#include <numpy/arrayobject.h>
+#include "visclibs/boxeslib.h"
+#include "visclibs/neb_list.h"
+#include "visclibs/array_utils.h"
+#include "gui/preferences.h"
+
+#if PY_MAJOR_VERSION >= 3
+    #define MOD_ERROR_VAL NULL
+    #define MOD_SUCCESS_VAL(val) val
+    #define MOD_INIT(name) PyMODINIT_FUNC PyInit_##name(void)
+    #define MOD_DEF(ob, name, doc, methods) \
+        static struct PyModuleDef moduledef = { \
+            PyModuleDef_HEAD_INIT, name, doc, -1, methods, }; \
+        ob = PyModule_Create(&moduledef);
+#else
+    #define MOD_ERROR_VAL
+    #define MOD_SUCCESS_VAL(val)
+    #define MOD_INIT(name) void init##name(void)
+    #define MOD_DEF(ob, name, doc, methods) \
+        ob = Py_InitModule3(name, methods, doc);
+#endif
+
+static PyObject* buildBoxes(PyObject*, PyObject*);
+static PyObject* boxesInfo(PyObject*, PyObject*);
+static PyObject* buildVerletList(PyObject*, PyObject*);
+static void destroyBoxes(PyObject*);
+static void destroyNeighbourList(PyObject*);
+
+
+/*******************************************************************************
+ ** List of python methods available in this module
+ *******************************************************************************/
+static struct PyMethodDef module_methods[] = {
+    {"buildBoxes", buildBoxes, METH_VARARGS, "Box all the atoms, returning the boxes in a capsule"},
+    {"boxesInfo", boxesInfo, METH_VARARGS, "Return the number of boxes and atoms in the boxes in a capsule"},
+    {"buildVerletList", buildVerletList, METH_VARARGS, "Build the neighbour list of all the atoms, returning it in a capsule"},
+    {NULL, NULL, 0, NULL}
+};
+
+/*******************************************************************************
+ ** Module initialisation function
+ *******************************************************************************/
+MOD_INIT(_spatialIndex)
+{
+    PyObject *mod;
+
+    MOD_DEF(mod, "_spatialIndex", "Spatial index C extension", module_methods)
+    if (mod == NULL)
+        return MOD_ERROR_VAL;
+
+    import_array();
+
+    return MOD_SUCCESS_VAL(mod);
+}
+
+/*******************************************************************************
+ ** Free the boxes when the capsule is destroyed
+ *******************************************************************************/
+static void
+destroyBoxes(PyObject *capsule)
+{
+    struct Boxes *boxes;
+
+    boxes = (struct Boxes *) PyCapsule_GetPointer(capsule, BOXES_CAPSULE_NAME);
+    if (boxes != NULL)
+    {
+        boxes->shared = 0;
+        freeBoxes(boxes);
+    }
+}
+
+/*******************************************************************************
+ ** Box all the atoms, returning the boxes in a capsule (they are shared by
+ ** the filters, see boxVisibleAtoms in boxeslib)
+ *******************************************************************************/
+static PyObject*
+buildBoxes(PyObject *self, PyObject *args)
+{
+    int NAtoms, *PBC;
+    double approxBoxWidth, *pos, *cellDims;
+    PyArrayObject *posIn=NULL;
+    PyArrayObject *PBCIn=NULL;
+    PyArrayObject *cellDimsIn=NULL;
+    PyObject *capsule;
+    struct Boxes *boxes;
+
+    /* parse and check arguments from Python */
+    if (!PyArg_ParseTuple(args, "O!dO!O!", &PyArray_Type, &posIn, &approxBoxWidth, &PyArray_Type, &PBCIn,
+            &PyArray_Type, &cellDimsIn))
+        return NULL;
+
+    if (not_doubleVector(posIn)) return NULL;
+    pos = pyvector_to_Cptr_double(posIn);
+    NAtoms = (int) PyArray_DIM(posIn, 0) / 3;
+
+    if (not_intVector(PBCIn)) return NULL;
+    PBC = pyvector_to_Cptr_int(PBCIn);
+
+    if (not_doubleVector(cellDimsIn)) return NULL;
+    cellDims = pyvector_to_Cptr_double(cellDimsIn);
+
+    /* box the atoms */
+    boxes = setupBoxes(approxBoxWidth, PBC, cellDims);
+    if (boxes == NULL) return NULL;
+    if (putAtomsInBoxes(NAtoms, pos, boxes)) return NULL;
+    boxes->shared = 1;
+
+    /* capsule frees the boxes when it is destroyed */
+    capsule = PyCapsule_New((void *) boxes, BOXES_CAPSULE_NAME, destroyBoxes);
+    if (capsule == NULL)
+    {
+        boxes->shared = 0;
+        freeBoxes(boxes);
+        return NULL;
+    }
+
+    return capsule;
+}
+
+/*******************************************************************************
+ ** Return the number of boxes and atoms in the boxes in a capsule
+ *******************************************************************************/
+static PyObject*
+boxesInfo(PyObject *self, PyObject *args)
+{
+    PyObject *capsule;
+    struct Boxes *boxes;
+
+    /* parse and check arguments from Python */
+    if (!PyArg_ParseTuple(args, "O", &capsule))
+        return NULL;
+
+    boxes = (struct Boxes *) PyCapsule_GetPointer(capsule, BOXES_CAPSULE_NAME);
+    if (boxes == NULL) return NULL;
+
+    return Py_BuildValue("(iii)i", boxes->NBoxes[0], boxes->NBoxes[1], boxes->NBoxes[2], boxes->NAtoms);
+}
+
+/*******************************************************************************
+ ** Free the neighbour list when the capsule is destroyed
+ *******************************************************************************/
+static void
+destroyNeighbourList(PyObject *capsule)
+{
+    struct NeighbourListCSR *nebList;
+
+    nebList = (struct NeighbourListCSR *) PyCapsule_GetPointer(capsule, NEBLIST_CAPSULE_NAME);
+    if (nebList != NULL) freeNeighbourListCSR(nebList);
+}
+
+/*******************************************************************************
+ ** Build the neighbour list of all the atoms (within maxSep), returning it in
+ ** a capsule (the filters use it as a Verlet list, see visibleNeighbourList in
+ ** neb_list)
+ *******************************************************************************/
+static PyObject*
+buildVerletList(PyObject *self, PyObject *args)
+{
+    int NAtoms, *PBC;
+    double maxSep, *pos, *cellDims;
+    PyArrayObject *posIn=NULL;
+    PyArrayObject *PBCIn=NULL;
+    PyArrayObject *cellDimsIn=NULL;
+    PyObject *capsule;
+    struct Boxes *boxes;
+    struct NeighbourListCSR *nebList;
+
+    /* parse and check arguments from Python */
+    if (!PyArg_ParseTuple(args, "O!dO!O!", &PyArray_Type, &posIn, &maxSep, &PyArray_Type, &PBCIn,
+            &PyArray_Type, &cellDimsIn))
+        return NULL;
+
+    if (not_doubleVector(posIn)) return NULL;
+    pos = pyvector_to_Cptr_double(posIn);
+    NAtoms = (int) PyArray_DIM(posIn, 0) / 3;
+
+    if (not_intVector(PBCIn)) return NULL;
+    PBC = pyvector_to_Cptr_int(PBCIn);
+
+    if (not_doubleVector(cellDimsIn)) return NULL;
+    cellDims = pyvector_to_Cptr_double(cellDimsIn);
+
+    /* box the atoms */
+    boxes = setupBoxes(maxSep, PBC, cellDims);
+    if (boxes == NULL) return NULL;
+    if (putAtomsInBoxes(NAtoms, pos, boxes)) return NULL;
+
+    /* build the neighbour list */
+    nebList = constructNeighbourListCSR(NAtoms, pos, boxes, cellDims, PBC, maxSep * maxSep, prefs_numThreads);
+    freeBoxes(boxes);
+    if (nebList == NULL) return NULL;
+
+    /* capsule frees the neighbour list when it is destroyed */
+    capsule = PyCapsule_New((void *) nebList, NEBLIST_CAPSULE_NAME, destroyNeighbourList);
+    if (capsule == NULL)
+    {
+        freeNeighbourListCSR(nebList);
+        return NULL;
+    }
+
+    return capsule;
+}
@@ -0,0 +1,228 @@
+"""
+Spatial index of the atoms of a Lattice, shared by the filters.
+
+The boxes (cell list) of all the atoms of a Lattice are built once for each box width
+and reused by the C filters (see `boxVisibleAtoms` in boxeslib), instead of each filter
+boxing the atoms again. The index is only valid while the positions of the Lattice do
+not change (see `Lattice.positionsVersion`).
+
+A `VerletCache` keeps neighbour lists built with a skin distance across the frames of
+a sequence (it belongs to the Filterer, see `Filterer.toggleVerletLists`). A list is
+only rebuilt when an atom has moved more than half the skin since it was built,
+otherwise the filters just filter its candidate pairs by the true cutoff (see
+`visibleNeighbourList` in neb_list). The lists contain all the atoms, so they are only
+used when most atoms are visible.
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import logging
+import weakref
+
+import numpy as np
+
+from . import _spatialIndex
+
+
+# Verlet lists are only used if at least this fraction of the atoms is visible
+VERLET_MIN_VISIBLE_FRACTION = 0.5
+
+
+class SpatialIndex(object):
+    """
+    Boxes of all the atoms of a Lattice (built as required for each box width).
+    
+    """
+    def __init__(self, lattice):
+        self.logger = logging.getLogger(__name__ + ".SpatialIndex")
+        self._lattice = weakref.ref(lattice)
+        self.version = lattice.positionsVersion
+        self.NAtoms = lattice.NAtoms
+        self.cellDims = np.array(lattice.cellDims, dtype=np.float64)
+        
+        # keep the positions so they cannot be freed while the boxes refer to them
+        self.pos = lattice.pos
+        
+        # boxes by (box width, PBC)
+        self._boxes = {}
+        
+        # Verlet lists by (cutoff, PBC), from the Verlet cache if there is one
+        self.verletCache = None
+        self._verletLists = {}
+        
+        # statistics
+        self.builds = 0
+        self.hits = 0
+    
+    def isValid(self):
+        """
+        Return True if the positions of the Lattice have not changed since the index was created.
+        
+        """
+        lattice = self._lattice()
+        
+        return (lattice is not None and lattice.positionsVersion == self.version and lattice.pos is self.pos and
+                lattice.NAtoms == self.NAtoms and np.array_equal(lattice.cellDims, self.cellDims))
+    
+    def boxes(self, approxBoxWidth, PBC, cellDims):
+        """
+        Return the boxes (in a capsule) for the given box width, or None if the index cannot be used.
+        
+        This is called from the C filters.
+        
+        """
+        if not self.isValid() or not np.array_equal(cellDims, self.cellDims):
+            return None
+        
+        key = (float(approxBoxWidth), tuple(int(pbc) for pbc in PBC))
+        capsule = self._boxes.get(key)
+        if capsule is None:
+            self.logger.debug("Building spatial index: width %f, PBC %r (%d atoms)", key[0], key[1], self.NAtoms)
+            capsule = _spatialIndex.buildBoxes(self.pos, key[0], np.asarray(key[1], dtype=np.int32), self.cellDims)
+            self._boxes[key] = capsule
+            self.builds += 1
+        
+        else:
+            self.hits += 1
+        
+        return capsule
+    
+    def verletList(self, cutoff, PBC, cellDims, NVisible):
+        """
+        Return the Verlet list (in a capsule) for the given cutoff, or None if there is no
+        Verlet cache, too few of the atoms are visible or the index cannot be used.
+        
+        This is called from the C filters.
+        
+        """
+        if self.verletCache is None or NVisible < VERLET_MIN_VISIBLE_FRACTION * self.NAtoms:
+            return None
+        
+        if not self.isValid() or not np.array_equal(cellDims, self.cellDims):
+            return None
+        
+        key = (float(cutoff), tuple(int(pbc) for pbc in PBC))
+        capsule = self._verletLists.get(key)
+        if capsule is None:
+            capsule = self.verletCache.neighbourList(self._lattice(), key[0], key[1])
+            self._verletLists[key] = capsule
+        
+        else:
+            self.hits += 1
+        
+        return capsule
+    
+    def info(self, approxBoxWidth, PBC):
+        """
+        Return (number of boxes in each direction, number of atoms) for the boxes that
+        have been built for the given box width and PBC, or None.
+        
+        """
+        capsule = self._boxes.get((float(approxBoxWidth), tuple(int(pbc) for pbc in PBC)))
+        if capsule is None:
+            return None
+        
+        return _spatialIndex.boxesInfo(capsule)
+
+
+class VerletCache(object):
+    """
+    Neighbour lists of all the atoms built with a skin distance, which are reused
+    until an atom has moved more than half the skin since the list was built.
+    
+    """
+    def __init__(self, skin=0.5):
+        self.logger = logging.getLogger(__name__ + ".VerletCache")
+        self.skin = skin
+        
+        # (capsule, reference positions, atom IDs, cell dimensions) by (cutoff, PBC)
+        self._entries = {}
+        
+        # statistics
+        self.hits = 0
+        self.misses = 0
+    
+    def setSkin(self, skin):
+        """
+        Set the skin distance (the lists are rebuilt).
+        
+        """
+        if skin < 0:
+            raise ValueError("Skin distance must not be negative: %r" % skin)
+        self.skin = skin
+        self.clear()
+    
+    def clear(self):
+        """
+        Remove the neighbour lists.
+        
+        """
+        self._entries = {}
+    
+    def hitRatio(self):
+        """
+        Return the fraction of requests that reused a neighbour list.
+        
+        """
+        total = self.hits + self.misses
+        
+        return float(self.hits) / total if total else 0.0
+    
+    def maxDisplacement(self, pos, refPos, cellDims, PBC):
+        """
+        Return the maximum displacement of the atoms from the reference positions
+        (using the minimum image convention in periodic directions).
+        
+        """
+        if not len(pos):
+            return 0.0
+        
+        disp = (pos - refPos).reshape((-1, 3))
+        for i in range(3):
+            if PBC[i]:
+                disp[:, i] -= np.round(disp[:, i] / cellDims[i]) * cellDims[i]
+        
+        return np.sqrt(np.max(np.sum(disp * disp, axis=1)))
+    
+    def neighbourList(self, lattice, cutoff, PBC):
+        """
+        Return a neighbour list (in a capsule) containing all the pairs of atoms of the
+        Lattice within the cutoff, rebuilding it if required.
+        
+        """
+        key = (cutoff, PBC)
+        entry = self._entries.get(key)
+        if (entry is not None and len(entry[1]) == len(lattice.pos) and np.array_equal(entry[2], lattice.atomID) and
+                np.array_equal(entry[3], lattice.cellDims) and
+                self.maxDisplacement(lattice.pos, entry[1], lattice.cellDims, PBC) <= 0.5 * self.skin):
+            self.hits += 1
+            return entry[0]
+        
+        self.misses += 1
+        self.logger.debug("Building Verlet list: cutoff %f, skin %f, PBC %r (%d atoms)", cutoff, self.skin, PBC,
+                          lattice.NAtoms)
+        cellDims = np.array(lattice.cellDims, dtype=np.float64)
+        capsule = _spatialIndex.buildVerletList(lattice.pos, cutoff + self.skin, np.asarray(PBC, dtype=np.int32),
+                                                cellDims)
+        self._entries[key] = (capsule, np.array(lattice.pos), np.array(lattice.atomID), cellDims)
+        
+        return capsule
+
+
+# spatial indexes by Lattice (they are removed with the Lattice)
+_indexes = weakref.WeakKeyDictionary()
+
+
+def forLattice(lattice):
+    """
+    Return the spatial index of the Lattice (a new one if its positions have changed).
+    
+    """
+    index = _indexes.get(lattice)
+    if index is None or not index.isValid():
+        index = SpatialIndex(lattice)
+        _indexes[lattice] = index
+    
+    return index
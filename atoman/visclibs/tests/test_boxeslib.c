@@ -28,6 +28,7 @@
 #endif
 
 static PyObject* test_boxes(PyObject*, PyObject*);
+static PyObject* test_putAtomsInBoxes(PyObject*, PyObject*);
 
 
 /*******************************************************************************
@@ -35,6 +36,7 @@ static PyObject* test_boxes(PyObject*, PyObject*);
  *******************************************************************************/
 static struct PyMethodDef module_methods[] = {
     {"test_boxes", test_boxes, METH_VARARGS, "The boxes functionality"},
+    {"test_putAtomsInBoxes", test_putAtomsInBoxes, METH_VARARGS, "Putting atoms in boxes"},
     {NULL, NULL, 0, NULL}
 };
 
@@ -113,3 +115,77 @@ test_boxes(PyObject *self, PyObject *args)
     
     return result;
 }
+
+/*******************************************************************************
+ ** Test putting atoms in boxes: returns the box offsets, the atoms in the boxes,
+ ** the box of each atom and the boxed positions
+ *******************************************************************************/
+static PyObject*
+test_putAtomsInBoxes(PyObject *self, PyObject *args)
+{
+    int i, numAtoms, *pbc;
+    double approxWidth, *pos, *cellDims, *boxPos;
+    PyArrayObject *posIn=NULL;
+    PyArrayObject *cellDimsIn=NULL;
+    PyArrayObject *pbcIn=NULL;
+    PyArrayObject *boxOffsets=NULL;
+    PyArrayObject *boxAtoms=NULL;
+    PyArrayObject *atomBox=NULL;
+    PyArrayObject *boxPosOut=NULL;
+    struct Boxes *boxes;
+    
+    
+    /* parse and check arguments from Python */
+    if (!PyArg_ParseTuple(args, "O!O!O!dO!O!O!O!", &PyArray_Type, &posIn, &PyArray_Type, &cellDimsIn, &PyArray_Type, &pbcIn,
+            &approxWidth, &PyArray_Type, &boxOffsets, &PyArray_Type, &boxAtoms, &PyArray_Type, &atomBox, &PyArray_Type,
+            &boxPosOut))
+        return NULL;
+    
+    if (not_doubleVector(posIn)) return NULL;
+    pos = pyvector_to_Cptr_double(posIn);
+    numAtoms = (int) PyArray_DIM(posIn, 0) / 3;
+    
+    if (not_doubleVector(cellDimsIn)) return NULL;
+    cellDims = pyvector_to_Cptr_double(cellDimsIn);
+    
+    if (not_intVector(pbcIn)) return NULL;
+    pbc = pyvector_to_Cptr_int(pbcIn);
+    
+    if (not_intVector(boxOffsets)) return NULL;
+    if (not_intVector(boxAtoms)) return NULL;
+    if (not_intVector(atomBox)) return NULL;
+    if (not_doubleVector(boxPosOut)) return NULL;
+    
+    /* box the atoms */
+    boxes = setupBoxes(approxWidth, pbc, cellDims);
+    if (boxes == NULL) return NULL;
+    if (putAtomsInBoxes(numAtoms, pos, boxes)) return NULL;
+    if ((int) PyArray_DIM(boxOffsets, 0) != boxes->totNBoxes + 1)
+    {
+        PyErr_SetString(PyExc_ValueError, "boxOffsets has the wrong size");
+        freeBoxes(boxes);
+        return NULL;
+    }
+    
+    /* store the results for checking in Python */
+    for (i = 0; i <= boxes->totNBoxes; i++) IIND1(boxOffsets, i) = boxes->boxOffsets[i];
+    for (i = 0; i < numAtoms; i++)
+    {
+        IIND1(boxAtoms, i) = boxes->boxAtoms[i];
+        IIND1(atomBox, i) = boxIndexOfAtom(pos[3 * i], pos[3 * i + 1], pos[3 * i + 2], boxes);
+    }
+    
+    boxPos = boxedPositions(boxes, pos);
+    if (boxPos == NULL)
+    {
+        freeBoxes(boxes);
+        return NULL;
+    }
+    for (i = 0; i < 3 * numAtoms; i++) DIND1(boxPosOut, i) = boxPos[i];
+    
+    free(boxPos);
+    freeBoxes(boxes);
+    
+    Py_INCREF(Py_None);
+    return Py_None;
+}
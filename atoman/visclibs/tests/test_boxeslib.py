@@ -85,3 +85,43 @@ class TestBoxeslib(unittest.TestCase):
         
         
         
+    
+    def test_putAtomsInBoxes(self):
+        """
+        Boxeslib put atoms in boxes
+        
+        """
+        pbc = np.ones(3, np.int32)
+        lattice = self.lattice2
+        
+        # displace the atoms (some outside the cell)
+        rng = np.random.RandomState(5)
+        pos = lattice.pos + rng.uniform(-1.0, 1.0, size=len(lattice.pos))
+        
+        # number of boxes
+        numBoxes = np.empty(3, np.int32)
+        cellLengths = np.empty(3, np.float64)
+        status = _test_boxeslib.test_boxes(pos, lattice.cellDims, pbc, 5.0, numBoxes, cellLengths)
+        self.assertEqual(status, 0)
+        
+        # box the atoms
+        boxOffsets = np.empty(np.prod(numBoxes) + 1, np.int32)
+        boxAtoms = np.empty(lattice.NAtoms, np.int32)
+        atomBox = np.empty(lattice.NAtoms, np.int32)
+        boxPos = np.empty(3 * lattice.NAtoms, np.float64)
+        _test_boxeslib.test_putAtomsInBoxes(pos, lattice.cellDims, pbc, 5.0, boxOffsets, boxAtoms, atomBox, boxPos)
+        
+        # offsets
+        self.assertEqual(boxOffsets[0], 0)
+        self.assertEqual(boxOffsets[-1], lattice.NAtoms)
+        self.assertTrue(np.all(np.diff(boxOffsets) >= 0))
+        
+        # each atom is in its own box, in order
+        self.assertEqual(sorted(boxAtoms), list(range(lattice.NAtoms)))
+        for box in range(len(boxOffsets) - 1):
+            atoms = boxAtoms[boxOffsets[box]:boxOffsets[box + 1]]
+            self.assertTrue(np.all(atomBox[atoms] == box))
+            self.assertTrue(np.all(np.diff(atoms) > 0))
+        
+        # positions in box order
+        self.assertTrue(np.array_equal(boxPos.reshape((-1, 3)), pos.reshape((-1, 3))[boxAtoms]))
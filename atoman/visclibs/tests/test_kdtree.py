@@ -0,0 +1,99 @@
+"""
+Unit tests for the k-d tree
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import unittest
+
+import numpy as np
+
+from ...lattice_gen import lattice_gen_bcc
+from .. import kdtree
+
+
+################################################################################
+
+class TestKDTree(unittest.TestCase):
+    """
+    Test the k-d tree
+    
+    """
+    def setUp(self):
+        """
+        Called before each test
+        
+        """
+        # lattice positions (lots of repeated coordinates and equal separations)
+        args = lattice_gen_bcc.Args(sym="Fe", NCells=[6,6,6], a0=2.87, pbcx=True, pbcy=True, pbcz=True)
+        gen = lattice_gen_bcc.BCCLatticeGenerator()
+        status, lattice = gen.generateLattice(args)
+        if status:
+            raise unittest.SkipTest("Generate lattice failed (%d)" % status)
+        self.pos = lattice.pos
+        self.tree = kdtree.KDTree(self.pos)
+        
+        rng = np.random.RandomState(20)
+        self.points = np.concatenate((np.reshape(self.pos[:30], (-1, 3)),
+                                      rng.uniform(-3.0, 20.0, size=(20, 3))))
+    
+    def tearDown(self):
+        """
+        Called after each test
+        
+        """
+        self.pos = None
+        self.tree = None
+        self.points = None
+    
+    def bruteForce(self, point):
+        """
+        Return the indexes of all the points, ordered by separation then index, and the separations
+        
+        """
+        sep2 = np.sum((np.reshape(self.pos, (-1, 3)) - point) ** 2, axis=1)
+        order = np.lexsort((np.arange(len(sep2)), sep2))
+        
+        return order, np.sqrt(sep2[order])
+    
+    def test_nearest(self):
+        """
+        k-d tree nearest
+        
+        """
+        self.assertEqual(len(self.tree), len(self.pos) // 3)
+        for point in self.points:
+            order, sep = self.bruteForce(point)
+            for k in (1, 9, 15):
+                indexes, separations = self.tree.nearest(point, k=k)
+                self.assertEqual(indexes.dtype, np.int32)
+                self.assertTrue(np.array_equal(indexes, order[:k]))
+                self.assertTrue(np.allclose(separations, sep[:k]))
+        
+        # more points than there are in the tree
+        indexes, separations = self.tree.nearest(self.points[0], k=len(self.tree) + 10)
+        self.assertEqual(len(indexes), len(self.tree))
+        
+        # empty tree
+        indexes, separations = kdtree.KDTree(np.empty(0, np.float64)).nearest(self.points[0], k=3)
+        self.assertEqual(len(indexes), 0)
+        self.assertEqual(len(separations), 0)
+        
+        with self.assertRaises(ValueError):
+            self.tree.nearest([0.0, 0.0], k=1)
+    
+    def test_withinRadius(self):
+        """
+        k-d tree within radius
+        
+        """
+        for point in self.points:
+            order, sep = self.bruteForce(point)
+            for radius in (0.0, 2.5, 4.1, 7.0):
+                indexes, separations = self.tree.withinRadius(point, radius)
+                within = sep <= radius
+                self.assertTrue(np.array_equal(indexes, order[within]))
+                self.assertTrue(np.allclose(separations, sep[within]))
+        
+        with self.assertRaises(ValueError):
+            self.tree.withinRadius(self.points[0], -1.0)
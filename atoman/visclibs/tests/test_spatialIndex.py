@@ -0,0 +1,202 @@
+"""
+Unit tests for the spatial index
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import unittest
+
+import numpy as np
+
+from ...lattice_gen import lattice_gen_fcc
+from ...filtering.filters import base
+from ...filtering.filters import bondOrderFilter
+from ...gui import _preferences
+from .. import spatialIndex
+
+
+################################################################################
+
+class TestSpatialIndex(unittest.TestCase):
+    """
+    Test the spatial index
+    
+    """
+    def setUp(self):
+        """
+        Called before each test
+        
+        """
+        # generate lattice (displace the atoms so the results depend on the order of the neighbours)
+        args = lattice_gen_fcc.Args(sym="Au", NCells=[8,8,8], a0=4.078, pbcx=True, pbcy=True, pbcz=True)
+        gen = lattice_gen_fcc.FCCLatticeGenerator()
+        status, self.lattice = gen.generateLattice(args)
+        if status:
+            raise unittest.SkipTest("Generate lattice failed (%d)" % status)
+        rng = np.random.RandomState(36)
+        self.lattice.pos += rng.uniform(-0.2, 0.2, size=len(self.lattice.pos))
+        self.lattice.wrapAtoms()
+        
+        # filter
+        self.filter = bondOrderFilter.BondOrderFilter("Bond order")
+        _preferences.setNumThreads(1)
+    
+    def tearDown(self):
+        """
+        Called after each test
+        
+        """
+        # remove refs
+        self.lattice = None
+        self.filter = None
+    
+    def runFilter(self, visibleAtoms, index):
+        """
+        Run the bond order filter, returning the visible atoms and the Q4/Q6 scalars.
+        
+        """
+        settings = bondOrderFilter.BondOrderFilterSettings()
+        settings.updateSetting("maxBondDistance", 3.5)
+        
+        filterInput = base.FilterInput()
+        filterInput.inputState = self.lattice
+        filterInput.visibleAtoms = np.array(visibleAtoms, dtype=np.int32)
+        filterInput.NScalars = 0
+        filterInput.fullScalars = np.empty(0, np.float64)
+        filterInput.NVectors = 0
+        filterInput.fullVectors = np.empty(0, np.float64)
+        filterInput.spatialIndex = index
+        
+        result = self.filter.apply(filterInput, settings)
+        scalars = result.getScalars()
+        
+        return filterInput.visibleAtoms, scalars["Q4"], scalars["Q6"]
+    
+    def assertSameResults(self, visibleAtoms):
+        """
+        Check the results are the same with and without the spatial index.
+        
+        """
+        index = spatialIndex.forLattice(self.lattice)
+        builds = index.builds
+        
+        expected = self.runFilter(visibleAtoms, None)
+        results = self.runFilter(visibleAtoms, index)
+        for res, exp in zip(results, expected):
+            np.testing.assert_array_equal(res, exp)
+        
+        return index.builds - builds
+    
+    def test_forLattice(self):
+        """
+        Spatial index: invalidation
+        
+        """
+        index = spatialIndex.forLattice(self.lattice)
+        self.assertTrue(index.isValid())
+        self.assertIs(spatialIndex.forLattice(self.lattice), index)
+        
+        # positions changed in place
+        self.lattice.positionsChanged()
+        self.assertFalse(index.isValid())
+        self.assertIsNone(index.boxes(3.5, self.lattice.PBC, self.lattice.cellDims))
+        index = spatialIndex.forLattice(self.lattice)
+        self.assertTrue(index.isValid())
+        
+        # positions replaced
+        self.lattice.pos = self.lattice.pos.copy()
+        self.assertFalse(index.isValid())
+        self.assertIsNot(spatialIndex.forLattice(self.lattice), index)
+    
+    def test_boxes(self):
+        """
+        Spatial index: boxes
+        
+        """
+        index = spatialIndex.forLattice(self.lattice)
+        capsule = index.boxes(3.5, self.lattice.PBC, self.lattice.cellDims)
+        self.assertIs(index.boxes(3.5, self.lattice.PBC, self.lattice.cellDims), capsule)
+        self.assertIsNot(index.boxes(4.0, self.lattice.PBC, self.lattice.cellDims), capsule)
+        self.assertEqual(index.builds, 2)
+        self.assertEqual(index.hits, 1)
+        
+        # different cell
+        self.assertIsNone(index.boxes(3.5, self.lattice.PBC, self.lattice.cellDims * 2.0))
+        
+        numBoxes, numAtoms = index.info(3.5, self.lattice.PBC)
+        self.assertEqual(numAtoms, self.lattice.NAtoms)
+        self.assertEqual(len(numBoxes), 3)
+        self.assertIsNone(index.info(5.0, self.lattice.PBC))
+    
+    def test_filterResults(self):
+        """
+        Spatial index: filter results
+        
+        """
+        NAtoms = self.lattice.NAtoms
+        rng = np.random.RandomState(7)
+        
+        # all atoms visible (shared boxes)
+        self.assertEqual(self.assertSameResults(np.arange(NAtoms)), 1)
+        
+        # most atoms visible (derived from the shared boxes)
+        subset = np.sort(rng.choice(NAtoms, NAtoms // 2, replace=False))
+        self.assertEqual(self.assertSameResults(subset), 0)
+        
+        # few atoms visible, or not in order (boxed by the filter)
+        self.assertSameResults(np.sort(rng.choice(NAtoms, NAtoms // 10, replace=False)))
+        self.assertSameResults(rng.permutation(NAtoms))
+    
+    def test_verletCache(self):
+        """
+        Spatial index: Verlet lists
+        
+        """
+        NAtoms = self.lattice.NAtoms
+        rng = np.random.RandomState(11)
+        cache = spatialIndex.VerletCache(skin=0.5)
+        
+        def assertSameResults(visibleAtoms):
+            index = spatialIndex.forLattice(self.lattice)
+            index.verletCache = cache
+            
+            expected = self.runFilter(visibleAtoms, None)
+            results = self.runFilter(visibleAtoms, index)
+            for res, exp in zip(results, expected):
+                np.testing.assert_array_equal(res, exp)
+        
+        # first frame builds the list
+        assertSameResults(np.arange(NAtoms))
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        
+        # reused by other filters on the same frame (without checking the positions)
+        assertSameResults(np.sort(rng.choice(NAtoms, NAtoms // 2, replace=False)))
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        
+        # not used when few atoms are visible
+        index = spatialIndex.forLattice(self.lattice)
+        self.assertIsNone(index.verletList(3.5, (1, 1, 1), self.lattice.cellDims, NAtoms // 4))
+        assertSameResults(np.sort(rng.choice(NAtoms, NAtoms // 4, replace=False)))
+        self.assertEqual(len(index._verletLists), 1)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        
+        # small displacements reuse the list
+        self.lattice.pos += rng.uniform(-0.1, 0.1, size=len(self.lattice.pos))
+        self.lattice.wrapAtoms()
+        assertSameResults(np.arange(NAtoms))
+        assertSameResults(rng.permutation(NAtoms))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertAlmostEqual(cache.hitRatio(), 0.5)
+        
+        # large displacements rebuild it
+        self.lattice.pos[0] += 0.3
+        self.lattice.wrapAtoms()
+        assertSameResults(np.arange(NAtoms))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        
+        # changing the skin removes the lists
+        cache.setSkin(1.0)
+        self.lattice.positionsChanged()
+        assertSameResults(np.arange(NAtoms))
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+        self.assertRaises(ValueError, cache.setSkin, -1.0)
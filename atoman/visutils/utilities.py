@@ -19,7 +19,6 @@ import tempfile
 import logging
 
 import pkg_resources
-from PySide import QtGui, QtCore
 
 from .appdirs import appdirs
 from six.moves import range
@@ -51,6 +50,8 @@ class TextEditHandler(logging.Handler):
         Write log message
          
         """
+        from PySide import QtCore
+        
         # format the record
         record.message = self.format(record)
         
@@ -222,6 +223,9 @@ def warnExeNotFound(parent, exe):
     Warn that an executable was not located.
     
     """
+    # Qt is imported here so the other utilities can be used without the GUI (eg. by atoman-batch)
+    from PySide import QtGui, QtCore
+    
 #     QtGui.QMessageBox.warning(parent, "Warning", "Could not locate '%s' executable!" % (exe,))
     
     message = "Could not locate '%s' executable!" % exe
@@ -175,7 +175,10 @@ def setup_package():
         entry_points={
             'gui_scripts': [
                 'Atoman = atoman.__main__:main',
-            ]
+            ],
+            'console_scripts': [
+                'atoman-batch = atoman.batch:main',
+            ],
         },
         zip_safe=False,
     )